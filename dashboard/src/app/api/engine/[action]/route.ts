@@ -1,50 +1,79 @@
 import { NextRequest, NextResponse } from "next/server";
-import { exec } from "child_process";
-import { promisify } from "util";
-import path from "path";
 
-const execAsync = promisify(exec);
+// The resident Python engine (tools/engine_server.py) keeps the tools imported and the
+// Supabase client warm, so an action is a queued job instead of a cold `python` process.
+const ENGINE_URL = process.env.ENGINE_URL || "http://127.0.0.1:8765";
 
+// Parameterless dashboard buttons only. Logging an outcome needs opportunity, contractor and
+// result fields no dashboard form sends yet: use tools/4_log_outcome.py or POST /jobs/log.
+const ACTIONS = new Set(["ingest", "score", "drafts"]);
+
+function engineUnavailable(error: any) {
+    return NextResponse.json({
+        success: false,
+        error: `Engine unreachable at ${ENGINE_URL} (${error.message}). Start it with: python tools/engine_server.py`
+    }, { status: 503 });
+}
+
+async function readParams(req: NextRequest): Promise<Record<string, unknown>> {
+    const contentType = req.headers.get("content-type") || "";
+    if (contentType.includes("application/json")) {
+        return await req.json().catch(() => ({}));
+    }
+    if (contentType.includes("form")) {
+        const form = await req.formData();
+        return Object.fromEntries(
+            Array.from(form.entries()).filter(([, value]) => typeof value === "string" && value !== "")
+        );
+    }
+    return {};
+}
+
+// POST /api/engine/<action>: enqueue the action and return its job right away
 export async function POST(
     req: NextRequest,
     { params }: { params: Promise<{ action: string }> }
 ) {
     const { action } = await params;
 
-    // Map action parameter to the specific script in the tools/ directory
-    const scriptMap: Record<string, string> = {
-        "ingest": "1_ingest_sam.py",
-        "score": "2_score_matches.py",
-        "drafts": "3_generate_email_drafts.py",
-        "log": "4_log_outcome.py"
-    };
-
-    const scriptName = scriptMap[action];
-
-    if (!scriptName) {
+    if (!ACTIONS.has(action)) {
         return NextResponse.json({ error: "Invalid action" }, { status: 400 });
     }
 
     try {
-        // Determine path relative to the dashboard directory (assuming tools is sibling)
-        const scriptPath = path.join(process.cwd(), "..", "tools", scriptName);
-
-        // Execute python script. Note: Assumes python environment is active or global python has dependencies.
-        // In a production setup, explicit python path (e.g., ../venv/bin/python) should be used.
-        const { stdout, stderr } = await execAsync(`python "${scriptPath}"`);
-
-        return NextResponse.json({
-            success: true,
-            action,
-            output: stdout,
-            errors: stderr
+        const response = await fetch(`${ENGINE_URL}/jobs/${action}`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify(await readParams(req))
         });
+        const body = await response.json();
+        return NextResponse.json({ success: response.ok, action, ...body }, { status: response.status });
+    } catch (error: any) {
+        return engineUnavailable(error);
+    }
+}
 
+// GET /api/engine/<job id>: the job's status and output (?stream=1 follows it as NDJSON until it ends)
+export async function GET(
+    req: NextRequest,
+    { params }: { params: Promise<{ action: string }> }
+) {
+    const { action: jobId } = await params;
+    const stream = req.nextUrl.searchParams.get("stream");
+    const since = req.nextUrl.searchParams.get("since") || "0";
+
+    try {
+        const path = `${encodeURIComponent(jobId)}${stream ? "/stream" : ""}`;
+        const response = await fetch(`${ENGINE_URL}/jobs/${path}?since=${encodeURIComponent(since)}`, {
+            cache: "no-store"
+        });
+        if (stream && response.ok) {
+            return new Response(response.body, {
+                headers: { "Content-Type": "application/x-ndjson", "Cache-Control": "no-cache" }
+            });
+        }
+        return NextResponse.json(await response.json(), { status: response.status });
     } catch (error: any) {
-        return NextResponse.json({
-            success: false,
-            action,
-            error: error.message
-        }, { status: 500 });
+        return engineUnavailable(error);
     }
 }
@@ -56,6 +56,8 @@ export default async function AgencyDashboard() {
         </div>
         <div className="flex space-x-3">
           <form action="/api/engine/ingest" method="POST" target="blank_iframe">
+            <input type="hidden" name="days_back" value="90" />
+            <input type="hidden" name="shard_days" value="7" />
             <button type="submit" className="flex items-center space-x-2 bg-white text-stone-700 px-4 py-2.5 rounded-full border border-stone-200 hover:border-black hover:text-black hover:shadow-md transition-all text-sm font-medium">
               <RefreshCw className="w-4 h-4" />
               <span className="font-typewriter">Backfill 90D</span>
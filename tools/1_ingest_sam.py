@@ -1,24 +1,61 @@
 import os
-import requests
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import argparse
 from datetime import datetime, timedelta
-
-load_dotenv()
+from clients import get_supabase
+from bulk_writer import BulkWriter
+from change_tracker import ChangeTracker
 
 SAM_API_KEY = os.getenv("SAM_API_KEY")
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-def ingest_sam_opportunities(days_back=2):
+def normalize_opportunity(op):
+    # Map properties carefully as SAM API structure can be inconsistent
+    notice_id = op.get("noticeId")
+    if not notice_id:
+        return None
+        
+    return {
+        "notice_id": notice_id,
+        "title": op.get("title"),
+        "agency": op.get("department") or op.get("subtier") or op.get("agency"),
+        "organization_code": None, # Future mapping
+        "naics_code": op.get("naicsCode"),
+        "psc_code": op.get("classificationCode"),
+        "set_aside_code": op.get("typeOfSetAsideDescription"),
+        "notice_type": op.get("type"),
+        "posted_date": op.get("postedDate"),
+        "response_deadline": op.get("responseDeadLine"),
+        "place_of_performance_state": (op.get("placeOfPerformance") or {}).get("state", {}).get("code"),
+        "raw_json": op
+    }
+
+def backfill_pages(supabase, days_back, shard_days, workers=None, checkpoints=None):
+    """(ptype, offset, records, landed) for each missing page of the backfill; pass `landed` as the page's BulkWriter `then=`."""
+    from run_state import client_source
+    from sam_fetcher import PTYPES, PAGE_LIMIT, opportunity_window_fetcher
+    from backfill import CheckpointStore, BACKFILL_WORKERS, backfill_shards, iter_shard_pages
+    store = checkpoints or CheckpointStore()
+    shards = backfill_shards(f"opportunities@{client_source(supabase)}", PTYPES, days_back, PAGE_LIMIT, shard_days)
+    for shard, offset, records in iter_shard_pages(shards, opportunity_window_fetcher(SAM_API_KEY), store,
+                                                   workers or BACKFILL_WORKERS):
+        yield shard.ptype, offset, records, store.landed(shard, offset, len(records))
+
+def ingest_sam_opportunities(days_back=2, supabase=None, shard_days=None, workers=None, checkpoints=None):
     """
     Deterministically fetches opportunities from SAM.gov based on architecture/1_sam_ingestion_sop.md
+    Pass `supabase` to reuse an existing client (e.g. the engine server's warm one).
+    With `shard_days`, runs as a resumable backfill (tools/backfill.py): (ptype, date-window) shards
+    are fetched `workers` at a time and every landed page is checkpointed in `checkpoints`.
     """
     if not all([SAM_API_KEY, SUPABASE_URL, SUPABASE_SERVICE_KEY]):
         print("❌ Missing API keys in .env. Halting execution.")
         return
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    # Imported here: the HTTP stack is only needed once there is something to fetch
+    from sam_fetcher import iter_opportunity_pages, PartialFetch
+    from http_transport import METRICS
+    supabase = supabase or get_supabase()
     
     # Calculate Date Range
     today = datetime.now()
@@ -27,96 +64,57 @@ def ingest_sam_opportunities(days_back=2):
     
     print(f"🔄 Starting SAM.gov Ingestion from {posted_from_date} to {posted_to_date}...")
     
-    url = "https://api.sam.gov/opportunities/v2/search"
-    limit = 1000
-    ptypes = ["r", "p", "o"] # Sources Sought, Presolicitation, Solicitation priorities
+    # Overlapping windows re-fetch most notices; only new or changed ones are written
+    tracker = ChangeTracker(supabase, "opportunities", "notice_id")
+    writer = BulkWriter(supabase, "opportunities", on_conflict="notice_id", tracker=tracker)
     
-    total_upserted = 0
-    
-    for ptype in ptypes:
-        print(f"\n📥 Fetching Notice Type: '{ptype}'")
-        offset = 0
-        keep_fetching = True
-        
-        while keep_fetching:
-            params = {
-                "api_key": SAM_API_KEY,
-                "postedFrom": posted_from_date,
-                "postedTo": posted_to_date,
-                "limit": limit,
-                "offset": offset,
-                "ptype": ptype
-            }
+    if shard_days:
+        pages = backfill_pages(supabase, days_back, shard_days, workers, checkpoints)
+    else:
+        # Notice types page concurrently; each page is normalized here while the next one is in flight
+        pages = ((ptype, offset, ops_batch, None) for ptype, offset, ops_batch
+                 in iter_opportunity_pages(SAM_API_KEY, posted_from_date, posted_to_date))
+    partial = None
+    try:
+        for ptype, offset, ops_batch, landed in pages:
+            print(f"  -> [{ptype}] Retrieved {len(ops_batch)} records at offset {offset}. Normalizing payload...")
+            
+            # Normalize exactly per SOP; skip malformed records silently
+            db_payload = [row for row in map(normalize_opportunity, ops_batch) if row]
             
-            try:
-                response = requests.get(url, params=params, timeout=30)
-                
-                if response.status_code == 429:
-                    print("⚠️ Rate limit hit. Sleeping for 10 seconds (per SOP)...")
-                    import time
-                    time.sleep(10)
-                    continue
-                    
-                if response.status_code != 200:
-                    print(f"❌ Failed to fetch page. Status: {response.status_code}")
-                    break
-                    
-                data = response.json()
-                ops_batch = data.get("opportunitiesData", [])
-                
-                if not ops_batch:
-                    print("No more records for this type.")
-                    keep_fetching = False
-                    break
-                    
-                print(f"  -> Retrieved {len(ops_batch)} records. Normalizing payload...")
-                
-                # Normalize exactly per SOP
-                db_payload = []
-                for op in ops_batch:
-                    # Map properties carefully as SAM API structure can be inconsistent
-                    notice_id = op.get("noticeId")
-                    if not notice_id:
-                        continue # Skip malformed records silently per SOP
-                        
-                    normalized = {
-                        "notice_id": notice_id,
-                        "title": op.get("title"),
-                        "agency": op.get("department") or op.get("subtier") or op.get("agency"),
-                        "organization_code": None, # Future mapping
-                        "naics_code": op.get("naicsCode"),
-                        "psc_code": op.get("classificationCode"),
-                        "set_aside_code": op.get("typeOfSetAsideDescription"),
-                        "notice_type": op.get("type"),
-                        "posted_date": op.get("postedDate"),
-                        "response_deadline": op.get("responseDeadLine"),
-                        "place_of_performance_state": (op.get("placeOfPerformance") or {}).get("state", {}).get("code"),
-                        "raw_json": op
-                    }
-                    db_payload.append(normalized)
-                
-                if db_payload:
-                    try:
-                        # Upsert batch to Supabase
-                        res = supabase.table("opportunities").upsert(db_payload, on_conflict="notice_id").execute()
-                        total_upserted += len(db_payload)
-                        print(f"  ✅ Upserted batch of {len(db_payload)}. Moving to next offset.")
-                    except Exception as db_err:
-                        print(f"  ❌ DB Error Upserting Batch: {db_err}")
-                
-                offset += limit
-                
-            except requests.exceptions.RequestException as req_err:
-                 print(f"❌ Request Exception: {req_err}")
-                 break
+            # Upserts run concurrently in the background; failures retry and then dead-letter
+            writer.write(db_payload, then=landed)
+    except PartialFetch as e:
+        partial = e # The pages that did arrive are still written below
+    finally:
+        pages.close() # Stops the fetch threads if normalizing or writing raised
                  
-    print(f"\n🎉 Ingestion Complete. Total Opportunities Upserted: {total_upserted}")
+    writer.close()
+    tracker.close()
+    writer.print_report()
+    tracker.print_report()
+    total_upserted = writer.stats["rows"]
+    if partial:
+        print(f"\n⚠️ Ingestion Partial. {partial}. Total Opportunities Upserted: {total_upserted}")
+    else:
+        print(f"\n🎉 Ingestion Complete. Total Opportunities Upserted: {total_upserted}")
+    METRICS.print_summary()
     
     # Log progress according to Project Constitution
     with open("progress.md", "a") as f:
-        f.write(f"\n* Ran SAM Ingestion Script. Fetched {total_upserted} records from {posted_from_date} to {posted_to_date}.\n")
+        f.write(f"\n* Ran SAM Ingestion Script. Fetched {total_upserted} records from {posted_from_date} to {posted_to_date}"
+                + (f" (partial: {partial})" if partial else "") + ".\n")
+    if partial:
+        raise partial
 
 if __name__ == "__main__":
-    import sys
-    days = int(sys.argv[1]) if len(sys.argv) > 1 else 7
-    ingest_sam_opportunities(days_back=days)
+    parser = argparse.ArgumentParser(description="Fetch recent SAM.gov opportunities into Supabase")
+    parser.add_argument("days", nargs="?", type=int, default=7, help="Days back to fetch (default 7)")
+    parser.add_argument("--shard-days", type=int, help="Resumable backfill: fetch date windows of this many days in parallel")
+    parser.add_argument("--workers", type=int, help="Backfill shards fetched at once (default BACKFILL_WORKERS)")
+    args = parser.parse_args()
+    from sam_fetcher import PartialFetch
+    try:
+        ingest_sam_opportunities(days_back=args.days, shard_days=args.shard_days, workers=args.workers)
+    except PartialFetch:
+        exit(1)
@@ -1,107 +1,192 @@
+from __future__ import annotations
 import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import argparse
+from typing import TYPE_CHECKING
+from datetime import datetime, timezone
+from clients import get_supabase
+from score_engine import (
+    score_top_matches, encode_snapshot, changed_contractor_reach, find_dirty_opportunities, diff_matches,
+    HOT_THRESHOLD, WARM_THRESHOLD
+)
+from candidate_index import CandidateIndex, score_top_matches_indexed
+from run_state import load_state, save_state, high_water_mark, changed_since, read_from
+from repository import fetch_all
+from roster_snapshot import refresh_snapshot
+
+if TYPE_CHECKING:
+    from supabase import Client
 
-load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-def score_matches():
+TIER_FLOORS = {"HOT": HOT_THRESHOLD, "WARM": WARM_THRESHOLD}
+STATE_FILE = "score_matches_state.json"
+ID_CHUNK = 100 # Keeps `in.(...)` filters well under URL length limits
+OPPORTUNITY_COLUMNS = "naics_code, set_aside_code, place_of_performance_state, response_deadline, updated_at"
+CONTRACTOR_COLUMNS = "naics_codes, certifications, state, updated_at"
+
+def fetch_stored_matches(supabase: Client, op_ids) -> dict:
+    """Current Top N rows per opportunity: {opportunity_id: {contractor_id: row}}."""
+    stored = {}
+    for i in range(0, len(op_ids), ID_CHUNK):
+        res = supabase.table("matches").select("opportunity_id, contractor_id, score, classification").in_("opportunity_id", op_ids[i:i + ID_CHUNK]).execute()
+        for row in res.data:
+            stored.setdefault(row["opportunity_id"], {})[row["contractor_id"]] = row
+    return stored
+
+def fetch_matched_opportunities(supabase: Client, con_ids) -> set:
+    """Opportunities whose stored Top N holds any of these contractors."""
+    op_ids = set()
+    for i in range(0, len(con_ids), ID_CHUNK):
+        res = supabase.table("matches").select("opportunity_id").in_("contractor_id", con_ids[i:i + ID_CHUNK]).execute()
+        op_ids.update(row["opportunity_id"] for row in res.data)
+    return op_ids
+
+def fetch_changed(supabase: Client, table: str, columns: str, mark) -> list:
+    """Rows touched since read_from(mark) (the whole table before a first run), filtered in the database."""
+    where = (lambda q: q.gte("updated_at", read_from(mark))) if mark else None
+    return changed_since(fetch_all(supabase, table, columns, where=where), mark)
+
+def save_marks(state_file: str, state: dict, changed_ops, changed_cons):
+    save_state(state_file, {
+        "opportunities": high_water_mark(changed_ops, previous=state.get("opportunities")),
+        "contractors": high_water_mark(changed_cons, previous=state.get("contractors")),
+        "last_run_at": datetime.now(timezone.utc).isoformat()
+    })
+
+def delete_stale_matches(supabase: Client, stale):
+    by_op = {}
+    for op_id, con_id in stale:
+        by_op.setdefault(op_id, []).append(con_id)
+    for op_id, con_ids in by_op.items():
+        supabase.table("matches").delete().eq("opportunity_id", op_id).in_("contractor_id", con_ids).execute()
+
+def score_matches_in_db(supabase: Client, min_score=None):
+    """Runs score_matches_sql() (tools/ranking_migration.sql): scoring, ranking and upserts stay in Postgres."""
+    res = supabase.rpc("score_matches_sql", {"p_min_score": min_score, "p_top_n": 10}).execute()
+    summary = res.data or {}
+    print(f"  -> Ranked {summary.get('opportunities', 0)} opportunities in Postgres: {summary.get('matches', 0)} Top 10 rows, "
+          f"{summary.get('written', 0)} inserted or changed.")
+    return summary
+
+def score_matches(min_tier=None, incremental=False, engine="python", snapshot=False, supabase=None, state_file=STATE_FILE):
     """
     Deterministically applies the Phase 1 blueprint formula described in architecture/2_contractor_matching_sop.md
+
+    With `min_tier` set, only pairs reaching that tier are kept, and the inverted candidate
+    index prunes contractors that cannot reach it before exact scoring.
+
+    With `incremental` set, only rows changed since the last run (per the `updated_at`
+    high-water marks in .tmp/) are downloaded to decide what is dirty. Stored matches are read
+    only for opportunities those changes can reach, only the dirty ones are re-scored, and only
+    match rows whose score or classification moved are written back. A run with only changed
+    opportunities never downloads the rest of the opportunities table.
+
+    With `engine="sql"` the whole run is one RPC to score_matches_sql(), so neither table is
+    downloaded. Same scores and Top 10 as the Python engine; no incremental mode.
+
+    With `snapshot` set, the roster comes from the memory-mapped snapshot in .tmp/ (see
+    tools/roster_snapshot.py), refreshed with only the contractors changed since it was written.
+
+    Pass `supabase` to reuse an existing client (e.g. the engine server's warm one).
     """
-    if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
+    if supabase is None and not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
         print("❌ Missing API keys in .env. Halting execution.")
         return
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    supabase = supabase or get_supabase()
     
     print("🔄 Starting Deterministic Contractor Matching...")
     
-    # For a real run we'd paginate, but for atomicity we select newly created opportunities
-    # Currently extracting a subset just to demonstrate logic engine mapping
-    ops_res = supabase.table("opportunities").select("id, naics_code, set_aside_code, place_of_performance_state, response_deadline").limit(10).execute()
-    con_res = supabase.table("contractors").select("id, naics_codes, certifications, state").execute()
+    min_score = TIER_FLOORS[min_tier] if min_tier else None
+    if engine == "sql":
+        try:
+            score_matches_in_db(supabase, min_score)
+            print("  ✅ Successfully committed Top 10 matches per Opportunity to database.")
+        except Exception as e:
+            print(f"  ❌ DB Error Ranking Matches (is tools/ranking_migration.sql applied?): {e}")
+        return
     
-    opportunities = ops_res.data
-    contractors = con_res.data
+    state = load_state(state_file) if incremental else {}
+    changed_ops, changed_cons = [], []
+    if incremental:
+        changed_ops = fetch_changed(supabase, "opportunities", OPPORTUNITY_COLUMNS, state.get("opportunities"))
+        changed_cons = fetch_changed(supabase, "contractors", CONTRACTOR_COLUMNS, state.get("contractors"))
+        print(f"  -> Incremental: {len(changed_ops)} opportunities and {len(changed_cons)} contractors changed since last run.")
+        if not changed_ops and not changed_cons:
+            print("  ✅ Nothing changed. Matches are up to date.")
+            return
+    
+    # Keyset pages in id order: nothing is lost to the PostgREST max-rows cap, and ties keep roster order.
+    # A changed contractor can enter any opportunity's Top N; changed opportunities only need themselves.
+    if incremental and (not changed_cons or not state.get("opportunities")):
+        opportunities = changed_ops
+    else:
+        opportunities = fetch_all(supabase, "opportunities", OPPORTUNITY_COLUMNS)
+    if snapshot:
+        contractors = refresh_snapshot(supabase)
+    elif incremental and not state.get("contractors"):
+        contractors = changed_cons # First run: every contractor counts as changed
+    else:
+        contractors = fetch_all(supabase, "contractors", CONTRACTOR_COLUMNS)
     
     if not opportunities or not contractors:
         print("⚠️ Not enough data in DB to run scoring matrix. Ensure contractors exist.")
         return
         
+    stored = {}
+    if incremental:
+        changed_op_ids = {op["id"] for op in changed_ops}
+        best_changed = changed_contractor_reach(opportunities, changed_cons, min_score)
+        reachable = changed_op_ids | set(best_changed) | fetch_matched_opportunities(supabase, [con["id"] for con in changed_cons])
+        stored = fetch_stored_matches(supabase, sorted(reachable))
+        opportunities = find_dirty_opportunities(opportunities, changed_op_ids, changed_cons, stored, top_n=10,
+                                                 min_score=min_score, best_changed=best_changed)
+        if not opportunities:
+            print("  ✅ No Top 10 can move. Matches are up to date.")
+            save_marks(state_file, state, changed_ops, changed_cons)
+            return
+        
     print(f"  -> Comparing {len(opportunities)} opportunities against {len(contractors)} contractors.")
     
-    match_payloads = []
+    if min_tier:
+        index = CandidateIndex.from_snapshot(contractors) if snapshot else CandidateIndex(contractors)
+        match_payloads = score_top_matches_indexed(opportunities, index, min_score, top_n=10)
+    else:
+        # Bitset engine: identical scores/tiers to the pair-by-pair loop, without walking every pair in Python
+        match_payloads = score_top_matches(opportunities, contractors, top_n=10,
+                                           blocks=encode_snapshot(contractors) if snapshot else None)
     
-    for op in opportunities:
-        op_id = op.get("id")
-        op_naics = op.get("naics_code")
-        op_setaside = op.get("set_aside_code")
-        op_state = op.get("place_of_performance_state")
-        
-        # Calculate days until deadline for feasibility score
-        deadline_score = 0.5 # Default fallback
-        # Real logic would parse `op.get("response_deadline")` and date-math here
-        
-        contractor_scores = []
-        
-        for con in contractors:
-            con_id = con.get("id")
-            
-            # Binary variables
-            naics_match = 1 if op_naics and con.get("naics_codes") and op_naics in con["naics_codes"] else 0
-            psc_match = 0 # Not fully implemented yet
-            setaside_match = 1 if op_setaside and con.get("certifications") and op_setaside in con["certifications"] else 0
-            geo_match = 1 if op_state and con.get("state") and op_state == con["state"] else 0
-            
-            # SOP Formula
-            score = (
-                (0.25 * naics_match) + 
-                (0.15 * psc_match) + 
-                (0.20 * setaside_match) + 
-                (0.15 * geo_match) + 
-                (0.15 * 0.5) +  # contract_value_fit fallback placeholder
-                (0.10 * deadline_score) 
-            )
-            
-            # Classification Tiering
-            if score >= 0.70:
-                classification = "HOT"
-            elif score >= 0.50:
-                classification = "WARM"
-            else:
-                classification = "COLD"
-                
-            contractor_scores.append({
-                "opportunity_id": op_id,
-                "contractor_id": con_id,
-                "score": round(score, 4),
-                "classification": classification,
-                "score_breakdown": {
-                    "naics_match": naics_match,
-                    "psc_match": psc_match,
-                    "setaside_match": setaside_match,
-                    "geo_match": geo_match,
-                    "contract_value_fit": 0.5,
-                    "deadline_feasibility": deadline_score
-                }
-            })
-            
-        # Top 10 Per Opportunity Constraint mapping
-        top_10 = sorted(contractor_scores, key=lambda x: x["score"], reverse=True)[:10]
-        match_payloads.extend(top_10)
-        
     print(f"  -> Generated {len(match_payloads)} match records across matrix.")
     
-    if match_payloads:
-        try:
-            # We assume deleting old matches for these exact op_ids first, or just upserting
-            # For simplicity of exact script logic, direct insert matching DB schema
-            supabase.table("matches").insert(match_payloads).execute()
-            print("  ✅ Successfully committed Top 10 matches per Opportunity to database.")
-        except Exception as e:
-            print(f"  ❌ DB Error Inserting Matches: {e}")
+    stale = []
+    if incremental:
+        match_payloads, stale = diff_matches(match_payloads, stored, scored_ids=[op["id"] for op in opportunities])
+        print(f"  -> {len(match_payloads)} rows changed score/classification, {len(stale)} dropped out of the Top 10.")
+    
+    try:
+        if match_payloads:
+            # Keyed on the pair so re-runs update in place instead of stacking duplicate rows
+            supabase.table("matches").upsert(match_payloads, on_conflict="opportunity_id,contractor_id").execute()
+        if stale:
+            delete_stale_matches(supabase, stale)
+        print("  ✅ Successfully committed Top 10 matches per Opportunity to database.")
+    except Exception as e:
+        print(f"  ❌ DB Error Upserting Matches: {e}")
+        return
+        
+    if incremental:
+        # Only advance the marks once the writes landed, so a failed run is retried next time. The snapshot's own
+        # mark is read after changed_cons: a contractor updated in between is in the roster but was never diffed
+        save_marks(state_file, state, changed_ops, changed_cons)
 
 if __name__ == "__main__":
-    score_matches()
+    parser = argparse.ArgumentParser(description="Deterministic SOP contractor matching")
+    parser.add_argument("--min-tier", choices=sorted(TIER_FLOORS), help="Only keep matches at or above this tier")
+    parser.add_argument("--incremental", action="store_true", help="Re-score only pairs touched since the last run")
+    parser.add_argument("--engine", choices=["python", "sql"], default="python", help="Rank in Python or inside Postgres (ranking_migration.sql)")
+    parser.add_argument("--snapshot", action="store_true", help="Score from the local memory-mapped roster snapshot")
+    args = parser.parse_args()
+    if args.engine == "sql" and args.incremental:
+        parser.error("--incremental is only supported by the python engine")
+    score_matches(min_tier=args.min_tier, incremental=args.incremental, engine=args.engine, snapshot=args.snapshot)
@@ -1,56 +1,28 @@
 import os
+import re
 import json
-from supabase import create_client, Client
-from google import genai
-from dotenv import load_dotenv
+import argparse
+from itertools import islice
+from clients import get_supabase
+from draft_pipeline import GeminiFlash, DRAFT_CONCURRENCY, draft_all, print_stats, fetch_by_ids, save_drafts
+from llm_cache import LLMCache, CACHE_PATH
+from repository import PAGE_SIZE, iter_rows
+from draft_rules import REPAIR_TEMPLATE_VERSION, QUALITY_LOG, repair_drafts, print_quality, record_quality
 
-load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-def generate_email_drafts():
-    """
-    Generates 3 email draft strategies for HOT matches using Gemini Flash, strictly adhering to constraints.
-    """
-    if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY, GEMINI_API_KEY]):
-        print("❌ Missing API keys in .env. Halting execution.")
-        return
+# Bump whenever build_prompt() / build_batch_prompt() change: cached drafts from older versions are dropped
+DRAFT_TEMPLATE_VERSION = "v3-1"
+BATCH_TEMPLATE_VERSION = "v3-batch-1"
+BATCH_MAX_CONTRACTORS = 10 # Contractors per batched request, keeping each response well inside the output limit
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-    gemini_client = genai.Client(api_key=GEMINI_API_KEY)
-    
-    print("🔄 Initializing Email Draft Engine for HOT Matches...")
-    
-    # 1. Fetch HOT Matches
-    # Note: In a production environment, you would use a joined view or GraphQL extension.
-    # For this deterministic script, we fetch the match, then join manually for strictly controlled payloads.
-    matches_res = supabase.table("matches").select("*").eq("classification", "HOT").limit(5).execute()
+def build_prompt(match, op_data, con_data) -> str:
+    score_breakdown = match.get("score_breakdown") or {}
     
-    if not matches_res.data:
-        print("⚠️ No 'HOT' matches found in the database. Run `2_score_matches.py` with eligible data first.")
-        return
-        
-    for match in matches_res.data:
-        op_id = match.get("opportunity_id")
-        con_id = match.get("contractor_id")
-        
-        # Fetch Opp details
-        op_res = supabase.table("opportunities").select("title, naics_code, response_deadline, agency, notice_type, set_aside_code").eq("id", op_id).execute()
-        if not op_res.data: continue
-        op_data = op_res.data[0]
-        
-        # Fetch Contractor details
-        con_res = supabase.table("contractors").select("company_name, certifications").eq("id", con_id).execute()
-        if not con_res.data: continue
-        con_data = con_res.data[0]
-        
-        score_breakdown = match.get("score_breakdown", {})
-        
-        print(f"\n📧 Generating drafts for: {con_data['company_name']} -> {op_data['title']}")
-        
-        # 2. Strict Prompt Construction according to V3 Master Prompt
-        prompt = f"""
+    # Strict Prompt Construction according to V3 Master Prompt
+    return f"""
         You are the Strategic Capture Intelligence Engine.
         Draft 3 email strategies for a B2G contractor regarding a federal opportunity.
         
@@ -71,25 +43,258 @@ def generate_email_drafts():
         Draft 2: Certification Leverage Angle (Focus heavily on their specific certifications matching the set-aside)
         Draft 3: Early Engagement Focus (Focus on this being an early Sources Sought or Presolicitation to shape the requirements)
         """
+
+def build_batch_prompt(op_data, entries) -> str:
+    """One request for several contractors on the same opportunity: the shared context is sent once."""
+    contractors = []
+    for ref, (match, _, con_data) in entries:
+        score_breakdown = match.get("score_breakdown") or {}
+        contractors.append({
+            "ref": ref,
+            "company_name": con_data["company_name"],
+            "certifications": con_data.get("certifications") or [],
+            "naics_match": score_breakdown.get("naics_match", 0),
+            "setaside_match": score_breakdown.get("setaside_match", 0),
+            "geo_match": score_breakdown.get("geo_match", 0),
+        })
+    
+    return f"""
+        You are the Strategic Capture Intelligence Engine.
+        For EACH contractor listed below, draft 3 email strategies regarding this federal opportunity.
+        
+        Opportunity: {op_data['title']} (Agency: {op_data['agency']})
+        Notice Type: {op_data['notice_type']}
+        Opportunity Set-Aside: {op_data['set_aside_code']}
+        NAICS Code: {op_data['naics_code']}
+        Response Deadline: {op_data['response_deadline']}
         
-        try:
-            response = gemini_client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt,
-            )
-            
-            drafts = response.text.split("---")
-            
-            print("========================================")
-            for i, draft in enumerate(drafts):
-                if draft.strip():
-                    print(f"** Strategy {i+1} **\n{draft.strip()}\n")
-            print("========================================\n")
-            
-            # In production, we'd save these to a 'communications' table or similar.
-            
-        except Exception as api_err:
-            print(f"❌ Failed to generate drafts via Gemini: {api_err}")
+        Contractors (JSON):
+        {json.dumps(contractors)}
+        
+        CRITICAL CONSTRAINTS (DO NOT VIOLATE), for every single email:
+        1. It MUST be under 180 words.
+        2. It MUST mention the specific NAICS code: {op_data['naics_code']}.
+        3. It MUST mention the Response Deadline: {op_data['response_deadline']}.
+        4. It MUST explicitly state why that contractor matched, using its naics_match, setaside_match and geo_match values.
+        
+        Strategies, in this order:
+        1: Standard Opportunity Alert (Direct, professional)
+        2: Certification Leverage Angle (Focus heavily on the contractor's certifications matching the set-aside)
+        3: Early Engagement Focus (Focus on this being an early Sources Sought or Presolicitation to shape the requirements)
+        
+        Respond with JSON only, one entry per contractor:
+        {{"drafts": [{{"ref": "<ref>", "strategies": ["<email 1>", "<email 2>", "<email 3>"]}}]}}
+        """
+
+def parse_batch(text, refs) -> dict:
+    """{ref: strategies} for every contractor the response covers (the repair loop checks them)."""
+    # JSON mode returns bare JSON, but tolerate a fenced block
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", text, re.S)
+    try:
+        payload = json.loads(fenced.group(1) if fenced else text)
+    except (json.JSONDecodeError, TypeError):
+        return {}
+    drafted = {}
+    for entry in payload.get("drafts", []) if isinstance(payload, dict) else []:
+        if not isinstance(entry, dict) or entry.get("ref") not in refs:
+            continue
+        strategies = [s.strip() for s in entry.get("strategies") or [] if isinstance(s, str) and s.strip()]
+        if strategies:
+            drafted[entry["ref"]] = strategies
+    return drafted
+
+def draft_context(match, op_data, con_data) -> dict:
+    # What the repair loop and the drafts payload need to know about a match
+    return {"match_id": match["id"], "opp_title": op_data["title"], "cont_name": con_data["company_name"],
+            "naics_code": op_data["naics_code"], "response_deadline": op_data["response_deadline"]}
+
+def draft_batched(entries, provider, concurrency, llm_cache):
+    """
+    Drafts matches grouped by opportunity, up to BATCH_MAX_CONTRACTORS per request. Returns
+    (results, stats, leftovers): leftovers are the entries the response left out, for the
+    per-match path to draft.
+    """
+    groups = {}
+    for entry in entries:
+        groups.setdefault(entry[0]["opportunity_id"], []).append(entry)
+    
+    jobs = []
+    for opp_id, group in groups.items():
+        for start in range(0, len(group), BATCH_MAX_CONTRACTORS):
+            chunk = [(f"c{i + 1}", entry) for i, entry in enumerate(group[start:start + BATCH_MAX_CONTRACTORS])]
+            jobs.append({"entries": chunk, "prompt": build_batch_prompt(chunk[0][1][1], chunk)})
+    
+    print(f"  -> Batched: {len(entries)} matches across {len(groups)} opportunities in {len(jobs)} requests...")
+    cache = LLMCache("email_drafts_batch", BATCH_TEMPLATE_VERSION, db_path=llm_cache) if llm_cache else None
+    batches, stats = draft_all(jobs, provider, concurrency=concurrency, cache=cache)
+    print_stats(provider, stats)
+    if cache is not None:
+        cache.print_report()
+        cache.close()
+    
+    results, leftovers = [], []
+    for batch in batches:
+        drafted = parse_batch(batch["text"], {ref for ref, _ in batch["entries"]}) if batch["text"] else {}
+        # The request's tokens are attributed evenly across the drafts it produced
+        share = batch["tokens"] // max(1, len(drafted))
+        source = ("email_drafts_batch", BATCH_TEMPLATE_VERSION, provider.cache_key(batch["prompt"]))
+        for ref, entry in batch["entries"]:
+            if ref not in drafted:
+                leftovers.append(entry)
+                continue
+            results.append(dict(draft_context(*entry), text="\n---\n".join(drafted[ref]), tokens=share, source=source))
+    return results, stats, leftovers
+
+def draft_per_match(entries, provider, concurrency, llm_cache):
+    jobs = []
+    for match, op_data, con_data in entries:
+        prompt = build_prompt(match, op_data, con_data)
+        jobs.append(dict(draft_context(match, op_data, con_data), prompt=prompt,
+                         source=("email_drafts", DRAFT_TEMPLATE_VERSION, provider.cache_key(prompt))))
+    
+    print(f"  -> Drafting {len(jobs)} matches ({concurrency} concurrent)...")
+    cache = LLMCache("email_drafts", DRAFT_TEMPLATE_VERSION, db_path=llm_cache) if llm_cache else None
+    results, stats = draft_all(jobs, provider, concurrency=concurrency, cache=cache)
+    print_stats(provider, stats)
+    if cache is not None:
+        cache.print_report()
+        cache.close()
+    return results, stats
+
+MATCH_COLUMNS = "id, opportunity_id, contractor_id, score_breakdown"
+OPPORTUNITY_COLUMNS = "title, naics_code, response_deadline, agency, notice_type, set_aside_code"
+CONTRACTOR_COLUMNS = "company_name, certifications"
+QUALITY_COUNTS = ("drafts", "emails", "first_pass", "repaired", "failed", "repair_requests", "repair_tokens")
+
+def draft_matches(matches, supabase, provider, concurrency, llm_cache, batched):
+    """Drafts, validates and saves one page of HOT matches. Returns (drafts_payload, quality stats)."""
+    opps = fetch_by_ids(supabase, "opportunities", OPPORTUNITY_COLUMNS, [m.get("opportunity_id") for m in matches])
+    contractors = fetch_by_ids(supabase, "contractors", CONTRACTOR_COLUMNS, [m.get("contractor_id") for m in matches])
+    
+    entries = []
+    for match in matches:
+        op_data = opps.get(match.get("opportunity_id"))
+        con_data = contractors.get(match.get("contractor_id"))
+        if not op_data or not con_data: continue
+        entries.append((match, op_data, con_data))
+    
+    # 2. Draft every match concurrently
+    results = []
+    if batched:
+        # JSON mode for the batched requests (and their own cache entries, via the parameters)
+        results, _, entries = draft_batched(entries, provider.with_params(**provider.json_params), concurrency, llm_cache)
+        if entries:
+            print(f"  ⚠️ {len(entries)} matches missing or invalid in their batch. Drafting them one by one.")
+    if entries:
+        per_match, _ = draft_per_match(entries, provider, concurrency, llm_cache)
+        results.extend(per_match)
+    
+    # 3. Validate against the SOP constraints and repair only the failing emails
+    repair_cache = LLMCache("draft_repair", REPAIR_TEMPLATE_VERSION, db_path=llm_cache) if llm_cache else None
+    results, quality = repair_drafts(results, provider, concurrency=concurrency, cache=repair_cache)
+    if repair_cache is not None:
+        repair_cache.close()
+    
+    drafts_payload = []
+    rejected = {}
+    for result in results:
+        if result["text"] is None:
+            print(f"❌ Failed to generate drafts via Gemini for {result['cont_name']}: {result['error']}")
+            continue
+        if not result["valid"]:
+            print(f"❌ Drafts for {result['cont_name']} still break the SOP after repair, not saved: {result['violations']}")
+            template, version, key = result["source"]
+            rejected.setdefault((template, version), set()).add(key)
+            continue
+        
+        drafts = result["text"].split("---")
+        
+        print(f"\n📧 Drafts for: {result['cont_name']} -> {result['opp_title']}")
+        print("========================================")
+        for i, draft in enumerate(drafts):
+            if draft.strip():
+                print(f"** Strategy {i+1} **\n{draft.strip()}\n")
+        print("========================================\n")
+        
+        # One active draft per match: the three strategies stay together, separated by '---'
+        drafts_payload.append({
+            "match_id": result["match_id"],
+            "recipient_name": result["cont_name"],
+            "subject_line": f"Opportunity Alert: {result['opp_title']}",
+            "email_body": result["text"].strip(),
+            "ai_model_used": provider.model,
+            "tokens_consumed": result["tokens"]
+        })
+    
+    # A rejected completion must not be served from cache again: the next run drafts it afresh
+    for (template, version), keys in rejected.items():
+        if llm_cache:
+            cache = LLMCache(template, version, db_path=llm_cache)
+            cache.discard(keys)
+            cache.close()
+    
+    # 4. Save the page's drafts in one bulk write
+    if drafts_payload:
+        saved = save_drafts(supabase, drafts_payload)
+        print(f"✅ {saved} draft sets saved to outreach_drafts.")
+    return drafts_payload, quality
+
+def generate_email_drafts(limit=5, concurrency=DRAFT_CONCURRENCY, supabase=None, provider=None, llm_cache=CACHE_PATH,
+                          batched=False, quality_log=QUALITY_LOG, page_size=PAGE_SIZE):
+    """
+    Generates 3 email draft strategies for HOT matches using Gemini Flash, strictly adhering to constraints.
+    HOT matches stream in keyset pages of `page_size` (all of them when `limit` is None); each page
+    is drafted concurrently, with opportunity and contractor details fetched in bulk, and saved
+    before the next page is read.
+    `batched` drafts all HOT contractors of an opportunity in one JSON request (any the batch
+    leaves out fall back to a per-match request).
+    Every email is then validated against the SOP constraints; only failing emails are regenerated,
+    and drafts still failing after DRAFT_REPAIR_ROUNDS are not saved. Pass/fail counts are
+    appended to `quality_log` (None to skip).
+    Completions are cached in `llm_cache` (":memory:" for a throwaway cache, None to disable).
+    """
+    if supabase is None or provider is None:
+        if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY, GEMINI_API_KEY]):
+            print("❌ Missing API keys in .env. Halting execution.")
+            return
+    supabase = supabase or get_supabase()
+    provider = provider or GeminiFlash(GEMINI_API_KEY)
+    
+    print("🔄 Initializing Email Draft Engine for HOT Matches...")
+    
+    # 1. Stream HOT Matches
+    # Note: In a production environment, you would use a joined view or GraphQL extension.
+    # For this deterministic script, we page through the matches, then join manually (two bulk lookups per page) for strictly controlled payloads.
+    hot = iter_rows(supabase, "matches", MATCH_COLUMNS, where=lambda q: q.eq("classification", "HOT"),
+                    page_size=page_size, limit=limit)
+    drafts_payload = []
+    quality = dict.fromkeys(QUALITY_COUNTS + ("rounds",), 0)
+    pages = 0
+    while True:
+        page = list(islice(hot, page_size))
+        if not page:
+            break
+        pages += 1
+        drafted, page_quality = draft_matches(page, supabase, provider, concurrency, llm_cache, batched)
+        drafts_payload.extend(drafted)
+        for field in QUALITY_COUNTS:
+            quality[field] += page_quality[field]
+        quality["rounds"] = max(quality["rounds"], page_quality["rounds"])
+    
+    if not pages:
+        print("⚠️ No 'HOT' matches found in the database. Run `2_score_matches.py` with eligible data first.")
+        return
+    print_quality(quality)
+    if quality_log:
+        record_quality(quality, quality_log)
+    return drafts_payload
 
 if __name__ == "__main__":
-    generate_email_drafts()
+    parser = argparse.ArgumentParser(description="Generate email drafts for HOT matches")
+    parser.add_argument("--limit", type=int, default=5, help="HOT matches to draft (0 for all of them)")
+    parser.add_argument("--concurrency", type=int, default=DRAFT_CONCURRENCY, help="Gemini requests in flight")
+    parser.add_argument("--no-cache", action="store_true", help="Re-draft even when a cached completion exists")
+    parser.add_argument("--batched", action="store_true", help="One request per opportunity for all its HOT contractors")
+    args = parser.parse_args()
+    generate_email_drafts(limit=args.limit or None, concurrency=args.concurrency, llm_cache=None if args.no_cache else CACHE_PATH,
+                          batched=args.batched)
@@ -1,20 +1,20 @@
 import os
-from supabase import create_client, Client
-from dotenv import load_dotenv
+import argparse
+from clients import get_supabase
 
-load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 
-def ingest_outcome_feedback(opportunity_id, contractor_id, won, loss_reason=None, hours_spent=0.0):
+def ingest_outcome_feedback(opportunity_id, contractor_id, won, loss_reason=None, hours_spent=0.0, supabase=None):
     """
     Deterministically logs the outcome of a pursuit so the engine learns.
+    Pass `supabase` to reuse an existing client (e.g. the engine server's warm one).
     """
     if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
         print("❌ Missing API keys in .env. Halting execution.")
         return
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    supabase = supabase or get_supabase()
     
     payload = {
         "opportunity_id": opportunity_id,
@@ -32,4 +32,13 @@ def ingest_outcome_feedback(opportunity_id, contractor_id, won, loss_reason=None
         print(f"❌ Error logging outcome: {e}")
 
 if __name__ == "__main__":
-    print("This is a module meant to be imported by the routing engine, not run directly.")
+    parser = argparse.ArgumentParser(description="Log the outcome of a pursuit")
+    parser.add_argument("opportunity_id", help="Opportunity the bid was for")
+    parser.add_argument("contractor_id", help="Contractor that bid")
+    result = parser.add_mutually_exclusive_group(required=True)
+    result.add_argument("--won", action="store_true", help="The bid was won")
+    result.add_argument("--lost", action="store_true", help="The bid was lost")
+    parser.add_argument("--loss-reason", help="Why the bid was lost")
+    parser.add_argument("--hours", type=float, default=0.0, help="Hours spent on the bid")
+    args = parser.parse_args()
+    ingest_outcome_feedback(args.opportunity_id, args.contractor_id, args.won, loss_reason=args.loss_reason, hours_spent=args.hours)
@@ -0,0 +1,109 @@
+"""
+Agency resolution cache for the sync pipelines.
+
+The `agencies` table is a small, append-only dimension keyed on (department, sub_tier, office),
+so instead of a select (and, on a miss, an upsert) per opportunity we keep the whole table in
+memory, resolve a page of records in one pass, and bulk-upsert only the triples we have never
+seen. The cache is snapshotted to .tmp/ with a version stamp (format, source project, and the
+table's row count and highest id as read when the cache was filled), so a cold start only has
+to confirm those two before trusting it. The stamp is the table's, not the cache's: rows whose
+NULL and "" parts collapse to one key would otherwise never match it.
+"""
+from run_state import load_state, save_state, client_source
+
+SNAPSHOT_FILE = "agency_cache.json"
+SNAPSHOT_FORMAT = 2
+PAGE_SIZE = 1000 # PostgREST db-max-rows default
+UNKNOWN_DEPARTMENT = "Unknown Department"
+
+def agency_key(department, subtier, office) -> tuple:
+    # Same normalization the per-record lookup used, so cached keys line up with stored rows
+    return (department or UNKNOWN_DEPARTMENT, subtier or "", office or "")
+
+class AgencyCache:
+    """Pass snapshot_file=None for a cache that never touches .tmp/ (tests, benchmarks)."""
+    def __init__(self, supabase, snapshot_file=SNAPSHOT_FILE):
+        self.supabase = supabase
+        self.snapshot_file = snapshot_file
+        self.ids = {}
+        self.remote = {} # {"rows", "max_id"} of the table this cache reflects
+        self.dirty = False
+        self.stats = {"hits": 0, "misses": 0, "upserted": 0, "round_trips": 0}
+
+    def _source(self) -> str:
+        return client_source(self.supabase)
+
+    def _remote_stamp(self) -> dict:
+        """Row count and highest id, in one round trip."""
+        self.stats["round_trips"] += 1
+        res = self.supabase.table("agencies").select("id", count="exact").order("id", desc=True).limit(1).execute()
+        return {"rows": res.count, "max_id": res.data[0]["id"] if res.data else None}
+
+    def _download(self):
+        ids, start = {}, 0
+        while True:
+            self.stats["round_trips"] += 1
+            res = self.supabase.table("agencies").select("id, department, sub_tier, office") \
+                .order("id").range(start, start + PAGE_SIZE - 1).execute()
+            for row in res.data:
+                ids[agency_key(row.get("department"), row.get("sub_tier"), row.get("office"))] = row["id"]
+            if len(res.data) < PAGE_SIZE:
+                return ids
+            start += PAGE_SIZE
+
+    def load(self):
+        """Preloads from the local snapshot when its stamp still matches the table, else from the DB."""
+        snapshot = load_state(self.snapshot_file) if self.snapshot_file else {}
+        stamp = snapshot.get("version", {})
+        # Read before any rows are: a row added during the download makes the next load re-download
+        self.remote = self._remote_stamp()
+        if (stamp.get("format") == SNAPSHOT_FORMAT and stamp.get("source") == self._source()
+                and self.remote["rows"] is not None and stamp.get("remote") == self.remote):
+            self.ids = {tuple(k.split("|", 2)): v for k, v in snapshot.get("agencies", {}).items()}
+            print(f"  -> Agency cache: {len(self.ids)} agencies from local snapshot.")
+        else:
+            self.ids = self._download()
+            self.dirty = True
+            print(f"  -> Agency cache: downloaded {len(self.ids)} agencies.")
+        return self
+
+    def save(self):
+        if not self.dirty or not self.snapshot_file:
+            return
+        save_state(self.snapshot_file, {
+            "version": {"format": SNAPSHOT_FORMAT, "source": self._source(), "remote": self.remote},
+            "agencies": {"|".join(k): v for k, v in self.ids.items()}
+        })
+        self.dirty = False
+
+    def resolve_many(self, triples) -> dict:
+        """
+        Maps every (department, sub_tier, office) triple to an agency id, bulk-upserting any
+        unseen ones in a single call. Returns {agency_key: id}; unresolvable keys map to None.
+        """
+        keys = {agency_key(*t) for t in triples}
+        missing = [k for k in keys if k not in self.ids]
+        self.stats["hits"] += len(keys) - len(missing)
+        self.stats["misses"] += len(missing)
+        if missing:
+            payload = [{"department": d, "sub_tier": s, "office": o} for d, s, o in sorted(missing)]
+            try:
+                self.stats["round_trips"] += 1
+                res = self.supabase.table("agencies").upsert(payload, on_conflict="department,sub_tier,office").execute()
+                known = set(self.ids.values())
+                for row in res.data or []:
+                    self.ids[agency_key(row.get("department"), row.get("sub_tier"), row.get("office"))] = row["id"]
+                    if row["id"] not in known and self.remote.get("rows") is not None:
+                        # Our own inserts move the table's stamp; anyone else's still invalidate it
+                        known.add(row["id"])
+                        self.remote["rows"] += 1
+                        self.remote["max_id"] = max(filter(None, (self.remote["max_id"], row["id"])))
+                self.stats["upserted"] += len(res.data or [])
+                self.dirty = True
+            except Exception as e:
+                print(f"Error upserting {len(payload)} agencies: {e}")
+        return {k: self.ids.get(k) for k in keys}
+
+    def resolve(self, department, subtier, office):
+        key = agency_key(department, subtier, office)
+        return self.resolve_many([key])[key]
@@ -0,0 +1,287 @@
+"""
+Resumable SAM.gov backfills: date-window shards fetched in parallel, checkpointed in SQLite.
+
+A backfill range is covered by fixed windows of `shard_days` days counted from a fixed epoch
+(whole ISO weeks by default), and every (ptype, window) pair is a shard. Shards are independent, so a pool of workers pages several at once (all sharing the
+fetcher's token bucket). Each page is a unit, (ptype, window, offset), and is recorded in
+.tmp/backfill_checkpoints.sqlite3 only after its rows have landed in Supabase (BulkWriter
+`then=store.landed(...)`); a page with any dead-lettered row stays missing and is fetched again. A shard is complete once its last offset is known and every unit up to it is recorded.
+
+Re-running the same backfill after a crash, a Ctrl-C or an exhausted SAM.gov quota skips the
+complete shards without a request and, inside a partial shard, fetches only the missing offsets.
+Windows do not move with the run date, so re-running tomorrow (after the daily quota reset) maps
+to the same shards. The window containing today is still filling up: it is never complete and is
+re-fetched from scratch on every run.
+
+Usage: python tools/backfill.py {opportunities,contractors} DAYS [--shard-days N] [--workers N]
+       python tools/backfill.py status | reset [SOURCE]
+"""
+import os
+import queue
+import sqlite3
+import argparse
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta, timezone
+from run_state import STATE_DIR
+
+CHECKPOINT_PATH = os.path.join(STATE_DIR, "backfill_checkpoints.sqlite3")
+BACKFILL_SHARD_DAYS = int(os.getenv("BACKFILL_SHARD_DAYS", "7"))
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", "4"))
+
+# `source` names the dataset and the project it is written to (opportunities@<host>)
+Shard = namedtuple("Shard", "source ptype window_from window_to limit")
+
+def date_windows(start: date, end: date, shard_days=BACKFILL_SHARD_DAYS) -> list:
+    """
+    [(first_day, last_day)] of the epoch-aligned `shard_days`-day windows that cover start..end.
+    Windows are numbered from date.min, so 7-day windows are Monday-Sunday weeks; the first and
+    last may reach past start / end.
+    """
+    windows = []
+    index = (start.toordinal() - 1) // shard_days
+    while index * shard_days + 1 <= end.toordinal():
+        first = index * shard_days + 1
+        windows.append((date.fromordinal(first), date.fromordinal(first + shard_days - 1)))
+        index += 1
+    return windows
+
+def backfill_shards(source, ptypes, days_back, limit, shard_days=BACKFILL_SHARD_DAYS, today=None) -> list:
+    """Every (ptype, window) shard covering the last `days_back` days."""
+    today = today or date.today()
+    return [Shard(source, ptype, first.isoformat(), last.isoformat(), limit)
+            for first, last in date_windows(today - timedelta(days=days_back), today, shard_days) for ptype in ptypes]
+
+def is_open(shard, today=None) -> bool:
+    """The shard's window has not ended yet, so SAM.gov can still add records to it."""
+    return shard.window_to >= (today or date.today()).isoformat()
+
+# ==========================================
+# 1. Checkpoint Store
+# ==========================================
+class CheckpointStore:
+    """Pass db_path=":memory:" for a throwaway store that never touches .tmp/ (tests)."""
+    def __init__(self, db_path=CHECKPOINT_PATH):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS shards (
+            source TEXT NOT NULL, ptype TEXT NOT NULL, window_from TEXT NOT NULL, window_to TEXT NOT NULL,
+            page_limit INTEGER NOT NULL, end_offset INTEGER,
+            PRIMARY KEY (source, ptype, window_from, window_to))""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS units (
+            source TEXT NOT NULL, ptype TEXT NOT NULL, window_from TEXT NOT NULL, window_to TEXT NOT NULL,
+            page_offset INTEGER NOT NULL, records INTEGER NOT NULL, completed_at TEXT NOT NULL,
+            PRIMARY KEY (source, ptype, window_from, window_to, page_offset))""")
+        self.conn.commit()
+
+    @staticmethod
+    def _key(shard) -> tuple:
+        return (shard.source, shard.ptype, shard.window_from, shard.window_to)
+
+    def progress(self, shard) -> tuple:
+        """(end_offset or None, {completed offsets}). Units paged with a different limit do not line up and are dropped."""
+        with self.lock:
+            row = self.conn.execute("SELECT page_limit, end_offset FROM shards WHERE source = ? AND ptype = ? "
+                                    "AND window_from = ? AND window_to = ?", self._key(shard)).fetchone()
+            if row and row[0] != shard.limit:
+                self.conn.execute("DELETE FROM units WHERE source = ? AND ptype = ? AND window_from = ? AND window_to = ?",
+                                  self._key(shard))
+                row = None
+            self.conn.execute("INSERT INTO shards VALUES (?, ?, ?, ?, ?, NULL) "
+                              "ON CONFLICT (source, ptype, window_from, window_to) DO UPDATE SET "
+                              "page_limit = excluded.page_limit, end_offset = CASE WHEN shards.page_limit = "
+                              "excluded.page_limit THEN shards.end_offset END", (*self._key(shard), shard.limit))
+            self.conn.commit()
+            done = {offset for (offset,) in self.conn.execute(
+                "SELECT page_offset FROM units WHERE source = ? AND ptype = ? AND window_from = ? AND window_to = ?",
+                self._key(shard))}
+        return (row[1] if row else None), done
+
+    def is_complete(self, shard) -> bool:
+        end_offset, done = self.progress(shard)
+        return end_offset is not None and all(offset in done for offset in range(0, end_offset, shard.limit))
+
+    def forget(self, shard):
+        with self.lock:
+            self.conn.execute("UPDATE shards SET end_offset = NULL WHERE source = ? AND ptype = ? AND window_from = ? "
+                              "AND window_to = ?", self._key(shard))
+            self.conn.execute("DELETE FROM units WHERE source = ? AND ptype = ? AND window_from = ? AND window_to = ?",
+                              self._key(shard))
+            self.conn.commit()
+
+    def set_end(self, shard, end_offset: int):
+        with self.lock:
+            self.conn.execute("UPDATE shards SET end_offset = ? WHERE source = ? AND ptype = ? AND window_from = ? "
+                              "AND window_to = ?", (end_offset, *self._key(shard)))
+            self.conn.commit()
+
+    def complete(self, shard, offset: int, records: int):
+        """Records a unit whose rows have landed. Idempotent."""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?, ?, ?, ?)",
+                              (*self._key(shard), offset, records, datetime.now(timezone.utc).isoformat()))
+            self.conn.commit()
+
+    def landed(self, shard, offset: int, records: int):
+        """A BulkWriter `then=` callback that completes the unit only if every row was written."""
+        def then(written):
+            if written:
+                self.complete(shard, offset, records)
+        return then
+
+    def summary(self) -> list:
+        """[(source, shards, complete shards, units, records)] per source."""
+        with self.lock:
+            rows = self.conn.execute("""
+                SELECT s.source, s.ptype, s.window_from, s.window_to, s.page_limit, s.end_offset,
+                       COUNT(u.page_offset), COALESCE(SUM(u.records), 0)
+                FROM shards s LEFT JOIN units u USING (source, ptype, window_from, window_to)
+                GROUP BY s.source, s.ptype, s.window_from, s.window_to ORDER BY s.source""").fetchall()
+        totals = {}
+        for source, _, _, _, limit, end_offset, units, records in rows:
+            entry = totals.setdefault(source, [source, 0, 0, 0, 0])
+            entry[1] += 1
+            entry[2] += end_offset is not None and units >= -(-end_offset // limit)
+            entry[3] += units
+            entry[4] += records
+        return [tuple(entry) for entry in totals.values()]
+
+    def reset(self, source=None) -> int:
+        """Forgets every shard (of `source`, when given). Returns the shards dropped."""
+        where, args = ("WHERE source = ?", (source,)) if source else ("", ())
+        with self.lock:
+            dropped = self.conn.execute(f"DELETE FROM shards {where}", args).rowcount
+            self.conn.execute(f"DELETE FROM units {where}", args)
+            self.conn.commit()
+        return dropped
+
+    def close(self):
+        self.conn.close()
+
+# ==========================================
+# 2. Parallel Shard Pager
+# ==========================================
+def _page_shard(shard, fetch, store, out: queue.Queue, stop: threading.Event):
+    """Pages one shard from offset 0, skipping units already recorded; stops at the known or discovered end."""
+    end_offset, done = store.progress(shard)
+    offset = 0
+    while not stop.is_set() and (end_offset is None or offset < end_offset):
+        if offset in done:
+            offset += shard.limit
+            continue
+        records, total = fetch(shard, offset)
+        if total is not None and end_offset is None:
+            end_offset = -(-int(total) // shard.limit) * shard.limit
+            store.set_end(shard, end_offset)
+        if records:
+            out.put(("page", shard, offset, records))
+        if not records or len(records) < shard.limit:
+            store.set_end(shard, offset + shard.limit if records else offset)
+            return
+        offset += shard.limit
+
+def _work(shards: queue.Queue, fetch, store, out: queue.Queue, stop: threading.Event):
+    from sam_fetcher import QuotaExhausted
+    while not stop.is_set():
+        try:
+            shard = shards.get_nowait()
+        except queue.Empty:
+            break
+        try:
+            _page_shard(shard, fetch, store, out, stop)
+        except QuotaExhausted as e:
+            stop.set() # Every other shard would hit the same wall; resume once the quota resets
+            out.put(("error", shard, None, e))
+        except Exception as e:
+            out.put(("error", shard, None, e))
+    out.put(("done", None, None, None))
+
+def iter_shard_pages(shards, fetch, store: CheckpointStore, workers=BACKFILL_WORKERS, prefetch=2, today=None):
+    """
+    Yields (shard, offset, records) for every page of every incomplete shard, `workers` shards at
+    a time. `fetch(shard, offset)` returns (records, total records or None). The caller records
+    each unit by writing the page with `then=store.landed(shard, offset, n)`. A shard that fails
+    is reported and stays incomplete for the next run. Open shards (window not over by `today`)
+    are always fetched in full: new records shift their offsets.
+    """
+    pending = queue.Queue()
+    skipped = 0
+    for shard in shards:
+        if is_open(shard, today):
+            store.forget(shard)
+            pending.put(shard)
+        elif store.is_complete(shard):
+            skipped += 1
+        else:
+            pending.put(shard)
+    print(f"  -> Backfill shards: {len(shards)} total, {skipped} already complete, {pending.qsize()} to fetch.")
+    if pending.empty():
+        return
+    workers = max(1, min(workers, pending.qsize()))
+    out = queue.Queue(maxsize=prefetch * workers)
+    stop = threading.Event()
+    for _ in range(workers):
+        threading.Thread(target=_work, args=(pending, fetch, store, out, stop), daemon=True).start()
+
+    from sam_fetcher import QuotaExhausted
+    remaining = workers
+    exhausted = False
+    try:
+        while remaining:
+            kind, shard, offset, payload = out.get()
+            if kind == "page":
+                yield shard, offset, payload
+            elif kind == "error":
+                exhausted = exhausted or isinstance(payload, QuotaExhausted)
+                print(f"     ❌ Shard {shard.ptype or '-'} {shard.window_from}..{shard.window_to} stopped: {payload}")
+            else:
+                remaining -= 1
+    finally:
+        # The caller stopped early: let each worker finish its request and exit instead of blocking on the queue
+        stop.set()
+        while remaining:
+            remaining -= out.get()[0] == "done"
+    if exhausted:
+        print("  ⚠️ SAM.gov quota exhausted. Re-run the same backfill once it resets to fetch only the missing shards.")
+
+# ==========================================
+# 3. CLI
+# ==========================================
+def print_status(store: CheckpointStore):
+    rows = store.summary()
+    if not rows:
+        print("📭 No backfill checkpoints recorded.")
+        return
+    print("📊 Backfill checkpoints:")
+    for source, shards, complete, units, records in rows:
+        print(f"  -> {source:<40} {complete}/{shards} shards complete, {units} pages, {records:,} records")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resumable, sharded SAM.gov backfill")
+    parser.add_argument("target", choices=["opportunities", "contractors", "status", "reset"])
+    parser.add_argument("days", nargs="?", help="Days back to backfill (for reset: the source to forget)")
+    parser.add_argument("--shard-days", type=int, default=BACKFILL_SHARD_DAYS, help="Days per date-window shard")
+    parser.add_argument("--workers", type=int, default=BACKFILL_WORKERS, help="Shards fetched in parallel")
+    args = parser.parse_args()
+
+    store = CheckpointStore()
+    if args.target == "status":
+        print_status(store)
+    elif args.target == "reset":
+        print(f"🧹 Forgot {store.reset(args.days)} shard(s).")
+    else:
+        if not args.days or not args.days.isdigit():
+            parser.error(f"{args.target} needs DAYS, the number of days back to backfill")
+        if args.target == "opportunities":
+            import importlib
+            importlib.import_module("1_ingest_sam").ingest_sam_opportunities(
+                int(args.days), shard_days=args.shard_days, workers=args.workers, checkpoints=store)
+        else:
+            from cron_daily_sync import sync_contractors
+            sync_contractors(int(args.days), shard_days=args.shard_days, workers=args.workers, checkpoints=store)
+        print_status(store)
+    store.close()
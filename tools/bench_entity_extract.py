@@ -0,0 +1,48 @@
+import os
+import sys
+import time
+from entity_extract import iter_entity_chunks, CHUNK_BYTES
+from test_entity_extract import write_synthetic_extract, legacy_parse
+
+# ==========================================
+# Benchmark: entity extract parse throughput
+# ==========================================
+# Usage: python tools/bench_entity_extract.py [entities] [workers]
+# Reports MB/s for a raw sequential read (the disk ceiling), the legacy line-by-line parse,
+# and the memory-mapped reader serially and fanned out to worker processes.
+
+def raw_read(path):
+    with open(path, "rb") as f:
+        while f.read(CHUNK_BYTES):
+            pass
+
+def mmap_parse(path, workers):
+    return sum(len(records) for records in iter_entity_chunks(path, workers=workers))
+
+def run_benchmark(n_entities=300_000, workers=None):
+    workers = workers or os.cpu_count() or 1
+    tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    path = os.path.join(tmp_dir, f"bench_entities_{n_entities}.dat")
+    if not os.path.exists(path):
+        print(f"  -> Generating {n_entities:,} entities...")
+        write_synthetic_extract(path, n_entities)
+    size_mb = os.path.getsize(path) / 1e6
+    print(f"  -> Extract: {size_mb:.0f} MB")
+
+    cases = [("raw read", lambda: raw_read(path)),
+             ("legacy", lambda: len(legacy_parse(path))),
+             ("mmap x1", lambda: mmap_parse(path, 1))]
+    if workers > 1:
+        cases.append((f"mmap x{workers}", lambda: mmap_parse(path, workers)))
+
+    for name, fn in cases:
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        print(f"  -> {name:<10} {elapsed:7.2f}s  {size_mb / elapsed:8.1f} MB/s")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    w = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    run_benchmark(n, w)
@@ -0,0 +1,99 @@
+import os
+import csv
+import sys
+import json
+import time
+import resource
+import subprocess
+from memory_supabase import MemorySupabase, MemoryResponse
+from test_ingest_csv import write_synthetic_csv, lookup_tables
+
+# ==========================================
+# Benchmark: streaming single-pass CSV ingest
+# ==========================================
+# Usage: python tools/bench_ingest_csv.py [rows] [latency_ms]
+# Compares the old two-pass flow (scan for lookups, upsert them, re-read and write serially) with
+# the streaming pipeline, each in its own process so peak RSS is measured independently. Writes go
+# to an in-memory client that sleeps `latency_ms` per call to stand in for PostgREST round trips.
+
+class SinkSupabase(MemorySupabase):
+    """Keeps lookup tables, counts (and drops) bulk rows, and charges a fixed latency per call."""
+    DISCARD = ("opportunities", "contacts")
+
+    def __init__(self, tables, latency):
+        super().__init__(tables)
+        self.latency = latency
+        self.rows_written = 0
+
+    def _execute(self, query):
+        time.sleep(self.latency)
+        if query._table in self.DISCARD:
+            self.rows_written += len(query._payload or [])
+            return MemoryResponse([])
+        return super()._execute(query)
+
+def legacy_two_pass(path, client):
+    from ingest_csv import LookupCache, iter_batches, row_agency, dedupe_contacts
+    # Pass 1: scan the whole file for lookups and upsert them up front
+    agencies, naics, psc = set(), set(), set()
+    with open(path, mode='r', encoding='latin-1', errors='replace') as f:
+        for row in csv.DictReader(f):
+            if row_agency(row): agencies.add(row_agency(row))
+            if row.get("NaicsCode", "").strip(): naics.add(row["NaicsCode"].strip())
+            if row.get("ClassificationCode", "").strip(): psc.add(row["ClassificationCode"].strip())
+    lookups = LookupCache(client, agency_snapshot=None, change_index=":memory:")
+    lookups.agencies.resolve_many(agencies)
+    lookups._ensure_codes("naics_codes", naics)
+    lookups._ensure_codes("psc_codes", psc)
+    # Pass 2: re-read, normalize and write serially, one batch at a time
+    opp_types = {t['name']: t['id'] for t in client.table('opportunity_types').select('id, name').execute().data}
+    set_asides = {s['code']: s['id'] for s in client.table('set_asides').select('id, code').execute().data}
+    total = 0
+    for batch in iter_batches(path, opp_types, set_asides):
+        lookups.prepare(batch)
+        client.table("opportunities").upsert(batch["ops"], on_conflict="notice_id").execute()
+        client.table("contacts").upsert(dedupe_contacts(batch["contacts"]), on_conflict="notice_id, email, fullname").execute()
+        total += len(batch["ops"])
+    return total
+
+def run_mode(mode, path, latency):
+    from ingest_csv import ingest_csv
+    client = SinkSupabase(lookup_tables(), latency)
+    t0 = time.perf_counter()
+    if mode == "legacy":
+        total = legacy_two_pass(path, client)
+    else:
+        total = ingest_csv(path, supabase=client, agency_snapshot=None, change_index=":memory:")
+    elapsed = time.perf_counter() - t0
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return {"mode": mode, "rows": total, "elapsed": elapsed, "peak_mb": peak_mb}
+
+def run_benchmark(n_rows=2_000_000, latency_ms=5.0):
+    tmp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    results = []
+    for rows in sorted({n_rows // 10, n_rows}):
+        path = os.path.join(tmp_dir, f"bench_opps_{rows}.csv")
+        if not os.path.exists(path):
+            print(f"  -> Generating {rows:,} rows...")
+            write_synthetic_csv(path, rows)
+        size_mb = os.path.getsize(path) / 1e6
+        for mode in ("legacy", "streaming"):
+            out = subprocess.run([sys.executable, __file__, "--child", mode, path, str(latency_ms / 1000)],
+                                 capture_output=True, text=True, check=True)
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            results.append(result)
+            print(f"  -> {rows:>9,} rows ({size_mb:6.0f} MB) {mode:<9} {result['elapsed']:7.1f}s  "
+                  f"{rows / result['elapsed']:9,.0f} rows/s  peak RSS {result['peak_mb']:6.0f} MB")
+    return results
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--child":
+        import contextlib, io
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_mode(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+        print(json.dumps(result))
+    else:
+        n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+        latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 5.0
+        run_benchmark(n_rows, latency_ms)
@@ -0,0 +1,34 @@
+import os
+import sys
+import time
+import random
+from memory_supabase import MemorySupabase
+from test_candidate_index import generated_roster, generated_opportunities
+from match_engine import run_match_engine
+
+# ==========================================
+# Benchmark: sharded match engine scaling
+# ==========================================
+# Usage: python tools/bench_match_engine.py [opportunities] [contractors]
+# Runs entirely against the in-memory client, so timings reflect scoring, not the network.
+
+def run_benchmark(n_opps=2000, n_contractors=20000):
+    rng = random.Random(1)
+    opportunities = generated_opportunities(rng, n_opps)
+    contractors = generated_roster(rng, n_contractors)
+    for con in contractors:
+        con["company_name"] = con["company_name"] or "Acme"
+
+    baseline = None
+    for workers in sorted({1, 2, 4, os.cpu_count() or 1}):
+        client = MemorySupabase({"opportunities": opportunities, "contractors": contractors})
+        t0 = time.perf_counter()
+        run_match_engine(client, workers=workers, opp_limit=None, contractor_limit=None)
+        elapsed = time.perf_counter() - t0
+        baseline = baseline or elapsed
+        print(f"  -> workers={workers:<3} {elapsed:7.2f}s  speedup {baseline / elapsed:4.1f}x")
+
+if __name__ == "__main__":
+    n_opps = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    n_con = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    run_benchmark(n_opps, n_con)
@@ -0,0 +1,46 @@
+import sys
+import time
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone
+from raw_archive import RawArchive, iter_archived_pages, ARCHIVE_WORKERS
+
+# ==========================================
+# Benchmark: raw archive size and replay speed, serial vs. parallel decompression
+# ==========================================
+# Usage: python tools/bench_raw_archive.py [days]
+# Archives `days` days of synthetic SAM.gov pages (3 ptypes x 5 pages of 1,000 notices per day),
+# then replays them with 1, 4 and ARCHIVE_WORKERS decompression threads.
+
+def synthetic_page(rng, ptype, offset, day):
+    return [{"noticeId": f"{ptype}-{day}-{offset + i}", "title": f"Synthetic requirement {rng.randrange(10**6)}",
+             "naicsCode": str(rng.choice([541511, 541512, 236220, 561210])), "type": ptype,
+             "typeOfSetAsideDescription": rng.choice([None, "Total Small Business Set-Aside (FAR 19.5)", "8(a) Set-Aside"]),
+             "description": "https://api.sam.gov/prod/opportunities/v1/noticedesc?noticeid=" + "%032x" % rng.getrandbits(128)}
+            for i in range(1000)]
+
+def run_benchmark(days=10):
+    rng = random.Random(7)
+    with tempfile.TemporaryDirectory() as root:
+        archive = RawArchive(root=root, segment_mb=8)
+        start = datetime(2026, 9, 1, tzinfo=timezone.utc)
+        t0 = time.perf_counter()
+        for day in range(days):
+            for ptype in ("r", "p", "o"):
+                for offset in range(0, 5000, 1000):
+                    archive.append("opportunities", ptype, offset, synthetic_page(rng, ptype, offset, day),
+                                   fetched_at=start + timedelta(days=day))
+        write_s = time.perf_counter() - t0
+        stats = archive.stats
+        print(f"🗄️ Archived {stats['pages']} pages / {stats['records']:,} records in {write_s:.2f}s "
+              f"({archive.suffix}): {stats['raw_bytes'] / 1e6:.1f} MB -> {stats['stored_bytes'] / 1e6:.1f} MB "
+              f"({stats['raw_bytes'] / stats['stored_bytes']:.1f}x)")
+
+        for workers in sorted({1, 4, ARCHIVE_WORKERS}):
+            t0 = time.perf_counter()
+            records = sum(len(batch) for _, _, batch in iter_archived_pages("opportunities", root=root, workers=workers))
+            elapsed = time.perf_counter() - t0
+            print(f"  -> replay, {workers} worker(s): {records:,} records in {elapsed:.2f}s ({records / elapsed:,.0f} records/s)")
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
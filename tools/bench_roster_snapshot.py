@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import tracemalloc
+from score_engine import encode_roster, encode_snapshot, score_top_matches
+from roster_snapshot import write_snapshot, RosterSnapshot
+from bench_score_engine import synthetic_roster, synthetic_opportunities
+
+# ==========================================
+# Benchmark: JSON row roster vs memory-mapped snapshot
+# ==========================================
+# Usage: python tools/bench_roster_snapshot.py [contractors] [opportunities]
+# Times what a scoring run pays before its first score: parsing the roster from JSON (what
+# the PostgREST pages amount to) and encoding it, against opening the snapshot and building
+# the same blocks from its stored postings. Peak memory is the Python heap (tracemalloc);
+# the mapped file pages are shared with the OS page cache and not counted.
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def load_rows(payload):
+    rows = json.loads(payload)
+    return rows, encode_roster(rows)
+
+def load_snapshot(path):
+    snapshot = RosterSnapshot(path)
+    return snapshot, encode_snapshot(snapshot)
+
+def run_benchmark(n_contractors=200_000, n_opportunities=200):
+    rng = random.Random(42)
+    print(f"🔄 Generating {n_contractors:,} contractors and {n_opportunities:,} opportunities...")
+    contractors = synthetic_roster(n_contractors, rng)
+    for con in contractors:
+        con["id"] = f"con-{int(con['id'][4:]):08d}" # id order, as the keyset reads return it
+    opportunities = synthetic_opportunities(n_opportunities, rng)
+    payload = json.dumps(contractors)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "roster.bin")
+        t0 = time.perf_counter()
+        write_snapshot(contractors, path, source="bench", mark="2026-01-01T00:00:00+00:00")
+        t_write = time.perf_counter() - t0
+        del contractors
+
+        (rows, rows_blocks), t_rows, peak_rows = measure(lambda: load_rows(payload))
+        fast = score_top_matches(opportunities, rows, blocks=rows_blocks)
+        del rows, rows_blocks
+
+        (snapshot, snap_blocks), t_snap, peak_snap = measure(lambda: load_snapshot(path))
+        assert score_top_matches(opportunities, snapshot, blocks=snap_blocks) == fast, "❌ Snapshot blocks diverged from the row roster"
+        size = os.path.getsize(path)
+        snapshot.close()
+
+    print(f"  -> JSON rows (parse + encode):      {t_rows:8.2f}s  peak {peak_rows / 1e6:8.1f} MB  ({len(payload) / 1e6:.1f} MB of JSON)")
+    print(f"  -> Snapshot (open + encode):        {t_snap:8.2f}s  peak {peak_snap / 1e6:8.1f} MB  ({size / 1e6:.1f} MB file, "
+          f"written in {t_write:.2f}s)")
+    print(f"  ✅ Top 10s identical. Load speedup: {t_rows / t_snap:.1f}x, heap {peak_rows / max(peak_snap, 1):.1f}x smaller")
+
+if __name__ == "__main__":
+    n_con = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    n_ops = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    run_benchmark(n_con, n_ops)
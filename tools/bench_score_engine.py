@@ -0,0 +1,64 @@
+import sys
+import time
+import random
+from score_engine import encode_roster, score_top_matches, score_matches_bruteforce
+
+# ==========================================
+# Benchmark: bitset engine vs pair-by-pair loop
+# ==========================================
+# Usage: python tools/bench_score_engine.py [contractors] [opportunities]
+# The brute-force loop is only timed on a small sample of opportunities and extrapolated,
+# since running it over the full synthetic matrix would take hours.
+
+NAICS_POOL = [f"{random.Random(i).randint(111110, 928120)}" for i in range(1200)]
+CERTS_POOL = ["8A", "SDVOSBC", "WOSB", "EDWOSB", "HZC", "SBA", "SBP", "VSA"]
+STATES = ["VA", "MD", "DC", "CO", "TX", "CA", "FL", "NY", "PA", "OH", "GA", "WA", "AL", "NC", "AZ"]
+
+def synthetic_roster(n, rng):
+    return [{
+        "id": f"con-{i}",
+        "naics_codes": rng.sample(NAICS_POOL, k=rng.randint(1, 6)),
+        "certifications": rng.sample(CERTS_POOL, k=rng.randint(0, 2)),
+        "state": rng.choice(STATES)
+    } for i in range(n)]
+
+def synthetic_opportunities(n, rng):
+    return [{
+        "id": f"op-{i}",
+        "naics_code": rng.choice(NAICS_POOL),
+        "set_aside_code": rng.choice(CERTS_POOL + [None, None]),
+        "place_of_performance_state": rng.choice(STATES + [None])
+    } for i in range(n)]
+
+def run_benchmark(n_contractors=500_000, n_opportunities=1000, sample_ops=3):
+    rng = random.Random(42)
+    print(f"🔄 Generating {n_contractors:,} contractors and {n_opportunities:,} opportunities...")
+    contractors = synthetic_roster(n_contractors, rng)
+    opportunities = synthetic_opportunities(n_opportunities, rng)
+
+    t0 = time.perf_counter()
+    blocks = encode_roster(contractors)
+    t_encode = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fast = score_top_matches(opportunities, contractors, blocks=blocks)
+    t_fast = time.perf_counter() - t0
+
+    sample = opportunities[:sample_ops]
+    t0 = time.perf_counter()
+    slow = score_matches_bruteforce(sample, contractors)
+    t_slow_per_op = (time.perf_counter() - t0) / len(sample)
+
+    fast_sample = [m for m in fast if m["opportunity_id"] in {op["id"] for op in sample}]
+    assert fast_sample == slow, "❌ Bitset engine diverged from the reference loop"
+
+    t_slow_est = t_slow_per_op * n_opportunities
+    print(f"  -> Roster encode:            {t_encode:8.2f}s")
+    print(f"  -> Bitset engine (all ops):  {t_fast:8.2f}s  ({t_fast / n_opportunities * 1000:.2f} ms/op)")
+    print(f"  -> Reference loop (est.):    {t_slow_est:8.2f}s  ({t_slow_per_op * 1000:.2f} ms/op, {len(sample)} ops sampled)")
+    print(f"  ✅ Outputs identical on sample. Speedup: {t_slow_est / (t_encode + t_fast):.1f}x end-to-end")
+
+if __name__ == "__main__":
+    n_con = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    n_ops = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    run_benchmark(n_con, n_ops)
@@ -0,0 +1,52 @@
+import os
+import sys
+import time
+import subprocess
+from statistics import median
+
+# ==========================================
+# Benchmark: CLI cold start, lazy vs. eagerly imported SDKs
+# ==========================================
+# Usage: python tools/bench_startup.py [runs]
+# Times `capturepilot <command> --help` in a fresh interpreter (start-up, the tool's import
+# and argument parsing, no network). "eager" runs the same command after importing the SDKs
+# that tool used to import at module top, which is what every invocation paid before clients
+# were deferred to first use.
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+CLI = os.path.join(TOOLS_DIR, "capturepilot.py")
+
+EAGER_SDKS = {
+    "log": ("supabase", "dotenv"),
+    "ingest": ("supabase", "dotenv", "requests"),
+    "score": ("supabase", "dotenv"),
+    "drafts": ("supabase", "dotenv", "httpx", "requests"),
+    "match": ("supabase", "dotenv", "httpx", "requests"),
+    "leads": ("supabase", "dotenv", "requests", "bs4"),
+}
+
+def median_wall(code, runs) -> float:
+    """Median wall seconds of `python -c code` in a new interpreter."""
+    timings = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd=TOOLS_DIR, stdout=subprocess.DEVNULL, check=True)
+        timings.append(time.perf_counter() - t0)
+    return median(timings)
+
+def cli_code(args, preload=()) -> str:
+    imports = "".join(f"import {module}; " for module in preload)
+    return f"import sys, runpy; {imports}sys.argv = [{CLI!r}, *{list(args)!r}]; runpy.run_path({CLI!r}, run_name='__main__')"
+
+def run_benchmark(runs=7):
+    print(f"🔄 Cold starts, median of {runs} runs (bare interpreter: {median_wall('pass', runs) * 1000:.0f} ms)")
+    print(f"  -> {'--help':<8} {median_wall(cli_code(['--help']), runs) * 1000:6.0f} ms")
+    for command, sdks in EAGER_SDKS.items():
+        lazy = median_wall(cli_code([command, "--help"]), runs)
+        eager = median_wall(cli_code([command, "--help"], sdks), runs)
+        print(f"  -> {command:<8} lazy {lazy * 1000:6.0f} ms   eager {eager * 1000:6.0f} ms   "
+              f"{eager / lazy:4.1f}x  ({', '.join(sdks)} deferred)")
+    print("  ✅ Run `python tools/capturepilot.py importtime` to see where the remaining import time goes.")
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 7)
@@ -0,0 +1,70 @@
+import sys
+import time
+import random
+from taxonomy import Taxonomy, has
+from bench_score_engine import synthetic_roster, synthetic_opportunities
+
+# ==========================================
+# Microbenchmark: taxonomy bitsets vs list scans
+# ==========================================
+# Usage: python tools/bench_taxonomy.py [contractors] [opportunities]
+# Times the three membership tests the scorers make per pair (exact NAICS, set-aside
+# certification, and the hierarchical "same industry group" NAICS test) over every pair,
+# once on the raw lists and once on the encoded bitsets. Opportunity codes are looked up once
+# per opportunity on both sides, as the scorers do.
+
+def list_pass(opportunities, contractors):
+    hits = [0, 0, 0]
+    for op in opportunities:
+        naics, setaside = op["naics_code"], op["set_aside_code"]
+        group = naics[:4] if naics else None
+        for con in contractors:
+            codes = con["naics_codes"]
+            hits[0] += bool(naics and naics in codes)
+            hits[1] += bool(setaside and setaside in con["certifications"])
+            hits[2] += bool(group and any(c[:4] == group for c in codes))
+    return hits
+
+def bitset_pass(opportunities, profiles, taxonomy):
+    hits = [0, 0, 0]
+    for op in opportunities:
+        naics_id = taxonomy.naics_id(op["naics_code"])
+        cert_id = taxonomy.certification_id(op["set_aside_code"])
+        group_id = taxonomy.naics_prefixes.get(op["naics_code"][:4]) if op["naics_code"] else None
+        for profile in profiles:
+            hits[0] += has(profile.naics, naics_id)
+            hits[1] += has(profile.certifications, cert_id)
+            hits[2] += has(profile.naics_prefixes, group_id)
+    return hits
+
+def run_benchmark(n_contractors=50_000, n_opportunities=40):
+    rng = random.Random(42)
+    print(f"🔄 Generating {n_contractors:,} contractors and {n_opportunities:,} opportunities...")
+    contractors = synthetic_roster(n_contractors, rng)
+    opportunities = synthetic_opportunities(n_opportunities, rng)
+    pairs = n_contractors * n_opportunities
+
+    taxonomy = Taxonomy()
+    t0 = time.perf_counter()
+    profiles = [taxonomy.profile(con) for con in contractors]
+    t_encode = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    slow = list_pass(opportunities, contractors)
+    t_list = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    fast = bitset_pass(opportunities, profiles, taxonomy)
+    t_bits = time.perf_counter() - t0
+
+    assert fast == slow, "❌ Bitset membership diverged from the list scans"
+    print(f"  -> Profile encode:           {t_encode:8.2f}s  ({len(taxonomy.naics):,} NAICS IDs, {len(taxonomy.naics_prefixes):,} prefix IDs)")
+    print(f"  -> List scans ({pairs:,} pairs): {t_list:8.2f}s  ({t_list / pairs * 1e9:.0f} ns/pair)")
+    print(f"  -> Bitsets    ({pairs:,} pairs): {t_bits:8.2f}s  ({t_bits / pairs * 1e9:.0f} ns/pair)")
+    print(f"  ✅ Hits identical {slow}. Speedup: {t_list / t_bits:.1f}x per pair, "
+          f"{t_list / (t_bits + t_encode):.1f}x including the encode")
+
+if __name__ == "__main__":
+    n_con = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    n_ops = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    run_benchmark(n_con, n_ops)
@@ -0,0 +1,264 @@
+"""
+Concurrent, self-tuning bulk upsert writer shared by every loader.
+
+Rows are buffered and cut into batches that several worker threads upsert at once, so parsing
+keeps going while PostgREST works. The batch size adapts to what the server tells us: it grows
+while batches come back fast and small, shrinks when latency climbs past the target, and halves
+on 413 Payload Too Large or timeouts (the failed batch is split and retried as two halves).
+Batches rejected for bad data (constraint violations, invalid values) are bisected until the
+offending rows are isolated; other failures retry with jittered backoff. Rows that can't be
+written are appended to a dead-letter JSONL file in .tmp/ instead of being lost.
+A `then` callback that raises is recorded and re-raised from the next flush()/close().
+
+Retries are order-independent: a retried batch may land after later batches, so a single writer
+should not be fed two versions of the same conflict key if the newer one must win.
+"""
+import os
+import json
+import time
+import random
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from run_state import STATE_DIR
+
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", "4"))
+BULK_TARGET_LATENCY = float(os.getenv("BULK_TARGET_LATENCY", "1.0")) # seconds per batch round trip
+BULK_MAX_BYTES = int(os.getenv("BULK_MAX_BYTES", str(4 * 1024 * 1024)))
+DEFAULT_BATCH_SIZE = 500
+MIN_BATCH_SIZE = 25
+MAX_BATCH_SIZE = 5000
+MAX_ATTEMPTS = 4
+DEAD_LETTER_DIR = os.path.join(STATE_DIR, "dead_letter")
+
+def is_size_error(exc) -> bool:
+    """413s, gateway/statement timeouts and client timeouts all mean 'send less per request'."""
+    code = str(getattr(exc, "code", "") or getattr(getattr(exc, "response", None), "status_code", ""))
+    if code in ("413", "504", "57014"): # 57014 = Postgres statement timeout
+        return True
+    if isinstance(exc, TimeoutError) or "timeout" in type(exc).__name__.lower():
+        return True
+    text = str(exc).lower()
+    return "payload too large" in text or "statement timeout" in text
+
+def is_row_error(exc) -> bool:
+    """Postgres data exceptions (22xxx) and integrity violations (23xxx) are caused by specific rows."""
+    code = str(getattr(exc, "code", "") or "")
+    return len(code) == 5 and code[:2] in ("22", "23")
+
+class CallbackFailed(Exception):
+    """Raised by flush()/close() when `then` callbacks raised; `errors` holds every one of them."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"{len(errors)} write() callback(s) failed; first: {type(errors[0]).__name__}: {errors[0]}")
+
+class _Group:
+    # Rows handed to one write() call; `then(written)` runs once every one of them is written or dead-lettered
+    __slots__ = ("pending", "then", "written")
+
+    def __init__(self, pending, then):
+        self.pending = pending
+        self.then = then
+        self.written = True # Until one of its rows is dead-lettered
+
+class BulkWriter:
+    def __init__(self, supabase, table, on_conflict=None, ignore_duplicates=False, workers=BULK_WORKERS,
+                 batch_size=DEFAULT_BATCH_SIZE, min_batch=MIN_BATCH_SIZE, max_batch=MAX_BATCH_SIZE,
+                 target_latency=BULK_TARGET_LATENCY, max_bytes=BULK_MAX_BYTES, max_attempts=MAX_ATTEMPTS,
+                 dead_letter_file=None, tracker=None):
+        self.supabase = supabase
+        self.table = table
+        self.upsert_kwargs = {"ignore_duplicates": ignore_duplicates, "returning": "minimal"}
+        if on_conflict:
+            self.upsert_kwargs["on_conflict"] = on_conflict
+        # A statement may touch each conflict key once, and batches mix rows from many write() calls
+        self.key_columns = [c.strip() for c in on_conflict.split(",")] if on_conflict else None
+        self.batch_size = batch_size
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+        self.max_attempts = max_attempts
+        self.dead_letter_path = dead_letter_file or os.path.join(DEAD_LETTER_DIR, f"{table}.jsonl")
+        # Optional ChangeTracker: unchanged rows are dropped on write(), hashes recorded once a batch lands
+        self.tracker = tracker
+
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.buffer = []
+        self.in_flight = 0
+        # Fresh batches queue at most one deep per worker: the caller blocks instead of buffering the file
+        self.slots = threading.BoundedSemaphore(workers * 2)
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bulk-{table}")
+        self.started = time.perf_counter()
+        self.stats = {"rows": 0, "bytes": 0, "batches": 0, "retries": 0, "splits": 0, "dead_lettered": 0}
+        self.callback_errors = [] # Raised from the next flush()/close(): workers have no caller to raise to
+
+    # ---- producer side ----
+    def write(self, rows, then=None):
+        """
+        Queues rows for upsert. `then(written)` is called (from a worker thread) once every row has
+        been dealt with; `written` is False if any of them was dead-lettered instead of landing.
+        """
+        rows = self.tracker.filter(rows) if self.tracker else list(rows)
+        if not rows:
+            if then:
+                then(True)
+            return
+        group = _Group(len(rows), then)
+        with self.lock:
+            self.buffer.extend((row, group) for row in rows)
+            ready = []
+            while len(self.buffer) >= self.batch_size:
+                ready.append(self.buffer[:self.batch_size])
+                del self.buffer[:self.batch_size]
+        for chunk in ready:
+            self._submit(chunk, attempt=0, fresh=True)
+
+    def flush(self):
+        """
+        Sends whatever is buffered and waits for every batch, including retries, to finish.
+        Raises CallbackFailed if any `then` callback raised since the last flush.
+        """
+        with self.lock:
+            chunk, self.buffer = self.buffer, []
+        if chunk:
+            self._submit(chunk, attempt=0, fresh=True)
+        with self.idle:
+            while self.in_flight:
+                self.idle.wait()
+            errors, self.callback_errors = self.callback_errors, []
+        if errors:
+            raise CallbackFailed(errors) from errors[0]
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.pool.shutdown(wait=True)
+        return self.stats
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- worker side ----
+    def _submit(self, chunk, attempt, fresh=False, delay=0.0):
+        if fresh:
+            self.slots.acquire()
+        with self.lock:
+            self.in_flight += 1
+        self.pool.submit(self._run, chunk, attempt, fresh, delay)
+
+    def _done(self, chunk, written=True):
+        finished = []
+        with self.lock:
+            for _, group in chunk:
+                group.pending -= 1
+                group.written = group.written and written
+                if group.pending == 0 and group.then:
+                    finished.append((group.then, group.written))
+        for then, group_written in finished:
+            # One failing callback must not cost the rest of the chunk theirs
+            try:
+                then(group_written)
+            except Exception as e:
+                print(f"     ❌ {self.table} write() callback failed: {type(e).__name__}: {e}")
+                with self.lock:
+                    self.callback_errors.append(e)
+
+    def _run(self, chunk, attempt, fresh, delay):
+        try:
+            if delay:
+                time.sleep(delay)
+            rows = [row for row, _ in chunk]
+            if self.key_columns:
+                rows = list({tuple(row.get(c) for c in self.key_columns): row for row in rows}.values())
+            size = len(json.dumps(rows, default=str).encode())
+            t0 = time.perf_counter()
+            try:
+                self.supabase.table(self.table).upsert(rows, **self.upsert_kwargs).execute()
+            except Exception as e:
+                self._failed(chunk, attempt, e, size)
+                return
+            self._tune(len(rows), size, time.perf_counter() - t0)
+            if self.tracker:
+                self.tracker.mark_written(rows)
+            with self.lock:
+                self.stats["rows"] += len(rows)
+                self.stats["bytes"] += size
+                self.stats["batches"] += 1
+            self._done(chunk)
+        finally:
+            if fresh:
+                self.slots.release()
+            with self.idle:
+                self.in_flight -= 1
+                self.idle.notify_all()
+
+    def _tune(self, n_rows, size, latency):
+        with self.lock:
+            bytes_per_row = max(1, size // n_rows)
+            ceiling = min(self.max_batch, max(self.min_batch, self.max_bytes // bytes_per_row))
+            if latency > self.target_latency * 1.5:
+                self.batch_size = int(self.batch_size * 0.7)
+            elif latency < self.target_latency * 0.5 and n_rows >= self.batch_size * 0.9:
+                # Only full batches are evidence that bigger ones would still be fast
+                self.batch_size = int(self.batch_size * 1.25) + 1
+            self.batch_size = max(self.min_batch, min(ceiling, self.batch_size))
+
+    def _failed(self, chunk, attempt, exc, size):
+        if is_size_error(exc):
+            with self.lock:
+                if str(getattr(exc, "code", "")) == "413":
+                    # Remember the server's body limit so the tuner never grows back past it
+                    self.max_bytes = min(self.max_bytes, int(size * 0.8))
+                self.batch_size = max(self.min_batch, min(self.batch_size, len(chunk)) // 2)
+            if len(chunk) > 1:
+                self._split(chunk, attempt)
+                return
+        if is_row_error(exc):
+            # Some row in here can never be written: bisect until it is isolated, then dead-letter it
+            if len(chunk) > 1:
+                self._split(chunk, 0)
+            else:
+                self._dead_letter(chunk, exc)
+        elif attempt + 1 < self.max_attempts:
+            with self.lock:
+                self.stats["retries"] += 1
+            # Full jitter so concurrent failures don't retry in lockstep
+            self._submit(chunk, attempt + 1, delay=random.uniform(0, min(10.0, 0.25 * 2 ** attempt)))
+        else:
+            self._dead_letter(chunk, exc)
+
+    def _split(self, chunk, attempt):
+        with self.lock:
+            self.stats["splits"] += 1
+        mid = len(chunk) // 2
+        self._submit(chunk[:mid], attempt)
+        self._submit(chunk[mid:], attempt)
+
+    def _dead_letter(self, chunk, exc):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            os.makedirs(os.path.dirname(self.dead_letter_path), exist_ok=True)
+            with open(self.dead_letter_path, "a") as f:
+                for row, _ in chunk:
+                    f.write(json.dumps({"table": self.table, "failed_at": now, "error": str(exc), "row": row}, default=str) + "\n")
+            self.stats["dead_lettered"] += len(chunk)
+        print(f"     ❌ {len(chunk)} {self.table} row(s) dead-lettered to {self.dead_letter_path}: {exc}")
+        self._done(chunk, written=False)
+
+    # ---- reporting ----
+    def report(self) -> dict:
+        elapsed = max(1e-9, time.perf_counter() - self.started)
+        return dict(self.stats, elapsed=elapsed, rows_per_sec=self.stats["rows"] / elapsed,
+                    bytes_per_sec=self.stats["bytes"] / elapsed, batch_size=self.batch_size)
+
+    def print_report(self):
+        r = self.report()
+        print(f"  📦 {self.table}: {r['rows']} rows in {r['batches']} batches ({r['retries']} retries, "
+              f"{r['splits']} splits, {r['dead_lettered']} dead-lettered) | {r['rows_per_sec']:,.0f} rows/s, "
+              f"{r['bytes_per_sec'] / 1e6:.2f} MB/s, batch size now {r['batch_size']}")
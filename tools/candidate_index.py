@@ -0,0 +1,108 @@
+"""
+In-memory inverted index over the contractor roster, built once per scoring run.
+
+Postings map a NAICS code, PSC code, state or certification to the sorted roster positions
+that carry it. Candidate generation takes the union of the postings an opportunity touches,
+then drops any candidate whose best possible score is below the cutoff before exact scoring.
+Bounds only ever over-estimate, so pruning never drops a pair the brute-force path would have
+kept. The PWin scorer prunes the same way inside pwin_engine.PWinModel.
+"""
+from score_engine import (
+    WEIGHT_NAICS, WEIGHT_PSC, WEIGHT_SETASIDE, WEIGHT_GEO, WEIGHT_VALUE_FIT, WEIGHT_DEADLINE, TOP_N,
+    contract_value_fit, deadline_feasibility, score_pair
+)
+from taxonomy import Taxonomy
+
+class CandidateIndex:
+    def __init__(self, contractors):
+        self.contractors = contractors
+        self.naics = {}
+        self.psc = {}
+        self.state = {}
+        self.certifications = {}
+        self.profiles = {}
+        self.taxonomy = Taxonomy() # Lives and dies with the index, so code IDs never outgrow one run
+
+        for pos, con in enumerate(contractors):
+            for code in set(con.get("naics_codes") or ()):
+                if code:
+                    self.naics.setdefault(code, []).append(pos)
+            for code in set(con.get("psc_codes") or ()):
+                if code:
+                    self.psc.setdefault(code, []).append(pos)
+            if con.get("state"):
+                self.state.setdefault(con["state"], []).append(pos)
+            # Both certification columns share one posting list: a superset only loosens the bound
+            certs = set(con.get("certifications") or ()) | set(con.get("sba_certifications") or ())
+            for cert in certs:
+                if cert:
+                    self.certifications.setdefault(cert, []).append(pos)
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Index over a roster_snapshot.RosterSnapshot, reusing its stored postings instead of walking rows."""
+        index = cls([])
+        index.contractors = snapshot
+        index.naics = {code: p for code, p in snapshot.postings("naics_codes").items() if code}
+        index.psc = {code: p for code, p in snapshot.postings("psc_codes").items() if code}
+        index.state = snapshot.postings("state")
+        # Both certification columns share one posting list, as in __init__
+        certs = {}
+        for column in ("certifications", "sba_certifications"):
+            for cert, positions in snapshot.postings(column).items():
+                certs.setdefault(cert, set()).update(positions)
+        index.certifications = {cert: sorted(positions) for cert, positions in certs.items() if cert}
+        return index
+
+    def profile(self, pos: int):
+        """Taxonomy bitsets of the contractor at `pos`, built on first use (only candidates are ever scored)."""
+        profile = self.profiles.get(pos)
+        if profile is None:
+            profile = self.profiles[pos] = self.taxonomy.profile(self.contractors[pos])
+        return profile
+
+    def postings(self, column: dict, value) -> list:
+        return column.get(value, []) if value else []
+
+    # ==========================================
+    # SOP scorer (2_score_matches.py)
+    # ==========================================
+    def sop_candidates(self, op, min_score: float) -> list:
+        """Sorted roster positions whose SOP upper bound reaches min_score."""
+        naics = set(self.postings(self.naics, op.get("naics_code")))
+        psc = set(self.postings(self.psc, op.get("psc_code")))
+        setaside = set(self.postings(self.certifications, op.get("set_aside_code")))
+        geo = set(self.postings(self.state, op.get("place_of_performance_state")))
+
+        base = (WEIGHT_VALUE_FIT * contract_value_fit(op)) + (WEIGHT_DEADLINE * deadline_feasibility(op))
+        if base >= min_score:
+            return list(range(len(self.contractors)))
+
+        survivors = []
+        for pos in naics | psc | setaside | geo:
+            bound = (base + WEIGHT_NAICS * (pos in naics) + WEIGHT_PSC * (pos in psc) +
+                     WEIGHT_SETASIDE * (pos in setaside) + WEIGHT_GEO * (pos in geo))
+            # Slack covers summation order and the 4dp rounding applied to stored scores
+            if bound + 1e-4 >= min_score:
+                survivors.append(pos)
+        survivors.sort()
+        return survivors
+
+# ==========================================
+# Pruned Scoring
+# ==========================================
+def score_top_matches_indexed(opportunities, index: CandidateIndex, min_score: float, top_n=TOP_N) -> list:
+    """
+    SOP Top N per opportunity, restricted to pairs scoring >= min_score. Equivalent to taking
+    the brute-force Top N and dropping the rows under the cutoff.
+    """
+    match_payloads = []
+    for op in opportunities:
+        scored = []
+        for pos in index.sop_candidates(op, min_score):
+            record = score_pair(op, index.contractors[pos], index.profile(pos))
+            if record["score"] >= min_score:
+                scored.append((pos, record))
+        scored.sort(key=lambda r: (-r[1]["score"], r[0]))
+        match_payloads.extend(record for _, record in scored[:top_n])
+    return match_payloads
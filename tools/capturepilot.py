@@ -0,0 +1,112 @@
+"""
+One entry point for the tools: `python tools/capturepilot.py <command> [args]`.
+
+Each command runs its tool's own CLI (same arguments as `python tools/<script>.py`) and imports
+only that tool. Tools defer the Supabase SDK, HTTP stacks and clients to first use
+(tools/clients.py), so `--help`, bad arguments and light commands start without paying for them.
+
+`importtime [command ...]` profiles what importing each command's tool costs (`python -X
+importtime` in a fresh interpreter) and flags any heavy SDK a tool still loads at import.
+`python tools/bench_startup.py` tracks end-to-end cold starts.
+"""
+import os
+import sys
+import runpy
+import argparse
+import subprocess
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "ingest": ("1_ingest_sam", "Fetch recent SAM.gov opportunities (days back, default 7)"),
+    "score": ("2_score_matches", "Deterministic SOP contractor matching"),
+    "drafts": ("3_generate_email_drafts", "Draft outreach emails for HOT matches"),
+    "log": ("4_log_outcome", "Log the outcome of a pursuit"),
+    "sync": ("cron_daily_sync", "24-hour SAM.gov opportunity and entity sync"),
+    "daily": ("daily_pipeline", "Run or resume the daily sync → score → draft pipeline"),
+    "match": ("match_engine", "Ten-factor PWin matching and enrichment"),
+    "features": ("pwin_features", "Refresh the materialized PWin contractor features"),
+    "snapshot": ("roster_snapshot", "Build or refresh the local roster snapshot"),
+    "contractors": ("ingest_contractors", "Load the SAM.gov entity extract (.dat)"),
+    "backfill": ("backfill", "Resumable sharded SAM.gov backfill (status, reset)"),
+    "archive": ("raw_archive", "Raw SAM.gov page archive: stats, offline replay"),
+    "csv": ("ingest_csv", "Load an opportunities CSV export"),
+    "leads": ("ingest_external_leads", "Crawl the web for non-SAM prospects"),
+    "cache": ("llm_cache", "Inspect or clear the LLM completion cache"),
+    "serve": ("engine_server", "Run the resident engine behind the dashboard"),
+}
+HEAVY_MODULES = ("supabase", "httpx", "requests", "bs4", "google.genai")
+
+# ==========================================
+# 1. Import-time Profile
+# ==========================================
+def profile_imports(module: str) -> dict:
+    """`python -X importtime` for importing `module` alone: total ms, [(self_us, cumulative_us, depth, name)], heavy SDKs."""
+    # __import__, not importlib.import_module: only the C import path is timed by -X importtime
+    probe = f"import sys; __import__({module!r}); print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe], cwd=TOOLS_DIR, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"exit code {proc.returncode}")
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    total_us = next((cumulative for _, cumulative, depth, name in entries if name == module and depth == 0), 0)
+    heavy = [name for name in proc.stdout.strip().split(",") if name]
+    return {"module": module, "total_ms": total_us / 1000, "entries": entries, "heavy": heavy}
+
+def print_profile(commands, top=5, raw=False):
+    print(f"⏱️ Import-time profile ({len(commands)} command(s), fresh interpreter each)")
+    for name in commands:
+        module = COMMANDS[name][0]
+        try:
+            profile = profile_imports(module)
+        except RuntimeError as e:
+            print(f"  ❌ {name} ({module}): import failed: {e}")
+            continue
+        status = f"⚠️ loads {', '.join(profile['heavy'])} at import" if profile["heavy"] else "✅ no heavy SDKs"
+        print(f"  -> {name:<12} {profile['total_ms']:7.1f} ms  {status}")
+        if raw:
+            for self_us, cumulative_us, depth, entry in profile["entries"]:
+                print(f"       {self_us:>8} | {cumulative_us:>9} | {'  ' * depth}{entry}")
+        elif top:
+            heaviest = sorted(profile["entries"], reverse=True)[:top]
+            print("       " + ", ".join(f"{entry} {self_us / 1000:.1f}ms" for self_us, _, _, entry in heaviest))
+
+# ==========================================
+# 2. Dispatch
+# ==========================================
+def run_command(name, argv):
+    """Runs the tool's `__main__` block as if invoked directly, with `argv` as its arguments."""
+    sys.argv = [f"capturepilot {name}", *argv]
+    runpy.run_module(COMMANDS[name][0], run_name="__main__", alter_sys=True)
+
+def build_parser() -> argparse.ArgumentParser:
+    listing = "\n".join(f"  {name:<12} {help_text}" for name, (_, help_text) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        prog="capturepilot", formatter_class=argparse.RawDescriptionHelpFormatter,
+        description="Capture Pilot tools. `capturepilot <command> --help` shows a command's arguments.",
+        epilog=f"commands:\n{listing}\n  {'importtime':<12} Profile each command's import cost")
+    parser.add_argument("command", choices=[*COMMANDS, "importtime"], metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command != "importtime":
+        return run_command(args.command, args.args)
+    parser = argparse.ArgumentParser(prog="capturepilot importtime", description="Profile each command's import cost")
+    parser.add_argument("commands", nargs="*", metavar="command", help="Commands to profile (default: all)")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest modules (self time) to list per command")
+    parser.add_argument("--raw", action="store_true", help="Print the full -X importtime tree")
+    profile_args = parser.parse_args(args.args)
+    unknown = [name for name in profile_args.commands if name not in COMMANDS]
+    if unknown:
+        parser.error(f"unknown command(s): {', '.join(unknown)} (choose from {', '.join(COMMANDS)})")
+    print_profile(profile_args.commands or list(COMMANDS), top=profile_args.top, raw=profile_args.raw)
+
+if __name__ == "__main__":
+    main()
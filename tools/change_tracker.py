@@ -0,0 +1,121 @@
+"""
+Content-hash change detection for the loaders.
+
+Each normalized record is hashed (canonical JSON, keys sorted, scalar lists order-insensitive)
+and compared with the hash last written for its key, kept in a local SQLite index in .tmp/.
+Pass a tracker to BulkWriter: only new or changed rows are sent, and the index is updated only
+once a batch has landed, so a row that failed or was dead-lettered is retried on the next run.
+Entries older than CHANGE_INDEX_MAX_AGE_DAYS are treated as unknown and rewritten, and the
+index resets itself when pointed at a different Supabase project, so drift self-heals.
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from run_state import STATE_DIR, client_source
+
+INDEX_PATH = os.path.join(STATE_DIR, "change_index.sqlite3")
+CHANGE_INDEX_MAX_AGE_DAYS = int(os.getenv("CHANGE_INDEX_MAX_AGE_DAYS", "30"))
+LOOKUP_CHUNK = 500 # Keys per SQLite IN (...) lookup
+
+def _canonical(value):
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [_canonical(v) for v in value]
+        # Array columns here are sets in practice (NAICS, certifications); their order is not a change
+        if all(isinstance(v, (str, int, float)) for v in items):
+            return sorted(items, key=lambda v: (type(v).__name__, v))
+        return items
+    return value
+
+def record_hash(row: dict) -> str:
+    payload = json.dumps(_canonical(row), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
+class ChangeTracker:
+    """Pass db_path=":memory:" for a throwaway index that never touches .tmp/ (tests, benchmarks)."""
+    def __init__(self, supabase, table, key_columns, db_path=INDEX_PATH, max_age_days=CHANGE_INDEX_MAX_AGE_DAYS):
+        self.table = table
+        self.key_columns = [c.strip() for c in key_columns.split(",")] if isinstance(key_columns, str) else list(key_columns)
+        self.max_age = timedelta(days=max_age_days)
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.stats = {"inserted": 0, "updated": 0, "skipped": 0}
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS record_hashes (
+            table_name TEXT NOT NULL, record_key TEXT NOT NULL, hash TEXT NOT NULL, written_at TEXT NOT NULL,
+            PRIMARY KEY (table_name, record_key)) WITHOUT ROWID""")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS index_source (table_name TEXT PRIMARY KEY, source TEXT NOT NULL)")
+
+        source = client_source(supabase)
+        stored = self.conn.execute("SELECT source FROM index_source WHERE table_name = ?", (table,)).fetchone()
+        if stored is None or stored[0] != source:
+            # A different project (or a fresh index): nothing we remember is known to be in this DB
+            self.conn.execute("DELETE FROM record_hashes WHERE table_name = ?", (table,))
+            self.conn.execute("INSERT OR REPLACE INTO index_source VALUES (?, ?)", (table, source))
+        self.conn.commit()
+
+    def key(self, row) -> str:
+        return "|".join(str(row.get(c)) for c in self.key_columns)
+
+    def _known(self, keys) -> dict:
+        cutoff = (datetime.now(timezone.utc) - self.max_age).isoformat()
+        known = {}
+        with self.lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                for key, digest, written_at in self.conn.execute(
+                        f"SELECT record_key, hash, written_at FROM record_hashes WHERE table_name = ? AND record_key IN ({marks})",
+                        (self.table, *chunk)):
+                    known[key] = digest if written_at >= cutoff else None
+        return known
+
+    def filter(self, rows) -> list:
+        """Returns only the rows that are new or whose content changed since they were last written."""
+        hashed = {}
+        for row in rows:
+            # Later duplicates of a key win, as they would in the upsert
+            hashed[self.key(row)] = (row, record_hash(row))
+        known = self._known(list(hashed))
+        changed = []
+        with self.lock:
+            for key, (row, digest) in hashed.items():
+                if key not in known:
+                    self.stats["inserted"] += 1
+                elif known[key] == digest:
+                    self.stats["skipped"] += 1
+                    continue
+                else:
+                    self.stats["updated"] += 1
+                self.pending[key] = digest
+                changed.append(row)
+        return changed
+
+    def mark_written(self, rows):
+        """Called by BulkWriter with each batch that landed: remember the hashes that are now in the DB."""
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            entries = []
+            for row in rows:
+                digest = self.pending.pop(self.key(row), None)
+                if digest is not None:
+                    entries.append((self.table, self.key(row), digest, now))
+            self.conn.executemany("INSERT OR REPLACE INTO record_hashes VALUES (?, ?, ?, ?)", entries)
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def print_report(self):
+        s = self.stats
+        print(f"  🧮 {self.table}: {s['inserted']} new, {s['updated']} changed, {s['skipped']} unchanged (skipped).")
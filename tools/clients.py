@@ -0,0 +1,28 @@
+"""
+Service clients shared by the tools, imported and constructed on first use.
+
+Importing a tool must not import the Supabase SDK or open a client: `capturepilot --help`,
+argument errors and pure-compute commands never need them, and the SDK import alone costs
+more than the rest of a cold start. `get_supabase()` imports it on the first call and returns
+the same client afterwards (one per process, shared across threads).
+"""
+import os
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+_lock = threading.Lock()
+_supabase = None
+
+def missing_env(*names) -> list:
+    """The names among `names` that are unset or empty in the environment."""
+    return [name for name in names if not os.getenv(name)]
+
+def get_supabase():
+    global _supabase
+    with _lock:
+        if _supabase is None:
+            from supabase import create_client
+            _supabase = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_SERVICE_KEY"))
+        return _supabase
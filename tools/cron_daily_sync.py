@@ -1,30 +1,26 @@
 import os
-import requests
-import time
-from datetime import datetime, timedelta
-from supabase import create_client, Client
-from dotenv import load_dotenv
-
-load_dotenv()
+import argparse
+from datetime import date, datetime, timedelta
+from clients import get_supabase, missing_env
+from agency_cache import AgencyCache, agency_key
+from bulk_writer import BulkWriter
+from change_tracker import ChangeTracker, INDEX_PATH
+from raw_archive import archive_page
 
 SAM_API_KEY = os.getenv("SAM_API_KEY")
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-
-if not all([SAM_API_KEY, SUPABASE_URL, SUPABASE_SERVICE_KEY]):
-    print("❌ Missing required API keys in .env. Halting.")
-    exit(1)
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+SAM_ENTITIES_URL = "https://api.sam.gov/entity-information/v3/entities"
 
 # ==========================================
 # 1. Lookups & Helpers
 # ==========================================
 TYPE_MAPPING = {}
 SET_ASIDE_MAPPING = {}
+AGENCY_CACHE = None # Bound to the client by load_lookups(), which every sync runs after
 
-def load_lookups():
-    global TYPE_MAPPING, SET_ASIDE_MAPPING
+def load_lookups(supabase=None):
+    global TYPE_MAPPING, SET_ASIDE_MAPPING, AGENCY_CACHE
+    supabase = supabase or get_supabase()
+    AGENCY_CACHE = AgencyCache(supabase)
     # Load Opportunity Types
     res = supabase.table("opportunity_types").select("id, name").execute()
     for row in res.data:
@@ -34,28 +30,12 @@ def load_lookups():
     res = supabase.table("set_asides").select("id, code").execute()
     for row in res.data:
         SET_ASIDE_MAPPING[row["code"].upper()] = row["id"]
+        
+    # Load Agencies (local snapshot when still current)
+    AGENCY_CACHE.load()
 
 def get_agency_id(department, subtier, office):
-    dept = department or "Unknown Department"
-    sub = subtier or ""
-    off = office or ""
-    
-    # Try exact match first
-    res = supabase.table("agencies").select("id").eq("department", dept).eq("sub_tier", sub).eq("office", off).execute()
-    if res.data:
-        return res.data[0]["id"]
-        
-    # Upsert if not found
-    try:
-        payload = {"department": dept, "sub_tier": sub, "office": off}
-        # The unique constraint is on (department, sub_tier, office)
-        insert_res = supabase.table("agencies").upsert(payload, on_conflict="department,sub_tier,office").execute()
-        if insert_res.data:
-            return insert_res.data[0]["id"]
-    except Exception as e:
-        print(f"Error inserting agency {dept}: {e}")
-    
-    return None
+    return AGENCY_CACHE.resolve(department, subtier, office)
 
 def normalize_set_aside(raw_code):
     if not raw_code: return None
@@ -82,227 +62,257 @@ def normalize_notice_type(raw_type):
 # ==========================================
 # 2. Sync Opportunities
 # ==========================================
-def sync_opportunities(days_back=1):
+def sync_opportunities(days_back=1, supabase=None, pages=None, on_batch=None, change_index=INDEX_PATH):
+    """
+    `pages` replaces the SAM.gov fetch with any iterable of (ptype, offset, records).
+    `on_batch(rows)` is called with each page's normalized rows once they have landed (from a
+    writer thread), so downstream work can start before the sync ends.
+    `change_index` is the ChangeTracker database (":memory:" for a throwaway one).
+    """
     today = datetime.now()
     posted_from_date = (today - timedelta(days=days_back)).strftime('%m/%d/%Y')
     posted_to_date = today.strftime('%m/%d/%Y')
     
     print(f"\n[OPPORTUNITIES] 🔄 Syncing SAM.gov from {posted_from_date} to {posted_to_date}...")
     
-    url = "https://api.sam.gov/opportunities/v2/search"
-    limit = 1000
-    ptypes = ["r", "p", "o"] # Sources Sought, Presolicitation, Solicitation
+    from sam_fetcher import iter_opportunity_pages, PartialFetch
+    supabase = supabase or get_supabase()
     
-    total_upserted = 0
+    # The sync window overlaps the previous run's; unchanged notices are skipped, not re-upserted
+    tracker = ChangeTracker(supabase, "opportunities", "notice_id", db_path=change_index)
+    writer = BulkWriter(supabase, "opportunities", on_conflict="notice_id", tracker=tracker)
     
-    for ptype in ptypes:
-        print(f"  -> Fetching Notice Type: '{ptype}'")
-        offset = 0
-        keep_fetching = True
+    # Notice types page concurrently through the shared rate limiter
+    if pages is None:
+        pages = iter_opportunity_pages(SAM_API_KEY, posted_from_date, posted_to_date)
+    partial = None
+    try:
+        for ptype, offset, ops_batch in pages:
+            print(f"     -> [{ptype}] Parsing {len(ops_batch)} records at offset {offset}...")
         
-        while keep_fetching:
-            params = {
-                "api_key": SAM_API_KEY,
-                "postedFrom": posted_from_date,
-                "postedTo": posted_to_date,
-                "limit": limit,
-                "offset": offset,
-                "ptype": ptype
-            }
-            
-            try:
-                response = requests.get(url, params=params, timeout=30)
-                
-                if response.status_code == 429:
-                    print("     ⚠️ Rate limit hit. Sleeping for 10 seconds...")
-                    time.sleep(10)
-                    continue
-                    
-                if response.status_code != 200:
-                    print(f"     ❌ Failed to fetch page. Status: {response.status_code}")
-                    break
-                    
-                data = response.json()
-                ops_batch = data.get("opportunitiesData", [])
-                
-                if not ops_batch:
-                    keep_fetching = False
-                    break
-                    
-                print(f"     -> Parsing {len(ops_batch)} records...")
-                
-                db_payload = []
-                for op in ops_batch:
-                    notice_id = op.get("noticeId")
-                    if not notice_id: continue
-                        
-                    # Agency Resolution
-                    dept = op.get("department") or op.get("agency")
-                    subtier = op.get("subtier")
-                    office = op.get("office")
-                    agency_id = get_agency_id(dept, subtier, office)
-                    
-                    # Types & Set Asides
-                    raw_type = op.get("type")
-                    norm_type = normalize_notice_type(raw_type)
-                    type_id = TYPE_MAPPING.get(norm_type.lower()) if norm_type else None
-                    
-                    raw_set_aside = op.get("typeOfSetAsideDescription")
-                    norm_sa = normalize_set_aside(raw_set_aside)
-                    sa_id = SET_ASIDE_MAPPING.get(norm_sa)
-                    
-                    normalized = {
-                        "notice_id": notice_id,
-                        "title": op.get("title"),
-                        "solicitation_number": op.get("solicitationNumber"),
-                        "agency_id": agency_id,
-                        "opportunity_type_id": type_id,
-                        "set_aside_id": sa_id,
-                        "naics_code": op.get("naicsCode"),
-                        "psc_code": op.get("classificationCode"),
-                        "posted_date": op.get("postedDate"),
-                        "response_deadline": op.get("responseDeadLine"),
-                        "active": op.get("active") == "Yes",
-                        "link": op.get("uiLink")
-                    }
-                    db_payload.append(normalized)
-                
-                if db_payload:
-                    try:
-                        supabase.table("opportunities").upsert(db_payload, on_conflict="notice_id").execute()
-                        total_upserted += len(db_payload)
-                        print(f"     ✅ Upserted batch of {len(db_payload)} via normalized schema.")
-                    except Exception as db_err:
-                        print(f"     ❌ DB upsert error: {db_err}")
-                
-                offset += limit
+            # Agency Resolution: one bulk upsert per page for triples the cache hasn't seen
+            agency_ids = AGENCY_CACHE.resolve_many(
+                (op.get("department") or op.get("agency"), op.get("subtier"), op.get("office")) for op in ops_batch
+            )
+        
+            db_payload = []
+            for op in ops_batch:
+                notice_id = op.get("noticeId")
+                if not notice_id: continue
                 
-            except Exception as e:
-                 print(f"     ❌ Error during request: {e}")
-                 break
-                 
+                agency_id = agency_ids.get(agency_key(op.get("department") or op.get("agency"), op.get("subtier"), op.get("office")))
+            
+                # Types & Set Asides
+                raw_type = op.get("type")
+                norm_type = normalize_notice_type(raw_type)
+                type_id = TYPE_MAPPING.get(norm_type.lower()) if norm_type else None
+            
+                raw_set_aside = op.get("typeOfSetAsideDescription")
+                norm_sa = normalize_set_aside(raw_set_aside)
+                sa_id = SET_ASIDE_MAPPING.get(norm_sa)
+            
+                normalized = {
+                    "notice_id": notice_id,
+                    "title": op.get("title"),
+                    "solicitation_number": op.get("solicitationNumber"),
+                    "agency_id": agency_id,
+                    "opportunity_type_id": type_id,
+                    "set_aside_id": sa_id,
+                    "naics_code": op.get("naicsCode"),
+                    "psc_code": op.get("classificationCode"),
+                    "posted_date": op.get("postedDate"),
+                    "response_deadline": op.get("responseDeadLine"),
+                    "active": op.get("active") == "Yes",
+                    "link": op.get("uiLink")
+                }
+                db_payload.append(normalized)
+        
+            writer.write(db_payload, then=(lambda written, rows=db_payload: on_batch(rows)) if on_batch else None)
+    except PartialFetch as e:
+        partial = e # The pages that did arrive are still written below
+    finally:
+        if hasattr(pages, "close"):
+            pages.close() # Stops the fetch threads if normalizing or writing raised
+
+    writer.close()
+    tracker.close()
+    writer.print_report()
+    tracker.print_report()
+    total_upserted = writer.stats["rows"]
+    AGENCY_CACHE.save()
+    stats = AGENCY_CACHE.stats
+    print(f"[OPPORTUNITIES] 🏛️ Agencies: {stats['hits']} cached, {stats['upserted']} new, {stats['round_trips']} round trips.")
+    if partial:
+        print(f"[OPPORTUNITIES] ⚠️ Sync partial. {partial}. Upserted {total_upserted} records.")
+        raise partial
     print(f"[OPPORTUNITIES] 🎉 Sync complete. Upserted {total_upserted} records.")
 
 # ==========================================
 # 3. Sync Contractors (Entities)
 # ==========================================
-def sync_contractors(days_back=1):
-    today = datetime.now()
-    reg_date = (today - timedelta(days=days_back)).strftime('%Y-%m-%d')
-    # Use SAM Entity Management API to find entities activated recently
-    
-    print(f"\n[CONTRACTORS] 🔄 Syncing SAM.gov Entities registered since {reg_date}...")
-    
-    url = "https://api.sam.gov/entity-information/v3/entities"
-    limit = 100
+def iter_entity_pages(reg_date, limit=100, url=SAM_ENTITIES_URL, limiter=None, session=None):
+    """
+    Yields (offset, entities) from the SAM Entity Management API for entities registered since reg_date.
+    Pages go through sam_fetcher.fetch_page: one token bucket, jittered backoff on 429/5xx and request errors.
+    """
+    from http_transport import get_session
+    from sam_fetcher import TokenBucket, SAM_REQUESTS_PER_SECOND, SAM_BURST, FetchError, fetch_page
+    limiter = limiter or TokenBucket(SAM_REQUESTS_PER_SECOND, SAM_BURST)
+    # fetch_page runs its own rate-aware retry loop, so the pooled session must not retry too
+    session = session or get_session(url, retries=0)
     offset = 0
-    total_upserted = 0
-    keep_fetching = True
-    
-    while keep_fetching:
+
+    while True:
         params = {
             "api_key": SAM_API_KEY,
             "registrationDate": reg_date, # Registered on or after this date
             "limit": limit,
             "offset": offset
         }
-        
         try:
-            response = requests.get(url, params=params, timeout=30)
-            
-            if response.status_code == 429:
-                print("     ⚠️ Rate limit hit. Sleeping for 10 seconds...")
-                time.sleep(10)
-                continue
-                
-            if response.status_code != 200:
-                print(f"     ❌ Failed to fetch page. Status: {response.status_code}")
-                # Fallback to outputting text if the API lacks v3 access
-                print(f"     Response: {response.text[:200]}")
-                break
-                
-            data = response.json()
-            entities = data.get("entityData", [])
-            
-            if not entities:
-                keep_fetching = False
-                break
-                
-            print(f"     -> Parsing {len(entities)} entity records...")
-            
-            db_payload = []
-            for item in entities:
-                entity = item.get("entityRegistration", {})
-                uei = entity.get("ueiSAM")
-                if not uei: continue
-                
-                legal_name = entity.get("legalBusinessName")
-                dba_name = entity.get("doingBusinessAsName")
-                cage = entity.get("cageCode")
-                
-                # address
-                phys_addr = entity.get("physicalAddress", {})
-                
-                # poc
-                poc = entity.get("electronicBusinessPoc", {})
-                
-                record = {
-                    "uei": uei,
-                    "company_name": legal_name,
-                    "dba_name": dba_name,
-                    "cage_code": cage,
-                    "address_line_1": phys_addr.get("addressLine1"),
-                    "city": phys_addr.get("city"),
-                    "state": phys_addr.get("stateOrProvinceCode"),
-                    "zip_code": phys_addr.get("zipCode"),
-                    "country_code": phys_addr.get("countryCode"),
-                    
-                    "primary_poc_name": f'{poc.get("firstName", "")} {poc.get("lastName", "")}'.strip(),
-                    "primary_poc_email": poc.get("email"),
-                    "primary_poc_phone": poc.get("usPhone"),
-                    "is_sam_registered": True
-                }
-                
-                # Optional: Handle NAICS and Certs if they exist in the v3 payload
-                core = item.get("coreData", {})
-                cert_data = item.get("assertions", {})
-                naics = [n.get("naicsCode") for n in cert_data.get("naicsList", [])]
-                if naics:
-                    record["naics_codes"] = naics
-                    
-                business_types = core.get("businessTypes", [])
-                certs = [bt.get("businessTypeCode") for bt in business_types]
-                if certs:
-                    record["sba_certifications"] = certs
-                
-                db_payload.append(record)
-                
-            if db_payload:
-                try:
-                    supabase.table("contractors").upsert(db_payload, on_conflict="uei").execute()
-                    total_upserted += len(db_payload)
-                    print(f"     ✅ Upserted batch of {len(db_payload)} entities.")
-                except Exception as db_err:
-                    print(f"     ❌ DB upsert error: {db_err}")
-            
-            offset += limit
-            
-        except Exception as e:
-            print(f"     ❌ Error during request: {e}")
-            break
+            data = fetch_page(session, url, params, limiter)
+        except FetchError as e:
+            print(f"     ❌ Entity paging stopped at offset {offset}: {e}")
+            return
+
+        entities = data.get("entityData", [])
+        if not entities:
+            return
+        archive_page("entities", None, offset, entities, params)
+        yield offset, entities
+        offset += limit
+        total = data.get("totalRecords")
+        if len(entities) < limit or (total is not None and offset >= int(total)):
+            return
+
+def normalize_entity(item):
+    entity = item.get("entityRegistration", {})
+    uei = entity.get("ueiSAM")
+    if not uei:
+        return None
+    
+    # address
+    phys_addr = entity.get("physicalAddress", {})
+    
+    # poc
+    poc = entity.get("electronicBusinessPoc", {})
+    
+    record = {
+        "uei": uei,
+        "company_name": entity.get("legalBusinessName"),
+        "dba_name": entity.get("doingBusinessAsName"),
+        "cage_code": entity.get("cageCode"),
+        "address_line_1": phys_addr.get("addressLine1"),
+        "city": phys_addr.get("city"),
+        "state": phys_addr.get("stateOrProvinceCode"),
+        "zip_code": phys_addr.get("zipCode"),
+        "country_code": phys_addr.get("countryCode"),
+        
+        "primary_poc_name": f'{poc.get("firstName", "")} {poc.get("lastName", "")}'.strip(),
+        "primary_poc_email": poc.get("email"),
+        "primary_poc_phone": poc.get("usPhone"),
+        "is_sam_registered": True
+    }
+    
+    # Optional: Handle NAICS and Certs if they exist in the v3 payload
+    core = item.get("coreData", {})
+    cert_data = item.get("assertions", {})
+    naics = [n.get("naicsCode") for n in cert_data.get("naicsList", [])]
+    if naics:
+        record["naics_codes"] = naics
+        
+    business_types = core.get("businessTypes", [])
+    certs = [bt.get("businessTypeCode") for bt in business_types]
+    if certs:
+        record["sba_certifications"] = certs
+    return record
+
+def entity_window_fetcher(limit=100):
+    """`fetch(shard, offset)` for backfill.iter_shard_pages: entities registered inside the shard's window."""
+    from http_transport import get_session
+    from sam_fetcher import TokenBucket, SAM_REQUESTS_PER_SECOND, SAM_BURST, fetch_page, sam_date
+    limiter = TokenBucket(SAM_REQUESTS_PER_SECOND, SAM_BURST)
+    session = get_session(SAM_ENTITIES_URL, retries=0)
+
+    def fetch(shard, offset):
+        window_to = min(shard.window_to, date.today().isoformat()) # The open window ends today
+        params = {"api_key": SAM_API_KEY, "registrationDate": f"[{sam_date(shard.window_from)},{sam_date(window_to)}]",
+                  "limit": shard.limit, "offset": offset}
+        data = fetch_page(session, SAM_ENTITIES_URL, params, limiter)
+        entities = data.get("entityData", [])
+        if entities:
+            archive_page("entities", None, offset, entities, params)
+        return entities, data.get("totalRecords")
+    return fetch
+
+def backfill_entity_pages(supabase, days_back, shard_days, workers=None, checkpoints=None, limit=100):
+    """(offset, entities, landed) for each missing page of an entity backfill; pass `landed` as the page's BulkWriter `then=`."""
+    from run_state import client_source
+    from backfill import CheckpointStore, BACKFILL_WORKERS, backfill_shards, iter_shard_pages
+    store = checkpoints or CheckpointStore()
+    shards = backfill_shards(f"contractors@{client_source(supabase)}", [""], days_back, limit, shard_days)
+    for shard, offset, entities in iter_shard_pages(shards, entity_window_fetcher(limit), store, workers or BACKFILL_WORKERS):
+        yield offset, entities, store.landed(shard, offset, len(entities))
+
+def sync_contractors(days_back=1, supabase=None, pages=None, shard_days=None, workers=None, checkpoints=None,
+                     change_index=INDEX_PATH):
+    """
+    `pages` replaces the SAM.gov fetch with any iterable of (offset, entities). With `shard_days`,
+    runs as a resumable backfill over registration-date windows (see tools/backfill.py).
+    `change_index` is the ChangeTracker database (":memory:" for a throwaway one).
+    """
+    today = datetime.now()
+    reg_date = (today - timedelta(days=days_back)).strftime('%Y-%m-%d')
+    # Use SAM Entity Management API to find entities activated recently
+    
+    print(f"\n[CONTRACTORS] 🔄 Syncing SAM.gov Entities registered since {reg_date}...")
+    
+    supabase = supabase or get_supabase()
+    tracker = ChangeTracker(supabase, "contractors", "uei", db_path=change_index)
+    writer = BulkWriter(supabase, "contractors", on_conflict="uei", tracker=tracker)
+    
+    if shard_days:
+        pages = backfill_entity_pages(supabase, days_back, shard_days, workers, checkpoints)
+    else:
+        pages = ((offset, entities, None) for offset, entities in (iter_entity_pages(reg_date) if pages is None else pages))
+    for offset, entities, landed in pages:
+        print(f"     -> Parsing {len(entities)} entity records...")
+        writer.write([record for record in map(normalize_entity, entities) if record], then=landed)
             
+    writer.close()
+    tracker.close()
+    writer.print_report()
+    tracker.print_report()
+    total_upserted = writer.stats["rows"]
     print(f"[CONTRACTORS] 🎉 Sync complete. Upserted {total_upserted} records.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sync SAM.gov opportunities and entity registrations")
+    parser.add_argument("--days", type=int, default=1, help="Days back to sync (default 1)")
+    args = parser.parse_args()
+    if missing_env("SAM_API_KEY", "SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+        print("❌ Missing required API keys in .env. Halting.")
+        exit(1)
+    
     print("="*60)
     print("🚀 INIT: CAPTURE PILOT 24-HOUR SYNC PIPELINE")
     print("="*60)
     load_lookups()
     
     # 1. Sync Opportunities
-    sync_opportunities(days_back=1)
+    from sam_fetcher import PartialFetch
+    partial = None
+    try:
+        sync_opportunities(days_back=args.days)
+    except PartialFetch as e:
+        partial = e
     
     # 2. Sync Entity Registrations (Contractors)
-    sync_contractors(days_back=1)
+    sync_contractors(days_back=args.days)
     
+    from http_transport import METRICS
+    METRICS.print_summary()
+    if partial:
+        print(f"\n⚠️ Daily sync finished with gaps: {partial}. Re-run to fetch the missing notice types.")
+        exit(1)
     print("\n✅ Daily sync successfully executed.")
@@ -0,0 +1,400 @@
+"""
+The daily run (sync, features, matching, drafting) as one DAG of checkpointed stages.
+
+    lookups ──► sync_opportunities ══ landed batches ══► score_opportunities ─────────┐
+    roster ─────────────────────────────────────────────────┘                          ├──► drafts
+    sync_contractors ──┬──► features ──► score_contractors ─────────────────────────────┘
+    sync_opportunities ┘
+
+Stages start as soon as their dependencies are done, each on its own thread. The roster is the
+contractors already in the table when the run starts, with the features from the last refresh,
+so `score_opportunities` scores each page against it as soon as the page has landed, while the
+two SAM.gov syncs are still running. Once both syncs are done, `features` folds this run's awards
+and registrations into the feature table, and `score_contractors` re-scores every contractor
+the syncs or that refresh touched against every active opportunity.
+
+Every stage transition is checkpointed to .tmp/daily_pipeline_state.json. A run that fails stops
+only the failed stage's dependents; re-running resumes it and skips the stages already done.
+Stages holding in-memory state (lookups, roster) are re-run when a pending stage needs them. A
+resumed scoring stage first re-scores every opportunity written since the run began, so batches
+that landed before the crash are not lost. Per-stage timings, and the seconds until the first
+HOT (elite) match was persisted, are printed and appended to .tmp/daily_pipeline_runs.jsonl.
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from run_state import STATE_DIR, MARK_OVERLAP, load_state, save_state, changed_since
+from llm_cache import CACHE_PATH
+from change_tracker import INDEX_PATH
+from draft_pipeline import DRAFT_CONCURRENCY
+
+STATE_FILE = "daily_pipeline_state.json"
+HISTORY_FILE = os.path.join(STATE_DIR, "daily_pipeline_runs.jsonl")
+NOTICE_CHUNK = 100 # Keeps `in.(...)` filters well under URL length limits
+
+# ==========================================
+# 1. DAG Runner
+# ==========================================
+class Stage:
+    """
+    One unit of the DAG. `run(ctx)` returns the stage's result; checkpointed stages must return
+    something JSON-serializable (it is stored). `feeds` names a stage whose emitted batches this
+    one consumes through `ctx.stream` while that stage is still running.
+    """
+    def __init__(self, name, run, deps=(), feeds=None, checkpoint=True):
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.feeds = feeds
+        self.checkpoint = checkpoint
+
+class UpstreamFailed(Exception):
+    pass
+
+class BatchStream:
+    """Batches handed from a producing stage to its consumer; iteration ends when the producer does."""
+    _END = object()
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.error = None
+
+    def put(self, batch):
+        self.queue.put(batch)
+
+    def close(self, error=None):
+        self.error = error
+        self.queue.put(self._END)
+
+    def __iter__(self):
+        while True:
+            batch = self.queue.get()
+            if batch is self._END:
+                if self.error:
+                    raise UpstreamFailed(self.error)
+                return
+            yield batch
+
+class StageContext:
+    def __init__(self, pipeline, stage, resumed):
+        self.pipeline = pipeline
+        self.stage = stage
+        self.resumed = resumed # An earlier attempt of this run left the stage unfinished
+        self.outputs = pipeline.outputs
+        self.run = pipeline.state["run"]
+        self.stream = pipeline.streams.get(stage.feeds)
+
+    def emit(self, batch):
+        self.pipeline.streams[self.stage.name].put(batch)
+
+    def record(self, metric, value):
+        """First value wins: e.g. the moment the first HOT match landed."""
+        self.pipeline.record(metric, value)
+
+class Pipeline:
+    def __init__(self, stages, state_file=STATE_FILE, history_file=HISTORY_FILE):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_file = state_file
+        self.history_file = history_file
+        self.lock = threading.Condition()
+        self.outputs = {}
+        self.streams = {}
+        self.state = {}
+        self.planned = []
+        self.t0 = None
+
+    def _begin(self, fresh):
+        state = {} if fresh else load_state(self.state_file)
+        if not state.get("run") or state["run"].get("finished_at") or set(state.get("stages", {})) - set(self.stages):
+            now = datetime.now(timezone.utc)
+            state = {"run": {"started_at": now.isoformat(), "mark": (now - MARK_OVERLAP).isoformat(), "attempts": 0,
+                             "finished_at": None}, "stages": {}, "metrics": {}}
+        state["run"]["attempts"] += 1
+        state["metrics"]["attempt_%d" % state["run"]["attempts"]] = {}
+        self.state = state
+        self.t0 = time.perf_counter()
+
+    def _attempt_metrics(self) -> dict:
+        return self.state["metrics"]["attempt_%d" % self.state["run"]["attempts"]]
+
+    def record(self, metric, value):
+        with self.lock:
+            self._attempt_metrics().setdefault(metric, value)
+
+    def _save(self):
+        save_state(self.state_file, self.state)
+
+    def _plan(self) -> list:
+        """Stages to run this attempt: unfinished checkpointed ones, plus the in-memory stages they need."""
+        done = {name for name, info in self.state["stages"].items() if info.get("status") == "done"}
+        planned = {name for name, stage in self.stages.items() if stage.checkpoint and name not in done}
+        frontier = list(planned)
+        while frontier:
+            for dep in self.stages[frontier.pop()].deps:
+                if dep not in planned and not (self.stages[dep].checkpoint and dep in done):
+                    planned.add(dep)
+                    frontier.append(dep)
+        return [name for name in self.stages if name in planned]
+
+    def _execute(self, stage, resumed):
+        info = self.state["stages"][stage.name]
+        started = time.perf_counter()
+        try:
+            result = stage.run(StageContext(self, stage, resumed))
+            status, error = "done", None
+        except Exception as e:
+            result, status, error = None, "failed", f"{type(e).__name__}: {e}"
+            print(f"  ❌ [{stage.name}] {error}")
+        if stage.name in self.streams:
+            self.streams[stage.name].close(error and f"{stage.name} failed")
+        with self.lock:
+            self.outputs[stage.name] = result
+            info.update(status=status, error=error, seconds=round(time.perf_counter() - started, 3),
+                        result=result if stage.checkpoint else None)
+            self._save()
+            self.lock.notify_all()
+
+    def run(self, fresh=False) -> bool:
+        """Runs (or resumes) the DAG. True when every stage is done."""
+        self._begin(fresh)
+        pending = self._plan()
+        self.planned = list(pending)
+        planned = set(pending)
+        for name in pending:
+            self.streams[name] = BatchStream()
+        for name, stage in self.stages.items():
+            if stage.feeds and stage.feeds not in planned:
+                self.streams.setdefault(stage.feeds, BatchStream()).close() # Producer finished in an earlier attempt
+        threads = []
+        with self.lock:
+            # Stale statuses from the last attempt must not block this one; remember which stages it left unfinished
+            unfinished = set()
+            for name in pending:
+                info = self.state["stages"].setdefault(name, {})
+                if info.get("status") in ("running", "failed", "blocked") and self.stages[name].checkpoint:
+                    unfinished.add(name)
+                info.update(status="pending", error=None)
+            self._save()
+            while True:
+                changed = True
+                while changed:
+                    changed = False
+                    for name in list(pending):
+                        stage = self.stages[name]
+                        deps = [self.state["stages"].get(dep, {}).get("status") for dep in stage.deps]
+                        if any(dep in ("failed", "blocked") for dep in deps):
+                            self.state["stages"][name].update(status="blocked", error="a dependency did not finish")
+                            self.streams[name].close(f"{name} blocked")
+                            pending.remove(name)
+                            changed = True
+                        elif all(dep == "done" for dep in deps):
+                            self.state["stages"][name].update(status="running", offset_s=round(time.perf_counter() - self.t0, 3))
+                            thread = threading.Thread(target=self._execute, args=(stage, name in unfinished),
+                                                      name=f"stage-{name}", daemon=True)
+                            threads.append(thread)
+                            thread.start()
+                            pending.remove(name)
+                            changed = True
+                self._save()
+                running = [name for name in planned if self.state["stages"][name].get("status") == "running"]
+                if not pending and not running:
+                    break
+                self.lock.wait()
+        for thread in threads:
+            thread.join()
+
+        complete = all(self.state["stages"].get(name, {}).get("status") == "done" for name in self.stages)
+        if complete:
+            self.state["run"]["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self._attempt_metrics()["seconds"] = round(time.perf_counter() - self.t0, 3)
+        self._save()
+        self._append_history(planned, complete)
+        return complete
+
+    def _append_history(self, planned, complete):
+        run = self.state["run"]
+        entry = {"started_at": run["started_at"], "attempt": run["attempts"], "complete": complete,
+                 **self._attempt_metrics(),
+                 "stages": {name: {k: info.get(k) for k in ("status", "offset_s", "seconds")}
+                            for name, info in self.state["stages"].items() if name in planned}}
+        os.makedirs(os.path.dirname(self.history_file) or ".", exist_ok=True)
+        with open(self.history_file, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def print_timings(self):
+        run = self.state["run"]
+        metrics = self._attempt_metrics()
+        print(f"\n⏱️ Stage timings (attempt {run['attempts']} of the run started {run['started_at']}):")
+        for name in self.stages:
+            info = self.state["stages"].get(name, {})
+            if name not in self.planned:
+                note = "✅ done in an earlier attempt" if info.get("status") == "done" else "not needed this attempt"
+                print(f"  -> {name:<20} {'':>8} {'':>8}  {note}")
+                continue
+            icon = {"done": "✅", "failed": "❌", "blocked": "⏸️"}.get(info.get("status"), "⚠️")
+            seconds = f"{info['seconds']:7.1f}s" if info.get("seconds") is not None else f"{'':>8}"
+            print(f"  -> {name:<20} +{info['offset_s']:6.1f}s {seconds}  {icon} {info.get('status')}"
+                  + (f" ({info['error']})" if info.get("error") else ""))
+        if "first_hot_s" in metrics:
+            print(f"  🔥 First HOT match persisted {metrics['first_hot_s']:.1f}s into the attempt.")
+        print(f"  Total: {metrics.get('seconds', 0):.1f}s")
+
+# ==========================================
+# 2. Daily Stages
+# ==========================================
+def fetch_opportunities(supabase, notice_ids, columns) -> list:
+    rows = []
+    notice_ids = sorted(set(notice_ids))
+    for i in range(0, len(notice_ids), NOTICE_CHUNK):
+        rows.extend(supabase.table("opportunities").select(columns).in_("notice_id", notice_ids[i:i + NOTICE_CHUNK]).execute().data)
+    return rows
+
+def score_and_persist(ctx, supabase, opportunities, contractors, model, totals):
+    from match_engine import score_opportunities, persist_matches
+    db_payload, elite = score_opportunities(opportunities, contractors, model=model)
+    if persist_matches(supabase, db_payload):
+        totals["matches"] += len(db_payload)
+        if elite:
+            ctx.record("first_hot_s", round(time.perf_counter() - ctx.pipeline.t0, 3))
+    totals["opportunities"] += len(opportunities)
+    totals["elite"].extend(elite)
+
+def daily_stages(supabase, days_back=1, snapshot=False, drafts=True, concurrency=DRAFT_CONCURRENCY, llm_cache=CACHE_PATH,
+                 opportunity_pages=None, entity_pages=None, change_index=INDEX_PATH) -> list:
+    """
+    The daily DAG over `supabase`. `opportunity_pages` / `entity_pages` replace the SAM.gov
+    fetches and `change_index` the change tracker's database (see cron_daily_sync).
+    """
+    import cron_daily_sync as sync
+    from repository import fetch_all
+    from pwin_engine import PWinModel
+    from pwin_features import load_features, refresh_feature_table
+    from match_engine import OPPORTUNITY_COLUMNS, CONTRACTOR_COLUMNS
+
+    opportunity_columns = f"{OPPORTUNITY_COLUMNS}, updated_at"
+
+    def lookups(ctx):
+        sync.load_lookups(supabase)
+
+    def sync_opportunities(ctx):
+        sync.sync_opportunities(days_back, supabase, pages=opportunity_pages,
+                                on_batch=lambda rows: ctx.emit([row["notice_id"] for row in rows]), change_index=change_index)
+        return {}
+
+    def sync_contractors(ctx):
+        sync.sync_contractors(days_back, supabase, pages=entity_pages, change_index=change_index)
+        return {}
+
+    def features(ctx):
+        refresh_feature_table(supabase)
+        return {}
+
+    def touched_contractors(ctx) -> list:
+        """Contractors this run wrote, plus those whose award history the feature refresh changed."""
+        since = lambda q: q.gte("updated_at", ctx.run["mark"])
+        touched = {con["id"]: con for con in fetch_all(supabase, "contractors", CONTRACTOR_COLUMNS, where=since)}
+        refreshed = sorted({row["contractor_id"] for row in fetch_all(supabase, "contractor_features", "contractor_id",
+                                                                      key="contractor_id", where=since)} - set(touched))
+        for i in range(0, len(refreshed), NOTICE_CHUNK):
+            chunk = refreshed[i:i + NOTICE_CHUNK]
+            touched.update((con["id"], con) for con in fetch_all(supabase, "contractors", CONTRACTOR_COLUMNS,
+                                                                   where=lambda q, chunk=chunk: q.in_("id", chunk)))
+        return list(touched.values())
+
+    def roster(ctx):
+        if snapshot:
+            from roster_snapshot import refresh_snapshot
+            contractors = refresh_snapshot(supabase)
+        else:
+            contractors = fetch_all(supabase, "contractors", CONTRACTOR_COLUMNS)
+        feature_rows = load_features(supabase)
+        print(f"  -> Roster ready: {len(contractors)} contractors, {len(feature_rows)} with award history.")
+        return {"contractors": contractors, "features": feature_rows, "model": PWinModel(contractors, feature_rows)}
+
+    def score_opportunities(ctx):
+        ready = ctx.outputs["roster"]
+        totals = {"opportunities": 0, "matches": 0, "elite": []}
+        scored = set()
+        if ctx.resumed:
+            # Pages that landed before the last attempt died were never scored: catch up on the whole run's writes
+            missed = fetch_all(supabase, "opportunities", opportunity_columns, where=lambda q: q.gte("updated_at", ctx.run["mark"]))
+            score_and_persist(ctx, supabase, missed, ready["contractors"], ready["model"], totals)
+            scored.update(opp["notice_id"] for opp in missed)
+            print(f"  -> [score_opportunities] Caught up on {len(missed)} opportunities written earlier in this run.")
+        for notice_ids in ctx.stream:
+            # Only what this run wrote: the change tracker skips unchanged notices, and the DB stamps updated_at.
+            # The run mark already sits MARK_OVERLAP before the start, so no further overlap is needed
+            landed = changed_since(fetch_opportunities(supabase, set(notice_ids) - scored, opportunity_columns),
+                                   ctx.run["mark"], overlap=timedelta(0))
+            score_and_persist(ctx, supabase, landed, ready["contractors"], ready["model"], totals)
+            scored.update(opp["notice_id"] for opp in landed)
+        print(f"  ✅ [score_opportunities] {totals['opportunities']} opportunities scored as they landed, "
+              f"{totals['matches']} matches, {len(totals['elite'])} elite.")
+        return totals
+
+    def score_contractors(ctx):
+        totals = {"opportunities": 0, "matches": 0, "elite": []}
+        touched = touched_contractors(ctx)
+        if touched:
+            active = fetch_all(supabase, "opportunities", opportunity_columns, where=lambda q: q.eq("active", True))
+            score_and_persist(ctx, supabase, active, touched, PWinModel(touched, load_features(supabase)), totals)
+        print(f"  ✅ [score_contractors] {len(touched)} new, changed or re-featured contractors scored against "
+              f"{totals['opportunities']} active opportunities, {totals['matches']} matches.")
+        return dict(totals, contractors=len(touched))
+
+    def draft(ctx):
+        from match_engine import draft_outreach_emails
+        elite = {}
+        for name in ("score_opportunities", "score_contractors"):
+            result = ctx.outputs.get(name) or ctx.pipeline.state["stages"][name]["result"]
+            for match in result["elite"]:
+                elite[(match["opportunity_id"], match["contractor_id"])] = match
+        if not elite:
+            print("  -> [drafts] No elite matches this run.")
+            return {"drafts": 0}
+        drafted = draft_outreach_emails(list(elite.values()), supabase, concurrency=concurrency, llm_cache=llm_cache)
+        return {"drafts": len(drafted or [])}
+
+    stages = [
+        Stage("lookups", lookups, checkpoint=False),
+        Stage("sync_opportunities", sync_opportunities, deps=["lookups"]),
+        Stage("sync_contractors", sync_contractors),
+        Stage("features", features, deps=["sync_opportunities", "sync_contractors"]),
+        Stage("roster", roster, checkpoint=False),
+        Stage("score_opportunities", score_opportunities, deps=["roster"], feeds="sync_opportunities"),
+        Stage("score_contractors", score_contractors, deps=["features"]),
+    ]
+    if drafts:
+        stages.append(Stage("drafts", draft, deps=["score_opportunities", "score_contractors"]))
+    return stages
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run (or resume) the daily sync → score → draft pipeline")
+    parser.add_argument("--days", type=int, default=1, help="Days back to sync (default 1)")
+    parser.add_argument("--fresh", action="store_true", help="Start a new run even if the last one did not finish")
+    parser.add_argument("--snapshot", action="store_true", help="Score from the local memory-mapped roster snapshot")
+    parser.add_argument("--no-drafts", action="store_true", help="Stop after scoring")
+    parser.add_argument("--concurrency", type=int, default=DRAFT_CONCURRENCY, help="LLM requests in flight while drafting")
+    parser.add_argument("--no-cache", action="store_true", help="Re-draft even when a cached completion exists")
+    args = parser.parse_args()
+
+    from clients import get_supabase, missing_env
+    if missing_env("SAM_API_KEY", "SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+        print("❌ Missing required API keys in .env. Halting.")
+        exit(1)
+
+    print("="*60)
+    print("🚀 INIT: CAPTURE PILOT DAILY PIPELINE")
+    print("="*60)
+    pipeline = Pipeline(daily_stages(get_supabase(), days_back=args.days, snapshot=args.snapshot, drafts=not args.no_drafts,
+                                     concurrency=args.concurrency, llm_cache=None if args.no_cache else CACHE_PATH))
+    complete = pipeline.run(fresh=args.fresh)
+    pipeline.print_timings()
+    if not complete:
+        print("\n⚠️ Pipeline stopped early. Re-run to resume from the failed stage.")
+        exit(1)
+    print("\n✅ Daily pipeline complete.")
@@ -0,0 +1,306 @@
+"""
+Async LLM drafting pipeline shared by match_engine and 3_generate_email_drafts.
+
+Every prompt is sent through one pooled httpx.AsyncClient, with at most `concurrency` requests
+in flight at once. Each provider has a request-per-minute and a token-per-minute budget: a
+request first reserves its estimated tokens, and the estimate is corrected from the reported
+usage once the response arrives. Timeouts, 429s and 5xx responses are retried with jittered
+exponential backoff (honouring Retry-After). Other 4xx responses fail fast.
+With an LLMCache, prompts whose completion is already cached (same model, rendered prompt and
+parameters) never reach the provider.
+The Supabase side is bulk-only: match IDs are resolved in one ranged query before any tokens
+are spent, and the drafts are written in a single upsert at the end.
+"""
+import os
+import copy
+import time
+import asyncio
+from sam_fetcher import backoff_delay
+from bulk_writer import BulkWriter
+from llm_cache import completion_key
+
+DRAFT_CONCURRENCY = int(os.getenv("DRAFT_CONCURRENCY", "16"))
+DRAFT_TIMEOUT = float(os.getenv("DRAFT_TIMEOUT", "60"))
+DRAFT_MAX_ATTEMPTS = int(os.getenv("DRAFT_MAX_ATTEMPTS", "4"))
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+EXPECTED_OUTPUT_TOKENS = 600 # Reserved per request until the real usage is known
+BURST_SECONDS = 10 # Rate budgets may be spent this far ahead, rather than a whole minute at once
+MATCH_LOOKUP_CHUNK = 100 # IDs per `in.(...)` filter, keeping the query string short
+PAGE_SIZE = 1000
+
+# ==========================================
+# 1. Providers
+# ==========================================
+class Provider:
+    name = None
+    json_params = {} # Generation parameters that make the model answer with bare JSON
+
+    def __init__(self, api_key, model, base_url, rpm, tpm, params=None):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.rpm = rpm
+        self.tpm = tpm
+        # Generation parameters (temperature, ...), sent with every request and part of the cache key
+        self.params = params or {}
+
+    def cache_key(self, prompt: str) -> str:
+        return completion_key(self.name, self.model, prompt, self.params)
+
+    def with_params(self, **params):
+        """A copy of this provider with extra generation parameters (e.g. **json_params)."""
+        clone = copy.copy(self)
+        clone.params = dict(self.params, **params)
+        return clone
+
+    def estimate_tokens(self, prompt: str) -> int:
+        # ~4 characters per token for English prose
+        return len(prompt) // 4 + EXPECTED_OUTPUT_TOKENS
+
+    def request(self, prompt: str):
+        """Returns (url, headers, json body) for one completion."""
+        raise NotImplementedError
+
+    def parse(self, data: dict):
+        """Returns (text, total tokens) from a completion response."""
+        raise NotImplementedError
+
+class OpenAIChat(Provider):
+    name = "openai"
+    json_params = {"response_format": {"type": "json_object"}}
+
+    def __init__(self, api_key, model="gpt-4o-mini", base_url=None, rpm=None, tpm=None, params=None):
+        super().__init__(api_key, model,
+                         base_url or os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+                         rpm or int(os.getenv("OPENAI_RPM", "500")),
+                         tpm or int(os.getenv("OPENAI_TPM", "200000")), params)
+
+    def request(self, prompt):
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        body = dict(self.params, model=self.model, messages=[{"role": "user", "content": prompt}])
+        return f"{self.base_url}/chat/completions", headers, body
+
+    def parse(self, data):
+        return data["choices"][0]["message"]["content"], data.get("usage", {}).get("total_tokens", 0)
+
+class GeminiFlash(Provider):
+    name = "gemini"
+    json_params = {"responseMimeType": "application/json"}
+
+    def __init__(self, api_key, model="gemini-2.5-flash", base_url=None, rpm=None, tpm=None, params=None):
+        super().__init__(api_key, model,
+                         base_url or os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta"),
+                         rpm or int(os.getenv("GEMINI_RPM", "1000")),
+                         tpm or int(os.getenv("GEMINI_TPM", "1000000")), params)
+
+    def request(self, prompt):
+        headers = {"x-goog-api-key": self.api_key, "Content-Type": "application/json"}
+        body = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if self.params:
+            body["generationConfig"] = self.params
+        return f"{self.base_url}/models/{self.model}:generateContent", headers, body
+
+    def parse(self, data):
+        if not data.get("candidates"):
+            # Blocked prompts come back as 200 with only promptFeedback
+            raise DraftError(f"no candidates (blockReason: {(data.get('promptFeedback') or {}).get('blockReason', 'unknown')})")
+        parts = data["candidates"][0]["content"]["parts"]
+        return "".join(p.get("text", "") for p in parts), data.get("usageMetadata", {}).get("totalTokenCount", 0)
+
+class DraftError(Exception):
+    pass
+
+# ==========================================
+# 2. Rate Limiting
+# ==========================================
+class AsyncRateLimiter:
+    """Continuously refilled request and token budgets for one provider (single event loop)."""
+    def __init__(self, rpm, tpm, burst_seconds=BURST_SECONDS):
+        self.request_rate = rpm / 60.0
+        self.token_rate = tpm / 60.0
+        self.request_capacity = max(1.0, self.request_rate * burst_seconds)
+        self.token_capacity = max(1.0, self.token_rate * burst_seconds)
+        self.requests = self.request_capacity
+        self.tokens = self.token_capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self.updated
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_rate)
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_rate)
+        self.updated = now
+
+    async def acquire(self, tokens: int) -> int:
+        """Waits until one request and `tokens` tokens are available. Returns the tokens reserved."""
+        # A prompt bigger than the whole burst would otherwise wait forever
+        tokens = min(tokens, self.token_capacity)
+        while True:
+            self._refill()
+            if self.requests >= 1 and self.tokens >= tokens:
+                self.requests -= 1
+                self.tokens -= tokens
+                return tokens
+            await asyncio.sleep(max((1 - self.requests) / self.request_rate,
+                                    (tokens - self.tokens) / self.token_rate, 0.001))
+
+    def settle(self, reserved: int, used: int):
+        # Under-estimates leave the budget negative, so later requests wait for the overdraft
+        self._refill()
+        self.tokens = min(self.token_capacity, self.tokens + reserved - used)
+
+    def drain(self):
+        # A 429 means the provider's window is ahead of our estimate; stop bursting
+        self._refill()
+        self.requests = min(self.requests, 0.0)
+
+# ==========================================
+# 3. Drafting
+# ==========================================
+
+async def _draft_one(client, provider, limiter, slots, job, timeout, max_attempts, stats, cache):
+    import httpx
+    url, headers, body = provider.request(job["prompt"])
+    error = None
+    async with slots:
+        for attempt in range(max_attempts):
+            reserved = await limiter.acquire(provider.estimate_tokens(job["prompt"]))
+            retry_after = None
+            try:
+                response = await client.post(url, headers=headers, json=body, timeout=timeout)
+            except httpx.TimeoutException as e:
+                limiter.settle(reserved, 0)
+                stats["timeouts"] += 1
+                error = DraftError(f"timed out after {timeout}s ({type(e).__name__})")
+            except httpx.TransportError as e:
+                limiter.settle(reserved, 0)
+                error = DraftError(f"transport error: {e}")
+            else:
+                if response.status_code < 400:
+                    try:
+                        text, tokens = provider.parse(response.json())
+                        if text is None:
+                            raise DraftError("empty completion (refused or filtered)")
+                    except (DraftError, KeyError, IndexError, TypeError, ValueError) as e:
+                        # A blocked or malformed completion fails this job only; asking again gets the same answer
+                        limiter.settle(reserved, 0)
+                        error = e if isinstance(e, DraftError) else DraftError(
+                            f"malformed completion ({type(e).__name__}: {e}): {response.text[:200]}")
+                        break
+                    limiter.settle(reserved, tokens)
+                    stats["tokens"] += tokens
+                    if cache is not None:
+                        cache.put(provider.cache_key(job["prompt"]), provider.model, text, tokens)
+                    return dict(job, text=text, tokens=tokens, attempts=attempt + 1, cached=False)
+                limiter.settle(reserved, 0)
+                error = DraftError(f"HTTP {response.status_code}: {response.text[:200]}")
+                if response.status_code not in RETRY_STATUSES:
+                    break
+                if response.status_code == 429:
+                    limiter.drain()
+                    retry_after = response.headers.get("Retry-After")
+            if attempt + 1 < max_attempts:
+                stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt, retry_after))
+    return dict(job, text=None, tokens=0, cached=False, error=str(error))
+
+async def draft_async(jobs, provider, concurrency=DRAFT_CONCURRENCY, timeout=DRAFT_TIMEOUT,
+                      max_attempts=DRAFT_MAX_ATTEMPTS, limiter=None, cache=None):
+    import httpx # Deferred: importing a tool that drafts must not pay for the HTTP client
+    stats = {"jobs": len(jobs), "drafted": 0, "failed": 0, "retries": 0, "timeouts": 0, "tokens": 0,
+             "cache_hits": 0, "tokens_saved": 0}
+    limiter = limiter or AsyncRateLimiter(provider.rpm, provider.tpm)
+    slots = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    started = time.perf_counter()
+
+    keys = [provider.cache_key(job["prompt"]) for job in jobs] if cache is not None else []
+    cached = cache.get_many(keys) if keys else {}
+    results = [None] * len(jobs)
+    pending = []
+    for i, job in enumerate(jobs):
+        hit = cached.get(keys[i]) if cached else None
+        if hit:
+            text, tokens = hit
+            results[i] = dict(job, text=text, tokens=tokens, attempts=0, cached=True)
+            stats["cache_hits"] += 1
+            stats["tokens_saved"] += tokens
+        else:
+            pending.append(i)
+
+    if pending:
+        async with httpx.AsyncClient(limits=limits) as client:
+            drafted = await asyncio.gather(*(
+                _draft_one(client, provider, limiter, slots, jobs[i], timeout, max_attempts, stats, cache) for i in pending),
+                return_exceptions=True)
+        for i, result in zip(pending, drafted):
+            if isinstance(result, BaseException):
+                # One job's unexpected failure must not cost the rest of the batch their drafts
+                result = dict(jobs[i], text=None, tokens=0, cached=False, error=f"{type(result).__name__}: {result}")
+            results[i] = result
+    for result in results:
+        stats["drafted" if result["text"] is not None else "failed"] += 1
+    stats["elapsed"] = time.perf_counter() - started
+    return results, stats
+
+def draft_all(jobs, provider, **kwargs):
+    """
+    Drafts every job concurrently. Each job is a dict with a `prompt`; other keys are passed through.
+    Returns (results, stats) in job order. Results gain `text`, `tokens` and `cached` (`text` is None
+    and `error` is set on failure). Pass cache=LLMCache(...) to reuse and record completions.
+    """
+    return asyncio.run(draft_async(list(jobs), provider, **kwargs))
+
+def print_stats(provider, stats):
+    print(f"  🤖 {provider.name}/{provider.model}: {stats['drafted']}/{stats['jobs']} drafted in {stats['elapsed']:.1f}s "
+          f"({stats['retries']} retries, {stats['timeouts']} timeouts, {stats['failed']} failed) | "
+          f"{stats['tokens']:,} tokens")
+    if stats["cache_hits"]:
+        print(f"  💾 {stats['cache_hits']} served from cache ({stats['cache_hits'] / max(1, stats['jobs']):.0%}), "
+              f"{stats['tokens_saved']:,} tokens saved")
+
+# ==========================================
+# 4. Bulk Supabase I/O
+# ==========================================
+def _chunks(values, size):
+    values = sorted(values)
+    return [values[i:i + size] for i in range(0, len(values), size)]
+
+def resolve_match_ids(supabase, pairs) -> dict:
+    """{(opportunity_id, contractor_id): match id} for every pair that exists in `matches`."""
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    contractor_ids = {c for _, c in pairs}
+    resolved = {}
+    for opp_chunk in _chunks({o for o, _ in pairs}, MATCH_LOOKUP_CHUNK):
+        start = 0
+        while True:
+            query = supabase.table("matches").select("id, opportunity_id, contractor_id").in_("opportunity_id", opp_chunk)
+            if len(contractor_ids) <= MATCH_LOOKUP_CHUNK:
+                query = query.in_("contractor_id", sorted(contractor_ids))
+            rows = query.order("id").range(start, start + PAGE_SIZE - 1).execute().data
+            for row in rows:
+                key = (row["opportunity_id"], row["contractor_id"])
+                if key in pairs:
+                    resolved[key] = row["id"]
+            if len(rows) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+    return resolved
+
+def fetch_by_ids(supabase, table, columns, ids) -> dict:
+    """{id: row} for the given primary keys, in as few queries as the filter length allows."""
+    rows = {}
+    for chunk in _chunks(set(ids), MATCH_LOOKUP_CHUNK):
+        for row in supabase.table(table).select(f"id, {columns}").in_("id", chunk).execute().data:
+            rows[row["id"]] = row
+    return rows
+
+def save_drafts(supabase, drafts) -> int:
+    """Upserts drafts on match_id (one active draft per match) in bulk. Returns rows written."""
+    if not drafts:
+        return 0
+    with BulkWriter(supabase, "outreach_drafts", on_conflict="match_id") as writer:
+        writer.write(drafts)
+    return writer.stats["rows"]
@@ -0,0 +1,184 @@
+"""
+Deterministic checks for the SOP constraints on generated outreach drafts.
+
+Every email must be under MAX_WORDS words, and must mention the opportunity's NAICS code and
+its response deadline. The deadline counts as mentioned in any of the usual written forms
+(2026-11-03, 11/03/2026, 11/3/2026, November 3, 2026, Nov 3rd 2026, 3 November 2026, ...).
+Each draft set must hold exactly STRATEGY_COUNT emails split on '---'.
+
+repair_drafts() regenerates only the failing emails, each from a targeted repair prompt naming
+its violations, for at most DRAFT_REPAIR_ROUNDS rounds, and reports first-pass and final pass
+rates. Runs append those counts to .tmp/draft_quality.jsonl.
+"""
+import os
+import re
+import json
+from datetime import datetime, timezone
+from run_state import parse_timestamp, state_path
+from draft_pipeline import DRAFT_CONCURRENCY, draft_all
+
+MAX_WORDS = 180
+STRATEGY_COUNT = 3
+
+# ==========================================
+# 1. SOP Checks
+# ==========================================
+_ORDINAL = re.compile(r"\b(\d{1,2})(st|nd|rd|th)\b")
+_SPACE = re.compile(r"\s+")
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+def _normalize(text: str) -> str:
+    text = _ORDINAL.sub(r"\1", text.lower().replace(",", " ").replace(".", " "))
+    return _SPACE.sub(" ", text)
+
+def deadline_forms(deadline) -> set:
+    """Normalized spellings of the deadline's date that count as mentioning it."""
+    raw = str(deadline or "").strip()
+    forms = {_normalize(raw)} if raw else set()
+    try:
+        parsed = parse_timestamp(raw)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        return forms
+    month, day, year = parsed.month, parsed.day, parsed.year
+    forms |= {f"{year}-{month:02d}-{day:02d}", f"{month:02d}/{day:02d}/{year}", f"{month}/{day}/{year}"}
+    for name in (parsed.strftime("%B"), parsed.strftime("%b")):
+        forms |= {f"{name} {day} {year}", f"{day} {name} {year}"}
+    return {_normalize(f) for f in forms}
+
+def check_email(text: str, naics_code, deadline) -> list:
+    """SOP violations for one email ([] when it passes)."""
+    violations = []
+    words = word_count(text)
+    if words >= MAX_WORDS:
+        violations.append(f"{words} words (must be under {MAX_WORDS})")
+    if naics_code and not re.search(rf"(?<!\d){re.escape(str(naics_code))}(?!\d)", text):
+        violations.append(f"missing NAICS code {naics_code}")
+    forms = deadline_forms(deadline)
+    normalized = _normalize(text)
+    if forms and not any(form in normalized for form in forms):
+        violations.append(f"missing response deadline {deadline}")
+    return violations
+
+# ==========================================
+# 2. Repair Loop
+# ==========================================
+STRATEGIES = [
+    "Standard Opportunity Alert (Direct, professional)",
+    "Certification Leverage Angle (Focus heavily on their specific certifications matching the set-aside)",
+    "Early Engagement Focus (Focus on this being an early Sources Sought or Presolicitation to shape the requirements)",
+]
+DRAFT_REPAIR_ROUNDS = int(os.getenv("DRAFT_REPAIR_ROUNDS", "2"))
+# Bump whenever repair_prompt() changes: cached repairs from older versions are dropped
+REPAIR_TEMPLATE_VERSION = "1"
+QUALITY_LOG = state_path("draft_quality.jsonl")
+
+def split_drafts(text: str) -> list:
+    return [d.strip() for d in (text or "").split("---") if d.strip()]
+
+def check_drafts(emails, naics_code, deadline) -> dict:
+    """{slot: violations} for every failing strategy slot; a missing slot is a violation too."""
+    failing = {}
+    for slot in range(STRATEGY_COUNT):
+        if slot >= len(emails) or not emails[slot]:
+            failing[slot] = [f"strategy {slot + 1} missing"]
+            continue
+        violations = check_email(emails[slot], naics_code, deadline)
+        if violations:
+            failing[slot] = violations
+    return failing
+
+def repair_prompt(item, slot, email, violations) -> str:
+    rules = f"""
+        CRITICAL CONSTRAINTS (DO NOT VIOLATE):
+        1. The email MUST be under {MAX_WORDS} words.
+        2. You MUST mention the specific NAICS code: {item['naics_code']}.
+        3. You MUST mention the Response Deadline: {item['response_deadline']}.
+        
+        Return only the email text, with no preamble and no '---' separators.
+        """
+    if email is None:
+        return f"""
+        You are the Strategic Capture Intelligence Engine.
+        Write one email from a capture advisor to {item['cont_name']} about the federal opportunity '{item['opp_title']}'.
+        Strategy: {STRATEGIES[slot]}
+        {rules}"""
+    return f"""
+        You are the Strategic Capture Intelligence Engine.
+        The email below breaks these rules: {'; '.join(violations)}.
+        Rewrite it to fix exactly those problems, keeping its strategy ({STRATEGIES[slot]}), facts and tone.
+        {rules}
+        EMAIL:
+        {email}
+        """
+
+def repair_drafts(results, provider, concurrency=DRAFT_CONCURRENCY, max_rounds=DRAFT_REPAIR_ROUNDS, cache=None):
+    """
+    Validates every drafted result (needs `text`, `naics_code`, `response_deadline`, `cont_name`,
+    `opp_title`) and regenerates only the failing emails, each with a targeted repair prompt, for
+    at most `max_rounds` rounds. Results gain `valid` (and `violations` when still failing); a
+    repaired result's `text` and `tokens` include the fixes. Returns (results, quality stats).
+    """
+    quality = {"drafts": 0, "emails": 0, "first_pass": 0, "repaired": 0, "failed": 0,
+               "repair_requests": 0, "repair_tokens": 0, "rounds": 0}
+    state = {}
+    for i, result in enumerate(results):
+        if result.get("text") is None:
+            continue
+        emails = split_drafts(result["text"])[:STRATEGY_COUNT] # Extra strategies are dropped, not regenerated
+        failing = check_drafts(emails, result["naics_code"], result["response_deadline"])
+        state[i] = (emails + [None] * (STRATEGY_COUNT - len(emails)), failing)
+        quality["drafts"] += 1
+        quality["emails"] += STRATEGY_COUNT
+        quality["first_pass"] += STRATEGY_COUNT - len(failing)
+    
+    for round_no in range(max_rounds):
+        jobs = [{"result": i, "slot": slot, "prompt": repair_prompt(results[i], slot, emails[slot], violations)}
+                for i, (emails, failing) in state.items() for slot, violations in failing.items()]
+        if not jobs:
+            break
+        quality["rounds"] = round_no + 1
+        print(f"  🔧 Repair round {round_no + 1}: regenerating {len(jobs)} failing emails...")
+        fixes, stats = draft_all(jobs, provider, concurrency=concurrency, cache=cache)
+        quality["repair_requests"] += len(jobs) - stats["cache_hits"]
+        quality["repair_tokens"] += stats["tokens"]
+        for fix in fixes:
+            result = results[fix["result"]]
+            emails, failing = state[fix["result"]]
+            result["tokens"] += fix["tokens"] if not fix["cached"] else 0
+            if fix["text"] is None:
+                continue
+            candidate = split_drafts(fix["text"])[:1]
+            emails[fix["slot"]] = candidate[0] if candidate else emails[fix["slot"]]
+            violations = check_drafts(emails, result["naics_code"], result["response_deadline"]).get(fix["slot"])
+            if violations:
+                failing[fix["slot"]] = violations
+            else:
+                del failing[fix["slot"]]
+                quality["repaired"] += 1
+    
+    for i, (emails, failing) in state.items():
+        result = results[i]
+        result["valid"] = not failing
+        quality["failed"] += len(failing)
+        if failing:
+            result["violations"] = {slot + 1: v for slot, v in failing.items()}
+        else:
+            result["text"] = "\n---\n".join(emails)
+    return results, quality
+
+def print_quality(quality):
+    emails = max(1, quality["emails"])
+    print(f"  📏 Draft validation: {quality['first_pass']}/{quality['emails']} emails passed first time "
+          f"({quality['first_pass'] / emails:.0%}), {quality['repaired']} repaired in {quality['repair_requests']} requests "
+          f"({quality['repair_tokens']:,} tokens), {quality['failed']} still failing "
+          f"({(quality['emails'] - quality['failed']) / emails:.0%} final pass rate)")
+
+def record_quality(quality, path=QUALITY_LOG):
+    """Appends the run's pass/fail counts to the quality log, one JSON line per run."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(dict(quality, recorded_at=datetime.now(timezone.utc).isoformat())) + "\n")
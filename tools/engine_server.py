@@ -0,0 +1,377 @@
+"""
+Resident engine process behind the dashboard's actions (ingest, score, drafts, log).
+
+`python tools/engine_server.py` imports the tools, loads .env and creates the Supabase client
+once, then serves jobs over a local HTTP API, so a dashboard click is a millisecond dispatch
+instead of a cold interpreter start plus SDK imports. Module-level caches (agency lookups, HTTP
+sessions) stay warm between jobs; taxonomy IDs are built per scoring run and freed with it.
+
+Jobs run from a FIFO queue, ENGINE_WORKERS at a time (1 by default, so two jobs never write the
+same tables at once). Submitting a job identical to one still queued or running (same action and
+parameters) returns that job instead of starting a second copy. Everything a job prints, from its
+own thread or from any thread it starts (fetcher producers, writer and scoring pools), is kept as
+its output, and can be followed live.
+
+  POST /jobs/<action>     JSON parameters -> 202 {"job": ...}; 200 with "deduplicated": true if joined
+  GET  /jobs/<id>         status, timings and output lines (?since=N for lines after the first N)
+  GET  /jobs/<id>/stream  NDJSON: {"line": ...} per output line as it is printed, then {"job": ...}
+  GET  /jobs              recent jobs, newest first (without output)
+  GET  /health
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import inspect
+import argparse
+import importlib
+import threading
+import traceback
+from collections import OrderedDict, deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+ENGINE_HOST = os.getenv("ENGINE_HOST", "127.0.0.1")
+ENGINE_PORT = int(os.getenv("ENGINE_PORT", "8765"))
+ENGINE_WORKERS = int(os.getenv("ENGINE_WORKERS", "1"))
+JOB_HISTORY = 200 # Finished jobs kept for status lookups
+STREAM_POLL = 15.0 # Seconds a stream waits for output before re-checking the connection
+
+# ==========================================
+# 1. Jobs & Output Capture
+# ==========================================
+class JobOutput:
+    """sys.stdout stand-in: writes from a thread running a job go to that job, the rest to the console."""
+    def __init__(self, console):
+        self.console = console
+        self.local = threading.local()
+
+    def current(self):
+        return getattr(self.local, "job", None)
+
+    def write(self, text):
+        job = self.current()
+        if job is None:
+            return self.console.write(text)
+        job.append_output(text)
+        return len(text)
+
+    def flush(self):
+        self.console.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.console, name)
+
+class Job:
+    def __init__(self, action, params, key):
+        self.id = uuid.uuid4().hex[:12]
+        self.action = action
+        self.params = params
+        self.key = key
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.lines = []
+        self._partial = ""
+        self.changed = threading.Condition()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("succeeded", "failed")
+
+    def append_output(self, text):
+        with self.changed:
+            *complete, self._partial = (self._partial + text).split("\n")
+            if complete:
+                self.lines.extend(complete)
+                self.changed.notify_all()
+
+    def start(self):
+        with self.changed:
+            self.status = "running"
+            self.started_at = time.time()
+            self.changed.notify_all()
+
+    def finish(self, status, result=None, error=None):
+        with self.changed:
+            if self._partial:
+                self.lines.append(self._partial)
+                self._partial = ""
+            self.status, self.result, self.error = status, result, error
+            self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def wait(self, since: int, timeout: float):
+        """Output lines after the first `since`, blocking up to `timeout` until there are some or the job ends."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.lines) > since or self.done, timeout)
+            return self.lines[since:], self.done
+
+    def to_dict(self, since=None) -> dict:
+        with self.changed:
+            job = {
+                "id": self.id, "action": self.action, "params": self.params, "status": self.status,
+                "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+                "queued_ms": round(((self.started_at or time.time()) - self.created_at) * 1000, 1),
+                "run_ms": round(((self.finished_at or time.time()) - self.started_at) * 1000, 1) if self.started_at else None,
+                "result": self.result, "error": self.error, "line_count": len(self.lines)
+            }
+            if since is not None:
+                job["output"] = self.lines[since:]
+            return job
+
+class JobQueue:
+    """FIFO job runner with de-duplication of identical queued/running jobs."""
+    def __init__(self, actions: dict, context, workers=ENGINE_WORKERS, stdout: JobOutput = None):
+        self.actions = actions
+        self.context = context
+        self.stdout = stdout or install_job_output()
+        self.jobs = OrderedDict()
+        self.active = {} # dedup key -> queued or running job
+        self.pending = deque()
+        self.lock = threading.Condition()
+        self.closed = False
+        self.threads = [threading.Thread(target=self._work, name=f"engine-worker-{i}", daemon=True) for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def validate(self, action, params):
+        """Raises KeyError for an unknown action, TypeError for parameters it does not take."""
+        inspect.signature(self.actions[action]).bind(self.context, **params)
+
+    def submit(self, action, params=None):
+        """(job, deduplicated): a new queued job, or the identical one already queued or running."""
+        params = params or {}
+        self.validate(action, params)
+        key = json.dumps([action, params], sort_keys=True, default=str)
+        with self.lock:
+            existing = self.active.get(key)
+            if existing is not None:
+                return existing, True
+            job = Job(action, params, key)
+            self.jobs[job.id] = job
+            self.active[key] = job
+            self.pending.append(job)
+            self._trim()
+            self.lock.notify()
+            return job, False
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def recent(self) -> list:
+        with self.lock:
+            return list(reversed(self.jobs.values()))
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self.jobs) - JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def _work(self):
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.pending or self.closed)
+                if self.closed:
+                    return
+                job = self.pending.popleft()
+            job.start()
+            self.stdout.local.job = job
+            try:
+                job.finish("succeeded", result=self.actions[job.action](self.context, **job.params))
+            except Exception as e:
+                traceback.print_exc(file=self.stdout)
+                job.finish("failed", error=f"{type(e).__name__}: {e}")
+            finally:
+                self.stdout.local.job = None
+                with self.lock:
+                    self.active.pop(job.key, None)
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+
+def install_job_output() -> JobOutput:
+    if not isinstance(sys.stdout, JobOutput):
+        sys.stdout = JobOutput(sys.stdout)
+        _inherit_job_output(sys.stdout)
+    return sys.stdout
+
+def _inherit_job_output(output: JobOutput):
+    """A thread started while a job runs (directly or as a pool worker) prints into that job."""
+    start = threading.Thread.start
+
+    def start_in_job(thread):
+        job = output.current()
+        if job is not None:
+            run = thread.run
+            def run_in_job():
+                output.local.job = job
+                try:
+                    run()
+                finally:
+                    output.local.job = None
+            thread.run = run_in_job
+        return start(thread)
+    threading.Thread.start = start_in_job
+
+# ==========================================
+# 2. Warm Context & Actions
+# ==========================================
+class EngineContext:
+    """What stays resident between jobs: loaded .env, imported tools and one Supabase client."""
+    def __init__(self):
+        self._modules = {}
+        self._lock = threading.Lock()
+
+    def module(self, name):
+        with self._lock:
+            if name not in self._modules:
+                self._modules[name] = importlib.import_module(name)
+            return self._modules[name]
+
+    @property
+    def supabase(self):
+        from clients import get_supabase, missing_env
+        if missing_env("SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+            raise RuntimeError("Missing SUPABASE_URL / SUPABASE_SERVICE_KEY in .env")
+        return get_supabase()
+
+    def warm_up(self, modules):
+        for name in modules:
+            self.module(name)
+        self.supabase
+
+def flag(value) -> bool:
+    # Form posts send "true"/"on"/"1"; JSON sends real booleans
+    return value if isinstance(value, bool) else str(value).strip().lower() in ("1", "true", "yes", "on")
+
+def run_ingest(ctx, days_back=7, shard_days=None):
+    ctx.module("1_ingest_sam").ingest_sam_opportunities(days_back=int(days_back), supabase=ctx.supabase,
+                                                        shard_days=int(shard_days) if shard_days else None)
+
+def run_score(ctx, min_tier=None, incremental=False, engine="python", snapshot=False):
+    ctx.module("2_score_matches").score_matches(min_tier=min_tier or None, incremental=flag(incremental), engine=engine,
+                                                snapshot=flag(snapshot), supabase=ctx.supabase)
+
+def run_drafts(ctx, limit=5, batched=False):
+    drafts = ctx.module("3_generate_email_drafts").generate_email_drafts(limit=int(limit) or None, batched=flag(batched),
+                                                                          supabase=ctx.supabase)
+    return {"drafts": len(drafts or [])}
+
+def run_log(ctx, opportunity_id, contractor_id, won, loss_reason=None, hours_spent=0.0):
+    ctx.module("4_log_outcome").ingest_outcome_feedback(opportunity_id, contractor_id, flag(won), loss_reason=loss_reason,
+                                                        hours_spent=float(hours_spent), supabase=ctx.supabase)
+
+ACTIONS = {"ingest": run_ingest, "score": run_score, "drafts": run_drafts, "log": run_log}
+WARM_MODULES = ("1_ingest_sam", "2_score_matches", "3_generate_email_drafts", "4_log_outcome")
+
+# ==========================================
+# 3. HTTP API
+# ==========================================
+class EngineHandler(BaseHTTPRequestHandler):
+    queue: JobQueue = None # Set by make_server()
+
+    def log_message(self, format, *args):
+        pass # Job output is the log; per-request lines would drown it
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        url = urlparse(self.path)
+        return [part for part in url.path.split("/") if part], parse_qs(url.query)
+
+    def do_POST(self):
+        parts, _ = self._route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            return self._send(404, {"error": "Not found"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            params = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            if not isinstance(params, dict):
+                raise ValueError("Parameters must be a JSON object")
+            job, deduplicated = self.queue.submit(parts[1], params)
+        except KeyError:
+            return self._send(404, {"error": f"Unknown action '{parts[1]}'", "actions": sorted(self.queue.actions)})
+        except (TypeError, ValueError) as e:
+            return self._send(400, {"error": f"Bad parameters for '{parts[1]}': {e}"})
+        self._send(200 if deduplicated else 202, {"job": job.to_dict(), "deduplicated": deduplicated})
+
+    def do_GET(self):
+        parts, query = self._route()
+        if parts == ["health"]:
+            return self._send(200, {"ok": True, "actions": sorted(self.queue.actions)})
+        if parts == ["jobs"]:
+            return self._send(200, {"jobs": [job.to_dict() for job in self.queue.recent()]})
+        job = self.queue.get(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+        if job is None:
+            return self._send(404, {"error": "Not found"})
+        since = int(query.get("since", ["0"])[0])
+        if parts[2:] == ["stream"]:
+            return self._stream(job, since)
+        if not parts[2:]:
+            return self._send(200, {"job": job.to_dict(since=since)})
+        self._send(404, {"error": "Not found"})
+
+    def _stream(self, job, since):
+        # No Content-Length: the body is newline-delimited JSON until the job ends and the connection closes
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        try:
+            done = False
+            while not done:
+                lines, done = job.wait(since, STREAM_POLL)
+                since += len(lines)
+                chunk = "".join(json.dumps({"line": line}) + "\n" for line in lines)
+                self.wfile.write(chunk.encode() or b"\n")
+                self.wfile.flush()
+            self.wfile.write((json.dumps({"job": job.to_dict()}, default=str) + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass # Client went away; the job keeps running
+        self.close_connection = True
+
+def make_server(queue: JobQueue, host=ENGINE_HOST, port=ENGINE_PORT) -> ThreadingHTTPServer:
+    handler = type("BoundEngineHandler", (EngineHandler,), {"queue": queue})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident engine serving dashboard actions as jobs")
+    parser.add_argument("--host", default=ENGINE_HOST, help="Interface to bind (keep it local)")
+    parser.add_argument("--port", type=int, default=ENGINE_PORT, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=ENGINE_WORKERS, help="Jobs run at the same time")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    context = EngineContext()
+    try:
+        context.warm_up(WARM_MODULES)
+    except RuntimeError as e:
+        print(f"❌ {e}. Halting execution.")
+        sys.exit(1)
+    queue = JobQueue(ACTIONS, context, workers=args.workers)
+    server = make_server(queue, args.host, args.port)
+    print(f"🚀 Engine warm in {time.perf_counter() - t0:.2f}s. Listening on http://{args.host}:{args.port} "
+          f"({', '.join(sorted(ACTIONS))}).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Shutting down engine.")
+    finally:
+        queue.close()
+        server.server_close()
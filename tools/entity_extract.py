@@ -0,0 +1,248 @@
+"""
+Fast reader for the SAM.gov entity extract (pipe-delimited .dat, latin-1).
+
+The file is memory-mapped and cut into large chunks on line boundaries. Each chunk is split into
+lines in one C-level call, and every line is split only as far as the last column we use
+(field 92), never across the ~150 fields of a full record. The status column is checked on the
+raw bytes, so inactive registrations are dropped before anything is decoded. Only the ~20 fields
+we keep are decoded, and each active entity becomes a compact `EntityRecord` tuple. With
+workers > 1, chunks fan out to processes that each map the file themselves, so only the
+parsed records cross the process boundary.
+"""
+import os
+import mmap
+from datetime import datetime
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from concurrent.futures import ProcessPoolExecutor
+
+CHUNK_BYTES = 16 * 1024 * 1024
+LAST_FIELD = 92 # Highest column index we read (secondary POC last name)
+MIN_FIELDS = 50 # Shorter lines are malformed
+
+# ==========================================
+# 1. Field Normalization
+# ==========================================
+@lru_cache(maxsize=65536)
+def parse_date(date_str: str) -> Optional[str]:
+    # Cached: the extract repeats a few thousand distinct dates across hundreds of thousands of rows
+    if not date_str or len(date_str) != 8:
+        return None
+    try:
+        # Expected format YYYYMMDD
+        parsed = datetime.strptime(date_str, "%Y%m%d")
+        return parsed.strftime("%Y-%m-%d")
+    except ValueError:
+        return None
+
+def clean_taxonomy(tax_str: str) -> list[str]:
+    if not tax_str:
+        return []
+    # Split by ~ and strip Y/N suffixes commonly found in NAICS/PSC flags
+    items = tax_str.split('~')
+    cleaned = []
+    for item in items:
+        item = item.strip()
+        if not item: continue
+        if item.endswith('Y') or item.endswith('N'):
+            item = item[:-1]
+        cleaned.append(item)
+    return list(set(cleaned))
+
+def map_sba_codes(certs_str: str) -> list[str]:
+    if not certs_str:
+        return []
+    codes = certs_str.split('~')
+    mapping = {
+        'A2': 'WOSB',
+        'A5': 'VOSB',
+        'QF': 'SDVOSB',
+        'HQ': 'HUBZone',
+        '8W': '8A',
+        'XX': 'SDB',     # Generic substitution logic for demonstration
+        'JT': '8A_JV',
+        'XX': 'MINORITY'
+    }
+    # Keep the raw code if unmapped, or just the mapped string
+    result = []
+    for c in codes:
+        if c in mapping:
+            result.append(mapping[c])
+        else:
+            result.append(c) # store raw code as fallback
+    return list(set(result))
+
+def trunc(val: str, length: int) -> Optional[str]:
+    v = val.strip() if val else ""
+    return v[:length] if v else None
+
+# Every latin-1 byte that str.strip() would remove, so stripping raw bytes matches trunc() exactly
+_WS = bytes(c for c in range(256) if chr(c).isspace())
+
+@lru_cache(maxsize=65536)
+def _taxonomy(raw: bytes) -> tuple:
+    # clean_taxonomy() on raw bytes: split on ~, strip, drop the Y/N flag suffix, dedupe
+    items = set()
+    for item in raw.split(b'~'):
+        item = item.strip(_WS)
+        if not item: continue
+        if item[-1:] in (b'Y', b'N'):
+            item = item[:-1]
+        items.add(item)
+    return tuple(sorted(i.decode('latin-1') for i in items))
+
+@lru_cache(maxsize=4096)
+def _certifications(raw: bytes) -> tuple:
+    return tuple(sorted(map_sba_codes(raw.decode('latin-1').strip())))
+
+# ==========================================
+# 2. Records
+# ==========================================
+class EntityRecord(NamedTuple):
+    uei: str
+    cage_code: Optional[str]
+    company_name: Optional[str]
+    dba_name: Optional[str]
+    address_line_1: Optional[str]
+    city: Optional[str]
+    state: Optional[str]
+    zip_code: Optional[str]
+    country_code: Optional[str]
+    activation_date: Optional[str]
+    expiration_date: Optional[str]
+    business_url: Optional[str]
+    sba_certifications: tuple
+    naics_codes: tuple
+    psc_codes: tuple
+    primary_poc_name: Optional[str]
+    secondary_poc_name: Optional[str]
+
+    def to_row(self) -> dict:
+        """The `contractors` upsert payload for this entity."""
+        row = self._asdict()
+        row["is_sam_registered"] = True
+        for column in ("sba_certifications", "naics_codes", "psc_codes"):
+            row[column] = list(row[column])
+        return row
+
+def _text(raw: bytes, length: int) -> Optional[str]:
+    # trunc() on raw bytes; latin-1 is one byte per character, so slicing before decoding is exact
+    return raw.strip(_WS)[:length].decode('latin-1') or None
+
+def _poc_name(row, first: int, last: int) -> Optional[str]:
+    # Contact parsing: First + Last. Public extracts omit email/phone.
+    first_name = row[first].strip(_WS) if len(row) > first else b""
+    last_name = row[last].strip(_WS) if len(row) > last else b""
+    if not first_name and not last_name:
+        return None
+    return (first_name + b" " + last_name).strip(_WS)[:255].decode('latin-1')
+
+def parse_lines(buf: bytes):
+    """Parses a block of whole lines. Returns (records, counts) with active/inactive/malformed tallies."""
+    records = []
+    append = records.append
+    counts = {"active": 0, "inactive": 0, "malformed": 0}
+    for line in buf.split(b'\n'):
+        if not line or line.startswith(b'BOF') or line.startswith(b'!end'):
+            continue
+        # Status lives in field 5: peek at it before paying for the full split or any decoding
+        head = line.split(b'|', 6)
+        if len(head) < 7:
+            counts["malformed"] += 1
+            continue
+        if head[5].strip(_WS) != b'A':
+            counts["inactive"] += 1
+            continue # Only ingest active entities
+        row = line.split(b'|', LAST_FIELD + 1)
+        if len(row) < MIN_FIELDS:
+            counts["malformed"] += 1
+            continue
+        uei = row[0].strip(_WS)
+        if not uei:
+            continue
+        # Positional construction, in EntityRecord field order (keyword calls cost ~2x here)
+        append(EntityRecord(
+            uei[:20].decode('latin-1'),
+            _text(row[3], 20),
+            _text(row[11], 255),
+            _text(row[12], 255),
+            _text(row[15], 255),
+            _text(row[17], 100),
+            _text(row[18], 50),
+            _text(row[19], 20),
+            _text(row[21], 3),
+            parse_date(row[9].strip(_WS).decode('latin-1')),
+            parse_date(row[8].strip(_WS).decode('latin-1')),
+            _text(row[26], 255),
+            _certifications(row[31]),
+            _taxonomy(row[34]),
+            _taxonomy(row[36]),
+            _poc_name(row, 46, 48),
+            _poc_name(row, 90, 92),
+        ))
+        counts["active"] += 1
+    return records, counts
+
+# ==========================================
+# 3. Chunked / Parallel Reading
+# ==========================================
+def chunk_bounds(mm, chunk_bytes=CHUNK_BYTES) -> list:
+    """(start, end) byte ranges of roughly chunk_bytes, each ending just after a newline."""
+    bounds, start, size = [], 0, len(mm)
+    while start < size:
+        end = mm.find(b'\n', min(size, start + chunk_bytes))
+        end = size if end == -1 else end + 1
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+_worker_map = None
+
+def _init_worker(filepath):
+    global _worker_map
+    f = open(filepath, 'rb')
+    _worker_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _parse_range(bounds):
+    start, end = bounds
+    return parse_lines(_worker_map[start:end])
+
+def iter_entity_chunks(filepath, workers=1, chunk_bytes=CHUNK_BYTES, stats=None):
+    """
+    Yields one list of EntityRecords per chunk, in file order. `stats`, if given, is filled with
+    active/inactive/malformed counts and bytes read as chunks complete.
+    """
+    stats = stats if stats is not None else {}
+    for key in ("active", "inactive", "malformed", "bytes"):
+        stats.setdefault(key, 0)
+    if os.path.getsize(filepath) == 0:
+        return
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        bounds = chunk_bounds(mm, chunk_bytes)
+        if workers <= 1:
+            results = (parse_lines(mm[start:end]) for start, end in bounds)
+            yield from _tally(results, bounds, stats)
+            return
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(filepath,)) as pool:
+            yield from _tally(_bounded_map(pool, bounds, window=workers * 2), bounds, stats)
+
+def _bounded_map(pool, bounds, window):
+    # Ordered like pool.map, but never more than `window` parsed chunks waiting on the consumer
+    pending = []
+    for b in bounds:
+        pending.append(pool.submit(_parse_range, b))
+        if len(pending) >= window:
+            yield pending.pop(0).result()
+    for future in pending:
+        yield future.result()
+
+def _tally(results, bounds, stats):
+    for (start, end), (records, counts) in zip(bounds, results):
+        for key, value in counts.items():
+            stats[key] += value
+        stats["bytes"] += end - start
+        yield records
+
+def iter_entities(filepath, workers=1, chunk_bytes=CHUNK_BYTES, stats=None):
+    for records in iter_entity_chunks(filepath, workers, chunk_bytes, stats):
+        yield from records
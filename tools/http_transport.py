@@ -0,0 +1,234 @@
+"""
+Shared HTTP transport for every tool that talks to SAM.gov, LLM providers or the web crawler.
+
+* One pooled keep-alive `requests.Session` per host (and retry profile), reused across calls.
+* gzip/deflate negotiation, plus brotli when a brotli decoder is installed.
+* urllib3 retries on 5xx and 429, honouring `Retry-After`.
+* A per-host concurrency cap shared by all sessions and threads.
+* Per-request timing metrics: DNS, connect (TCP + TLS), TTFB, total time and body size,
+  folded into running per-host totals and a latency histogram, so a resident process
+  (the engine server) holds a fixed amount of metrics however many requests it makes.
+"""
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.exceptions import NewConnectionError
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "8"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+DEFAULT_RETRIES = int(os.getenv("HTTP_RETRIES", "3"))
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0) # Upper bounds in seconds; one more bucket for slower
+
+def _accept_encoding() -> str:
+    encodings = ["gzip", "deflate"]
+    for module in ("brotli", "brotlicffi"):
+        try:
+            __import__(module)
+            encodings.append("br")
+            break
+        except ImportError:
+            continue
+    return ", ".join(encodings)
+
+ACCEPT_ENCODING = _accept_encoding()
+
+# ==========================================
+# 1. Timing Metrics
+# ==========================================
+_current = threading.local()
+
+class TransportMetrics:
+    def __init__(self):
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def record(self, entry: dict):
+        """Folds one request into its host's running totals; the entry itself is not kept."""
+        with self.lock:
+            h = self.hosts.get(entry["host"])
+            if h is None:
+                h = self.hosts[entry["host"]] = {"requests": 0, "connections": 0, "dns": 0.0, "connect": 0.0, "ttfb": 0.0,
+                                                 "total": 0.0, "bytes": 0, "errors": 0,
+                                                 "latency": [0] * (len(LATENCY_BUCKETS) + 1)}
+            h["requests"] += 1
+            h["connections"] += entry["new_connections"]
+            h["errors"] += 1 if entry["status"] is None or entry["status"] >= 400 else 0
+            for key in ("dns", "connect", "ttfb", "total", "bytes"):
+                h[key] += entry[key]
+            h["latency"][bisect_left(LATENCY_BUCKETS, entry["total"])] += 1
+
+    def reset(self):
+        with self.lock:
+            self.hosts = {}
+
+    def summary(self) -> dict:
+        """Per-host totals: requests, new connections, errors, seconds spent in each phase, bytes received, latency histogram."""
+        with self.lock:
+            return {host: dict(h, latency=list(h["latency"])) for host, h in self.hosts.items()}
+
+    @staticmethod
+    def percentile(latency: list, q: float):
+        """Upper bound (seconds) of the histogram bucket holding the q-th quantile; None past the last bound."""
+        rank = q * sum(latency)
+        seen = 0
+        for i, count in enumerate(latency):
+            seen += count
+            if count and seen >= rank:
+                return LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else None
+        return None
+
+    def print_summary(self):
+        summary = self.summary()
+        if not summary:
+            return
+        print("\n📶 HTTP transport timings (seconds, summed per host):")
+        for host, h in sorted(summary.items()):
+            p50, p95 = (self.percentile(h["latency"], q) for q in (0.5, 0.95))
+            bound = lambda b: f"<={b}" if b is not None else f">{LATENCY_BUCKETS[-1]}"
+            print(f"  -> {host}: {h['requests']} reqs / {h['connections']} conns / {h['errors']} errors | "
+                  f"dns {h['dns']:.2f} connect {h['connect']:.2f} ttfb {h['ttfb']:.2f} "
+                  f"total {h['total']:.2f} (p50 {bound(p50)}, p95 {bound(p95)}) | {h['bytes'] / 1e6:.2f} MB")
+
+METRICS = TransportMetrics()
+
+def _timing():
+    return getattr(_current, "timing", None)
+
+class _TimedConnectionMixin:
+    def _new_conn(self):
+        timing = _timing()
+        if timing is None:
+            return super()._new_conn()
+        # Resolve once ourselves so DNS is measured apart from the TCP handshake
+        t0 = time.perf_counter()
+        original = self._dns_host
+        try:
+            infos = socket.getaddrinfo(original, self.port, type=socket.SOCK_STREAM)
+            self._dns_host = infos[0][4][0]
+        except socket.gaierror:
+            pass # Let urllib3 raise its own NameResolutionError below
+        timing["dns"] += time.perf_counter() - t0
+        try:
+            return super()._new_conn()
+        except NewConnectionError:
+            if self._dns_host == original:
+                raise
+            # The pinned first address refused: let urllib3 resolve again and walk every address
+            self._dns_host = original
+            return super()._new_conn()
+        finally:
+            self._dns_host = original
+
+    def connect(self):
+        timing = _timing()
+        t0 = time.perf_counter()
+        dns_before = timing["dns"] if timing else 0.0
+        super().connect()
+        if timing is not None:
+            # connect() covers DNS + TCP (+ TLS for https); keep DNS in its own bucket
+            timing["connect"] += time.perf_counter() - t0 - (timing["dns"] - dns_before)
+            timing["new_connections"] += 1
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+class TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+# ==========================================
+# 2. Sessions & Per-Host Caps
+# ==========================================
+_host_caps = {}
+_host_limits = {}
+_sessions = {}
+_registry_lock = threading.Lock()
+
+def set_host_limit(host: str, max_in_flight: int):
+    """Overrides the concurrency cap for one host (call before its first request)."""
+    with _registry_lock:
+        _host_limits[host] = max_in_flight
+        _host_caps.pop(host, None)
+
+def _host_cap(host: str) -> threading.BoundedSemaphore:
+    with _registry_lock:
+        if host not in _host_caps:
+            _host_caps[host] = threading.BoundedSemaphore(_host_limits.get(host, HTTP_MAX_PER_HOST))
+        return _host_caps[host]
+
+class TransportSession(requests.Session):
+    def request(self, method, url, *args, **kwargs):
+        host = urlparse(url).netloc
+        timing = {"dns": 0.0, "connect": 0.0, "new_connections": 0}
+        with _host_cap(host):
+            _current.timing = timing
+            t0 = time.perf_counter()
+            response = None
+            try:
+                response = super().request(method, url, *args, **kwargs)
+                return response
+            finally:
+                _current.timing = None
+                total = time.perf_counter() - t0
+                elapsed = response.elapsed.total_seconds() if response is not None else total
+                METRICS.record({
+                    "host": host,
+                    "method": method,
+                    "status": response.status_code if response is not None else None,
+                    "dns": timing["dns"],
+                    "connect": timing["connect"],
+                    "new_connections": timing["new_connections"],
+                    # requests' elapsed runs from send until headers are parsed
+                    "ttfb": max(0.0, elapsed - timing["dns"] - timing["connect"]),
+                    "total": total,
+                    "bytes": len(response.content) if response is not None and not kwargs.get("stream") else 0
+                })
+
+def get_session(url_or_host: str, retries: int = DEFAULT_RETRIES, retry_methods=("GET", "HEAD")) -> requests.Session:
+    """
+    Returns the shared pooled session for a host. Callers that run their own rate-aware retry
+    loop (e.g. sam_fetcher) pass retries=0 so the two layers don't stack.
+    """
+    parsed = urlparse(url_or_host if "//" in url_or_host else f"https://{url_or_host}")
+    key = (parsed.scheme, parsed.netloc, retries, tuple(retry_methods))
+    with _registry_lock:
+        session = _sessions.get(key)
+        if session is not None:
+            return session
+        session = TransportSession()
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(retry_methods),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = TimedAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+        _sessions[key] = session
+        return session
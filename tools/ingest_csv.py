@@ -1,11 +1,13 @@
 import os
 import csv
-import sys
+import queue
+import argparse
+import threading
 from typing import Optional
-from supabase import create_client, Client
-from dotenv import load_dotenv
-
-load_dotenv()
+from clients import get_supabase
+from agency_cache import AgencyCache, agency_key, SNAPSHOT_FILE
+from bulk_writer import BulkWriter
+from change_tracker import ChangeTracker, INDEX_PATH
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
@@ -36,63 +38,140 @@ def parse_currency(val: str) -> Optional[float]:
     except ValueError:
         return None
 
-def ingest_csv(filepath: str):
-    if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
-        print("❌ Missing Supabase keys in .env.")
-        return
+# ==========================================
+# Row Normalization
+# ==========================================
+BATCH_SIZE = 500
+QUEUE_DEPTH = 4 # Parsed batches allowed to wait for the writer; bounds memory on any file size
+
+def trunc(val, length):
+    # Safe string truncator
+    v = val.strip() if val else ""
+    return v[:length] if v else None
+
+def row_agency(row):
+    dept = row.get("Department/Ind.Agency", "").strip() or None
+    subtier = row.get("CGAC", "").strip() or row.get("Sub-Tier", "").strip() or None
+    office = row.get("Office", "").strip() or None
+    return (dept, subtier, office) if (dept or subtier or office) else None
+
+def row_contacts(row, notice_id) -> list:
+    contacts = []
+    for prefix, is_primary in (("Primary", True), ("Secondary", False)):
+        email = row.get(f"{prefix}ContactEmail", "").strip().lower()
+        name = row.get(f"{prefix}ContactFullname", "").strip()
+        if email or name:
+            contacts.append({
+                "notice_id": trunc(notice_id, 255),
+                "is_primary": is_primary,
+                "title": trunc(row.get(f"{prefix}ContactTitle", ""), 255),
+                "fullname": trunc(name, 255),
+                "email": trunc(email, 255),
+                "phone": trunc(row.get(f"{prefix}ContactPhone", ""), 100),
+                "fax": trunc(row.get(f"{prefix}ContactFax", ""), 100)
+            })
+    return contacts
+
+def normalize_row(row, opp_type_map, set_aside_map) -> dict:
+    """Opportunity record for one CSV row; `agency_id` is filled in by the writer once resolved."""
+    return {
+        "notice_id": row.get("NoticeId", "").strip(),
+        "title": row.get("Title", "").strip(),
+        "solicitation_number": row.get("Sol#", "").strip() or None,
+        "posted_date": row.get("PostedDate", "").strip() or None,
+        "response_deadline": row.get("ResponseDeadLine", "").strip() or None,
+        # If not in our enum, default to None
+        "opportunity_type_id": opp_type_map.get(row.get("Type", "").strip()),
+        "agency_id": None,
+        "naics_code": row.get("NaicsCode", "").strip() or None,
+        "psc_code": row.get("ClassificationCode", "").strip() or None,
+        "set_aside_id": set_aside_map.get(map_set_aside_code(row.get("SetASideCode", ""))),
+        "award_amount": parse_currency(row.get("Award$", "")),
+        "award_date": row.get("AwardDate", "").strip() or None,
+        "award_number": row.get("AwardNumber", "").strip() or None,
+        "awardee": row.get("Awardee", "").strip() or None,
+        "description": row.get("Description", "").strip() or None,
+        "link": row.get("Link", "").strip() or None,
+        "active": row.get("Active", "Yes").strip() == "Yes"
+    }
+
+def iter_batches(filepath, opp_type_map, set_aside_map, batch_size=BATCH_SIZE):
+    """Single pass over the CSV, yielding {ops, agencies, contacts} batches of batch_size opportunities."""
+    batch = {"ops": [], "agencies": [], "contacts": []}
+    with open(filepath, mode='r', encoding='latin-1', errors='replace') as f:
+        for row in csv.DictReader(f):
+            notice_id = row.get("NoticeId", "").strip()
+            if not notice_id: continue
+            batch["ops"].append(normalize_row(row, opp_type_map, set_aside_map))
+            batch["agencies"].append(row_agency(row))
+            batch["contacts"].extend(row_contacts(row, notice_id))
+            if len(batch["ops"]) >= batch_size:
+                yield batch
+                batch = {"ops": [], "agencies": [], "contacts": []}
+    if batch["ops"]:
+        yield batch
+
+# ==========================================
+# Incremental Lookups & Writer
+# ==========================================
+class LookupCache:
+    """Agencies, NAICS and PSC codes already in the DB; each batch only upserts what is new."""
+    def __init__(self, supabase, agency_snapshot=SNAPSHOT_FILE):
+        self.supabase = supabase
+        self.agencies = AgencyCache(supabase, snapshot_file=agency_snapshot).load()
+        self.codes = {"naics_codes": set(), "psc_codes": set()}
+
+    def _ensure_codes(self, table, values):
+        unseen = {v for v in values if v} - self.codes[table]
+        if unseen:
+            self.supabase.table(table).upsert([{"code": c} for c in sorted(unseen)], on_conflict='code', ignore_duplicates=True).execute()
+            self.codes[table].update(unseen)
+
+    def prepare(self, batch):
+        # Lookups land before the opportunities that reference them (FKs on naics/psc/agency)
+        self._ensure_codes("naics_codes", (op["naics_code"] for op in batch["ops"]))
+        self._ensure_codes("psc_codes", (op["psc_code"] for op in batch["ops"]))
+        ids = self.agencies.resolve_many(t for t in batch["agencies"] if t)
+        for op, triple in zip(batch["ops"], batch["agencies"]):
+            op["agency_id"] = ids.get(agency_key(*triple)) if triple else None
 
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+def dedupe_contacts(contacts) -> list:
+    unique_contacts = {}
+    for c in contacts:
+        unique_contacts.setdefault(f"{c['notice_id']}|{c['email']}|{c['fullname']}", c)
+    return list(unique_contacts.values())
+
+def write_batch(lookups: LookupCache, batch, ops_writer: BulkWriter, contacts_writer: BulkWriter) -> int:
+    lookups.prepare(batch)
+    contacts = dedupe_contacts(batch["contacts"])
+    # Contacts reference opportunities(notice_id), so they are only queued once their opportunities land
+    ops_writer.write(batch["ops"], then=lambda written: contacts_writer.write(contacts))
+    return len(batch["ops"])
+
+def _parse_into(queue_out: queue.Queue, filepath, opp_type_map, set_aside_map, batch_size):
+    try:
+        for batch in iter_batches(filepath, opp_type_map, set_aside_map, batch_size):
+            queue_out.put(("batch", batch))
+    except Exception as e:
+        queue_out.put(("error", e))
+    finally:
+        queue_out.put(("done", None))
+
+def ingest_csv(filepath: str, supabase=None, batch_size=BATCH_SIZE, queue_depth=QUEUE_DEPTH, agency_snapshot=SNAPSHOT_FILE,
+               change_index=INDEX_PATH) -> int:
+    """
+    Streams the CSV once: a parser thread normalizes rows into batches on a bounded queue while
+    this thread resolves each batch's new lookups and hands it to the concurrent bulk writers,
+    so parsing, lookups and upserts all overlap.
+    """
+    if supabase is None:
+        if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
+            print("❌ Missing Supabase keys in .env.")
+            return 0
+        supabase = get_supabase()
     
     print(f"🔄 Starting Ingestion of {filepath}...")
     
-    agencies_map = {}
-    naics_set = set()
-    psc_set = set()
-    
-    # 1. First Parse to collect lookups
-    print("  -> Scanning for Agencies, NAICS, PSCs...")
-    with open(filepath, mode='r', encoding='latin-1', errors='replace') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            dept = row.get("Department/Ind.Agency", "").strip() or None
-            subtier = row.get("CGAC", "").strip() or row.get("Sub-Tier", "").strip() or None
-            office = row.get("Office", "").strip() or None
-            
-            if dept or subtier or office:
-                agency_key = f"{dept}|{subtier}|{office}"
-                if agency_key not in agencies_map:
-                    agencies_map[agency_key] = {
-                        "department": dept,
-                        "sub_tier": subtier,
-                        "office": office,
-                    }
-                    
-            naics = row.get("NaicsCode", "").strip()
-            if naics: naics_set.add(naics)
-            
-            psc = row.get("ClassificationCode", "").strip()
-            if psc: psc_set.add(psc)
-            
-    # 2. Upsert Lookups
-    print("  -> Upserting Lookups...")
-    if agencies_map:
-        agency_list = list(agencies_map.values())
-        res, _ = supabase.table('agencies').upsert(agency_list, on_conflict='department, sub_tier, office').execute()
-        # Create map of agency_key -> ID
-        # Since upsert returns data, we can match
-        agency_id_map = {}
-        for a in res[1]:
-            key = f"{a.get('department')}|{a.get('sub_tier')}|{a.get('office')}"
-            agency_id_map[key] = a['id']
-    else:
-        agency_id_map = {}
-        
-    if naics_set:
-        supabase.table('naics_codes').upsert([{"code": c} for c in naics_set], on_conflict='code').execute()
-        
-    if psc_set:
-        supabase.table('psc_codes').upsert([{"code": c} for c in psc_set], on_conflict='code').execute()
-
     # Load ENUMS
     opp_types = supabase.table('opportunity_types').select('id, name').execute().data
     opp_type_map = {t['name']: t['id'] for t in opp_types}
@@ -100,125 +179,46 @@ def ingest_csv(filepath: str):
     set_asides = supabase.table('set_asides').select('id, code').execute().data
     set_aside_map = {s['code']: s['id'] for s in set_asides}
 
-    # 3. Second Parse to ingest main records
-    print("  -> Upserting Opportunities...")
-    batch_size = 500
-    ops_batch = []
-    contacts_batch = []
+    lookups = LookupCache(supabase, agency_snapshot)
+    trackers = [ChangeTracker(supabase, "opportunities", "notice_id", db_path=change_index),
+                ChangeTracker(supabase, "contacts", "notice_id, email, fullname", db_path=change_index)]
+    ops_writer = BulkWriter(supabase, "opportunities", on_conflict="notice_id", tracker=trackers[0])
+    contacts_writer = BulkWriter(supabase, "contacts", on_conflict="notice_id, email, fullname", tracker=trackers[1])
+    batches = queue.Queue(maxsize=queue_depth)
+    parser = threading.Thread(target=_parse_into, args=(batches, filepath, opp_type_map, set_aside_map, batch_size), daemon=True)
+    parser.start()
+
+    print("  -> Streaming Opportunities...")
     total_ops = 0
-    
-    def flush_batches():
-        nonlocal total_ops
-        if ops_batch:
-            supabase.table("opportunities").upsert(ops_batch, on_conflict="notice_id").execute()
-            total_ops += len(ops_batch)
-            print(f"    ✅ Upserted {len(ops_batch)} records. Total: {total_ops}")
-            ops_batch.clear()
-            
-        if contacts_batch:
-            # dedupe contacts
-            unique_contacts = {}
-            for c in contacts_batch:
-                key = f"{c['notice_id']}|{c['email']}|{c['fullname']}"
-                if key not in unique_contacts:
-                    unique_contacts[key] = c
-            supabase.table("contacts").upsert(list(unique_contacts.values()), on_conflict="notice_id, email, fullname").execute()
-            contacts_batch.clear()
+    while True:
+        kind, payload = batches.get()
+        if kind == "done":
+            break
+        if kind == "error":
+            print(f"    ❌ Parse error, stopping after {total_ops} records: {payload}")
+            continue
+        total_ops += write_batch(lookups, payload, ops_writer, contacts_writer)
+        if total_ops % (batch_size * 20) == 0:
+            print(f"    ✅ Queued {total_ops} records so far...")
+    parser.join()
+    # Opportunities first: draining them is what releases the last contacts
+    ops_writer.close()
+    contacts_writer.close()
+    lookups.agencies.save()
+    for writer, tracker in zip((ops_writer, contacts_writer), trackers):
+        tracker.close()
+        writer.print_report()
+        tracker.print_report()
 
-    with open(filepath, mode='r', encoding='latin-1', errors='replace') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            notice_id = row.get("NoticeId", "").strip()
-            if not notice_id: continue
-            
-            dept = row.get("Department/Ind.Agency", "").strip() or None
-            subtier = row.get("CGAC", "").strip() or row.get("Sub-Tier", "").strip() or None
-            office = row.get("Office", "").strip() or None
-            agency_key = f"{dept}|{subtier}|{office}"
-            
-            sa_raw = row.get("SetASideCode", "")
-            sa_code = map_set_aside_code(sa_raw)
-            
-            opp_type_raw = row.get("Type", "").strip()
-            # If not in our enum, default to None or try to map
-            opp_type_id = opp_type_map.get(opp_type_raw)
-            
-            # Dates
-            posted_date = row.get("PostedDate", "").strip()
-            posted_date = posted_date if posted_date else None
-            response_deadline = row.get("ResponseDeadLine", "").strip()
-            response_deadline = response_deadline if response_deadline else None
-            award_date = row.get("AwardDate", "").strip()
-            award_date = award_date if award_date else None
-
-            op_record = {
-                "notice_id": notice_id,
-                "title": row.get("Title", "").strip(),
-                "solicitation_number": row.get("Sol#", "").strip() or None,
-                "posted_date": posted_date,
-                "response_deadline": response_deadline,
-                "opportunity_type_id": opp_type_id,
-                "agency_id": agency_id_map.get(agency_key),
-                "naics_code": row.get("NaicsCode", "").strip() or None,
-                "psc_code": row.get("ClassificationCode", "").strip() or None,
-                "set_aside_id": set_aside_map.get(sa_code),
-                "award_amount": parse_currency(row.get("Award$", "")),
-                "award_date": award_date,
-                "award_number": row.get("AwardNumber", "").strip() or None,
-                "awardee": row.get("Awardee", "").strip() or None,
-                "description": row.get("Description", "").strip() or None,
-                "link": row.get("Link", "").strip() or None,
-                "active": row.get("Active", "Yes").strip() == "Yes"
-            }
-            ops_batch.append(op_record)
-
-            # Safe string truncator
-            def trunc(val, length):
-                v = val.strip() if val else ""
-                return v[:length] if v else None
-            
-            # Extract Primary Contact
-            p_email = row.get("PrimaryContactEmail", "").strip().lower()
-            p_name = row.get("PrimaryContactFullname", "").strip()
-            if p_email or p_name:
-                contacts_batch.append({
-                    "notice_id": trunc(notice_id, 255),
-                    "is_primary": True,
-                    "title": trunc(row.get("PrimaryContactTitle", ""), 255),
-                    "fullname": trunc(p_name, 255),
-                    "email": trunc(p_email, 255),
-                    "phone": trunc(row.get("PrimaryContactPhone", ""), 100),
-                    "fax": trunc(row.get("PrimaryContactFax", ""), 100)
-                })
-                
-            # Extract Secondary Contact
-            s_email = row.get("SecondaryContactEmail", "").strip().lower()
-            s_name = row.get("SecondaryContactFullname", "").strip()
-            if s_email or s_name:
-                contacts_batch.append({
-                    "notice_id": trunc(notice_id, 255),
-                    "is_primary": False,
-                    "title": trunc(row.get("SecondaryContactTitle", ""), 255),
-                    "fullname": trunc(s_name, 255),
-                    "email": trunc(s_email, 255),
-                    "phone": trunc(row.get("SecondaryContactPhone", ""), 100),
-                    "fax": trunc(row.get("SecondaryContactFax", ""), 100)
-                })
-
-            if len(ops_batch) >= batch_size:
-                flush_batches()
-                
-    # Flush remaining
-    flush_batches()
     print(f"\n🎉 Finished Ingesting {filepath}. Total Opportunities: {total_ops}")
+    return total_ops
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python ingest_csv.py <path_to_csv>")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Load a SAM.gov opportunities CSV export")
+    parser.add_argument("filepath", help="Path to the CSV")
+    args = parser.parse_args()
     
-    filepath = sys.argv[1]
-    if os.path.exists(filepath):
-        ingest_csv(filepath)
+    if os.path.exists(args.filepath):
+        ingest_csv(args.filepath)
     else:
-        print(f"❌ File not found: {filepath}")
+        print(f"❌ File not found: {args.filepath}")
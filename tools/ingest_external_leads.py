@@ -1,34 +1,24 @@
-import os
-import requests
-from bs4 import BeautifulSoup
 import uuid
 import time
-from supabase import create_client, Client
-from dotenv import load_dotenv
-
-load_dotenv()
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
-
-if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
-    print("❌ Missing Supabase keys in .env. Halting.")
-    exit(1)
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+import argparse
+from urllib.parse import quote, unquote
+from clients import get_supabase, missing_env
+from bulk_writer import BulkWriter
 
 def search_duckduckgo(query, max_results=20):
     """
     Scrapes DuckDuckGo HTML results as a free crawler proxy for Bing/Yellowpages.
     (Note: In a true enterprise environment, use the Bing Web Search API or apify).
     """
+    from bs4 import BeautifulSoup
+    from http_transport import get_session
     print(f"🔍 Crawling web for query: '{query}'")
     headers = {
         "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
     }
     
-    url = f"https://html.duckduckgo.com/html/?q={requests.utils.quote(query)}"
-    response = requests.get(url, headers=headers)
+    url = f"https://html.duckduckgo.com/html/?q={quote(query)}"
+    response = get_session(url).get(url, headers=headers, timeout=30)
     
     if response.status_code != 200:
         print(f"❌ Failed to reach search engine. Status Code: {response.status_code}")
@@ -46,7 +36,7 @@ def search_duckduckgo(query, max_results=20):
             href = title_tag.get('href', '')
             # Clean up DDG redirect URLs
             if href.startswith('//duckduckgo.com/l/?uddg='):
-                href = requests.utils.unquote(href.split('uddg=')[1].split('&')[0])
+                href = unquote(href.split('uddg=')[1].split('&')[0])
             
             domain = href.replace('https://', '').replace('http://', '').split('/')[0]
             domain = domain.replace('www.', '')
@@ -69,7 +59,7 @@ def search_duckduckgo(query, max_results=20):
     return leads
 
 def ingest_external_leads(queries):
-    total_upserted = 0
+    writer = BulkWriter(get_supabase(), "contractors", on_conflict="uei")
     
     for query in queries:
         leads = search_duckduckgo(query)
@@ -97,29 +87,33 @@ def ingest_external_leads(queries):
             }
             db_payload.append(record)
             
-        if db_payload:
-            try:
-                # Upserting. If domain/name already exists, we might want to handle it, 
-                # but unique UEI works here for external rapid ingestion.
-                supabase.table("contractors").upsert(db_payload, on_conflict="uei").execute()
-                total_upserted += len(db_payload)
-                print(f"  ✅ Upserted {len(db_payload)} external leads to Supabase.")
-            except Exception as e:
-                print(f"  ❌ DB Error Upserting external leads: {e}")
+        # Upserting. If domain/name already exists, we might want to handle it, 
+        # but unique UEI works here for external rapid ingestion.
+        writer.write(db_payload)
                 
         time.sleep(2) # Be polite to search engines
         
-    print(f"\n🎉 External Web Crawler Complete. Upserted {total_upserted} Non-SAM entities.")
+    writer.close()
+    writer.print_report()
+    print(f"\n🎉 External Web Crawler Complete. Upserted {writer.stats['rows']} Non-SAM entities.")
+    from http_transport import METRICS
+    METRICS.print_summary()
 
 if __name__ == "__main__":
-    print("="*60)
-    print("🕸️  INIT: CAPTURE PILOT EXTERNAL PROSPECT CRAWLER")
-    print("="*60)
-    
     target_queries = [
         "top cybersecurity contractors defense",
         "AI software providers government directory",
         "logistics and supply chain contractors list USA"
     ]
+    parser = argparse.ArgumentParser(description="Crawl the web for non-SAM prospects")
+    parser.add_argument("queries", nargs="*", default=target_queries, help="Search queries (default: the built-in list)")
+    args = parser.parse_args()
+    if missing_env("SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+        print("❌ Missing Supabase keys in .env. Halting.")
+        exit(1)
+    
+    print("="*60)
+    print("🕸️  INIT: CAPTURE PILOT EXTERNAL PROSPECT CRAWLER")
+    print("="*60)
     
-    ingest_external_leads(target_queries)
+    ingest_external_leads(args.queries)
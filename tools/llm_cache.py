@@ -0,0 +1,157 @@
+"""
+Content-addressed cache of LLM completions, kept in a local SQLite file in .tmp/.
+
+A completion is keyed by a hash of the provider, model, fully rendered prompt and generation
+parameters, so an unchanged (contractor, opportunity, template) is never paid for twice.
+Every entry records the template it was rendered from and the template's version. Opening a
+cache for a template drops entries from any other version of it, so bumping the version
+constant next to a prompt is the explicit invalidate. Entries expire after LLM_CACHE_TTL_DAYS,
+and once the cache outgrows LLM_CACHE_MAX_MB the least recently used entries are evicted (both
+are enforced when a cache is opened).
+
+Usage: python tools/llm_cache.py [--clear [TEMPLATE]]
+"""
+import os
+import json
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+from run_state import STATE_DIR
+
+CACHE_PATH = os.path.join(STATE_DIR, "llm_cache.sqlite3")
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "200"))
+LOOKUP_CHUNK = 500 # Keys per SQLite IN (...) lookup
+
+def completion_key(provider: str, model: str, prompt: str, params=None) -> str:
+    payload = json.dumps({"provider": provider, "model": model, "prompt": prompt, "params": params or {}},
+                         sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+class LLMCache:
+    """Pass db_path=":memory:" for a throwaway cache that never touches .tmp/ (tests, benchmarks)."""
+    def __init__(self, template, version, db_path=CACHE_PATH, ttl_days=LLM_CACHE_TTL_DAYS, max_mb=LLM_CACHE_MAX_MB):
+        self.template = template
+        self.version = str(version)
+        self.ttl = timedelta(days=ttl_days)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "tokens_saved": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL") # Commit per completion stays cheap
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS completions (
+            cache_key TEXT PRIMARY KEY, template TEXT NOT NULL, version TEXT NOT NULL, model TEXT NOT NULL,
+            text TEXT NOT NULL, tokens INTEGER NOT NULL, size INTEGER NOT NULL,
+            created_at TEXT NOT NULL, last_used TEXT NOT NULL)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions(last_used)")
+        # Entries rendered from any other version of this template can never be correct again
+        self.stats["invalidated"] = self.conn.execute(
+            "DELETE FROM completions WHERE template = ? AND version != ?", (template, self.version)).rowcount
+        self.conn.commit()
+        self.evict()
+
+    def get_many(self, keys) -> dict:
+        """{key: (text, tokens)} for every live entry; touches each hit for LRU."""
+        keys = list(dict.fromkeys(keys))
+        now = datetime.now(timezone.utc)
+        cutoff = (now - self.ttl).isoformat()
+        found = {}
+        with self.lock:
+            for start in range(0, len(keys), LOOKUP_CHUNK):
+                chunk = keys[start:start + LOOKUP_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                for key, text, tokens, created_at in self.conn.execute(
+                        f"SELECT cache_key, text, tokens, created_at FROM completions WHERE cache_key IN ({marks})", chunk):
+                    if created_at < cutoff:
+                        continue
+                    found[key] = (text, tokens)
+            self.conn.executemany("UPDATE completions SET last_used = ? WHERE cache_key = ?",
+                                  [(now.isoformat(), key) for key in found])
+            self.conn.commit()
+            self.stats["hits"] += len(found)
+            self.stats["misses"] += len(keys) - len(found)
+            self.stats["tokens_saved"] += sum(tokens for _, tokens in found.values())
+        return found
+
+    def put(self, key, model, text, tokens):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                              (key, self.template, self.version, model, text, tokens, len(text.encode()), now, now))
+            # Committed right away: a crashed run keeps what it paid for, and other runs aren't locked out
+            self.conn.commit()
+            self.stats["stored"] += 1
+
+    def discard(self, keys):
+        """Forgets specific completions (e.g. drafts that failed validation), so they are regenerated."""
+        with self.lock:
+            self.conn.executemany("DELETE FROM completions WHERE cache_key = ?", [(key,) for key in keys])
+            self.conn.commit()
+
+    def invalidate(self, template=None) -> int:
+        """Drops every entry for `template` (all templates if None). Returns entries removed."""
+        with self.lock:
+            if template is None:
+                removed = self.conn.execute("DELETE FROM completions").rowcount
+            else:
+                removed = self.conn.execute("DELETE FROM completions WHERE template = ?", (template,)).rowcount
+            self.conn.commit()
+        return removed
+
+    def evict(self):
+        """Drops expired entries, then least recently used ones until the cache fits in max_mb."""
+        cutoff = (datetime.now(timezone.utc) - self.ttl).isoformat()
+        with self.lock:
+            self.stats["expired"] += self.conn.execute("DELETE FROM completions WHERE created_at < ?", (cutoff,)).rowcount
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()[0]
+            if total > self.max_bytes:
+                doomed, freed = [], 0
+                for key, size in self.conn.execute("SELECT cache_key, size FROM completions ORDER BY last_used"):
+                    if total - freed <= self.max_bytes:
+                        break
+                    doomed.append((key,))
+                    freed += size
+                self.conn.executemany("DELETE FROM completions WHERE cache_key = ?", doomed)
+                self.stats["evicted"] += len(doomed)
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+
+    def summary(self) -> dict:
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM completions").fetchone()
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return dict(self.stats, hit_rate=self.stats["hits"] / lookups if lookups else 0.0, entries=entries, size=size)
+
+    def print_report(self):
+        s = self.summary()
+        print(f"  💾 LLM cache [{self.template} {self.version}]: {s['hits']}/{s['hits'] + s['misses']} hits "
+              f"({s['hit_rate']:.0%}), {s['tokens_saved']:,} tokens saved | {s['entries']} entries, "
+              f"{s['size'] / 1e6:.1f} MB ({s['invalidated']} invalidated, {s['evicted']} evicted)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or clear the local LLM completion cache")
+    parser.add_argument("--clear", nargs="?", const="*", metavar="TEMPLATE", help="Drop a template's entries (all if omitted)")
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(CACHE_PATH) if os.path.exists(CACHE_PATH) else None
+    if conn is None:
+        print("⚠️ No LLM cache yet.")
+    elif args.clear:
+        query, params = ("DELETE FROM completions", ()) if args.clear == "*" else \
+                        ("DELETE FROM completions WHERE template = ?", (args.clear,))
+        print(f"🗑️ Removed {conn.execute(query, params).rowcount} cached completions.")
+        conn.commit()
+    else:
+        for template, version, entries, size, tokens in conn.execute(
+                "SELECT template, version, COUNT(*), SUM(size), SUM(tokens) FROM completions GROUP BY template, version"):
+            print(f"  -> {template} {version}: {entries} entries, {size / 1e6:.1f} MB, {tokens:,} tokens cached")
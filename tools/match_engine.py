@@ -1,10 +1,14 @@
 import os
-import requests
-import json
-from supabase import create_client, Client
-from dotenv import load_dotenv
-
-load_dotenv()
+import pickle
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import clients
+from pwin_engine import PWinModel, pwin_factors, pwin_score
+from pwin_features import load_features, refresh_feature_table
+from draft_pipeline import OpenAIChat, DRAFT_CONCURRENCY, draft_all, print_stats, resolve_match_ids, save_drafts
+from llm_cache import LLMCache, CACHE_PATH
+from repository import fetch_all
+from roster_snapshot import RosterSnapshot, refresh_snapshot
 
 # ==========================================
 # Phase 16: PWin Match Engine & Enrichment Schema
@@ -18,171 +22,247 @@ SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") 
 
-if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
-    print("❌ Missing Supabase keys in .env. Halting.")
-    exit(1)
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+def get_supabase():
+    # Created on first use so the scoring logic can be imported (and tested) without credentials
+    if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
+        print("❌ Missing Supabase keys in .env. Halting.")
+        exit(1)
+    return clients.get_supabase()
 
 # ==========================================
 # 1. Deterministic Scoring Logic
 # ==========================================
-def calculate_pwin_score(opp_record, contractor_record):
+def calculate_pwin_score(opp_record, contractor_record, features=None, profile=None):
     """
-    Simulates the 10-Factor Masterguide Probability of Win (PWin) Score.
-    Normally this would be a highly complex NLP model.
-    Here we use deterministic signals based on the active schema.
+    The 10-Factor Masterguide Probability of Win (PWin) Score for one pair (tools/pwin_engine.py).
+    `features` is the contractor's contractor_features row (None: no award history); `profile`
+    its taxonomy bitsets (Taxonomy.profile), built here when not given.
+    Reference path only: runs score the whole roster at once through PWinModel.
     """
-    score = 50 # Baseline assumption
-    
-    # 1. NAICS Alignment (+20)
-    opp_naics = opp_record.get('naics_code')
-    cont_naics = contractor_record.get('naics_codes') or []
-    if opp_naics and opp_naics in cont_naics:
-        score += 20
-        
-    # 2. Set-Aside Alignment (+15)
-    # E.g. Opportunity requires 8A, contractor has 8A
-    opp_sa_id = opp_record.get('set_aside_id')
-    # In a full system we'd join exactly text to text, but roughly:
-    cont_certs = contractor_record.get('sba_certifications') or []
-    if opp_sa_id and len(cont_certs) > 0:
-        # Give bump if they possess certifications and it's a restricted opp
-        score += 15
-        
-    # 3. Keyword Match / Capabilities Overlap (+10)
-    # Simple check if company name is in the title (edge case, but illustrative)
-    if contractor_record.get('company_name', '').lower() in opp_record.get('title', '').split():
-        score += 10
-        
-    # 4. Active SAM Registration (+5)
-    if contractor_record.get('is_sam_registered'):
-        score += 5
-        
-    return min(score, 100) # Cap at 100
+    return pwin_score(pwin_factors(opp_record, contractor_record, features, profile))
 
 # ==========================================
 # 2. Match Execution
 # ==========================================
-def run_match_engine():
+MATCH_FLOOR = 60
+ELITE_THRESHOLD = 85
+# Everything the PWin factors and the drafting context read; never raw_json/fts
+OPPORTUNITY_COLUMNS = "notice_id, title, naics_code, set_aside_id, agency_id, award_amount, place_of_performance_state"
+CONTRACTOR_COLUMNS = "company_name, state, naics_codes, certifications, sba_certifications, is_sam_registered, primary_poc_email"
+
+def score_opportunities(opportunities, contractors, features=None, model=None):
+    """
+    Scores opportunities against the roster, returning (db_payload, high_score_matches).
+    `features` maps contractor id to its contractor_features row; pass a prebuilt PWinModel as
+    `model` to reuse one across calls. No per-pair lookups: each opportunity is one roster pass.
+    """
+    model = model or PWinModel(contractors, features)
+    db_payload = []
+    high_score_matches = []
+    
+    for opp in opportunities:
+        for pos, score, signals in model.score(opp, MATCH_FLOOR):
+            cont = contractors[pos]
+            # Only record matches historically if > 60%
+            record = dict(
+                opportunity_id=opp["notice_id"],
+                contractor_id=model.ids[pos],
+                pwin_score=score,
+                status="Identified",
+                **signals
+            )
+            db_payload.append(record)
+            
+            # Flag >80 for AI Action
+            if score >= ELITE_THRESHOLD:
+                # Context travels on a copy so it never leaks into the matches upsert
+                high_score_matches.append(dict(
+                    record,
+                    opp_title=opp["title"],
+                    cont_name=cont["company_name"],
+                    cont_email=cont.get("primary_poc_email")
+                ))
+    
+    return db_payload, high_score_matches
+
+# ==========================================
+# 2b. Sharded Parallel Execution
+# ==========================================
+# Each worker process receives the roster and its PWin features once, as a pickled snapshot,
+# through the pool initializer and builds its own PWinModel from them. Tasks only carry opportunity shards,
+# and results stream back to the parent, which is the single writer to `matches`.
+# A roster read from the memory-mapped snapshot file is passed by path instead: every worker maps
+# the same file, so its pages are shared rather than copied per process.
+_worker_contractors = None
+_worker_model = None
+
+def _init_worker(roster_snapshot: bytes, features: bytes, snapshot_path=None):
+    global _worker_contractors, _worker_model
+    if snapshot_path:
+        _worker_contractors = RosterSnapshot(snapshot_path)
+    else:
+        _worker_contractors = pickle.loads(roster_snapshot)
+    _worker_model = PWinModel(_worker_contractors, pickle.loads(features))
+
+def _score_shard(shard):
+    return score_opportunities(shard, _worker_contractors, model=_worker_model)
+
+def iter_shard_results(opportunities, contractors, workers: int, shards_per_worker=4, features=None):
+    """Yields (db_payload, high_score_matches) per opportunity shard as each one completes."""
+    shard_count = max(1, min(len(opportunities), workers * shards_per_worker))
+    shard_size = -(-len(opportunities) // shard_count)
+    shards = [opportunities[i:i + shard_size] for i in range(0, len(opportunities), shard_size)]
+    features = pickle.dumps(features or {}, protocol=pickle.HIGHEST_PROTOCOL)
+    if isinstance(contractors, RosterSnapshot):
+        initargs = (None, features, contractors.path)
+    else:
+        initargs = (pickle.dumps(contractors, protocol=pickle.HIGHEST_PROTOCOL), features)
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        futures = [pool.submit(_score_shard, shard) for shard in shards]
+        for future in as_completed(futures):
+            yield future.result()
+
+def persist_matches(supabase, db_payload) -> bool:
+    if not db_payload:
+        return True
+    try:
+        # We use ON CONFLICT DO UPDATE so the score is lively updated
+        supabase.table("matches").upsert(db_payload, on_conflict="opportunity_id,contractor_id").execute()
+        return True
+    except Exception as e:
+        # Supabase API sometimes throws unique constraints differently. 
+        print(f"  ⚠️ Match Upsert note: {e}")
+        return False
+
+def run_match_engine(supabase=None, workers=1, opp_limit=50, contractor_limit=200, snapshot=False):
+    """
+    Scores opportunities against the roster and upserts viable matches.
+    `workers` > 1 shards opportunities across a process pool; `supabase` may be any client
+    exposing the PostgREST builder (e.g. memory_supabase.MemorySupabase for offline runs).
+    A limit of None fetches the whole table. With `snapshot` set, the whole roster comes from the
+    local memory-mapped snapshot (refreshed incrementally) and `contractor_limit` is ignored.
+    """
     print("🧠 Starting Capture Pilot Deterministic Match Engine...")
+    supabase = supabase or get_supabase()
     
-    # Fetch 50 random active opportunities
-    opps_res = supabase.table("opportunities").select("*").limit(50).execute()
-    opportunities = opps_res.data
+    # Fetch active opportunities (50 by default) and contractors to score against (200 by default),
+    # in keyset pages so a None limit really reads the whole table past the PostgREST row cap
+    opportunities = fetch_all(supabase, "opportunities", OPPORTUNITY_COLUMNS, limit=opp_limit)
+    if snapshot:
+        contractors = refresh_snapshot(supabase)
+    else:
+        contractors = fetch_all(supabase, "contractors", CONTRACTOR_COLUMNS, limit=contractor_limit)
     
-    # Fetch 200 random contractors to score against
-    cont_res = supabase.table("contractors").select("*").limit(200).execute()
-    contractors = cont_res.data
+    # Award history, keyword vectors and size fit, precomputed by tools/pwin_features.py
+    features = load_features(supabase)
     
+    print(f"  -> Cross-referencing {len(opportunities)} Opps vs {len(contractors)} Entities "
+          f"({len(features)} with award history).")
     total_matches = 0
     high_score_matches = []
     
-    db_payload = []
+    if workers > 1 and len(opportunities) > 1:
+        print(f"  -> Sharding across {workers} worker processes.")
+        for db_payload, elite in iter_shard_results(opportunities, contractors, workers, features=features):
+            if persist_matches(supabase, db_payload):
+                total_matches += len(db_payload)
+            high_score_matches.extend(elite)
+    else:
+        db_payload, high_score_matches = score_opportunities(opportunities, contractors, features)
+        if persist_matches(supabase, db_payload):
+            total_matches = len(db_payload)
     
-    print(f"  -> Cross-referencing {len(opportunities)} Opps vs {len(contractors)} Entities.")
-    for opp in opportunities:
-        for cont in contractors:
-            score = calculate_pwin_score(opp, cont)
-            
-            # Only record matches historically if > 60%
-            if score >= 60:
-                record = {
-                    "opportunity_id": opp["notice_id"],
-                    "contractor_id": cont["id"],
-                    "pwin_score": score,
-                    "naics_match": (opp.get('naics_code') in (cont.get('naics_codes') or [])),
-                    "status": "Identified"
-                }
-                db_payload.append(record)
-                total_matches += 1
-                
-                # Flag >80 for AI Action
-                if score >= 85:
-                    record["opp_title"] = opp["title"] # pass context
-                    record["cont_name"] = cont["company_name"]
-                    record["cont_email"] = cont.get("primary_poc_email")
-                    high_score_matches.append(record)
-                
-    if db_payload:
-        try:
-            # We use ON CONFLICT DO UPDATE so the score is lively updated
-            res = supabase.table("matches").upsert(db_payload, on_conflict="opportunity_id,contractor_id").execute()
-            print(f"  ✅ Persisted {total_matches} viable paths to Matches database.")
-        except Exception as e:
-            # Supabase API sometimes throws unique constraints differently. 
-            print(f"  ⚠️ Match Upsert note: {e}")
-            
+    print(f"  ✅ Persisted {total_matches} viable paths to Matches database.")
     print(f"\n🧠 Match Engine Complete. Found {len(high_score_matches)} HIGH PWin (>85) targets needing AI Enrichment.")
     return high_score_matches
 
 # ==========================================
 # 3. AI Enrichment & Drafting
 # ==========================================
-def draft_outreach_emails(high_score_matches):
-    if not OPENAI_API_KEY:
-        print("⚠️ No OPENAI_API_KEY found. Skipping AI Outreach Drafts.")
-        return
+# Bump whenever outreach_prompt() changes: cached drafts from older versions are dropped
+OUTREACH_TEMPLATE_VERSION = "1"
+
+def outreach_prompt(match) -> str:
+    return f"Write a professional, concise B2G email to {match.get('cont_name')} explaining why they " \
+           f"are an excellent fit for the government opportunity '{match.get('opp_title')}'. " \
+           f"Mention their Masterguide PWin match score of {match.get('pwin_score')}/100 based on their SAM.gov profile."
+
+def draft_outreach_emails(high_score_matches, supabase=None, provider=None, concurrency=DRAFT_CONCURRENCY,
+                          llm_cache=CACHE_PATH):
+    """
+    Drafts one outreach email per elite match through the async pipeline and bulk-saves them.
+    `provider` defaults to OpenAI with OPENAI_API_KEY; pass one pointed elsewhere (e.g. a local fake).
+    Completions are cached in `llm_cache` (":memory:" for a throwaway cache, None to disable).
+    """
+    if provider is None:
+        if not OPENAI_API_KEY:
+            print("⚠️ No OPENAI_API_KEY found. Skipping AI Outreach Drafts.")
+            return
+        provider = OpenAIChat(OPENAI_API_KEY)
         
     print(f"🤖 Booting AI Intake for {len(high_score_matches)} Elite Prospects...")
+    supabase = supabase or get_supabase()
     
-    # Normally we'd use openai library, using simple requests here for dependency-free
-    # ... In a real app we hit https://api.openai.com/v1/chat/completions ...
-    print("  -> Generating hyper-personalized B2G outreach emails via LLM...")
+    # Resolve every match_id in one pass up front, so no tokens are spent on a match we can't save
+    match_ids = resolve_match_ids(supabase, [(m["opportunity_id"], m["contractor_id"]) for m in high_score_matches])
+    jobs = [dict(match, match_id=match_ids[(match["opportunity_id"], match["contractor_id"])], prompt=outreach_prompt(match))
+            for match in high_score_matches if (match["opportunity_id"], match["contractor_id"]) in match_ids]
+    if len(jobs) < len(high_score_matches):
+        print(f"  ⚠️ {len(high_score_matches) - len(jobs)} matches not found in the database. Skipping them.")
     
-    drafts_payload = []
+    print(f"  -> Generating hyper-personalized B2G outreach emails via LLM ({concurrency} concurrent)...")
+    cache = LLMCache("outreach", OUTREACH_TEMPLATE_VERSION, db_path=llm_cache) if llm_cache else None
+    results, stats = draft_all(jobs, provider, concurrency=concurrency, cache=cache)
+    print_stats(provider, stats)
+    if cache is not None:
+        cache.print_report()
+        cache.close()
     
-    headers = {
-        "Authorization": f"Bearer {OPENAI_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    
-    for match in high_score_matches:
-        prompt = f"Write a professional, concise B2G email to {match.get('cont_name')} explaining why they " \
-                 f"are an excellent fit for the government opportunity '{match.get('opp_title')}'. " \
-                 f"Mention their Masterguide PWin match score of {match.get('pwin_score')}/100 based on their SAM.gov profile."
-                 
-        payload = {
-            "model": "gpt-4o-mini",
-            "messages": [{"role": "user", "content": prompt}]
-        }
-        
-        try:
-            response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-            response.raise_for_status()
-            data = response.json()
-            draft_text = data['choices'][0]['message']['content']
-            
-            # Retrieve the match_id from the database based on opp and cont (since we upserted it)
-            match_id_res = supabase.table("matches").select("id").eq("opportunity_id", match["opportunity_id"]).eq("contractor_id", match["contractor_id"]).execute()
-            
-            if match_id_res.data:
-                match_id = match_id_res.data[0]["id"]
-                drafts_payload.append({
-                    "match_id": match_id,
-                    "recipient_email": match.get("cont_email") or "info@contractor.com",
-                    "subject": f"Strategic Teaming Opportunity: {match.get('opp_title')}",
-                    "body": draft_text,
-                    "ai_model_used": "gpt-4o-mini",
-                    "tokens_consumed": data['usage']['total_tokens']
-                })
-        except Exception as e:
-            print(f"  ⚠️ OpenAI API Error for {match.get('cont_name')}: {e}")
+    drafts_payload = []
+    for result in results:
+        if result["text"] is None:
+            print(f"  ⚠️ {provider.name} error for {result.get('cont_name')}: {result['error']}")
+            continue
+        drafts_payload.append({
+            "match_id": result["match_id"],
+            "recipient_email": result.get("cont_email") or "info@contractor.com",
+            "recipient_name": result.get("cont_name"),
+            "subject_line": f"Strategic Teaming Opportunity: {result.get('opp_title')}",
+            "email_body": result["text"],
+            "ai_model_used": provider.model,
+            "tokens_consumed": result["tokens"]
+        })
     
     if drafts_payload:
-        try:
-            res = supabase.table("outreach_drafts").insert(drafts_payload).execute()
-            print(f"  ✅ {len(drafts_payload)} Drafts Successfully Generated and Saved to Supabase.")
-        except Exception as e:
-            print(f"  ⚠️ Drafts Insert Error: {e}")
+        saved = save_drafts(supabase, drafts_payload)
+        print(f"  ✅ {saved} Drafts Successfully Generated and Saved to Supabase.")
+    return drafts_payload
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="PWin match engine & outreach enrichment")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes for sharded scoring")
+    parser.add_argument("--opportunities", type=int, default=50, help="Opportunities to score (0 = all)")
+    parser.add_argument("--contractors", type=int, default=200, help="Contractors to score against (0 = all)")
+    parser.add_argument("--concurrency", type=int, default=DRAFT_CONCURRENCY, help="LLM requests in flight while drafting")
+    parser.add_argument("--no-cache", action="store_true", help="Re-draft even when a cached completion exists")
+    parser.add_argument("--snapshot", action="store_true", help="Score the full roster from the local memory-mapped snapshot")
+    parser.add_argument("--skip-features", action="store_true", help="Score with contractor_features as stored, without refreshing it first")
+    args = parser.parse_args()
+    
     print("="*60)
     print("🧠 INIT: INTELLIGENCE ENGINE (MATCHING & ENRICHMENT)")
     print("="*60)
     
-    elite_targets = run_match_engine()
+    if not args.skip_features:
+        refresh_feature_table(get_supabase())
+    
+    elite_targets = run_match_engine(workers=args.workers, opp_limit=args.opportunities, contractor_limit=args.contractors,
+                                     snapshot=args.snapshot)
     
     if elite_targets:
-        draft_outreach_emails(elite_targets)
+        draft_outreach_emails(elite_targets, concurrency=args.concurrency, llm_cache=None if args.no_cache else CACHE_PATH)
+    
+    from http_transport import METRICS
+    METRICS.print_summary()
@@ -0,0 +1,206 @@
+"""
+In-memory stand-in for the supabase-py client, for running tools offline.
+
+Implements the slice of the PostgREST query builder the tools actually use:
+select / insert / upsert / update / delete, eq / neq / gt / gte / lt / lte / in_ / is_
+filters, order, limit and range. Writes stamp `updated_at` the way the DB triggers do.
+Thread-safe, so concurrent writers can be exercised against it.
+"""
+import uuid
+import threading
+from datetime import datetime, timezone
+
+class MemoryResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+class MemoryQuery:
+    def __init__(self, client, table: str):
+        self._client = client
+        self._table = table
+        self._action = "select"
+        self._columns = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._offset = 0
+        self._payload = None
+        self._on_conflict = None
+        self._ignore_duplicates = False
+        self._count = None
+        self._returning = None
+
+    # ---- actions ----
+    def select(self, columns="*", count=None):
+        self._action = "select"
+        self._count = count
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",") if c.strip()]
+        return self
+
+    def insert(self, rows):
+        self._action, self._payload = "insert", rows
+        return self
+
+    def upsert(self, rows, on_conflict=None, ignore_duplicates=False, returning=None):
+        self._action, self._payload = "upsert", rows
+        self._on_conflict = on_conflict
+        self._ignore_duplicates = ignore_duplicates
+        self._returning = returning
+        return self
+
+    def update(self, values):
+        self._action, self._payload = "update", values
+        return self
+
+    def delete(self):
+        self._action = "delete"
+        return self
+
+    # ---- filters ----
+    def _filter(self, column, predicate):
+        self._filters.append((column, predicate))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, lambda v: v == value)
+
+    def neq(self, column, value):
+        return self._filter(column, lambda v: v != value)
+
+    def gt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v > value)
+
+    def gte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v >= value)
+
+    def lt(self, column, value):
+        return self._filter(column, lambda v: v is not None and v < value)
+
+    def lte(self, column, value):
+        return self._filter(column, lambda v: v is not None and v <= value)
+
+    def in_(self, column, values):
+        allowed = set(values)
+        return self._filter(column, lambda v: v in allowed)
+
+    def is_(self, column, value):
+        target = None if value in (None, "null") else value
+        return self._filter(column, lambda v: v is target or v == target)
+
+    # ---- modifiers ----
+    def order(self, column, desc=False, nullsfirst=None):
+        # Postgres default: NULLs sort as the largest value (last ascending, first descending)
+        self._order.append((column, desc, desc if nullsfirst is None else nullsfirst))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limit = start, end - start + 1
+        return self
+
+    def execute(self) -> MemoryResponse:
+        return self._client._execute(self)
+
+class MemorySupabase:
+    def __init__(self, tables=None, max_rows=None, supabase_url=None):
+        # Optional project URL, so per-project local caches can be exercised
+        self.supabase_url = supabase_url
+        self.tables = {name: [dict(row) for row in rows] for name, rows in (tables or {}).items()}
+        # Mirrors PostgREST's db-max-rows cap, which also clips larger limits and ranges
+        self.max_rows = max_rows
+        self.functions = {}
+        self.calls = []
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def table(self, name: str) -> MemoryQuery:
+        return MemoryQuery(self, name)
+
+    def rpc(self, fn: str, params=None):
+        client = self
+        class _Call:
+            def execute(self_inner):
+                return MemoryResponse(client.functions[fn](client, **(params or {})))
+        return _Call()
+
+    # ---- internals ----
+    def _matches(self, row, filters):
+        return all(predicate(row.get(column)) for column, predicate in filters)
+
+    def _key_index(self, table, columns):
+        key = (table, columns)
+        if key not in self._indexes:
+            self._indexes[key] = {tuple(r.get(c) for c in columns): r for r in self.tables.get(table, [])}
+        return self._indexes[key]
+
+    def _write_row(self, table, row):
+        self.tables.setdefault(table, []).append(row)
+        for (t, columns), index in self._indexes.items():
+            if t == table:
+                index[tuple(row.get(c) for c in columns)] = row
+
+    def _execute(self, query: MemoryQuery) -> MemoryResponse:
+        with self._lock:
+            self.calls.append((query._table, query._action))
+            now = datetime.now(timezone.utc).isoformat()
+            rows = self.tables.setdefault(query._table, [])
+
+            if query._action == "select":
+                selected = [r for r in rows if self._matches(r, query._filters)]
+                for column, desc, nullsfirst in reversed(query._order):
+                    values = sorted((r for r in selected if r.get(column) is not None), key=lambda r: r.get(column), reverse=desc)
+                    nulls = [r for r in selected if r.get(column) is None]
+                    selected = nulls + values if nullsfirst else values + nulls
+                count = len(selected) if query._count else None
+                limit = query._limit if query._limit is not None else self.max_rows
+                if self.max_rows is not None:
+                    limit = min(limit, self.max_rows)
+                selected = selected[query._offset:]
+                if limit is not None:
+                    selected = selected[:limit]
+                if query._columns:
+                    return MemoryResponse([{c: r.get(c) for c in query._columns} for r in selected], count)
+                return MemoryResponse([dict(r) for r in selected], count)
+
+            if query._action in ("insert", "upsert"):
+                payload = query._payload if isinstance(query._payload, list) else [query._payload]
+                conflict = tuple(c.strip() for c in (query._on_conflict or "id").split(","))
+                index = self._key_index(query._table, conflict) if query._action == "upsert" else None
+                written = []
+                for incoming in payload:
+                    existing = index.get(tuple(incoming.get(c) for c in conflict)) if index is not None else None
+                    if existing is not None:
+                        if not query._ignore_duplicates:
+                            existing.update(incoming)
+                            existing["updated_at"] = now
+                        written.append(dict(existing))
+                        continue
+                    row = dict(incoming)
+                    row.setdefault("id", str(uuid.uuid4()))
+                    row.setdefault("created_at", now)
+                    row["updated_at"] = now
+                    self._write_row(query._table, row)
+                    written.append(dict(row))
+                return MemoryResponse([] if query._returning == "minimal" else written)
+
+            if query._action == "update":
+                written = []
+                for r in rows:
+                    if self._matches(r, query._filters):
+                        r.update(query._payload)
+                        r["updated_at"] = now
+                        written.append(dict(r))
+                self._indexes = {k: v for k, v in self._indexes.items() if k[0] != query._table}
+                return MemoryResponse(written)
+
+            if query._action == "delete":
+                removed = [r for r in rows if self._matches(r, query._filters)]
+                self.tables[query._table] = [r for r in rows if not self._matches(r, query._filters)]
+                self._indexes = {k: v for k, v in self._indexes.items() if k[0] != query._table}
+                return MemoryResponse([dict(r) for r in removed])
+
+            raise ValueError(f"Unsupported action {query._action}")
@@ -0,0 +1,264 @@
+"""
+Ten-factor PWin (Probability of Win) score, per the Masterguide's Part 10 factor model.
+
+PWin = Σ(Wi × Ri/5) / Σ(Wi), reported as an integer percentage. Each factor's 1-5 rating Ri is
+derived deterministically from the opportunity, the contractor row, its taxonomy profile and
+its precomputed award-history features (tools/pwin_features.py):
+
+| Factor                | W  | Rating from                                                            |
+| :-- | :-- | :-- |
+| Customer Relationship | 12 | Awards won at the opportunity's agency: 0→1, 1→3, 2→4, 3+→5             |
+| Competitive Position  | 10 | Set-aside: certified→5, not certified→1; full and open→3                |
+| Technical Fit         | 15 | Deepest shared NAICS level: exact→5, 5-digit→4, 4-digit→3, 3-digit→2    |
+| Past Performance      | 12 | Awards won overall: 0→1, 1→2, 2-3→3, 4-9→4, 10+→5                       |
+| Key Personnel         | 10 | Named point of contact→3, none→1                                       |
+| Price-to-Win          | 15 | Award amount vs. the contractor's median award, in powers of two       |
+| Teaming & SB Strategy |  8 | Distinct certifications: 0→2, 1→3, 2→4, 3+→5                            |
+| Compliance Risk       | 10 | Active SAM registration→5, else 1                                      |
+| Capture Maturity      |  8 | Opportunity title terms in the contractor's award keywords: 1 + min(k, 4) |
+| Operational Readiness | 10 | Place of performance: same state→5, unknown→3, other state→2           |
+
+`pwin_factors()` rates one pair and is the reference. `PWinModel` scores an opportunity
+against the whole roster in one pass: contractor-only factors are summed once per contractor,
+and the opportunity-dependent ones are added through postings (agency, NAICS level, size
+bucket, keyword, state), so only contractors that carry a signal are touched per factor.
+Below a floor, `pwin_candidates()` drops every contractor without a signal whose static points
+cannot reach `min_points(floor)` even with the best size fit, before any scoring.
+"""
+from bisect import bisect_left, bisect_right
+from taxonomy import Taxonomy, has
+from pwin_features import keywords
+
+FACTOR_WEIGHTS = {
+    "customer_relationship": 12,
+    "competitive_position": 10,
+    "technical_fit": 15,
+    "past_performance": 12,
+    "key_personnel": 10,
+    "price_to_win": 15,
+    "teaming_strategy": 8,
+    "compliance_risk": 10,
+    "capture_maturity": 8,
+    "operational_readiness": 10
+}
+MAX_RATING = 5
+MAX_POINTS = MAX_RATING * sum(FACTOR_WEIGHTS.values())
+
+RELATIONSHIP_RATINGS = (1, 3, 4, 5) # By awards at the agency, capped at 3
+PAST_PERFORMANCE_CUTS = (1, 2, 4, 10) # Rating = 1 + cuts reached
+NAICS_LEVEL_RATINGS = {5: 4, 4: 3, 3: 2} # Sector-only (2-digit) overlap earns nothing
+TEAMING_RATINGS = (2, 3, 4, 5) # By distinct certifications, capped at 3
+NEUTRAL = 3 # Rating when a factor has no data on either side
+
+# ==========================================
+# 1. Factor Ratings
+# ==========================================
+def pwin_from_points(points: int) -> int:
+    """Σ(Wi × Ri) as a 0-100 percentage of the maximum, rounded half up (integer math, no float drift)."""
+    return (200 * points + MAX_POINTS) // (2 * MAX_POINTS)
+
+def size_bucket(amount):
+    """Power-of-two size class of a dollar amount (None when unknown or under $1)."""
+    if amount is None or float(amount) < 1:
+        return None
+    return int(float(amount)).bit_length() - 1
+
+def size_rating(opp_bucket, con_bucket) -> int:
+    if opp_bucket is None or con_bucket is None:
+        return NEUTRAL
+    gap = abs(opp_bucket - con_bucket)
+    return 5 if gap <= 1 else 4 if gap <= 2 else 3 if gap <= 3 else 2
+
+def readiness_rating(opp_state, con_state) -> int:
+    if not opp_state or not con_state:
+        return NEUTRAL
+    return 5 if opp_state == con_state else 2
+
+def static_ratings(con, profile, features) -> dict:
+    """The four factors that depend on the contractor alone."""
+    certifications = bin(profile.certifications | profile.sba_certifications).count("1")
+    return {
+        "past_performance": 1 + bisect_right(PAST_PERFORMANCE_CUTS, features.get("award_count") or 0),
+        "key_personnel": 3 if con.get("primary_poc_email") else 1,
+        "teaming_strategy": TEAMING_RATINGS[min(certifications, 3)],
+        "compliance_risk": 5 if con.get("is_sam_registered") else 1
+    }
+
+def pwin_factors(opp, con, features=None, profile=None) -> dict:
+    """Reference: {factor: rating 1-5} for one pair, plus the `agency_awards` and `keyword_matches` behind them."""
+    features = features or {}
+    profile = profile or Taxonomy().profile(con)
+    ratings = static_ratings(con, profile, features)
+
+    agency_awards = (features.get("agency_awards") or {}).get(opp.get("agency_id"), 0) if opp.get("agency_id") else 0
+    ratings["customer_relationship"] = RELATIONSHIP_RATINGS[min(agency_awards, 3)]
+    ratings["competitive_position"] = (5 if profile.has_sba_certification else 1) if opp.get("set_aside_id") else NEUTRAL
+
+    naics = opp.get("naics_code")
+    if has(profile.naics, profile.taxonomy.naics_id(naics)):
+        ratings["technical_fit"] = 5
+    else:
+        ratings["technical_fit"] = NAICS_LEVEL_RATINGS.get(profile.taxonomy.naics_level(profile, naics), 1)
+
+    ratings["price_to_win"] = size_rating(size_bucket(opp.get("award_amount")), size_bucket(features.get("typical_award")))
+    keyword_matches = len(set(keywords(opp.get("title"))) & set(features.get("keywords") or ()))
+    ratings["capture_maturity"] = 1 + min(keyword_matches, 4)
+    ratings["operational_readiness"] = readiness_rating(opp.get("place_of_performance_state"), con.get("state"))
+    return dict(ratings, agency_awards=agency_awards, keyword_matches=keyword_matches)
+
+def pwin_score(ratings: dict) -> int:
+    return pwin_from_points(sum(weight * ratings[factor] for factor, weight in FACTOR_WEIGHTS.items()))
+
+# ==========================================
+# 2. Roster-at-once Scoring
+# ==========================================
+class PWinModel:
+    """Per-contractor columns and postings for scoring an opportunity against the whole roster."""
+    def __init__(self, contractors, features=None):
+        features = features or {}
+        self.ids = []
+        self.static = [] # Weighted points of static_ratings(), per roster position
+        self.certified = [] # Any sba_certifications entry, blank included (as in pwin_factors)
+        self.agency = {} # agency_id -> [(pos, awards there)]
+        self.naics = {} # exact code -> [pos]
+        self.naics_prefixes = {} # 3- to 5-digit prefix -> [pos]
+        self.sizes = {} # size bucket -> [pos]
+        self.keywords = {} # award-title term -> [pos]
+        self.state = {} # state -> [pos]
+        self.stateless = []
+
+        for pos, con in enumerate(contractors):
+            feat = features.get(con["id"]) or {}
+            self.ids.append(con["id"])
+            certs = {c for c in (con.get("certifications") or ()) if c} | {c for c in (con.get("sba_certifications") or ()) if c}
+            self.static.append(
+                FACTOR_WEIGHTS["past_performance"] * (1 + bisect_right(PAST_PERFORMANCE_CUTS, feat.get("award_count") or 0)) +
+                FACTOR_WEIGHTS["key_personnel"] * (3 if con.get("primary_poc_email") else 1) +
+                FACTOR_WEIGHTS["teaming_strategy"] * TEAMING_RATINGS[min(len(certs), 3)] +
+                FACTOR_WEIGHTS["compliance_risk"] * (5 if con.get("is_sam_registered") else 1)
+            )
+            if len(con.get("sba_certifications") or ()) > 0:
+                self.certified.append(pos)
+            for agency_id, awards in (feat.get("agency_awards") or {}).items():
+                self.agency.setdefault(agency_id, []).append((pos, awards))
+            codes = {code for code in (con.get("naics_codes") or ()) if code}
+            for code in codes:
+                self.naics.setdefault(code, []).append(pos)
+            for prefix in {code[:digits] for code in codes for digits in NAICS_LEVEL_RATINGS if len(code) > digits}:
+                self.naics_prefixes.setdefault(prefix, []).append(pos)
+            bucket = size_bucket(feat.get("typical_award"))
+            if bucket is not None:
+                self.sizes.setdefault(bucket, []).append(pos)
+            for term in set(feat.get("keywords") or ()):
+                self.keywords.setdefault(term, []).append(pos)
+            if con.get("state"):
+                self.state.setdefault(con["state"], []).append(pos)
+            else:
+                self.stateless.append(pos)
+        self.by_static = sorted(range(len(self.ids)), key=self.static.__getitem__)
+        self.static_sorted = [self.static[pos] for pos in self.by_static]
+
+    def _base(self, opp) -> int:
+        """Points of the opportunity-dependent factors for a contractor with no signal (neutral size fit)."""
+        W = FACTOR_WEIGHTS
+        return (W["customer_relationship"] + W["technical_fit"] + W["capture_maturity"] +
+                W["competitive_position"] * (1 if opp.get("set_aside_id") else NEUTRAL) +
+                W["price_to_win"] * NEUTRAL +
+                W["operational_readiness"] * (2 if opp.get("place_of_performance_state") else NEUTRAL))
+
+    def pwin_candidates(self, opp, min_score: int) -> list:
+        """Sorted roster positions whose PWin upper bound reaches min_score."""
+        # Without a posting hit, only the size fit can lift a contractor above base + static
+        size_gain = FACTOR_WEIGHTS["price_to_win"] * (5 - NEUTRAL) if size_bucket(opp.get("award_amount")) is not None else 0
+        needed = min_points(min_score) - self._base(opp) - size_gain
+        if not self.static_sorted or needed <= self.static_sorted[0]:
+            return list(range(len(self.ids)))
+
+        survivors = set(self.by_static[bisect_left(self.static_sorted, needed):])
+        if opp.get("set_aside_id"):
+            survivors.update(self.certified)
+        if opp.get("agency_id"):
+            survivors.update(pos for pos, _ in self.agency.get(opp["agency_id"], ()))
+        naics = opp.get("naics_code")
+        if naics:
+            survivors.update(self.naics.get(naics, ()))
+            for digits in NAICS_LEVEL_RATINGS:
+                if len(naics) > digits:
+                    survivors.update(self.naics_prefixes.get(naics[:digits], ()))
+        for term in set(keywords(opp.get("title"))):
+            survivors.update(self.keywords.get(term, ()))
+        if opp.get("place_of_performance_state"):
+            survivors.update(self.state.get(opp["place_of_performance_state"], ()))
+            survivors.update(self.stateless)
+        return sorted(survivors)
+
+    def _add(self, points, positions, delta):
+        if delta:
+            for pos in positions:
+                if pos in points:
+                    points[pos] += delta
+
+    def score(self, opp, floor=0) -> list:
+        """
+        [(pos, pwin, signals)] for every contractor scoring >= floor, in roster order. `signals`
+        holds the per-match columns: naics_match, set_aside_aligned, agency_history_aligned,
+        keyword_match_count. Only pwin_candidates() are scored.
+        """
+        W = FACTOR_WEIGHTS
+        set_aside = bool(opp.get("set_aside_id"))
+        opp_state = opp.get("place_of_performance_state")
+        opp_bucket = size_bucket(opp.get("award_amount"))
+        # Every candidate starts at the rating it gets with no signal, then postings add the difference
+        base = self._base(opp)
+        points = {pos: base + self.static[pos] for pos in self.pwin_candidates(opp, floor)}
+
+        if set_aside:
+            self._add(points, self.certified, W["competitive_position"] * 4)
+        agency_awards = {}
+        if opp.get("agency_id"):
+            for pos, awards in self.agency.get(opp["agency_id"], ()):
+                agency_awards[pos] = awards
+                if pos in points:
+                    points[pos] += W["customer_relationship"] * (RELATIONSHIP_RATINGS[min(awards, 3)] - 1)
+
+        naics = opp.get("naics_code")
+        exact = set(self.naics.get(naics, ())) if naics else set()
+        self._add(points, exact, W["technical_fit"] * 4)
+        seen = set(exact)
+        for digits, rating in NAICS_LEVEL_RATINGS.items():
+            if naics and len(naics) > digits:
+                level = [pos for pos in self.naics_prefixes.get(naics[:digits], ()) if pos not in seen]
+                self._add(points, level, W["technical_fit"] * (rating - 1))
+                seen.update(level)
+
+        if opp_bucket is not None:
+            for bucket, positions in self.sizes.items():
+                self._add(points, positions, W["price_to_win"] * (size_rating(opp_bucket, bucket) - NEUTRAL))
+
+        matches = {}
+        for term in set(keywords(opp.get("title"))):
+            for pos in self.keywords.get(term, ()):
+                matches[pos] = matches.get(pos, 0) + 1
+        for pos, count in matches.items():
+            if pos in points:
+                points[pos] += W["capture_maturity"] * min(count, 4)
+
+        if opp_state:
+            self._add(points, self.stateless, W["operational_readiness"] * (NEUTRAL - 2))
+            self._add(points, self.state.get(opp_state, ()), W["operational_readiness"] * 3)
+
+        threshold = min_points(floor)
+        certified = set(self.certified) if set_aside else ()
+        return [(pos, pwin_from_points(p), {
+            "naics_match": pos in exact,
+            "set_aside_aligned": pos in certified,
+            "agency_history_aligned": pos in agency_awards,
+            "keyword_match_count": matches.get(pos, 0)
+        }) for pos, p in points.items() if p >= threshold]
+
+def min_points(floor: int) -> int:
+    """Fewest weighted points whose PWin reaches `floor`."""
+    points = max(0, ((2 * floor - 1) * MAX_POINTS) // 200) # Never past the answer: pwin rounds half up
+    while pwin_from_points(points) < floor:
+        points += 1
+    return points
@@ -0,0 +1,206 @@
+"""
+Materialized per-contractor PWin features, refreshed incrementally.
+
+Two tables (tools/pwin_features_migration.sql):
+  * `contractor_awards`: one ledger row per awarded opportunity (`opportunities.awardee` set),
+    with the awardee resolved to a roster contractor (UEI first, then normalized company name),
+    the agency, the amount and the title's keywords. Keyed on notice_id, so re-reading an award
+    replaces its row instead of counting it twice.
+  * `contractor_features`: aggregated from the ledger per contractor: awards won overall and per
+    agency, the median award amount (size standard fit) and the most frequent award-title
+    keywords. Contractors with no resolved awards have no row (all features at their zero value).
+
+A refresh only reads opportunities and contractors whose `updated_at` is at or past the marks in
+.tmp/pwin_features_state.json (less run_state.MARK_OVERLAP, for rows that committed late), and re-aggregates only the contractors those rows touch. The
+match engine reads the feature table once per run; nothing is queried per pair.
+"""
+import re
+import sys
+import time
+import argparse
+from collections import Counter
+from statistics import median
+from repository import fetch_all
+from run_state import load_state, save_state, high_water_mark, changed_since, read_from
+
+STATE_FILE = "pwin_features_state.json"
+ID_CHUNK = 100 # Keeps `in.(...)` filters well under URL length limits
+WRITE_CHUNK = 500
+TOP_KEYWORDS = 25
+AWARD_COLUMNS = "notice_id, title, awardee, award_amount, agency_id, updated_at"
+ROSTER_COLUMNS = "uei, company_name, updated_at"
+LEDGER_COLUMNS = "contractor_id, awardee_key, awardee_uei, agency_id, award_amount, keywords"
+FEATURE_COLUMNS = "award_count, agency_awards, typical_award, keywords"
+
+# Legal-form suffixes dropped before comparing names, so "ACME, INC." resolves to "Acme Inc"
+NAME_SUFFIXES = {"inc", "incorporated", "llc", "l", "c", "ltd", "co", "corp", "corporation", "company", "lp", "llp", "pllc", "pc", "the"}
+UEI_PATTERN = re.compile(r"\b[A-Z0-9]{12}\b")
+STOPWORDS = {
+    "and", "for", "the", "with", "from", "services", "service", "support", "contract", "requirement", "requirements",
+    "notice", "intent", "sole", "source", "award", "base", "option", "year", "years", "various", "other", "new",
+    "this", "that", "are", "all", "per", "via", "non", "inc", "llc", "amendment", "combined", "synopsis", "solicitation"
+}
+
+# ==========================================
+# 1. Normalization
+# ==========================================
+def name_key(name) -> str:
+    """Case-, punctuation- and legal-suffix-insensitive company name."""
+    words = re.findall(r"[a-z0-9]+", (name or "").lower())
+    while words and words[-1] in NAME_SUFFIXES:
+        words.pop()
+    return " ".join(word for word in words if word != "the")
+
+def awardee_uei(awardee):
+    match = UEI_PATTERN.search(awardee or "")
+    return match.group(0) if match else None
+
+def keywords(text) -> list:
+    """Distinct capability terms of a title, in first-seen order."""
+    seen = {}
+    for token in re.findall(r"[a-z][a-z0-9]+", (text or "").lower()):
+        if len(token) >= 3 and token not in STOPWORDS:
+            seen.setdefault(token, None)
+    return list(seen)
+
+class RosterResolver:
+    """Maps an awardee string to a contractor id. Ties on a shared name go to the lowest id."""
+    def __init__(self, contractors):
+        self.by_uei = {}
+        self.by_name = {}
+        for con in sorted(contractors, key=lambda c: c["id"]):
+            if con.get("uei"):
+                self.by_uei.setdefault(con["uei"], con["id"])
+            key = name_key(con.get("company_name"))
+            if key:
+                self.by_name.setdefault(key, con["id"])
+
+    def resolve(self, uei, key):
+        return self.by_uei.get(uei) or self.by_name.get(key)
+
+def ledger_row(award, resolver: RosterResolver) -> dict:
+    uei, key = awardee_uei(award["awardee"]), name_key(award["awardee"])
+    return {
+        "notice_id": award["notice_id"],
+        "contractor_id": resolver.resolve(uei, key),
+        "awardee_key": key,
+        "awardee_uei": uei,
+        "agency_id": award.get("agency_id"),
+        "award_amount": float(award["award_amount"]) if award.get("award_amount") is not None else None,
+        "keywords": keywords(award.get("title"))
+    }
+
+# ==========================================
+# 2. Aggregation
+# ==========================================
+def aggregate(contractor_id, awards) -> dict:
+    """One contractor_features row from its ledger rows."""
+    agencies = Counter(award["agency_id"] for award in awards if award.get("agency_id"))
+    amounts = [float(award["award_amount"]) for award in awards if award.get("award_amount") is not None]
+    terms = Counter(term for award in awards for term in award.get("keywords") or ())
+    return {
+        "contractor_id": contractor_id,
+        "award_count": len(awards),
+        "agency_awards": dict(sorted(agencies.items())),
+        "typical_award": median(amounts) if amounts else None,
+        "keywords": [term for term, _ in sorted(terms.items(), key=lambda t: (-t[1], t[0]))[:TOP_KEYWORDS]]
+    }
+
+def load_features(supabase) -> dict:
+    """{contractor_id: feature row} for every contractor with award history."""
+    return {row["contractor_id"]: row for row in fetch_all(supabase, "contractor_features", FEATURE_COLUMNS, key="contractor_id")}
+
+# ==========================================
+# 3. Incremental Refresh
+# ==========================================
+def _chunks(values, size=ID_CHUNK):
+    values = sorted(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+def _upsert(supabase, table, rows, on_conflict):
+    for i in range(0, len(rows), WRITE_CHUNK):
+        supabase.table(table).upsert(rows[i:i + WRITE_CHUNK], on_conflict=on_conflict).execute()
+
+def _ledger_where(supabase, column, values) -> list:
+    rows = []
+    for chunk in _chunks(values):
+        rows.extend(fetch_all(supabase, "contractor_awards", "notice_id, " + LEDGER_COLUMNS, key="notice_id",
+                              where=lambda q, chunk=chunk: q.in_(column, chunk)))
+    return rows
+
+def refresh_features(supabase, marks=None) -> dict:
+    """
+    Brings contractor_awards and contractor_features up to date and returns the new marks
+    ({"opportunities": ..., "contractors": ...}). Empty `marks` rebuilds from every award.
+    Nothing is written to the marks until the caller persists them after this returns.
+    """
+    t0 = time.perf_counter()
+    marks = marks or {}
+    award_mark = marks.get("opportunities")
+
+    roster = fetch_all(supabase, "contractors", ROSTER_COLUMNS)
+    resolver = RosterResolver(roster)
+    awards = [row for row in fetch_all(supabase, "opportunities", AWARD_COLUMNS,
+                                       where=(lambda q: q.gte("updated_at", read_from(award_mark))) if award_mark else None)
+              if row.get("awardee")]
+    changed_cons = changed_since(roster, marks.get("contractors"))
+
+    # Awards read this run replace their ledger rows; the previous owners must be re-aggregated too
+    new_rows = [ledger_row(award, resolver) for award in awards]
+    previous = {row["notice_id"]: row for row in _ledger_where(supabase, "notice_id", [r["notice_id"] for r in new_rows])} if marks else {}
+    affected = {row["contractor_id"] for row in new_rows} | {row["contractor_id"] for row in previous.values()}
+
+    # Renamed or newly registered contractors can claim awards already in the ledger
+    if marks and changed_cons:
+        ueis = {con["uei"] for con in changed_cons if con.get("uei")}
+        keys = {name_key(con.get("company_name")) for con in changed_cons} - {""}
+        claimable = {row["notice_id"]: row for row in _ledger_where(supabase, "awardee_uei", ueis) + _ledger_where(supabase, "awardee_key", keys)}
+        claimable.update({row["notice_id"]: row for row in _ledger_where(supabase, "contractor_id", {con["id"] for con in changed_cons})})
+        for notice_id, row in claimable.items():
+            owner = resolver.resolve(row["awardee_uei"], row["awardee_key"])
+            if owner != row["contractor_id"] and notice_id not in previous:
+                affected.update({owner, row["contractor_id"]})
+                new_rows.append(dict(row, notice_id=notice_id, contractor_id=owner))
+    _upsert(supabase, "contractor_awards", new_rows, "notice_id")
+    affected.discard(None)
+
+    if marks:
+        ledger = _ledger_where(supabase, "contractor_id", affected)
+    else:
+        ledger = [row for row in fetch_all(supabase, "contractor_awards", LEDGER_COLUMNS, key="notice_id") if row["contractor_id"]]
+        affected = {row["contractor_id"] for row in ledger} | set(load_features(supabase))
+    by_contractor = {}
+    for row in ledger:
+        by_contractor.setdefault(row["contractor_id"], []).append(row)
+    features = [aggregate(con_id, rows) for con_id, rows in sorted(by_contractor.items())]
+    _upsert(supabase, "contractor_features", features, "contractor_id")
+    # Contractors left with no awards drop back to "no history"
+    emptied = sorted(affected - set(by_contractor))
+    for chunk in _chunks(emptied):
+        supabase.table("contractor_features").delete().in_("contractor_id", chunk).execute()
+
+    print(f"  -> PWin features: {len(awards)} awards read, {len(features)} contractors re-aggregated, "
+          f"{len(emptied)} cleared in {time.perf_counter() - t0:.2f}s.")
+    return {
+        "opportunities": high_water_mark(awards, previous=marks.get("opportunities")),
+        "contractors": high_water_mark(changed_cons, previous=marks.get("contractors"))
+    }
+
+def refresh_feature_table(supabase, full=False) -> dict:
+    """refresh_features() with its marks kept in .tmp/ (advanced only once the writes landed)."""
+    state = {} if full else load_state(STATE_FILE)
+    marks = refresh_features(supabase, {k: state[k] for k in ("opportunities", "contractors") if state.get(k)})
+    save_state(STATE_FILE, marks)
+    return marks
+
+if __name__ == "__main__":
+    from clients import get_supabase, missing_env
+    parser = argparse.ArgumentParser(description="Refresh the materialized PWin contractor features")
+    parser.add_argument("--full", action="store_true", help="Rebuild from every award instead of rows changed since the last run")
+    args = parser.parse_args()
+    if missing_env("SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+        print("❌ Missing API keys in .env. Halting execution.")
+        sys.exit(1)
+    refresh_feature_table(get_supabase(), full=args.full)
+    print("  ✅ contractor_features is up to date.")
@@ -0,0 +1,41 @@
+-- ==========================================
+-- PWin Feature Tables (tools/pwin_features.py)
+-- ==========================================
+-- Materialized inputs of the ten-factor PWin score in tools/pwin_engine.py. Filled and kept
+-- current by `python tools/pwin_features.py` (incremental on `updated_at`); the match engine
+-- reads `contractor_features` once per run. Apply after scoring_migration.sql.
+
+-- 1. AWARD LEDGER
+-- One row per awarded opportunity, with the awardee resolved to a roster contractor
+-- (NULL until a contractor with that UEI or normalized name is registered).
+CREATE TABLE IF NOT EXISTS contractor_awards (
+    notice_id VARCHAR(255) PRIMARY KEY,
+    contractor_id UUID,
+    awardee_key TEXT,
+    awardee_uei VARCHAR(12),
+    agency_id UUID,
+    award_amount NUMERIC,
+    keywords TEXT[] DEFAULT '{}',
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_contractor_awards_contractor_id ON contractor_awards(contractor_id);
+CREATE INDEX IF NOT EXISTS idx_contractor_awards_awardee_key ON contractor_awards(awardee_key);
+CREATE INDEX IF NOT EXISTS idx_contractor_awards_awardee_uei ON contractor_awards(awardee_uei);
+
+-- 2. CONTRACTOR FEATURES
+-- Aggregated per contractor from the ledger. No row means no award history.
+CREATE TABLE IF NOT EXISTS contractor_features (
+    contractor_id UUID PRIMARY KEY,
+    award_count INTEGER DEFAULT 0,
+    agency_awards JSONB DEFAULT '{}',   -- {agency_id: awards won at that agency}
+    typical_award NUMERIC,              -- Median award amount (size standard fit)
+    keywords TEXT[] DEFAULT '{}',       -- Most frequent award-title terms, most frequent first
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Same updated_at trigger as the scored tables (touch_updated_at() is in scoring_migration.sql)
+DROP TRIGGER IF EXISTS contractor_features_touch_updated_at ON contractor_features;
+CREATE TRIGGER contractor_features_touch_updated_at
+    BEFORE UPDATE ON contractor_features
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
@@ -0,0 +1,151 @@
+-- ==========================================
+-- Phase 18: Set-Based Ranking In Postgres
+-- ==========================================
+-- `tools/2_score_matches.py --engine sql` calls score_matches_sql() over RPC instead of pulling
+-- both tables into Python. The function scores, ranks and upserts the Top 10 per opportunity
+-- in one statement, so no opportunity or contractor rows cross the network.
+-- Requires `tools/scoring_migration.sql` (the matches_opp_contractor_key upsert key).
+
+-- 1. OVERLAP INDEXES
+-- ==========================================
+-- `&&` tests on the contractor arrays are answered from GIN indexes; state uses contractors_state_idx.
+CREATE INDEX IF NOT EXISTS contractors_naics_codes_gin ON contractors USING GIN (naics_codes);
+CREATE INDEX IF NOT EXISTS contractors_certifications_gin ON contractors USING GIN (certifications);
+
+-- 2. SCORING FUNCTION
+-- ==========================================
+-- Mirrors tools/score_engine.py exactly: the same weights summed in the same float8 term order,
+-- psc_match fixed at 0 and the value-fit / deadline placeholders at 0.5, tiers decided on the
+-- unrounded score. Ties are broken by contractor id, which is the roster order when the Python
+-- engine reads contractors ordered by id.
+--
+-- Like the bitset engine, candidates are drawn tier by tier instead of scoring every pair: for
+-- each of the 8 (NAICS, set-aside, geo) combinations an opportunity takes at most p_top_n
+-- contractors with exactly that combination, first by id. The positive tests are answered by
+-- the GIN / state indexes, and a window function ranks the <= 8 x p_top_n candidates per
+-- opportunity. Blank opportunity codes are no signal; the `IS NOT NULL` guards let Postgres skip a
+-- tier outright instead of walking the roster for a match that cannot exist.
+-- With p_min_score set, pairs under the floor are dropped before ranking (same as --min-tier).
+CREATE OR REPLACE FUNCTION score_matches_sql(p_min_score float8 DEFAULT NULL, p_top_n integer DEFAULT 10)
+RETURNS jsonb AS $$
+DECLARE
+    v_opportunities integer;
+    v_generated integer;
+    v_written integer;
+BEGIN
+    SELECT COUNT(*) INTO v_opportunities FROM opportunities;
+
+    WITH ops AS (
+        SELECT id,
+               ARRAY[NULLIF(naics_code::text, '')] AS naics,
+               ARRAY[NULLIF(set_aside_code::text, '')] AS setaside,
+               NULLIF(place_of_performance_state::text, '') AS state
+        FROM opportunities
+    ),
+    candidates (opportunity_id, contractor_id, naics_match, setaside_match, geo_match) AS (
+        SELECT o.id, t.id, 1, 1, 1 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE o.naics[1] IS NOT NULL AND c.naics_codes && o.naics
+              AND o.setaside[1] IS NOT NULL AND c.certifications && o.setaside
+              AND o.state IS NOT NULL AND c.state = o.state
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 1, 1, 0 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE o.naics[1] IS NOT NULL AND c.naics_codes && o.naics
+              AND o.setaside[1] IS NOT NULL AND c.certifications && o.setaside
+              AND NOT COALESCE(c.state = o.state, false)
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 1, 0, 1 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE o.naics[1] IS NOT NULL AND c.naics_codes && o.naics
+              AND NOT COALESCE(c.certifications && o.setaside, false)
+              AND o.state IS NOT NULL AND c.state = o.state
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 0, 1, 1 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE NOT COALESCE(c.naics_codes && o.naics, false)
+              AND o.setaside[1] IS NOT NULL AND c.certifications && o.setaside
+              AND o.state IS NOT NULL AND c.state = o.state
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 1, 0, 0 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE o.naics[1] IS NOT NULL AND c.naics_codes && o.naics
+              AND NOT COALESCE(c.certifications && o.setaside, false)
+              AND NOT COALESCE(c.state = o.state, false)
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 0, 1, 0 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE NOT COALESCE(c.naics_codes && o.naics, false)
+              AND o.setaside[1] IS NOT NULL AND c.certifications && o.setaside
+              AND NOT COALESCE(c.state = o.state, false)
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 0, 0, 1 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE NOT COALESCE(c.naics_codes && o.naics, false)
+              AND NOT COALESCE(c.certifications && o.setaside, false)
+              AND o.state IS NOT NULL AND c.state = o.state
+            ORDER BY c.id LIMIT p_top_n) t
+        UNION ALL
+        SELECT o.id, t.id, 0, 0, 0 FROM ops o CROSS JOIN LATERAL (
+            SELECT c.id FROM contractors c
+            WHERE NOT COALESCE(c.naics_codes && o.naics, false)
+              AND NOT COALESCE(c.certifications && o.setaside, false)
+              AND NOT COALESCE(c.state = o.state, false)
+            ORDER BY c.id LIMIT p_top_n) t
+    ),
+    scored AS (
+        SELECT k.*,
+               (0.25::float8 * naics_match) +
+               (0.15::float8 * 0) +
+               (0.20::float8 * setaside_match) +
+               (0.15::float8 * geo_match) +
+               (0.15::float8 * 0.5::float8) +
+               (0.10::float8 * 0.5::float8) AS score
+        FROM candidates k
+    ),
+    ranked AS (
+        SELECT s.*, row_number() OVER (PARTITION BY opportunity_id ORDER BY score DESC, contractor_id) AS rank
+        FROM scored s
+        WHERE p_min_score IS NULL OR score >= p_min_score
+    ),
+    top_matches AS (
+        SELECT * FROM ranked WHERE rank <= p_top_n
+    ),
+    upserted AS (
+        INSERT INTO matches (opportunity_id, contractor_id, score, classification, score_breakdown)
+        SELECT opportunity_id, contractor_id, round(score::numeric, 4),
+               CASE WHEN score >= 0.70 THEN 'HOT' WHEN score >= 0.50 THEN 'WARM' ELSE 'COLD' END,
+               jsonb_build_object('naics_match', naics_match, 'psc_match', 0, 'setaside_match', setaside_match,
+                                  'geo_match', geo_match, 'contract_value_fit', 0.5, 'deadline_feasibility', 0.5)
+        FROM top_matches
+        ON CONFLICT (opportunity_id, contractor_id) DO UPDATE
+            SET score = EXCLUDED.score,
+                classification = EXCLUDED.classification,
+                score_breakdown = EXCLUDED.score_breakdown
+            -- Unchanged rows are left alone: no dead tuples, no trigger or replication churn
+            WHERE matches.score IS DISTINCT FROM EXCLUDED.score
+               OR matches.classification IS DISTINCT FROM EXCLUDED.classification
+               OR matches.score_breakdown IS DISTINCT FROM EXCLUDED.score_breakdown
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM top_matches), (SELECT COUNT(*) FROM upserted) INTO v_generated, v_written;
+
+    RETURN jsonb_build_object('opportunities', v_opportunities, 'matches', v_generated, 'written', v_written);
+END;
+$$ LANGUAGE plpgsql;
+
+-- 3. ACCESS
+-- ==========================================
+-- The function writes to matches, so only the service role may call it over RPC.
+REVOKE ALL ON FUNCTION score_matches_sql(float8, integer) FROM PUBLIC;
+DO $$ BEGIN
+    IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+        REVOKE ALL ON FUNCTION score_matches_sql(float8, integer) FROM anon, authenticated;
+    END IF;
+END $$;
@@ -0,0 +1,233 @@
+"""
+Append-only local archive of raw SAM.gov API pages, with replay for zero-API re-ingestion.
+
+Every opportunity and entity page the fetchers receive is appended, untouched, to a compressed
+JSONL segment under .tmp/raw_archive/<kind>/<capture day>/<ptype>/ (kind is `opportunities` or
+`entities`; entities have no ptype and use `all`). One line per page, each page its own
+compressed frame, so a crash loses at most the page being written. Segments are zstd (.zst)
+when a zstd codec is installed (Python 3.14 `compression.zstd` or the `zstandard` package),
+gzip (.gz) otherwise; replay reads both. The API key is never stored.
+
+Replay re-runs normalization and upserts from disk with no network: segments are decompressed in
+parallel (ARCHIVE_WORKERS threads), filtered by capture-day range and ptype, and fed to the same
+sync functions the live fetch uses. Newest captures are read first and only the latest copy of
+each notice / UEI is replayed, so an amendment is never overwritten by an older capture. Point
+`root` at a directory of segments to use an archive as an offline test fixture.
+
+Usage: python tools/raw_archive.py stats
+       python tools/raw_archive.py replay {opportunities,contractors} [--from DAY] [--to DAY] [--ptype P]
+"""
+import io
+import os
+import gzip
+import json
+import argparse
+import threading
+from itertools import islice
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from run_state import STATE_DIR
+
+ARCHIVE_DIR = os.getenv("RAW_ARCHIVE_DIR") or os.path.join(STATE_DIR, "raw_archive")
+RAW_ARCHIVE = os.getenv("RAW_ARCHIVE", "1") != "0" # Set RAW_ARCHIVE=0 to stop capturing pages
+ARCHIVE_SEGMENT_MB = float(os.getenv("ARCHIVE_SEGMENT_MB", "32")) # Uncompressed bytes per segment
+ARCHIVE_WORKERS = int(os.getenv("ARCHIVE_WORKERS", str(min(8, os.cpu_count() or 1))))
+ARCHIVE_ZSTD_LEVEL = 6
+
+# Replay keeps only the newest copy of each record, by these keys
+RECORD_KEYS = {
+    "opportunities": lambda record: record.get("noticeId"),
+    "entities": lambda record: (record.get("entityRegistration") or {}).get("ueiSAM"),
+}
+
+# ==========================================
+# 1. Codecs
+# ==========================================
+def _zstd():
+    """(compress, open_reader) from whichever zstd binding is installed, or None."""
+    try:
+        from compression import zstd # Python 3.14+
+        return (lambda data: zstd.compress(data, level=ARCHIVE_ZSTD_LEVEL)), zstd.ZstdFile
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return ((lambda data: zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(data)),
+            lambda f: zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True))
+
+def codec(name=None) -> tuple:
+    """(suffix, compress, open_reader) for `name` ("zstd" / "gzip"); the default prefers zstd."""
+    zstd = _zstd() if name in (None, "zstd") else None
+    if zstd:
+        return (".zst", *zstd)
+    if name == "zstd":
+        raise RuntimeError("No zstd codec installed (pip install zstandard, or Python 3.14+)")
+    return ".gz", gzip.compress, lambda f: gzip.GzipFile(fileobj=f)
+
+# ==========================================
+# 2. Capture
+# ==========================================
+class RawArchive:
+    def __init__(self, root=ARCHIVE_DIR, codec_name=None, segment_mb=ARCHIVE_SEGMENT_MB):
+        self.root = root
+        self.suffix, self.compress, _ = codec(codec_name)
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        self.lock = threading.Lock()
+        self.segments = {} # (kind, day, ptype) -> [path, uncompressed bytes]
+        self.stats = {"pages": 0, "records": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    def _segment(self, kind, day, ptype, size) -> str:
+        segment = self.segments.get((kind, day, ptype))
+        if segment is None or segment[1] + size > self.segment_bytes:
+            stamp = datetime.now(timezone.utc).strftime("%H%M%S%f")
+            name = f"{stamp}-{os.getpid()}-{len(self.segments)}.jsonl{self.suffix}"
+            segment = self.segments[(kind, day, ptype)] = [os.path.join(self.root, kind, day, ptype or "all", name), 0]
+            os.makedirs(os.path.dirname(segment[0]), exist_ok=True)
+        segment[1] += size
+        return segment[0]
+
+    def append(self, kind, ptype, offset, records, params=None, fetched_at=None):
+        """Appends one raw page. `params` are the request's filters (the API key is dropped)."""
+        fetched_at = fetched_at or datetime.now(timezone.utc)
+        line = json.dumps({"fetched_at": fetched_at.isoformat(), "ptype": ptype, "offset": offset,
+                           "params": {k: v for k, v in (params or {}).items() if k != "api_key"},
+                           "records": records}, separators=(",", ":")).encode() + b"\n"
+        frame = self.compress(line) # Outside the lock: producers compress in parallel
+        with self.lock:
+            path = self._segment(kind, fetched_at.strftime("%Y-%m-%d"), ptype, len(line))
+            with open(path, "ab") as f:
+                f.write(frame)
+            self.stats["pages"] += 1
+            self.stats["records"] += len(records)
+            self.stats["raw_bytes"] += len(line)
+            self.stats["stored_bytes"] += len(frame)
+
+_lock = threading.Lock()
+_archive = None
+
+def set_archive(archive):
+    """Captures into `archive` from now on (None: back to the default under ARCHIVE_DIR). Tests use a temp dir."""
+    global _archive
+    with _lock:
+        _archive = archive
+
+def archive_page(kind, ptype, offset, records, params=None):
+    """Captures a fetched page in the process-wide archive (a no-op with RAW_ARCHIVE=0). Never raises."""
+    global _archive
+    if not RAW_ARCHIVE:
+        return
+    try:
+        with _lock:
+            if _archive is None:
+                _archive = RawArchive()
+        _archive.append(kind, ptype, offset, records, params)
+    except Exception as e:
+        print(f"     ⚠️ Raw archive write failed ({type(e).__name__}: {e}); the page was still ingested.")
+
+# ==========================================
+# 3. Replay
+# ==========================================
+def list_segments(kind, since=None, until=None, ptypes=None, root=ARCHIVE_DIR) -> list:
+    """[(day, ptype, path)] for segments whose capture day is within since..until (YYYY-MM-DD, inclusive)."""
+    base = os.path.join(root, kind)
+    segments = []
+    for day in sorted(os.listdir(base)) if os.path.isdir(base) else []:
+        if (since and day < since) or (until and day > until):
+            continue
+        for ptype in sorted(os.listdir(os.path.join(base, day))):
+            if ptypes and ptype not in ptypes:
+                continue
+            for name in sorted(os.listdir(os.path.join(base, day, ptype))):
+                if name.endswith((".jsonl.zst", ".jsonl.gz")):
+                    segments.append((day, ptype, os.path.join(base, day, ptype, name)))
+    return segments
+
+def read_segment(path) -> list:
+    """Every complete page in a segment. A frame cut short by a crash ends the segment with a warning."""
+    open_reader = codec("zstd" if path.endswith(".zst") else "gzip")[2]
+    pages = []
+    with open(path, "rb") as f:
+        try:
+            for line in io.TextIOWrapper(open_reader(f), encoding="utf-8"):
+                pages.append(json.loads(line))
+        except Exception as e:
+            print(f"     ⚠️ {path}: stopped after {len(pages)} pages at a damaged frame ({type(e).__name__}).")
+    return pages
+
+def iter_archived_pages(kind, since=None, until=None, ptypes=None, root=ARCHIVE_DIR, workers=ARCHIVE_WORKERS,
+                        latest_only=True):
+    """
+    Yields (ptype, offset, records) from the archive, newest capture first. Segments are
+    decompressed `workers` at a time. With `latest_only`, a record whose key (notice id / UEI)
+    was already yielded from a newer capture is dropped, and emptied pages are skipped.
+    """
+    segments = sorted(list_segments(kind, since, until, ptypes, root), key=lambda s: (s[0], os.path.basename(s[2])), reverse=True)
+    paths = iter([path for _, _, path in segments])
+    key = RECORD_KEYS[kind]
+    seen = set()
+    workers = max(1, workers)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Bounded read-ahead: at most `workers` decoded segments wait in memory
+        ahead = deque(pool.submit(read_segment, path) for path in islice(paths, workers))
+        while ahead:
+            pages = ahead.popleft().result()
+            ahead.extend(pool.submit(read_segment, path) for path in islice(paths, 1))
+            for page in reversed(pages): # Appended in capture order, so the newest is last
+                records = page["records"]
+                if latest_only:
+                    fresh = []
+                    for record in records:
+                        record_key = key(record)
+                        if record_key is None or record_key not in seen:
+                            seen.add(record_key)
+                            fresh.append(record)
+                    records = fresh
+                if records:
+                    yield page["ptype"], page["offset"], records
+
+def archive_stats(root=ARCHIVE_DIR) -> list:
+    """[(kind, days, segments, compressed bytes)] per kind."""
+    rows = []
+    for kind in RECORD_KEYS:
+        segments = list_segments(kind, root=root)
+        if segments:
+            rows.append((kind, len({day for day, _, _ in segments}), len(segments),
+                         sum(os.path.getsize(path) for _, _, path in segments)))
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect or replay the raw SAM.gov page archive")
+    parser.add_argument("command", choices=["stats", "replay"])
+    parser.add_argument("target", nargs="?", choices=["opportunities", "contractors"], help="What to replay")
+    parser.add_argument("--from", dest="since", help="First capture day to replay (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="until", help="Last capture day to replay (YYYY-MM-DD)")
+    parser.add_argument("--ptype", action="append", help="Notice type(s) to replay (default: all)")
+    parser.add_argument("--workers", type=int, default=ARCHIVE_WORKERS, help="Segments decompressed in parallel")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        rows = archive_stats()
+        if not rows:
+            print(f"📭 No archived pages under {ARCHIVE_DIR}.")
+        for kind, days, segments, size in rows:
+            print(f"  -> {kind:<14} {days} day(s), {segments} segment(s), {size / 1024 / 1024:.1f} MB compressed")
+        exit(0)
+    if not args.target:
+        parser.error("replay needs a target: opportunities or contractors")
+
+    from clients import missing_env
+    if missing_env("SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+        print("❌ Missing Supabase keys in .env. Halting.")
+        exit(1)
+    import cron_daily_sync as sync
+    print(f"🔁 Replaying archived {args.target} ({args.since or 'first'} .. {args.until or 'last'} capture day), no SAM.gov calls.")
+    if args.target == "opportunities":
+        sync.load_lookups()
+        sync.sync_opportunities(pages=iter_archived_pages("opportunities", args.since, args.until, args.ptype,
+                                                          workers=args.workers))
+    else:
+        sync.sync_contractors(pages=((offset, entities) for _, offset, entities
+                                     in iter_archived_pages("entities", args.since, args.until, workers=args.workers)))
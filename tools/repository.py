@@ -0,0 +1,53 @@
+"""
+Keyset-paginated, column-projected table reads for the tools.
+
+PostgREST silently truncates any select at its db-max-rows cap, and `select("*")` drags along
+`raw_json` and `fts`, which no scorer or drafter reads. Whole-table reads go through here
+instead: only the declared columns are selected, and rows come in primary-key order, each page
+starting after the last key seen (`key > last`), so a table of any size streams in constant
+memory.
+
+Keyset pages stay correct while other jobs write. An upsert never moves a row's key, so every
+row present for the whole scan is returned exactly once, which offset (`range()`) pages cannot
+promise once rows land ahead of the cursor. A scan ends on an empty page, not a short one, so a
+server cap below `page_size` cannot end it early.
+"""
+from itertools import islice
+
+PAGE_SIZE = 1000 # PostgREST db-max-rows default
+
+def projection(columns: str, key: str = "id") -> str:
+    names = [c.strip() for c in columns.split(",") if c.strip()]
+    if not names or "*" in names:
+        raise ValueError("Declare the columns to read: '*' pulls raw_json/fts payloads nobody uses")
+    return ", ".join(names if key in names else [key] + names)
+
+def iter_pages(supabase, table: str, columns: str, key: str = "id", where=None, page_size: int = PAGE_SIZE):
+    """
+    Yields `table` a page (list of rows) at a time in `key` order, selecting only `columns` (plus
+    the key). `where` takes the query builder and returns it with extra filters applied.
+    """
+    select = projection(columns, key)
+    last = None
+    while True:
+        query = supabase.table(table).select(select)
+        if where is not None:
+            query = where(query)
+        if last is not None:
+            query = query.gt(key, last)
+        rows = query.order(key).limit(page_size).execute().data
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][key]
+
+def iter_rows(supabase, table: str, columns: str, key: str = "id", where=None, page_size: int = PAGE_SIZE, limit=None):
+    """Row-by-row view of iter_pages(); stops after `limit` rows when set."""
+    if limit:
+        page_size = min(page_size, limit)
+    rows = (row for page in iter_pages(supabase, table, columns, key, where, page_size) for row in page)
+    return islice(rows, limit) if limit else rows
+
+def fetch_all(supabase, table: str, columns: str, key: str = "id", where=None, page_size: int = PAGE_SIZE, limit=None) -> list:
+    """Every row (or the first `limit`) as a list, for callers that need the table resident (e.g. the roster)."""
+    return list(iter_rows(supabase, table, columns, key, where, page_size, limit))
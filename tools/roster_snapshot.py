@@ -0,0 +1,314 @@
+"""
+Columnar, memory-mapped snapshot of the contractor roster's scoring fields, kept in .tmp/.
+
+Every scoring run used to download the whole roster as JSON dicts. The snapshot keeps only the
+fields the scorers read, one column at a time in a single file:
+  * strings (id, uei, company_name, primary_poc_email) as uint32 offsets + one UTF-8 blob
+  * state as a uint16 dictionary code (0 = none), is_sam_registered as one byte per row
+  * NAICS / PSC / certification sets as uint16 (or uint32) dictionary codes per row (CSR
+    offsets + codes), plus the inverted postings (code -> sorted row positions) the bitset
+    engine and the candidate index are built from
+Rows are in id order, the order the repository pages them in. Opening a snapshot is an mmap plus
+zero-copy memoryview casts, so it takes milliseconds, and worker processes opening the same file
+share its pages through the OS page cache instead of each unpickling a copy.
+
+refresh_snapshot() re-fetches only rows whose `updated_at` is at or after the snapshot's mark
+(less run_state.MARK_OVERLAP, for rows that committed late) and merges them in. Deleted contractors are caught by comparing the exact row count, which triggers
+a full rebuild (as does a different project, format or byte order).
+
+Usage: python tools/roster_snapshot.py [--full]
+"""
+import os
+import sys
+import json
+import mmap
+import time
+import struct
+import argparse
+from array import array
+from run_state import STATE_DIR, client_source, read_from
+from repository import iter_rows, fetch_all
+
+SNAPSHOT_PATH = os.path.join(STATE_DIR, "roster_snapshot.bin")
+SNAPSHOT_FORMAT = 1
+MAGIC = b"CPROSTER"
+SOURCE_COLUMNS = ("uei, company_name, state, naics_codes, psc_codes, certifications, sba_certifications, "
+                  "is_sam_registered, primary_poc_email, updated_at")
+
+STRING_COLUMNS = ("id", "uei", "company_name", "primary_poc_email")
+SET_COLUMNS = ("naics_codes", "psc_codes", "certifications", "sba_certifications")
+POSTING_COLUMNS = SET_COLUMNS + ("state",)
+
+# ==========================================
+# 1. Writing
+# ==========================================
+class _Encoder:
+    """Accumulates rows into compact column arrays in one pass, assigning dictionary codes on first sight."""
+    def __init__(self):
+        self.rows = 0
+        self.strings = {c: (array("I", [0]), bytearray()) for c in STRING_COLUMNS}
+        self.sets = {c: (array("I", [0]), array("I")) for c in SET_COLUMNS}
+        self.dictionaries = {c: {} for c in POSTING_COLUMNS}
+        self.state = array("H")
+        self.sam = bytearray()
+
+    def _code(self, column, value) -> int:
+        codes = self.dictionaries[column]
+        if value not in codes:
+            codes[value] = len(codes)
+        return codes[value]
+
+    def add(self, row):
+        for column in STRING_COLUMNS:
+            offsets, data = self.strings[column]
+            data += (row.get(column) or "").encode()
+            offsets.append(len(data))
+        for column in SET_COLUMNS:
+            offsets, codes = self.sets[column]
+            # Blank elements are kept (as ""): a certification list of [""] still counts as non-empty for PWin
+            codes.extend(self._code(column, "" if v is None else v) for v in dict.fromkeys(row.get(column) or ()))
+            offsets.append(len(codes))
+        self.state.append(self._code("state", row["state"]) + 1 if row.get("state") else 0)
+        self.sam.append(1 if row.get("is_sam_registered") else 0)
+        self.rows += 1
+
+    def postings(self, column):
+        """(offsets, positions): the row positions carrying each dictionary code, in row order."""
+        buckets = [[] for _ in self.dictionaries[column]]
+        if column == "state":
+            for pos, code in enumerate(self.state):
+                if code:
+                    buckets[code - 1].append(pos)
+        else:
+            offsets, codes = self.sets[column]
+            for pos in range(self.rows):
+                for code in codes[offsets[pos]:offsets[pos + 1]]:
+                    buckets[code].append(pos)
+        offsets, positions = array("I", [0]), array("I")
+        for bucket in buckets:
+            positions.extend(bucket)
+            offsets.append(len(positions))
+        return offsets, positions
+
+    def sections(self):
+        for column, (offsets, data) in self.strings.items():
+            yield f"{column}.offsets", offsets
+            yield f"{column}.data", array("B", data)
+        for column, (offsets, codes) in self.sets.items():
+            yield f"{column}.offsets", offsets
+            yield f"{column}.codes", array("H", codes) if len(self.dictionaries[column]) <= 0xFFFF else codes
+        yield "state", self.state
+        yield "is_sam_registered", array("B", self.sam)
+        for column in POSTING_COLUMNS:
+            offsets, positions = self.postings(column)
+            yield f"{column}.postings.offsets", offsets
+            yield f"{column}.postings", positions
+
+def write_snapshot(rows, path=SNAPSHOT_PATH, source=None, mark=None) -> int:
+    """Writes rows (already in id order) as a snapshot, atomically. Returns rows written."""
+    encoder = _Encoder()
+    for row in rows:
+        encoder.add(row)
+
+    header = {"format": SNAPSHOT_FORMAT, "byteorder": sys.byteorder, "source": source, "mark": mark,
+              "rows": encoder.rows, "written_at": time.time(), "sections": {},
+              "dictionaries": {c: list(codes) for c, codes in encoder.dictionaries.items()}}
+    sections = list(encoder.sections())
+    # Offsets are relative to the end of the header, so they can be laid out before its length is known
+    offset = 0
+    for name, values in sections:
+        offset += -offset % 8 # Keep every column 8-byte aligned for memoryview casts
+        header["sections"][name] = [offset, values.typecode, len(values)]
+        offset += len(values) * values.itemsize
+    blob = json.dumps(header, separators=(",", ":")).encode()
+
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".partial"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<Q", len(blob)) + blob)
+        f.write(b"\0" * (-f.tell() % 8))
+        base = f.tell()
+        for name, values in sections:
+            f.write(b"\0" * (base + header["sections"][name][0] - f.tell()))
+            values.tofile(f)
+    os.replace(tmp, path)
+    return encoder.rows
+
+# ==========================================
+# 2. Reading
+# ==========================================
+class RosterSnapshot:
+    """
+    Read-only, memory-mapped roster. Behaves as a sequence of contractor dicts (decoded on access),
+    and exposes postings(column) for the engines to build their indexes without per-row dicts.
+    """
+    def __init__(self, path=SNAPSHOT_PATH):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a roster snapshot")
+        (length,) = struct.unpack_from("<Q", self._mmap, len(MAGIC))
+        start = len(MAGIC) + 8
+        self.header = json.loads(self._mmap[start:start + length])
+        base = start + length + (-(start + length) % 8)
+
+        view = memoryview(self._mmap)
+        self._views = {"": view}
+        for name, (offset, typecode, count) in self.header["sections"].items():
+            size = array(typecode).itemsize
+            self._views[name] = view[base + offset:base + offset + count * size].cast(typecode)
+        self.dictionaries = self.header["dictionaries"]
+        self._postings = {}
+
+    @property
+    def mark(self):
+        return self.header.get("mark")
+
+    @property
+    def source(self):
+        return self.header.get("source")
+
+    def __len__(self) -> int:
+        return self.header["rows"]
+
+    def column(self, name) -> memoryview:
+        """A raw column section (e.g. "state", "is_sam_registered"), zero-copy."""
+        return self._views[name]
+
+    def string(self, column, pos) -> str:
+        offsets = self._views[f"{column}.offsets"]
+        return bytes(self._views[f"{column}.data"][offsets[pos]:offsets[pos + 1]]).decode()
+
+    def codes(self, column, pos) -> list:
+        offsets = self._views[f"{column}.offsets"]
+        names = self.dictionaries[column]
+        return [names[code] for code in self._views[f"{column}.codes"][offsets[pos]:offsets[pos + 1]]]
+
+    def __getitem__(self, pos) -> dict:
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError(pos)
+        state = self._views["state"][pos]
+        row = {column: self.string(column, pos) or None for column in STRING_COLUMNS}
+        row["company_name"] = row["company_name"] or ""
+        row.update({column: self.codes(column, pos) for column in SET_COLUMNS})
+        row["state"] = self.dictionaries["state"][state - 1] if state else None
+        row["is_sam_registered"] = bool(self._views["is_sam_registered"][pos])
+        return row
+
+    def __iter__(self):
+        return (self[pos] for pos in range(len(self)))
+
+    def position(self, contractor_id):
+        """Row position of a contractor id (binary search over the sorted id column), or None."""
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string("id", mid) < contractor_id:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self) and self.string("id", lo) == contractor_id else None
+
+    def postings(self, column) -> dict:
+        """{value: sorted row positions (a zero-copy memoryview)} for a set column or state."""
+        if column not in self._postings:
+            offsets = self._views[f"{column}.postings.offsets"]
+            positions = self._views[f"{column}.postings"]
+            self._postings[column] = {value: positions[offsets[code]:offsets[code + 1]]
+                                      for code, value in enumerate(self.dictionaries[column])}
+        return self._postings[column]
+
+    def close(self):
+        self._postings.clear()
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass # An index still holds postings slices; the map is unmapped once they are collected
+
+def open_snapshot(path=SNAPSHOT_PATH):
+    """The snapshot at `path`, or None if there is none (or it is unreadable)."""
+    try:
+        return RosterSnapshot(path)
+    except (FileNotFoundError, ValueError, KeyError, json.JSONDecodeError, struct.error):
+        return None
+
+# ==========================================
+# 3. Incremental Refresh
+# ==========================================
+def _merge(snapshot, changed):
+    """Snapshot rows with `changed` (sorted by id) replacing or inserting by id, still in id order."""
+    changed = iter(changed)
+    pending = next(changed, None)
+    for row in snapshot:
+        while pending is not None and pending["id"] < row["id"]:
+            yield pending
+            pending = next(changed, None)
+        if pending is not None and pending["id"] == row["id"]:
+            yield pending
+            pending = next(changed, None)
+        else:
+            yield row
+    while pending is not None:
+        yield pending
+        pending = next(changed, None)
+
+def _remote_count(supabase):
+    return supabase.table("contractors").select("id", count="exact").limit(1).execute().count
+
+def _latest_update(supabase):
+    # Read before any rows are: anything written while we page gets a later updated_at and is re-fetched next time
+    res = supabase.table("contractors").select("updated_at").order("updated_at", desc=True, nullsfirst=False).limit(1).execute()
+    return res.data[0]["updated_at"] if res.data else None
+
+def refresh_snapshot(supabase, path=SNAPSHOT_PATH, full=False) -> RosterSnapshot:
+    """
+    Brings the local snapshot up to date with `contractors` and returns it opened.
+    Only rows changed since the snapshot's mark are downloaded, unless `full` is set or the
+    snapshot is missing, stale in format/byte order, from another project, or its row count
+    no longer matches the table (deletions).
+    """
+    t0 = time.perf_counter()
+    source = client_source(supabase)
+    snapshot = None if full else open_snapshot(path)
+    if snapshot is not None and (snapshot.header.get("format") != SNAPSHOT_FORMAT or snapshot.source != source
+                                 or snapshot.header.get("byteorder") != sys.byteorder or not snapshot.mark):
+        snapshot.close()
+        snapshot = None
+    mark = _latest_update(supabase)
+
+    if snapshot is not None:
+        previous = snapshot.mark
+        changed = fetch_all(supabase, "contractors", SOURCE_COLUMNS, where=lambda q: q.gte("updated_at", read_from(previous)))
+        added = sum(1 for row in changed if snapshot.position(row["id"]) is None)
+        if _remote_count(supabase) == len(snapshot) + added:
+            written = write_snapshot(_merge(snapshot, changed), path, source, mark or previous)
+            snapshot.close()
+            print(f"  -> Roster snapshot: merged {len(changed)} changed contractors ({written:,} rows) "
+                  f"in {time.perf_counter() - t0:.2f}s.")
+            return RosterSnapshot(path)
+        print("  -> Roster snapshot: row count drifted (contractors deleted). Rebuilding.")
+        snapshot.close()
+
+    written = write_snapshot(iter_rows(supabase, "contractors", SOURCE_COLUMNS), path, source, mark)
+    print(f"  -> Roster snapshot: full build of {written:,} contractors in {time.perf_counter() - t0:.2f}s.")
+    return RosterSnapshot(path)
+
+if __name__ == "__main__":
+    from clients import get_supabase, missing_env
+    parser = argparse.ArgumentParser(description="Build or refresh the local contractor roster snapshot")
+    parser.add_argument("--full", action="store_true", help="Rebuild from scratch instead of merging changed rows")
+    args = parser.parse_args()
+    if missing_env("SUPABASE_URL", "SUPABASE_SERVICE_KEY"):
+        print("❌ Missing API keys in .env. Halting execution.")
+        sys.exit(1)
+    snapshot = refresh_snapshot(get_supabase(), full=args.full)
+    print(f"  ✅ {len(snapshot):,} contractors, {os.path.getsize(snapshot.path) / 1e6:.1f} MB at {snapshot.path} "
+          f"(mark {snapshot.mark}).")
@@ -0,0 +1,63 @@
+import os
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from urllib.parse import urlparse
+
+# ==========================================
+# Local run state (.tmp/ per gemini.md: intermediates live in .tmp/)
+# ==========================================
+STATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tmp")
+# The touch triggers stamp NOW(), the transaction's start: a row can commit after a reader has
+# passed its timestamp. Incremental reads start this far before the mark and re-read the overlap.
+MARK_OVERLAP = timedelta(minutes=5)
+
+def client_source(supabase) -> str:
+    """Identifies the project a client points at, so local caches never leak across projects."""
+    url = getattr(supabase, "supabase_url", None)
+    return urlparse(str(url)).netloc if url else type(supabase).__name__
+
+def state_path(name: str) -> str:
+    return os.path.join(STATE_DIR, name)
+
+def load_state(name: str) -> dict:
+    try:
+        with open(state_path(name), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_state(name: str, state: dict):
+    # Write-then-rename so a crash never leaves a half-written state file behind
+    os.makedirs(STATE_DIR, exist_ok=True)
+    tmp = state_path(name) + ".partial"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp, state_path(name))
+
+def parse_timestamp(value) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+def high_water_mark(rows, column="updated_at", previous=None) -> Optional[str]:
+    """Latest timestamp seen in rows (ISO string), never moving backwards from previous. Read it back with read_from()."""
+    latest = parse_timestamp(previous)
+    for row in rows:
+        ts = parse_timestamp(row.get(column))
+        if ts and (latest is None or ts > latest):
+            latest = ts
+    return latest.isoformat() if latest else None
+
+def read_from(mark, overlap=MARK_OVERLAP) -> Optional[str]:
+    """Where an incremental read resumes: `overlap` before the mark, so late commits are not skipped."""
+    cutoff = parse_timestamp(mark)
+    return (cutoff - overlap).isoformat() if cutoff else None
+
+def changed_since(rows, mark, column="updated_at", overlap=MARK_OVERLAP) -> list:
+    """Rows touched at or after read_from(mark). Inclusive, so same-timestamp writes are never missed."""
+    cutoff = parse_timestamp(read_from(mark, overlap))
+    if cutoff is None:
+        return list(rows)
+    return [row for row in rows if (parse_timestamp(row.get(column)) or cutoff) >= cutoff]
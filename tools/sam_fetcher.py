@@ -0,0 +1,191 @@
+"""
+Concurrent, rate-limit-aware pager for the SAM.gov Opportunities API.
+
+Each notice type (ptype) gets its own producer thread that walks offsets and pushes pages onto
+a bounded queue, so the next offset is already in flight while the caller normalizes and upserts
+the current page. All producers draw from one shared token bucket, and 429/5xx responses back off
+exponentially with full jitter (honouring Retry-After) instead of a fixed sleep.
+A consumer that stops early stops the producers too, and a ptype that failed is raised as
+PartialFetch after the other ptypes' pages, so a partial run is never reported as complete.
+"""
+import os
+import time
+import queue
+import random
+import threading
+from datetime import date
+from raw_archive import archive_page
+
+SAM_OPPORTUNITIES_URL = "https://api.sam.gov/opportunities/v2/search"
+PAGE_LIMIT = 1000
+PTYPES = ["r", "p", "o"] # Sources Sought, Presolicitation, Solicitation priorities
+
+# Defaults sized for a standard SAM.gov key; override per deployment in .env
+SAM_REQUESTS_PER_SECOND = float(os.getenv("SAM_REQUESTS_PER_SECOND", "2"))
+SAM_BURST = int(os.getenv("SAM_BURST", "4"))
+MAX_RETRIES = 6
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+PREFETCH_PAGES = 2 # Pages each producer may run ahead of the consumer
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`."""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        # A 429 means the server-side quota is ahead of our estimate; stop bursting
+        with self.lock:
+            self.tokens = 0.0
+            self.updated = time.monotonic()
+
+def backoff_delay(attempt: int, retry_after=None) -> float:
+    if retry_after:
+        try:
+            return min(BACKOFF_CAP, float(retry_after))
+        except ValueError:
+            pass
+    # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * (2 ** attempt)))
+
+class FetchError(Exception):
+    pass
+
+class QuotaExhausted(FetchError):
+    """Still throttled after every retry: the key's quota is spent, not just the burst."""
+
+class PartialFetch(FetchError):
+    """Raised after the last page that could be fetched: `failed` maps each ptype that stopped early to its error."""
+    def __init__(self, failed: dict):
+        self.failed = failed
+        super().__init__("Paging stopped early for ptype " + ", ".join(f"'{p}' ({e})" for p, e in sorted(failed.items())))
+
+def fetch_page(session, url, params, limiter: TokenBucket, timeout=30) -> dict:
+    import requests # Deferred with the HTTP stack (see iter_opportunity_pages)
+    throttled = False
+    for attempt in range(MAX_RETRIES):
+        limiter.acquire()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except requests.exceptions.RequestException as req_err:
+            delay = backoff_delay(attempt)
+            print(f"     ⚠️ Request error ({req_err}). Retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+
+        throttled = response.status_code == 429
+        if response.status_code == 429 or response.status_code >= 500:
+            if response.status_code == 429:
+                limiter.drain()
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            print(f"     ⚠️ HTTP {response.status_code} for ptype '{params.get('ptype')}' offset {params.get('offset')}. Backing off {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+
+        if response.status_code != 200:
+            raise FetchError(f"Failed to fetch page. Status: {response.status_code}")
+        return response.json()
+
+    if throttled:
+        raise QuotaExhausted(f"Still rate limited after {MAX_RETRIES} attempts")
+    raise FetchError(f"Gave up after {MAX_RETRIES} attempts")
+
+def _produce(session, url, base_params, ptype, limit, limiter, out: queue.Queue, stop: threading.Event):
+    offset = 0
+    try:
+        while not stop.is_set():
+            params = dict(base_params, limit=limit, offset=offset, ptype=ptype)
+            data = fetch_page(session, url, params, limiter)
+            batch = data.get("opportunitiesData", [])
+            if batch:
+                archive_page("opportunities", ptype, offset, batch, params)
+                out.put(("page", ptype, offset, batch))
+            total = data.get("totalRecords")
+            offset += limit
+            if not batch or len(batch) < limit or (total is not None and offset >= int(total)):
+                break
+    except Exception as e:
+        out.put(("error", ptype, offset, e))
+    finally:
+        out.put(("done", ptype, offset, None))
+
+def iter_opportunity_pages(api_key, posted_from, posted_to, ptypes=PTYPES, limit=PAGE_LIMIT,
+                           url=SAM_OPPORTUNITIES_URL, limiter=None, session=None):
+    """
+    Yields (ptype, offset, records) for every page of every notice type, in arrival order.
+    Notice types are paged concurrently; a failure ends only that ptype's paging, and once the
+    others are done PartialFetch is raised so the caller can report a partial run.
+    """
+    from http_transport import get_session # Deferred: importing a tool must not load requests/urllib3
+    limiter = limiter or TokenBucket(SAM_REQUESTS_PER_SECOND, SAM_BURST)
+    # The fetcher runs its own rate-aware retry loop, so the pooled session must not retry too
+    session = session or get_session(url, retries=0)
+    base_params = {"api_key": api_key, "postedFrom": posted_from, "postedTo": posted_to}
+    out = queue.Queue(maxsize=PREFETCH_PAGES * len(ptypes))
+    stop = threading.Event()
+
+    producers = [
+        threading.Thread(target=_produce, args=(session, url, base_params, ptype, limit, limiter, out, stop),
+                         name=f"sam-pages-{ptype}", daemon=True)
+        for ptype in ptypes
+    ]
+    for t in producers:
+        t.start()
+
+    remaining = len(producers)
+    failed = {}
+    try:
+        while remaining:
+            kind, ptype, offset, payload = out.get()
+            if kind == "page":
+                yield ptype, offset, payload
+            elif kind == "error":
+                failed[ptype] = payload
+                print(f"     ❌ Paging stopped for ptype '{ptype}' at offset {offset}: {payload}")
+            else:
+                remaining -= 1
+    finally:
+        # The caller stopped early: let each producer finish its request and exit instead of blocking on the queue
+        stop.set()
+        while remaining:
+            remaining -= out.get()[0] == "done"
+    if failed:
+        raise PartialFetch(failed)
+
+def opportunity_window_fetcher(api_key, url=SAM_OPPORTUNITIES_URL, limiter=None, session=None):
+    """`fetch(shard, offset)` for backfill.iter_shard_pages: one page of the shard's ptype, posted inside its window."""
+    from http_transport import get_session
+    limiter = limiter or TokenBucket(SAM_REQUESTS_PER_SECOND, SAM_BURST)
+    session = session or get_session(url, retries=0)
+
+    def fetch(shard, offset):
+        window_to = min(shard.window_to, date.today().isoformat()) # The open window ends today
+        params = {"api_key": api_key, "postedFrom": sam_date(shard.window_from), "postedTo": sam_date(window_to),
+                  "ptype": shard.ptype, "limit": shard.limit, "offset": offset}
+        data = fetch_page(session, url, params, limiter)
+        records = data.get("opportunitiesData", [])
+        if records:
+            archive_page("opportunities", shard.ptype, offset, records, params)
+        return records, data.get("totalRecords")
+    return fetch
+
+def sam_date(iso_day: str) -> str:
+    """2026-10-17 -> 10/17/2026, the date format SAM.gov filters take."""
+    year, month, day = iso_day.split("-")
+    return f"{month}/{day}/{year}"
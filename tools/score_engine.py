@@ -0,0 +1,287 @@
+"""
+Bitset scoring engine for the Phase 1 blueprint formula (architecture/2_contractor_matching_sop.md).
+
+The SOP score only varies per pair through three binary signals (NAICS, set-aside, geo), so
+instead of walking every (opportunity, contractor) pair in Python we encode the roster as
+column bitsets: one arbitrary-precision int per NAICS code / certification / state, where bit i
+is set when contractor i carries that attribute. Scoring an opportunity is then a handful of
+C-level AND/NOT operations over the whole block, and the Top 10 is pulled tier by tier from the
+resulting masks (a partial selection, never a full sort of the roster).
+"""
+from bisect import bisect_left
+from typing import Optional
+from taxonomy import Taxonomy, has
+
+# ==========================================
+# 1. SOP Formula
+# ==========================================
+WEIGHT_NAICS = 0.25
+WEIGHT_PSC = 0.15
+WEIGHT_SETASIDE = 0.20
+WEIGHT_GEO = 0.15
+WEIGHT_VALUE_FIT = 0.15
+WEIGHT_DEADLINE = 0.10
+
+HOT_THRESHOLD = 0.70
+WARM_THRESHOLD = 0.50
+
+TOP_N = 10
+DEFAULT_BLOCK_SIZE = 1 << 16  # 65,536 contractors per bitset block
+
+def sop_score(naics_match, psc_match, setaside_match, geo_match, contract_value_fit=0.5, deadline_feasibility=0.5) -> float:
+    # Keep the exact term order of the original loop so floats compare bit-for-bit
+    return (
+        (WEIGHT_NAICS * naics_match) +
+        (WEIGHT_PSC * psc_match) +
+        (WEIGHT_SETASIDE * setaside_match) +
+        (WEIGHT_GEO * geo_match) +
+        (WEIGHT_VALUE_FIT * contract_value_fit) +
+        (WEIGHT_DEADLINE * deadline_feasibility)
+    )
+
+def classify(score: float) -> str:
+    if score >= HOT_THRESHOLD:
+        return "HOT"
+    if score >= WARM_THRESHOLD:
+        return "WARM"
+    return "COLD"
+
+def deadline_feasibility(op) -> float:
+    # Real logic would parse `op.get("response_deadline")` and date-math here
+    return 0.5
+
+def contract_value_fit(op) -> float:
+    # Size standard alignment is not modelled yet; SOP placeholder
+    return 0.5
+
+def build_match_record(op_id, con_id, naics_match, psc_match, setaside_match, geo_match, value_fit, deadline_score) -> dict:
+    score = sop_score(naics_match, psc_match, setaside_match, geo_match, value_fit, deadline_score)
+    return {
+        "opportunity_id": op_id,
+        "contractor_id": con_id,
+        "score": round(score, 4),
+        "classification": classify(score),
+        "score_breakdown": {
+            "naics_match": naics_match,
+            "psc_match": psc_match,
+            "setaside_match": setaside_match,
+            "geo_match": geo_match,
+            "contract_value_fit": value_fit,
+            "deadline_feasibility": deadline_score
+        }
+    }
+
+# ==========================================
+# 2. Reference (pair-by-pair) Scoring
+# ==========================================
+def score_pair(op, con, profile=None) -> dict:
+    """
+    Scores a single pair exactly as the original nested loop did. Code membership is tested on the
+    contractor's taxonomy bitsets; pass `profile` (from the run's Taxonomy) to reuse one across pairs.
+    """
+    profile = profile or Taxonomy().profile(con)
+    taxonomy = profile.taxonomy
+    op_state = op.get("place_of_performance_state")
+
+    naics_match = 1 if has(profile.naics, taxonomy.naics_id(op.get("naics_code"))) else 0
+    psc_match = 0 # Not fully implemented yet
+    setaside_match = 1 if has(profile.certifications, taxonomy.certification_id(op.get("set_aside_code"))) else 0
+    geo_match = 1 if op_state and con.get("state") and op_state == con["state"] else 0
+
+    return build_match_record(op.get("id"), con.get("id"), naics_match, psc_match, setaside_match, geo_match,
+                              contract_value_fit(op), deadline_feasibility(op))
+
+def score_matches_bruteforce(opportunities, contractors, top_n=TOP_N) -> list:
+    """O(ops x contractors) reference implementation, kept for equivalence checks and benchmarks."""
+    match_payloads = []
+    taxonomy = Taxonomy()
+    profiles = [taxonomy.profile(con) for con in contractors]
+    for op in opportunities:
+        contractor_scores = [score_pair(op, con, profile) for con, profile in zip(contractors, profiles)]
+        match_payloads.extend(sorted(contractor_scores, key=lambda x: x["score"], reverse=True)[:top_n])
+    return match_payloads
+
+# ==========================================
+# 3. Bitset Roster Encoding
+# ==========================================
+class RosterBlock:
+    """Column bitsets for a contiguous slice of the contractor roster."""
+    __slots__ = ("start", "size", "full", "naics", "certifications", "state")
+
+    def __init__(self, start: int, size: int):
+        self.start = start
+        self.size = size
+        self.full = (1 << size) - 1
+        self.naics = {}
+        self.certifications = {}
+        self.state = {}
+
+def encode_roster(contractors, block_size=DEFAULT_BLOCK_SIZE) -> list:
+    blocks = []
+    for start in range(0, len(contractors), block_size):
+        chunk = contractors[start:start + block_size]
+        block = RosterBlock(start, len(chunk))
+        # Accumulate bit positions per value first; OR-ing into growing ints one bit at a time is quadratic
+        naics, certs, states = {}, {}, {}
+        for i, con in enumerate(chunk):
+            for code in set(con.get("naics_codes") or ()):
+                if code:
+                    naics.setdefault(code, []).append(i)
+            for cert in set(con.get("certifications") or ()):
+                if cert:
+                    certs.setdefault(cert, []).append(i)
+            if con.get("state"):
+                states.setdefault(con["state"], []).append(i)
+        for column, positions in ((block.naics, naics), (block.certifications, certs), (block.state, states)):
+            for value, idxs in positions.items():
+                column[value] = _positions_to_mask(idxs)
+        blocks.append(block)
+    return blocks
+
+def encode_snapshot(snapshot, block_size=DEFAULT_BLOCK_SIZE) -> list:
+    """Same blocks as encode_roster(), built straight from a roster_snapshot.RosterSnapshot's postings."""
+    blocks = [RosterBlock(start, min(block_size, len(snapshot) - start)) for start in range(0, len(snapshot), block_size)]
+    for field, column in (("naics", "naics_codes"), ("certifications", "certifications"), ("state", "state")):
+        for value, positions in snapshot.postings(column).items():
+            if not value:
+                continue
+            # Postings are sorted, so each block's share is one contiguous run
+            cut = 0
+            for block in blocks:
+                end = bisect_left(positions, block.start + block.size, cut)
+                if end > cut:
+                    getattr(block, field)[value] = _positions_to_mask([p - block.start for p in positions[cut:end]])
+                cut = end
+    return blocks
+
+def _positions_to_mask(positions) -> int:
+    buf = bytearray((positions[-1] >> 3) + 1)
+    for i in positions:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, "little")
+
+def _iter_bits(mask: int, limit: int):
+    # Yields set bit positions lowest-first, i.e. in roster order, which keeps ties stable
+    while mask and limit > 0:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+        limit -= 1
+
+# Every (naics, setaside, geo) combination, strongest first. The weights make all eight sums distinct.
+_COMBOS = sorted(
+    ((n, s, g) for n in (1, 0) for s in (1, 0) for g in (1, 0)),
+    key=lambda c: WEIGHT_NAICS * c[0] + WEIGHT_SETASIDE * c[1] + WEIGHT_GEO * c[2],
+    reverse=True
+)
+
+def _block_top(block: RosterBlock, op_naics, op_setaside, op_state, top_n: int) -> list:
+    """Returns up to top_n (combo, global_index) pairs from one block, best tier first, roster order within a tier."""
+    full = block.full
+    n_mask = block.naics.get(op_naics, 0) if op_naics else 0
+    s_mask = block.certifications.get(op_setaside, 0) if op_setaside else 0
+    g_mask = block.state.get(op_state, 0) if op_state else 0
+    picks = []
+    for combo in _COMBOS:
+        mask = full
+        mask &= n_mask if combo[0] else ~n_mask
+        mask &= s_mask if combo[1] else ~s_mask
+        mask &= g_mask if combo[2] else ~g_mask
+        for i in _iter_bits(mask, top_n - len(picks)):
+            picks.append((combo, block.start + i))
+        if len(picks) >= top_n:
+            break
+    return picks
+
+# ==========================================
+# 4. Batched Scoring
+# ==========================================
+def score_top_matches(opportunities, contractors, top_n=TOP_N, block_size=DEFAULT_BLOCK_SIZE, blocks: Optional[list] = None) -> list:
+    """
+    Returns the Top N match records per opportunity, identical (scores, tiers, ordering) to
+    `score_matches_bruteforce()`, computed block by block over the bitset-encoded roster.
+    """
+    if blocks is None:
+        blocks = encode_roster(contractors, block_size)
+
+    # Running candidates per opportunity: (combo, global_index). Each block contributes at most top_n.
+    candidates = [[] for _ in opportunities]
+    for block in blocks:
+        for slot, op in enumerate(opportunities):
+            candidates[slot].extend(_block_top(block, op.get("naics_code"), op.get("set_aside_code"),
+                                               op.get("place_of_performance_state"), top_n))
+
+    match_payloads = []
+    for op, picks in zip(opportunities, candidates):
+        value_fit = contract_value_fit(op)
+        deadline_score = deadline_feasibility(op)
+        records = []
+        for (naics_match, setaside_match, geo_match), idx in picks:
+            records.append((idx, build_match_record(op.get("id"), contractors[idx].get("id"), naics_match, 0,
+                                                    setaside_match, geo_match, value_fit, deadline_score)))
+        # Blocks are visited in roster order, so sorting on (-score, index) reproduces the stable sort
+        records.sort(key=lambda r: (-r[1]["score"], r[0]))
+        match_payloads.extend(record for _, record in records[:top_n])
+    return match_payloads
+
+# ==========================================
+# 5. Incremental Re-scoring
+# ==========================================
+def changed_contractor_reach(opportunities, changed_contractors, min_score=None) -> dict:
+    """{opportunity_id: best score any changed contractor now reaches there}, counting only scores >= min_score."""
+    best_changed = {}
+    if changed_contractors:
+        for record in score_top_matches(opportunities, changed_contractors, top_n=1):
+            if min_score is None or record["score"] >= min_score:
+                best_changed[record["opportunity_id"]] = record["score"]
+    return best_changed
+
+def find_dirty_opportunities(opportunities, changed_op_ids, changed_contractors, stored_matches, top_n=TOP_N, min_score=None,
+                             best_changed=None) -> list:
+    """
+    Opportunities whose stored Top N may differ after this run's changes:
+      * the opportunity itself changed, or
+      * a changed contractor currently sits in its stored Top N, or
+      * a changed contractor now scores at least the stored Nth score (or the Top N is not full),
+        and at least min_score when a tier floor is in force.
+    `stored_matches` maps opportunity_id -> {contractor_id: {"score": ..., ...}}; it needs every
+    opportunity in `best_changed` (changed_contractor_reach(), computed here when not given).
+    """
+    changed_con_ids = {con.get("id") for con in changed_contractors}
+    if best_changed is None:
+        best_changed = changed_contractor_reach(opportunities, changed_contractors, min_score)
+
+    dirty = []
+    for op in opportunities:
+        op_id = op.get("id")
+        rows = stored_matches.get(op_id, {})
+        if op_id in changed_op_ids or changed_con_ids.intersection(rows):
+            dirty.append(op)
+        elif op_id in best_changed and (len(rows) < top_n or best_changed[op_id] >= min(r["score"] for r in rows.values())):
+            dirty.append(op)
+    return dirty
+
+def diff_matches(new_records, stored_matches, scored_ids=None):
+    """
+    Splits freshly scored Top N rows against what is stored.
+    Returns (upserts, stale) where upserts are new rows or rows whose score/classification moved,
+    and stale lists (opportunity_id, contractor_id) pairs that dropped out of the Top N.
+    `scored_ids` are the opportunities re-scored this run (default: every one in stored_matches);
+    one left with no rows at all (e.g. everything fell under the tier floor) loses all its rows.
+    """
+    upserts = []
+    kept = {}
+    for record in new_records:
+        op_id, con_id = record["opportunity_id"], record["contractor_id"]
+        kept.setdefault(op_id, set()).add(con_id)
+        previous = stored_matches.get(op_id, {}).get(con_id)
+        if previous is None or previous.get("score") != record["score"] or previous.get("classification") != record["classification"]:
+            upserts.append(record)
+
+    stale = []
+    for op_id in stored_matches if scored_ids is None else scored_ids:
+        survivors = kept.get(op_id, set())
+        for con_id in stored_matches.get(op_id, {}):
+            if con_id not in survivors:
+                stale.append((op_id, con_id))
+    return upserts, stale
@@ -0,0 +1,42 @@
+-- ==========================================
+-- Phase 17: Incremental Scoring Support
+-- ==========================================
+-- `tools/2_score_matches.py --incremental` re-scores only pairs where the opportunity or the
+-- contractor changed since its last run, so both sides need a reliable `updated_at`.
+
+-- 1. UPDATED_AT TRACKING
+-- ==========================================
+ALTER TABLE IF EXISTS contractors
+    ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS opportunities_touch_updated_at ON opportunities;
+CREATE TRIGGER opportunities_touch_updated_at
+    BEFORE UPDATE ON opportunities
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+DROP TRIGGER IF EXISTS contractors_touch_updated_at ON contractors;
+CREATE TRIGGER contractors_touch_updated_at
+    BEFORE UPDATE ON contractors
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
+
+CREATE INDEX IF NOT EXISTS idx_opps_updated_at ON opportunities(updated_at);
+CREATE INDEX IF NOT EXISTS idx_contractors_updated_at ON contractors(updated_at);
+
+-- 2. MATCH UPSERT KEY
+-- ==========================================
+-- Match rows are upserted on (opportunity_id, contractor_id) instead of blindly inserted.
+-- Remove duplicates left behind by earlier insert-only runs before adding the constraint.
+DELETE FROM matches a
+    USING matches b
+    WHERE a.opportunity_id = b.opportunity_id
+      AND a.contractor_id = b.contractor_id
+      AND (a.created_at, a.ctid) < (b.created_at, b.ctid);
+
+CREATE UNIQUE INDEX IF NOT EXISTS matches_opp_contractor_key ON matches(opportunity_id, contractor_id);
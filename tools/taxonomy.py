@@ -0,0 +1,107 @@
+"""
+Dense integer encoding of the NAICS / PSC / certification taxonomies.
+
+Every code the scorers see gets a small integer ID on first sight, and a contractor's
+capabilities become one int bitset per column (bit i set when it holds the code with ID i).
+"Does this contractor hold the opportunity's NAICS code?" is then a shift and a mask instead of
+a scan of its `naics_codes` list, and an opportunity's codes are looked up once, not per pair.
+
+NAICS codes are hierarchical (sector 2 digits, subsector 3, industry group 4, industry 5,
+national industry 6), so each contractor also gets a bitset of its codes' 2- to 5-digit
+prefixes. `naics_level()` answers "same industry group?" (or subsector, sector) in a few bit
+tests instead of string slicing over every code. The SOP score only credits exact NAICS matches;
+the ten-factor PWin (tools/pwin_engine.py) rates Technical Fit by the shared level.
+
+IDs only grow, so a Taxonomy lives as long as one scoring run (or one roster index) and is then
+dropped; there is no process-wide instance for a resident server to grow forever. Each profile
+keeps the Taxonomy that built it, so opportunity codes are always looked up in the same ID space.
+Allocation is locked: threads profiling new codes at once never share a bit.
+"""
+import threading
+
+NAICS_PREFIX_LEVELS = (5, 4, 3, 2) # Longest first: naics_level() returns the deepest shared level
+
+class CapabilityProfile:
+    """One contractor's codes as bitsets over a Taxonomy's IDs."""
+    __slots__ = ("taxonomy", "naics", "naics_prefixes", "psc", "certifications", "sba_certifications", "has_sba_certification")
+
+    def __init__(self, taxonomy, naics=0, naics_prefixes=0, psc=0, certifications=0, sba_certifications=0, has_sba_certification=False):
+        self.taxonomy = taxonomy # The ID space the bitsets index into
+        self.naics = naics
+        self.naics_prefixes = naics_prefixes
+        self.psc = psc
+        self.certifications = certifications
+        self.sba_certifications = sba_certifications
+        # PWin credits any non-empty sba_certifications list, blank entries included
+        self.has_sba_certification = has_sba_certification
+
+class Taxonomy:
+    def __init__(self):
+        self.naics = {}
+        self.naics_prefixes = {} # "54", "541", "5415", "54151": one ID space, lengths never collide
+        self.psc = {}
+        self.certifications = {} # Shared by `certifications` and `sba_certifications`
+        self.lock = threading.Lock() # Guards allocation only; lookups of known codes stay lock-free
+
+    def _id(self, ids: dict, code) -> int:
+        code_id = ids.get(code)
+        if code_id is None:
+            with self.lock:
+                # Re-checked under the lock: another thread may have allocated it since the lookup
+                code_id = ids.get(code)
+                if code_id is None:
+                    code_id = ids[code] = len(ids)
+        return code_id
+
+    def _bits(self, ids: dict, codes) -> int:
+        bits = 0
+        for code in codes or ():
+            if code:
+                bits |= 1 << self._id(ids, code)
+        return bits
+
+    def profile(self, con) -> CapabilityProfile:
+        naics = [code for code in con.get("naics_codes") or () if code]
+        prefixes = {code[:digits] for code in naics for digits in NAICS_PREFIX_LEVELS if len(code) > digits}
+        sba = con.get("sba_certifications") or ()
+        return CapabilityProfile(
+            self,
+            naics=self._bits(self.naics, naics),
+            naics_prefixes=self._bits(self.naics_prefixes, prefixes),
+            psc=self._bits(self.psc, con.get("psc_codes")),
+            certifications=self._bits(self.certifications, con.get("certifications")),
+            sba_certifications=self._bits(self.certifications, sba),
+            has_sba_certification=len(sba) > 0
+        )
+
+    # ==========================================
+    # Opportunity-side lookups (never allocate: an unseen code matches nobody)
+    # ==========================================
+    def naics_id(self, code):
+        return self.naics.get(code) if code else None
+
+    def psc_id(self, code):
+        return self.psc.get(code) if code else None
+
+    def certification_id(self, code):
+        return self.certifications.get(code) if code else None
+
+    def naics_prefix_ids(self, code) -> list:
+        """[(digits, id)] for the opportunity code's prefixes any contractor carries, deepest first."""
+        if not code:
+            return []
+        found = ((digits, self.naics_prefixes.get(code[:digits])) for digits in NAICS_PREFIX_LEVELS if len(code) > digits)
+        return [(digits, prefix_id) for digits, prefix_id in found if prefix_id is not None]
+
+    def naics_level(self, profile: CapabilityProfile, code) -> int:
+        """Digits of the deepest NAICS level the contractor shares with `code`: 6 exact, 4 industry group, 0 none."""
+        if has(profile.naics, self.naics_id(code)):
+            return len(code)
+        for digits, prefix_id in self.naics_prefix_ids(code):
+            if profile.naics_prefixes >> prefix_id & 1:
+                return digits
+        return 0
+
+def has(bits: int, code_id) -> bool:
+    """O(1) membership: is the code with `code_id` (None for unknown) in the bitset?"""
+    return code_id is not None and bits >> code_id & 1 == 1
@@ -0,0 +1,75 @@
+import os
+from memory_supabase import MemorySupabase
+from agency_cache import AgencyCache, agency_key
+from run_state import state_path
+
+SNAPSHOT = "test_agency_cache.json"
+
+def page_of_triples(n_records=1000, distinct=40):
+    return [(f"Dept {i % 7}", f"Sub {i % distinct}" if i % 5 else None, f"Office {i % distinct}") for i in range(n_records)]
+
+def test_page_resolves_in_one_round_trip():
+    client = MemorySupabase({"agencies": [{"id": "a-0", "department": "Dept 0", "sub_tier": "", "office": "Office 0"}]})
+    try:
+        cache = AgencyCache(client, snapshot_file=SNAPSHOT).load()
+        before = len(client.calls)
+        triples = page_of_triples()
+        ids = cache.resolve_many(triples)
+
+        # One bulk upsert for the unseen triples; no per-record selects
+        assert client.calls[before:] == [("agencies", "upsert")], "❌ Page resolution was not a single bulk upsert"
+        stored = {agency_key(r["department"], r["sub_tier"], r["office"]): r["id"] for r in client.tables["agencies"]}
+        assert all(ids[agency_key(*t)] == stored[agency_key(*t)] for t in triples), "❌ Cached ids disagree with the table"
+        assert ids[agency_key("Dept 0", None, "Office 0")] == "a-0", "❌ Preloaded agency was re-created"
+
+        # A second page with the same triples is served entirely from memory
+        before = len(client.calls)
+        cache.resolve_many(triples)
+        assert len(client.calls) == before, "❌ Known agencies triggered a round trip"
+        cache.save()
+
+        # Cold start: the snapshot is trusted after a single stamp check
+        cold = AgencyCache(client, snapshot_file=SNAPSHOT)
+        before = len(client.calls)
+        cold.load()
+        assert len(client.calls) - before == 1 and cold.ids == cache.ids, "❌ Snapshot was not reused on cold start"
+
+        # A row added behind the cache's back invalidates the stamp and forces a download
+        client.table("agencies").insert({"department": "Dept X", "sub_tier": "", "office": ""}).execute()
+        stale = AgencyCache(client, snapshot_file=SNAPSHOT).load()
+        assert agency_key("Dept X", None, None) in stale.ids, "❌ Stale snapshot was trusted"
+        print(f"✅ SUCCESS: {len(triples)} records resolved with 1 upsert; snapshot reused on cold start.")
+    finally:
+        if os.path.exists(state_path(SNAPSHOT)):
+            os.remove(state_path(SNAPSHOT))
+
+def test_snapshot_stamp_tracks_the_table_not_the_keys():
+    # NULL and "" parts collapse to the same key: the table has more rows than the cache has keys
+    client = MemorySupabase({"agencies": [
+        {"id": "a-1", "department": "Dept 0", "sub_tier": None, "office": "Office 0"},
+        {"id": "a-2", "department": "Dept 0", "sub_tier": "", "office": "Office 0"},
+        {"id": "a-3", "department": "Dept 1", "sub_tier": "Sub 1", "office": "Office 1"}]})
+    try:
+        cache = AgencyCache(client, snapshot_file=SNAPSHOT).load()
+        assert len(cache.ids) == 2
+        cache.resolve_many([("Dept 2", None, None)])
+        cache.save()
+
+        # Cold start after our own insert: trusted, no download
+        before = len(client.calls)
+        cold = AgencyCache(client, snapshot_file=SNAPSHOT).load()
+        assert len(client.calls) - before == 1 and cold.ids == cache.ids, "❌ Collapsed keys made every cold start re-download"
+
+        # A replaced row keeps the count but not the highest id
+        client.table("agencies").delete().eq("id", "a-3").execute()
+        client.table("agencies").insert({"id": "z-3", "department": "Dept 1", "sub_tier": "Sub 1", "office": "Office 1"}).execute()
+        replaced = AgencyCache(client, snapshot_file=SNAPSHOT).load()
+        assert replaced.ids[agency_key("Dept 1", "Sub 1", "Office 1")] == "z-3", "❌ Snapshot with a replaced row was trusted"
+        print("✅ SUCCESS: collapsed keys still reuse the snapshot; a replaced row forces a download.")
+    finally:
+        if os.path.exists(state_path(SNAPSHOT)):
+            os.remove(state_path(SNAPSHOT))
+
+if __name__ == "__main__":
+    test_page_resolves_in_one_round_trip()
+    test_snapshot_stamp_tracks_the_table_not_the_keys()
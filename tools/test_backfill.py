@@ -0,0 +1,171 @@
+import os
+import time
+import tempfile
+import threading
+from datetime import date, timedelta
+from memory_supabase import MemorySupabase
+from bulk_writer import BulkWriter
+from sam_fetcher import QuotaExhausted
+from backfill import Shard, CheckpointStore, date_windows, backfill_shards, iter_shard_pages
+
+LIMIT = 50
+PTYPES = ["r", "p", "o"]
+
+def posted_notices(ptype, window_from, window_to) -> list:
+    """Deterministic stand-in for SAM.gov: 0-140 notices per (ptype, window)."""
+    count = (sum(map(ord, ptype + window_from)) * 7) % 141
+    return [{"noticeId": f"{ptype}-{window_from}-{i}"} for i in range(count)]
+
+class FakeSam:
+    def __init__(self, quota=None):
+        self.quota = quota
+        self.calls = []
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.peak = 0
+
+    def fetch(self, shard, offset):
+        with self.lock:
+            if self.quota is not None and len(self.calls) >= self.quota:
+                raise QuotaExhausted("Still rate limited after 6 attempts")
+            self.calls.append((shard.ptype, shard.window_from, offset))
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            time.sleep(0.005)
+            records = posted_notices(shard.ptype, shard.window_from, shard.window_to)
+            return records[offset:offset + shard.limit], len(records)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+class DownSupabase:
+    # Every write fails with a 503, as PostgREST does while the database is unreachable
+    def table(self, name):
+        return self
+
+    def upsert(self, rows, **kwargs):
+        return self
+
+    def execute(self):
+        raise ConnectionError("503 Service Unavailable")
+
+def run_backfill(client, store, sam, shards, crash_after=None, today=date(2026, 10, 17), writer=None) -> set:
+    """
+    Writes every page and checkpoints it once landed; `crash_after` pages abandons the run mid-stream.
+    Returns the (ptype, window_from, offset) pages written, in whatever order the workers delivered them.
+    """
+    written = set()
+    writer = writer or BulkWriter(client, "opportunities", on_conflict="notice_id")
+    for n, (shard, offset, records) in enumerate(iter_shard_pages(shards, sam.fetch, store, workers=4, today=today)):
+        if crash_after is not None and n == crash_after:
+            break # Fetched but never written: must not count as done
+        written.add((shard.ptype, shard.window_from, offset))
+        rows = [{"notice_id": op["noticeId"]} for op in records]
+        writer.write(rows, then=store.landed(shard, offset, len(records)))
+    writer.close()
+    return written
+
+def test_backfill_resumes_only_missing_units():
+    windows = date_windows(date(2026, 7, 1), date(2026, 9, 28), shard_days=7)
+    # Monday-Sunday weeks, whatever the range's own start and end
+    assert windows[0] == (date(2026, 6, 29), date(2026, 7, 5)) and windows[-1] == (date(2026, 9, 28), date(2026, 10, 4))
+    shards = [Shard("opportunities@test", ptype, first.isoformat(), last.isoformat(), LIMIT)
+              for first, last in windows for ptype in PTYPES]
+    expected = {op["noticeId"] for s in shards for op in posted_notices(s.ptype, s.window_from, s.window_to)}
+    pages = {(s.ptype, s.window_from, offset) for s in shards
+             for offset in range(0, len(posted_notices(s.ptype, s.window_from, s.window_to)), LIMIT)}
+
+    client, store = MemorySupabase({"opportunities": []}), CheckpointStore(":memory:")
+
+    # 1. Quota runs out part-way: shards stop, and landed pages are checkpointed
+    first = FakeSam(quota=40)
+    first_written = run_backfill(client, store, first, shards)
+    assert first.peak > 1, "❌ Shards were not fetched in parallel"
+    done_after_quota = sum(store.is_complete(s) for s in shards)
+    assert 0 < done_after_quota < len(shards)
+
+    # 2. A crash mid-stream: one page was fetched but never written
+    second = FakeSam()
+    second_written = run_backfill(client, store, second, shards, crash_after=5)
+    assert len(second_written) == 5
+    assert not first_written & set(second.calls), "❌ Re-fetched a unit that had already landed"
+
+    # 3. Resume to completion, fetching only what is still missing
+    third = FakeSam()
+    run_backfill(client, store, third, shards)
+    assert not set(third.calls) & (first_written | second_written), "❌ Re-fetched a landed unit"
+    assert {row["notice_id"] for row in client.tables["opportunities"]} == expected
+    assert all(store.is_complete(s) for s in shards)
+    fetched = set(first.calls) | set(second.calls) | set(third.calls)
+    assert pages <= fetched, "❌ A page was never fetched"
+
+    # 4. A finished backfill makes no requests at all
+    fourth = FakeSam()
+    run_backfill(client, store, fourth, shards)
+    assert fourth.calls == []
+    (source, shard_count, complete, units, records), = store.summary()
+    assert (source, shard_count, complete, units, records) == ("opportunities@test", len(shards), len(shards), len(pages), len(expected))
+    print(f"✅ SUCCESS: {len(shards)} shards / {len(pages)} pages resumed across a quota stop and a crash; "
+          f"{len(first.calls) + len(second.calls) + len(third.calls)} requests in total, none repeated for a landed page.")
+
+def test_rerun_next_day_maps_to_the_same_shards():
+    # Quota resets overnight: tomorrow's re-run of "the last 90 days" must find today's checkpoints
+    today = date(2026, 10, 14) # A Wednesday: its week is still open
+    client, store = MemorySupabase({"opportunities": []}), CheckpointStore(":memory:")
+    shards = backfill_shards("opportunities@test", PTYPES, 90, LIMIT, shard_days=7, today=today)
+    run_backfill(client, store, FakeSam(), shards, today=today)
+
+    tomorrow = today + timedelta(days=1)
+    next_shards = backfill_shards("opportunities@test", PTYPES, 90, LIMIT, shard_days=7, today=tomorrow)
+    assert set(shards) <= set(next_shards) or set(next_shards) <= set(shards)
+    rerun = FakeSam()
+    run_backfill(client, store, rerun, next_shards, today=tomorrow)
+    # Only the week that contains tomorrow is fetched again, in full
+    assert {(ptype, window) for ptype, window, _ in rerun.calls} == {(ptype, "2026-10-12") for ptype in PTYPES}
+    # ...and again on every run while it is open, even though this run checkpointed it
+    again = FakeSam()
+    run_backfill(client, store, again, next_shards, today=tomorrow)
+    assert sorted(again.calls) == sorted(rerun.calls)
+    print(f"✅ SUCCESS: the next day's re-run re-fetched {len(rerun.calls)} pages of the open week only.")
+
+def test_dead_lettered_pages_are_not_checkpointed():
+    store = CheckpointStore(":memory:")
+    shards = [Shard("opportunities@test", ptype, "2026-07-06", "2026-07-12", LIMIT) for ptype in PTYPES]
+    pages = {(s.ptype, s.window_from, offset) for s in shards
+             for offset in range(0, len(posted_notices(s.ptype, s.window_from, s.window_to)), LIMIT)}
+
+    # An outage outlasts every retry: each page is dead-lettered, and none may count as landed
+    with tempfile.TemporaryDirectory() as tmp:
+        down = BulkWriter(DownSupabase(), "opportunities", on_conflict="notice_id", max_attempts=2,
+                          dead_letter_file=os.path.join(tmp, "opportunities.jsonl"))
+        run_backfill(None, store, FakeSam(), shards, writer=down)
+    assert down.stats["dead_lettered"] > 0 and down.stats["rows"] == 0
+    for shard in shards:
+        assert not store.is_complete(shard), "❌ A shard whose rows were dead-lettered was checkpointed"
+        assert store.progress(shard)[1] == set()
+
+    # Once the database is back, the re-run fetches every page again
+    client, sam = MemorySupabase({"opportunities": []}), FakeSam()
+    run_backfill(client, store, sam, shards)
+    assert set(sam.calls) == pages and all(store.is_complete(s) for s in shards)
+    print(f"✅ SUCCESS: {down.stats['dead_lettered']} dead-lettered rows left their shards incomplete; "
+          f"the re-run fetched all {len(pages)} pages again.")
+
+def test_changed_page_size_starts_the_shard_over():
+    store = CheckpointStore(":memory:")
+    shard = Shard("contractors@test", "", "2026-07-01", "2026-07-07", 100)
+    store.progress(shard)
+    store.set_end(shard, 200)
+    store.complete(shard, 0, 100)
+    store.complete(shard, 100, 37)
+    assert store.is_complete(shard)
+    # Offsets from a different page size do not line up with the new pages
+    assert store.progress(shard._replace(limit=10)) == (None, set())
+    print("✅ SUCCESS: checkpoints are only reused for the page size they were recorded with.")
+
+if __name__ == "__main__":
+    test_backfill_resumes_only_missing_units()
+    test_rerun_next_day_maps_to_the_same_shards()
+    test_dead_lettered_pages_are_not_checkpointed()
+    test_changed_page_size_starts_the_shard_over()
@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from supabase import create_client
+from bulk_writer import BulkWriter, CallbackFailed
+from memory_supabase import MemorySupabase
+
+# Local stand-in for PostgREST's POST /rest/v1/<table>: rejects bodies over MAX_BODY with a 413,
+# fails every 7th request with a 500, rejects any batch holding a "poison" row with a 400 (as a
+# NOT NULL violation would), and otherwise upserts on the on_conflict column.
+MAX_BODY = 60_000
+LATENCY = 0.02
+
+class MockPostgrestHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, content_type="application/json"):
+        payload = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        state = MockPostgrestHandler.state
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(LATENCY)
+        with state["lock"]:
+            state["requests"] += 1
+            nth = state["requests"]
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        try:
+            if len(raw) > MAX_BODY:
+                state["too_large"] += 1
+                return self._reply(413, "<html>413 Payload Too Large</html>", "text/html")
+            if nth % 7 == 0:
+                return self._reply(500, json.dumps({"code": "XX000", "message": "transient", "hint": None, "details": None}))
+            rows = json.loads(raw)
+            if any(row.get("poison") for row in rows):
+                return self._reply(400, json.dumps({"code": "23502", "message": "null value in column \"uei\"", "hint": None, "details": None}))
+            with state["lock"]:
+                for row in rows:
+                    state["table"][row["uei"]] = row
+            self._reply(201, "")
+        finally:
+            with state["lock"]:
+                state["in_flight"] -= 1
+
+def test_writer_against_mock_postgrest():
+    MockPostgrestHandler.state = {"lock": threading.Lock(), "requests": 0, "in_flight": 0, "peak": 0, "too_large": 0, "table": {}}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockPostgrestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = create_client(f"http://127.0.0.1:{server.server_address[1]}", "test-service-key")
+    rows = [{"uei": f"UEI{i:06d}", "company_name": f"Contractor {i}", "naics_codes": ["541512", "541511"] * 4,
+             "poison": i in (123, 4567)} for i in range(6000)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dead_letter = os.path.join(tmp, "contractors.jsonl")
+        try:
+            writer = BulkWriter(client, "contractors", on_conflict="uei", workers=4, batch_size=1000,
+                                dead_letter_file=dead_letter)
+            for start in range(0, len(rows), 250):
+                writer.write(rows[start:start + 250])
+            stats = writer.close()
+            report = writer.report()
+        finally:
+            server.shutdown()
+        with open(dead_letter) as f:
+            dead = [json.loads(line)["row"]["uei"] for line in f]
+
+    state = MockPostgrestHandler.state
+    expected = {r["uei"] for r in rows if not r["poison"]}
+    assert set(state["table"]) == expected, "❌ Good rows were lost or bad rows slipped through"
+    assert sorted(dead) == ["UEI000123", "UEI004567"], "❌ Dead-letter file should hold exactly the poison rows"
+    row_bytes = len(json.dumps(rows[0]))
+    assert state["too_large"] > 0 and report["batch_size"] * row_bytes <= MAX_BODY, "❌ Batch size did not back off after 413s"
+    assert state["peak"] > 1, "❌ Upserts were not concurrent"
+    assert stats["retries"] > 0 and stats["dead_lettered"] == 2
+    print(f"✅ SUCCESS: {stats['rows']} rows landed, 2 dead-lettered, {state['too_large']} 413s, "
+          f"{stats['retries']} retries, batch size settled at {report['batch_size']}.")
+    writer.print_report()
+
+def test_callback_errors_reach_the_caller():
+    client = MemorySupabase({"contractors": []})
+    landed = []
+
+    def then(group):
+        def callback(written):
+            if group == 0:
+                raise RuntimeError("database is locked") # e.g. a checkpoint store that could not commit
+            landed.append(group)
+        return callback
+
+    # Three write() groups in one 30-row batch: the first group's callback fails
+    writer = BulkWriter(client, "contractors", on_conflict="uei", batch_size=30)
+    for group in range(3):
+        writer.write([{"uei": f"U{group}-{i}"} for i in range(10)], then=then(group))
+    try:
+        writer.close()
+        raise AssertionError("❌ A failed callback was swallowed by the worker")
+    except CallbackFailed as e:
+        assert len(e.errors) == 1 and isinstance(e.errors[0], RuntimeError)
+    assert sorted(landed) == [1, 2], "❌ A failed callback skipped the rest of its batch's callbacks"
+    assert len(client.tables["contractors"]) == 30
+    print("✅ SUCCESS: a failing write() callback is raised from close(); the batch's other callbacks still ran.")
+
+if __name__ == "__main__":
+    test_writer_against_mock_postgrest()
+    test_callback_errors_reach_the_caller()
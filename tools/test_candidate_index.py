@@ -0,0 +1,74 @@
+import random
+from score_engine import score_matches_bruteforce, HOT_THRESHOLD, WARM_THRESHOLD
+from candidate_index import CandidateIndex, score_top_matches_indexed
+
+# Small pools so generated pairs collide often and every bound branch gets exercised
+NAICS_POOL = ["541511", "541512", "541519", "541611", "236220", "561210"]
+PSC_POOL = ["D302", "D307", "R408", "Y1AA"]
+CERTS_POOL = ["8A", "SDVOSBC", "WOSB", "HZC", "SBA"]
+STATES = ["VA", "MD", "DC", "TX", "CA"]
+NAMES = ["apex", "nova", "Quantum", "titan", "Vanguard Systems", ""]
+
+def generated_roster(rng, n):
+    return [{
+        "id": f"con-{i}",
+        "company_name": rng.choice(NAMES),
+        "naics_codes": rng.sample(NAICS_POOL, k=rng.randint(0, 3)) or rng.choice([None, []]),
+        "psc_codes": rng.sample(PSC_POOL, k=rng.randint(0, 2)),
+        "certifications": rng.sample(CERTS_POOL, k=rng.randint(0, 2)),
+        "sba_certifications": rng.sample(CERTS_POOL, k=rng.randint(0, 1)),
+        "state": rng.choice(STATES + [None]),
+        "is_sam_registered": rng.random() < 0.7,
+        "primary_poc_email": None
+    } for i in range(n)]
+
+def generated_opportunities(rng, n):
+    return [{
+        "id": f"op-{i}",
+        "notice_id": f"N-{i}",
+        "title": " ".join(rng.sample(["Cloud", "apex", "nova", "Support", "titan", "Services", "quantum"], k=3)),
+        "naics_code": rng.choice(NAICS_POOL + [None]),
+        "psc_code": rng.choice(PSC_POOL + [None]),
+        "set_aside_code": rng.choice(CERTS_POOL + [None]),
+        "set_aside_id": rng.choice([None, 1, 3]),
+        "place_of_performance_state": rng.choice(STATES + [None])
+    } for i in range(n)]
+
+def test_sop_pruning_matches_bruteforce():
+    rng = random.Random(7)
+    for trial in range(50):
+        contractors = generated_roster(rng, rng.randint(0, 150))
+        opportunities = generated_opportunities(rng, 8)
+        index = CandidateIndex(contractors)
+        brute = score_matches_bruteforce(opportunities, contractors)
+        for floor in (WARM_THRESHOLD, HOT_THRESHOLD):
+            expected = [m for m in brute if m["score"] >= floor]
+            assert score_top_matches_indexed(opportunities, index, floor) == expected, f"SOP trial {trial} floor {floor}"
+    print("✅ SOP: indexed pruning kept every pair the brute-force path kept.")
+
+def test_pwin_pruning_matches_bruteforce():
+    from match_engine import calculate_pwin_score, score_opportunities, MATCH_FLOOR
+    from pwin_engine import PWinModel
+    from test_pwin_engine import featured_roster, featured_opportunities
+    rng = random.Random(11)
+    pruned = pairs = 0
+    for trial in range(50):
+        contractors, features = featured_roster(rng, rng.randint(0, 150))
+        opportunities = featured_opportunities(rng, 8)
+        expected = [
+            (opp["notice_id"], con["id"], calculate_pwin_score(opp, con, features.get(con["id"])))
+            for opp in opportunities for con in contractors
+            if calculate_pwin_score(opp, con, features.get(con["id"])) >= MATCH_FLOOR
+        ]
+        model = PWinModel(contractors, features)
+        db_payload, _ = score_opportunities(opportunities, contractors, model=model)
+        actual = [(r["opportunity_id"], r["contractor_id"], r["pwin_score"]) for r in db_payload]
+        assert actual == expected, f"PWin trial {trial}"
+        pairs += len(opportunities) * len(contractors)
+        pruned += sum(len(contractors) - len(model.pwin_candidates(opp, MATCH_FLOOR)) for opp in opportunities)
+    assert pruned > 0, "❌ The floor never pruned a contractor"
+    print(f"✅ PWin: floor pruning skipped {pruned} of {pairs} pairs and kept every pair the brute-force path kept.")
+
+if __name__ == "__main__":
+    test_sop_pruning_matches_bruteforce()
+    test_pwin_pruning_matches_bruteforce()
@@ -0,0 +1,22 @@
+from capturepilot import COMMANDS, profile_imports, main
+
+def test_tools_import_without_heavy_sdks():
+    slowest = (0, None)
+    for name, (module, _) in COMMANDS.items():
+        profile = profile_imports(module)
+        assert not profile["heavy"], f"❌ `{name}` ({module}) loads {profile['heavy']} at import; defer it to first use"
+        slowest = max(slowest, (profile["total_ms"], name))
+    print(f"✅ SUCCESS: all {len(COMMANDS)} commands import without heavy SDKs (slowest: {slowest[1]}, {slowest[0]:.0f} ms).")
+
+def test_unknown_command_is_rejected():
+    try:
+        main(["nope"])
+    except SystemExit as e:
+        assert e.code == 2
+    else:
+        raise AssertionError("❌ Unknown command was accepted")
+    print("✅ SUCCESS: unknown commands exit with a usage error.")
+
+if __name__ == "__main__":
+    test_tools_import_without_heavy_sdks()
+    test_unknown_command_is_rejected()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+from memory_supabase import MemorySupabase
+from bulk_writer import BulkWriter
+from change_tracker import ChangeTracker
+
+class RejectingSupabase(MemorySupabase):
+    """Rejects any upsert batch containing a row flagged `reject`, like a constraint violation would."""
+    def _execute(self, query):
+        if query._action == "upsert" and any(r.get("reject") for r in query._payload):
+            err = Exception("violates check constraint")
+            err.code = "23514"
+            raise err
+        return super()._execute(query)
+
+def notice(i, title_suffix="", reject=False):
+    return {"notice_id": f"N{i:05d}", "title": f"Requirement {i}{title_suffix}",
+            "naics_code": str(541000 + i % 50), "active": True, "reject": reject}
+
+def sync(client, rows, index_path, dead_letter):
+    tracker = ChangeTracker(client, "opportunities", "notice_id", db_path=index_path)
+    writer = BulkWriter(client, "opportunities", on_conflict="notice_id", tracker=tracker, workers=2,
+                        batch_size=100, dead_letter_file=dead_letter)
+    for start in range(0, len(rows), 250):
+        writer.write(rows[start:start + 250])
+    writer.close()
+    tracker.close()
+    return dict(tracker.stats, written=writer.stats["rows"])
+
+def test_overlapping_windows_only_write_changes():
+    client = RejectingSupabase(supabase_url="https://project-a.supabase.co")
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path, dead_letter = os.path.join(tmp, "index.sqlite3"), os.path.join(tmp, "dead.jsonl")
+
+        # Day 1: notices 0-999, one of which the DB rejects
+        day1 = sync(client, [notice(i, reject=(i == 42)) for i in range(1000)], index_path, dead_letter)
+        assert day1 == {"inserted": 1000, "updated": 0, "skipped": 0, "written": 999}
+
+        # Day 2 overlaps half of day 1: 20 amended notices, 500 new ones, and the rejected row fixed
+        day2_rows = [notice(i, " (Amendment 1)" if i % 25 == 0 else "") for i in range(500, 1500)] + [notice(42)]
+        day2 = sync(client, day2_rows, index_path, dead_letter)
+        assert day2["skipped"] == 480, "❌ Unchanged overlap was re-upserted"
+        assert day2["updated"] == 20, "❌ Amended rows were not rewritten"
+        # The row rejected on day 1 never reached the index, so it is retried as new
+        assert day2["inserted"] == 500 + 1 and day2["written"] == 521
+
+        # Same window again: nothing to write
+        day3 = sync(client, day2_rows, index_path, dead_letter)
+        assert day3["written"] == 0 and day3["skipped"] == len(day2_rows)
+
+        # Pointed at another project, the index forgets everything rather than skipping blindly
+        other = RejectingSupabase(supabase_url="https://project-b.supabase.co")
+        assert sync(other, day2_rows[:10], index_path, dead_letter)["inserted"] == 10
+
+    stored = {r["notice_id"]: r["title"] for r in client.tables["opportunities"]}
+    assert len(stored) == 1500 and stored["N00525"].endswith("(Amendment 1)")
+    print(f"✅ SUCCESS: day 2 wrote {day2['written']} of {len(day2_rows)} rows ({day2['skipped']} unchanged skipped); day 3 wrote 0.")
+
+if __name__ == "__main__":
+    test_overlapping_windows_only_write_changes()
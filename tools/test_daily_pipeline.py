@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import run_state
+from run_state import STATE_DIR, load_state
+from memory_supabase import MemorySupabase
+from daily_pipeline import Pipeline, Stage, daily_stages
+from test_ingest_csv import lookup_tables
+
+STATE_FILE = "test_daily_pipeline_state.json"
+
+def test_stages_overlap_stream_and_resume_after_failure():
+    calls = []
+    both_syncing = threading.Barrier(2, timeout=5)
+    first_batch_scored = threading.Event()
+    crash = {"score_contractors": True}
+
+    def record(name, result=None):
+        calls.append(name)
+        return result
+
+    def sync_opportunities(ctx):
+        both_syncing.wait() # Only returns if sync_contractors is running at the same time
+        ctx.emit(["n-1", "n-2"])
+        assert first_batch_scored.wait(5), "consumer did not see the batch while the producer ran"
+        ctx.emit(["n-3"])
+        return record("sync_opportunities", {})
+
+    def sync_contractors(ctx):
+        both_syncing.wait()
+        return record("sync_contractors", {})
+
+    def score_opportunities(ctx):
+        scored = []
+        for batch in ctx.stream:
+            scored.extend(batch)
+            first_batch_scored.set()
+            ctx.record("first_hot_s", 0.5)
+        return record("score_opportunities", {"scored": scored, "resumed": ctx.resumed})
+
+    def score_contractors(ctx):
+        assert ctx.outputs["roster"] == "warm roster"
+        if crash.pop("score_contractors", False):
+            raise RuntimeError("supabase timed out")
+        return record("score_contractors", {"resumed": ctx.resumed})
+
+    def stages():
+        return [
+            Stage("sync_opportunities", sync_opportunities),
+            Stage("sync_contractors", sync_contractors),
+            Stage("roster", lambda ctx: record("roster", "warm roster"), checkpoint=False),
+            Stage("score_opportunities", score_opportunities, deps=["roster"], feeds="sync_opportunities"),
+            Stage("score_contractors", score_contractors, deps=["roster", "sync_opportunities", "sync_contractors"]),
+            Stage("drafts", lambda ctx: record("drafts", {}), deps=["score_opportunities", "score_contractors"]),
+        ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        history = os.path.join(tmp, "runs.jsonl")
+        try:
+            # Attempt 1: scoring contractors fails, so drafts is blocked; everything else finishes
+            pipeline = Pipeline(stages(), state_file=STATE_FILE, history_file=history)
+            assert not pipeline.run(fresh=True)
+            state = load_state(STATE_FILE)
+            assert state["stages"]["score_contractors"]["status"] == "failed"
+            assert state["stages"]["drafts"]["status"] == "blocked"
+            assert state["stages"]["score_opportunities"]["result"]["scored"] == ["n-1", "n-2", "n-3"]
+            assert "drafts" not in calls
+
+            # Attempt 2 re-runs only the failed stage, its blocked dependent and the in-memory roster
+            calls.clear()
+            pipeline = Pipeline(stages(), state_file=STATE_FILE, history_file=history)
+            assert pipeline.run()
+            assert sorted(calls) == ["drafts", "roster", "score_contractors"]
+            state = load_state(STATE_FILE)
+            assert state["run"]["attempts"] == 2 and state["run"]["finished_at"]
+            assert state["stages"]["score_contractors"]["result"] == {"resumed": True}
+            pipeline.print_timings()
+
+            with open(history) as f:
+                runs = [json.loads(line) for line in f]
+            assert [run["attempt"] for run in runs] == [1, 2] and [run["complete"] for run in runs] == [False, True]
+            assert runs[0]["first_hot_s"] == 0.5 and "first_hot_s" not in runs[1]
+            assert set(runs[1]["stages"]) == {"roster", "score_contractors", "drafts"}
+            assert all(info["seconds"] is not None for info in runs[1]["stages"].values())
+
+            # A finished run is not resumed: the next invocation starts a new one
+            calls.clear()
+            first_batch_scored.clear()
+            both_syncing.reset()
+            assert Pipeline(stages(), state_file=STATE_FILE, history_file=history).run()
+            assert load_state(STATE_FILE)["run"]["attempts"] == 1 and len(calls) == 6
+        finally:
+            if os.path.exists(os.path.join(STATE_DIR, STATE_FILE)):
+                os.remove(os.path.join(STATE_DIR, STATE_FILE))
+    print("✅ Independent stages overlap, batches stream to scoring, and a failed run resumes at the failed stage.")
+
+def sam_notices(start, n):
+    return [{"noticeId": f"N-{i}", "title": f"Notice {i}", "naicsCode": "541511", "department": "DEPT OF DEFENSE",
+             "subtier": "DEPT OF THE ARMY", "office": f"OFFICE {i % 3}", "type": "Solicitation", "active": "Yes"}
+            for i in range(start, start + n)]
+
+def sam_entities(start, n):
+    return [{"entityRegistration": {"ueiSAM": f"UEI{i}", "legalBusinessName": f"Firm {i}",
+                                    "physicalAddress": {"stateOrProvinceCode": "VA"},
+                                    "electronicBusinessPoc": {"email": f"bd@firm{i}.com"}},
+             "coreData": {"businessTypes": [{"businessTypeCode": code} for code in ("A6", "JT", "XX")]},
+             "assertions": {"naicsList": [{"naicsCode": "541511"}]}} for i in range(start, start + n)]
+
+def known_roster(n):
+    # Contractors from earlier runs, written well before this run's mark
+    return [{"id": f"old-{i}", "uei": f"OLD{i}", "company_name": f"Incumbent {i}", "state": "VA", "naics_codes": ["541511"],
+             "certifications": [], "sba_certifications": ["A6", "JT", "XX"], "is_sam_registered": True,
+             "primary_poc_email": f"bd@incumbent{i}.com", "updated_at": "2026-01-01T00:00:00+00:00"} for i in range(n)]
+
+def slow_entity_pages(fail_after=None):
+    # The entity sync outlasts the opportunity sync, so a stage that does not wait for it starts first
+    for offset in (0, 100):
+        time.sleep(0.3)
+        if fail_after is not None and offset > fail_after:
+            raise ConnectionError("SAM.gov entity API reset the connection")
+        yield offset, sam_entities(offset, 100)
+
+def test_daily_stages_order_and_resume():
+    client = MemorySupabase({**lookup_tables(), "opportunities": [], "contractors": known_roster(20), "matches": [],
+                             "contractor_awards": [], "contractor_features": []})
+    scored_mid_sync = []
+
+    def opportunity_pages():
+        # A full batch lands on its own; the second page is only fetched once the first one has been scored
+        yield "o", 0, sam_notices(0, 500)
+        deadline = time.monotonic() + 10
+        while not client.tables["matches"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        scored_mid_sync.append(len(client.tables["matches"]))
+        yield "o", 500, sam_notices(500, 20)
+
+    state_dir = run_state.STATE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        run_state.STATE_DIR = tmp # Agency snapshot, feature marks and pipeline state stay out of .tmp/
+        history = os.path.join(tmp, "runs.jsonl")
+        change_index = os.path.join(tmp, "changes.sqlite")
+
+        def pipeline(entity_pages):
+            return Pipeline(daily_stages(client, drafts=False, opportunity_pages=opportunity_pages(), entity_pages=entity_pages,
+                                         change_index=change_index), state_file=STATE_FILE, history_file=history)
+        try:
+            # Attempt 1: opportunities are scored while their sync runs; the entity sync dies on its second page
+            first = pipeline(slow_entity_pages(fail_after=0))
+            assert not first.run(fresh=True)
+            assert scored_mid_sync and scored_mid_sync[0] > 0, "❌ No batch was scored while sync_opportunities ran"
+            stages = load_state(STATE_FILE)["stages"]
+            assert stages["sync_opportunities"]["status"] == "done" and stages["sync_contractors"]["status"] == "failed"
+            assert stages["score_opportunities"]["status"] == "done"
+            assert stages["score_opportunities"]["result"]["opportunities"] == 520
+            for name in ("features", "score_contractors"):
+                assert stages[name]["status"] == "blocked", f"❌ {name} ran before the entity sync finished"
+
+            # Attempt 2 resumes: neither the opportunity sync nor its scoring is re-run
+            second = pipeline(slow_entity_pages())
+            assert second.run()
+            assert second.planned == ["sync_contractors", "features", "score_contractors"]
+            stages = load_state(STATE_FILE)["stages"]
+            synced = stages["sync_contractors"]["offset_s"] + stages["sync_contractors"]["seconds"]
+            assert stages["features"]["offset_s"] >= synced - 0.01, "❌ Features refreshed before both syncs finished"
+            assert stages["score_contractors"]["offset_s"] >= stages["features"]["offset_s"] + stages["features"]["seconds"] - 0.01
+            # This run's registrations were scored against every active opportunity once they landed
+            assert stages["score_contractors"]["result"]["contractors"] == 200
+            assert stages["score_contractors"]["result"]["opportunities"] == 520
+            new_ids = {con["id"] for con in client.tables["contractors"] if con["uei"].startswith("UEI")}
+            assert len(new_ids) == 200 and any(m["contractor_id"] in new_ids for m in client.tables["matches"])
+            assert all(info["status"] == "done" for info in stages.values())
+            second.print_timings()
+        finally:
+            run_state.STATE_DIR = state_dir
+    print(f"✅ SUCCESS: {scored_mid_sync[0]} matches persisted while sync_opportunities ran; features wait for both syncs, "
+          "and a failed entity sync resumes without re-syncing.")
+
+if __name__ == "__main__":
+    test_stages_overlap_stream_and_resume_after_failure()
+    test_daily_stages_order_and_resume()
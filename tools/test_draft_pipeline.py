@@ -0,0 +1,158 @@
+import json
+import time
+import asyncio
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from memory_supabase import MemorySupabase
+from draft_pipeline import OpenAIChat, GeminiFlash, AsyncRateLimiter, draft_all
+from match_engine import draft_outreach_emails
+
+# Local stand-in for the OpenAI chat and Gemini generateContent endpoints. Every completion takes
+# LATENCY seconds. Prompts can steer failures: "[429-once]" is rate limited on its first attempt,
+# "[slow-once]" stalls past the client timeout on its first attempt, "[bad]" always gets a 400,
+# "[blocked]" gets Gemini's 200 with only promptFeedback, "[garbled]" a 200 whose body is not JSON.
+# Tests can install state["responder"](prompt) -> (text, total_tokens) to shape the completions.
+LATENCY = 0.1
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client already timed out ("[slow-once]")
+
+    def do_POST(self):
+        state = FakeLLMHandler.state
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        gemini = self.path.endswith(":generateContent")
+        prompt = body["contents"][0]["parts"][0]["text"] if gemini else body["messages"][0]["content"]
+        with state["lock"]:
+            state["requests"] += 1
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+            state["seen"][prompt] = state["seen"].get(prompt, 0) + 1
+            state["prompt_chars"] += len(prompt)
+            first = state["seen"][prompt] == 1
+        try:
+            if "[bad]" in prompt:
+                return self._reply(400, {"error": {"message": "invalid request"}})
+            if "[blocked]" in prompt:
+                return self._reply(200, {"promptFeedback": {"blockReason": "SAFETY"}})
+            if "[garbled]" in prompt:
+                self.send_response(200)
+                self.send_header("Content-Length", "15")
+                self.end_headers()
+                return self.wfile.write(b"<html>oops</ht>")
+            if "[429-once]" in prompt and first:
+                return self._reply(429, {"error": {"message": "rate limited"}}, {"Retry-After": "0"})
+            time.sleep(1.0 if "[slow-once]" in prompt and first else LATENCY)
+            responder = state.get("responder") or (lambda p: (f"Draft for: {p[:40]}", 120))
+            text, tokens = responder(prompt)
+            if gemini:
+                return self._reply(200, {"candidates": [{"content": {"parts": [{"text": text}]}}],
+                                         "usageMetadata": {"totalTokenCount": tokens}})
+            self._reply(200, {"choices": [{"message": {"content": text}}], "usage": {"total_tokens": tokens}})
+        finally:
+            with state["lock"]:
+                state["in_flight"] -= 1
+
+def start_fake_llm(responder=None):
+    FakeLLMHandler.state = {"lock": threading.Lock(), "requests": 0, "in_flight": 0, "peak": 0, "seen": {},
+                            "prompt_chars": 0, "responder": responder}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeLLMHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def test_elite_matches_drafted_concurrently_with_bulk_io():
+    server, base = start_fake_llm()
+    try:
+        elite = [{"opportunity_id": f"OPP-{i % 40}", "contractor_id": f"C-{i // 40}", "pwin_score": 90,
+                  "opp_title": f"Requirement {i % 40}", "cont_name": f"Contractor {i}"} for i in range(200)]
+        elite[7]["cont_name"] = "[429-once] Contractor 7"
+        stored = [{"id": f"M-{i}", "opportunity_id": m["opportunity_id"], "contractor_id": m["contractor_id"]}
+                  for i, m in enumerate(elite[:-1])] # The last match never made it to the DB
+        client = MemorySupabase({"matches": stored})
+
+        provider = OpenAIChat("test-key", base_url=f"{base}/v1", rpm=60_000, tpm=10_000_000)
+        t0 = time.perf_counter()
+        drafts = draft_outreach_emails(elite, supabase=client, provider=provider, concurrency=20, llm_cache=None)
+        elapsed = time.perf_counter() - t0
+
+        state = FakeLLMHandler.state
+        serial = len(elite) * LATENCY
+        assert len(drafts) == 199 and len(client.tables["outreach_drafts"]) == 199
+        assert state["peak"] <= 20, f"❌ {state['peak']} requests in flight, limit was 20"
+        assert elapsed < serial / 4, f"❌ {elapsed:.1f}s is not concurrent (serial would be {serial:.0f}s)"
+        # One lookup for every match_id, one write for every draft
+        assert client.calls.count(("matches", "select")) == 1
+        assert client.calls.count(("outreach_drafts", "upsert")) == 1
+        assert {d["match_id"] for d in drafts} == {f"M-{i}" for i in range(199)}
+        print(f"✅ SUCCESS: 199 drafts in {elapsed:.2f}s (serial ~{serial:.0f}s), peak {state['peak']} in flight.")
+    finally:
+        server.shutdown()
+
+def test_timeouts_and_rate_limits_retry_but_client_errors_fail_fast():
+    server, base = start_fake_llm()
+    try:
+        provider = GeminiFlash("test-key", base_url=f"{base}/v1beta", rpm=60_000, tpm=10_000_000)
+        jobs = [{"prompt": "[slow-once] stalls"}, {"prompt": "[429-once] throttled"}, {"prompt": "[bad] rejected"},
+                {"prompt": "plain"}]
+        results, stats = draft_all(jobs, provider, concurrency=4, timeout=0.5, max_attempts=3)
+
+        slow, throttled, bad, plain = results
+        assert slow["text"] and slow["attempts"] == 2
+        assert throttled["text"] and throttled["attempts"] == 2
+        assert bad["text"] is None and "HTTP 400" in bad["error"]
+        assert FakeLLMHandler.state["seen"]["[bad] rejected"] == 1, "❌ A 400 was retried"
+        assert plain["attempts"] == 1 and plain["tokens"] == 120
+        assert stats["drafted"] == 3 and stats["failed"] == 1 and stats["timeouts"] == 1 and stats["retries"] == 2
+    finally:
+        server.shutdown()
+
+def test_blocked_or_malformed_completion_fails_only_its_job():
+    server, base = start_fake_llm()
+    try:
+        provider = GeminiFlash("test-key", base_url=f"{base}/v1beta", rpm=60_000, tpm=10_000_000)
+        jobs = [{"prompt": f"plain {i}"} for i in range(6)]
+        jobs[2] = {"prompt": "[blocked] unsafe"}
+        jobs[4] = {"prompt": "[garbled] proxy page"}
+        results, stats = draft_all(jobs, provider, concurrency=4, max_attempts=3)
+
+        assert "blockReason: SAFETY" in results[2]["error"] and results[2]["text"] is None
+        assert "malformed completion" in results[4]["error"] and results[4]["text"] is None
+        assert FakeLLMHandler.state["seen"]["[blocked] unsafe"] == 1, "❌ A blocked prompt was retried"
+        assert all(results[i]["text"] for i in (0, 1, 3, 5)), "❌ One bad completion cost the batch its drafts"
+        assert stats["drafted"] == 4 and stats["failed"] == 2
+    finally:
+        server.shutdown()
+    print("✅ SUCCESS: a blocked and a malformed completion fail only their own jobs.")
+
+def test_rate_limiter_paces_requests_and_tokens():
+    async def run(limiter, n, tokens):
+        t0 = time.perf_counter()
+        for _ in range(n):
+            await limiter.acquire(tokens)
+        return time.perf_counter() - t0
+
+    # 600 rpm with a 0.1s burst: one request up front, then one every 0.1s
+    assert asyncio.run(run(AsyncRateLimiter(600, 10_000_000, burst_seconds=0.1), 6, 1)) >= 0.45
+    # 60k tpm = 1000 tokens/s with a 100-token burst: 100-token requests every 0.1s
+    assert asyncio.run(run(AsyncRateLimiter(60_000, 60_000, burst_seconds=0.1), 6, 100)) >= 0.45
+
+if __name__ == "__main__":
+    test_elite_matches_drafted_concurrently_with_bulk_io()
+    test_timeouts_and_rate_limits_retry_but_client_errors_fail_fast()
+    test_blocked_or_malformed_completion_fails_only_its_job()
+    test_rate_limiter_paces_requests_and_tokens()
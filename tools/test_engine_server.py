@@ -0,0 +1,102 @@
+import json
+import time
+import threading
+from urllib.request import urlopen, Request
+from urllib.error import HTTPError
+from engine_server import JobQueue, make_server
+
+def start_engine(actions):
+    queue = JobQueue(actions, context={"warm": True})
+    server = make_server(queue, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return queue, server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def call(url, params=None):
+    data = json.dumps(params).encode() if params is not None else None
+    try:
+        with urlopen(Request(url, data=data, method="POST" if data is not None else "GET"), timeout=10) as response:
+            return response.status, json.loads(response.read())
+    except HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def test_jobs_dedupe_stream_and_capture_failures():
+    release = threading.Event()
+    def slow_score(ctx, min_tier=None):
+        print(f"🔄 Scoring with warm context {ctx['warm']}...")
+        release.wait(10)
+        print("✅ Scored 3 matches.")
+        return {"matches": 3}
+    def broken(ctx):
+        print("partial output before the crash")
+        raise RuntimeError("boom")
+    queue, server, base = start_engine({"score": slow_score, "broken": broken})
+    try:
+        t0 = time.perf_counter()
+        status, first = call(f"{base}/jobs/score", {"min_tier": "HOT"})
+        dispatch_ms = (time.perf_counter() - t0) * 1000
+        assert status == 202 and first["job"]["status"] in ("queued", "running")
+
+        # An identical click joins the running job; different parameters queue behind it
+        status, again = call(f"{base}/jobs/score", {"min_tier": "HOT"})
+        assert status == 200 and again["deduplicated"] and again["job"]["id"] == first["job"]["id"]
+        _, other = call(f"{base}/jobs/score", {})
+        assert not other["deduplicated"] and other["job"]["id"] != first["job"]["id"]
+        assert call(f"{base}/jobs/score", {"bogus": 1})[0] == 400
+        assert call(f"{base}/jobs/nope", {})[0] == 404
+
+        # The stream delivers output as it is printed and ends with the finished job
+        threading.Timer(0.2, release.set).start()
+        with urlopen(f"{base}/jobs/{first['job']['id']}/stream", timeout=10) as response:
+            events = [json.loads(line) for line in response if line.strip()]
+        lines = [event["line"] for event in events if "line" in event]
+        assert lines == ["🔄 Scoring with warm context True...", "✅ Scored 3 matches."]
+        assert events[-1]["job"]["status"] == "succeeded" and events[-1]["job"]["result"] == {"matches": 3}
+
+        _, failed = call(f"{base}/jobs/broken", {})
+        job_id = failed["job"]["id"]
+        while queue.get(job_id).status != "failed":
+            time.sleep(0.01)
+        _, done = call(f"{base}/jobs/{job_id}?since=1")
+        assert done["job"]["error"] == "RuntimeError: boom" and done["job"]["output"][-1] == "RuntimeError: boom"
+        assert queue.get(job_id).lines[0] == "partial output before the crash"
+        assert call(f"{base}/health")[1]["actions"] == ["broken", "score"]
+    finally:
+        release.set()
+        server.shutdown()
+        server.server_close()
+        queue.close()
+    assert dispatch_ms < 500, f"❌ Dispatch took {dispatch_ms:.0f}ms"
+    print(f"✅ SUCCESS: jobs dispatched in {dispatch_ms:.1f}ms, de-duplicated, streamed and failures captured.")
+
+def test_output_from_threads_a_job_starts():
+    from concurrent.futures import ThreadPoolExecutor
+    def threaded(ctx):
+        print("🔄 Fetching in the background...")
+        producer = threading.Thread(target=lambda: print("  -> producer page 1"))
+        producer.start()
+        producer.join()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            list(pool.map(lambda shard: print(f"  -> shard {shard} written"), range(2)))
+        return {"shards": 2}
+    queue, server, base = start_engine({"threaded": threaded})
+    try:
+        _, submitted = call(f"{base}/jobs/threaded", {})
+        job = queue.get(submitted["job"]["id"])
+        while not job.done:
+            time.sleep(0.01)
+        # A thread started outside any job still prints to the console
+        outside = threading.Thread(target=lambda: print("console only"))
+        outside.start()
+        outside.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+        queue.close()
+    assert job.status == "succeeded"
+    assert job.lines[:2] == ["🔄 Fetching in the background...", "  -> producer page 1"]
+    assert sorted(job.lines[2:]) == ["  -> shard 0 written", "  -> shard 1 written"], f"❌ Worker output lost: {job.lines}"
+    print(f"✅ SUCCESS: output from a producer thread and a pool reached the job ({len(job.lines)} lines).")
+
+if __name__ == "__main__":
+    test_jobs_dedupe_stream_and_capture_failures()
+    test_output_from_threads_a_job_starts()
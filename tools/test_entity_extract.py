@@ -0,0 +1,88 @@
+import os
+import random
+import tempfile
+from entity_extract import iter_entities, parse_date, clean_taxonomy, map_sba_codes, trunc
+
+N_FIELDS = 150 # Width of a public entity extract record
+STATES = ["VA", "MD", "DC", "TX", "CA", "FL", "CO", "WA"]
+
+def write_synthetic_extract(path, n_entities, seed=3, inactive_ratio=0.3):
+    """Pipe-delimited extract shaped like SAM's public entity .dat: BOF header, ~150 fields, !end trailer."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="latin-1", newline="\n") as f:
+        f.write(f"BOF PUBLIC V2 00000000 20260101 {n_entities} 0000001\n")
+        for i in range(n_entities):
+            row = [""] * N_FIELDS
+            row[0] = f"UEI{i:09d}"
+            row[3] = f"{i % 99999:05d}"
+            row[5] = "E" if rng.random() < inactive_ratio else "A"
+            row[8] = f"2027{rng.randrange(1, 13):02d}{rng.randrange(1, 29):02d}"
+            row[9] = f"20{rng.randrange(10, 26)}{rng.randrange(1, 13):02d}{rng.randrange(1, 29):02d}" if i % 17 else "2026023"
+            row[11] = f"Synthetic Federal Services {i} LLC"
+            row[12] = "SFS" if i % 3 == 0 else ""
+            row[15] = f"{i % 9000} Commerce Blvd"
+            row[17] = "Arlington"
+            row[18] = rng.choice(STATES)
+            row[19] = f"{22000 + i % 900}"
+            row[21] = "USA"
+            row[26] = f"www.sfs{i}.example.com" if i % 2 else ""
+            row[31] = "~".join(rng.sample(["A2", "A5", "QF", "HQ", "8W", "XX", "JT", "27"], rng.randrange(0, 3)))
+            row[34] = "~".join(f"{541000 + rng.randrange(900)}{rng.choice('YN')}" for _ in range(rng.randrange(1, 6)))
+            row[36] = "~".join(f"R{rng.randrange(900):03d}" for _ in range(rng.randrange(0, 4)))
+            row[46], row[48] = f"Pat{i % 500}", f"Smith{i % 700}"
+            row[90], row[92] = ("Lee", f"Jordan{i % 300}") if i % 4 else ("", "")
+            for j in range(100, N_FIELDS):
+                row[j] = f"x{j}" if j % 7 == 0 else ""
+            f.write("|".join(row) + "\n")
+            if i % 1000 == 999:
+                f.write("truncated|line\n")
+        f.write(f"!end {n_entities}\n")
+
+def legacy_parse(path):
+    """The original line-by-line parse from ingest_contractors(), kept as the equivalence reference."""
+    records = []
+    with open(path, mode='r', encoding='latin-1', errors='replace') as f:
+        for line in f:
+            if line.startswith('BOF') or line.startswith('!end'):
+                continue
+            row = line.split('|')
+            if len(row) < 50 or row[5].strip() != 'A' or not row[0].strip():
+                continue
+            primary_name = f"{row[46].strip()} {row[48].strip()}".strip()
+            secondary_name = f"{row[90].strip()} {row[92].strip()}".strip()
+            records.append({
+                "uei": trunc(row[0].strip(), 20), "cage_code": trunc(row[3], 20), "is_sam_registered": True,
+                "company_name": trunc(row[11], 255), "dba_name": trunc(row[12], 255),
+                "address_line_1": trunc(row[15], 255), "city": trunc(row[17], 100), "state": trunc(row[18], 50),
+                "zip_code": trunc(row[19], 20), "country_code": trunc(row[21], 3),
+                "activation_date": parse_date(row[9].strip()), "expiration_date": parse_date(row[8].strip()),
+                "business_url": trunc(row[26], 255), "sba_certifications": map_sba_codes(row[31].strip()),
+                "naics_codes": clean_taxonomy(row[34].strip()), "psc_codes": clean_taxonomy(row[36].strip()),
+                "primary_poc_name": trunc(primary_name, 255) if primary_name else None,
+                "secondary_poc_name": trunc(secondary_name, 255) if secondary_name else None,
+            })
+    return records
+
+def comparable(row):
+    return {k: (sorted(v) if isinstance(v, list) else v) for k, v in row.items()}
+
+def test_mmap_reader_matches_legacy_parse():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "entities.dat")
+        write_synthetic_extract(path, 5_000)
+        expected = [comparable(r) for r in legacy_parse(path)]
+
+        stats = {}
+        serial = [comparable(r.to_row()) for r in iter_entities(path, chunk_bytes=64 * 1024, stats=stats)]
+        parallel = [comparable(r.to_row()) for r in iter_entities(path, workers=2, chunk_bytes=64 * 1024)]
+        size = os.path.getsize(path)
+
+    assert serial == expected, "❌ mmap reader disagrees with the line-by-line parse"
+    assert parallel == expected, "❌ Worker fan-out changed records or their order"
+    assert stats["active"] == len(expected) and stats["inactive"] > 0 and stats["malformed"] == 5
+    assert stats["bytes"] == size, "❌ Chunks did not cover the whole file"
+    print(f"✅ SUCCESS: {len(expected)} active entities identical across legacy, mmap and 2-process reads "
+          f"({stats['inactive']} inactive skipped).")
+
+if __name__ == "__main__":
+    test_mmap_reader_matches_legacy_parse()
@@ -0,0 +1,124 @@
+import os
+import re
+import json
+import sqlite3
+import tempfile
+import importlib
+from memory_supabase import MemorySupabase
+from draft_pipeline import GeminiFlash
+from draft_rules import check_email, deadline_forms
+from test_draft_pipeline import start_fake_llm, FakeLLMHandler
+
+email_drafts = importlib.import_module("3_generate_email_drafts")
+
+# 3 opportunities x 10 HOT contractors. The fake model writes valid drafts, except that it leaves
+# "Skipped Co" out of its batch and forgets the NAICS code for "Sloppy Co" in the batch. In
+# per-match prompts it pads one "Wordy Co" email past 180 words, writes only two strategies for
+# "Short Co", and never mentions the deadline for "Hopeless Co", not even when asked to repair.
+SKIP_SLOPPY = {(0, 3): "Skipped Co", (1, 5): "Sloppy Co"}
+WORDY_SHORT_HOPELESS = {(0, 1): "Wordy Co", (1, 2): "Short Co", (2, 3): "Hopeless Co"}
+
+def hot_matches_db(names):
+    opportunities = [{"id": f"OPP-{o}", "title": f"Cloud Migration Services {o}", "naics_code": f"54151{o}",
+                      "response_deadline": f"2026-11-0{o + 1}", "agency": "Department of Energy",
+                      "notice_type": "Sources Sought", "set_aside_code": "SBA"} for o in range(3)]
+    contractors, matches = [], []
+    for o in range(3):
+        for c in range(10):
+            name = names.get((o, c), f"Contractor {o}-{c}")
+            contractors.append({"id": f"C-{o}-{c}", "company_name": name, "certifications": ["8A"]})
+            matches.append({"id": f"M-{o}-{c}", "opportunity_id": f"OPP-{o}", "contractor_id": f"C-{o}-{c}",
+                            "classification": "HOT", "score_breakdown": {"naics_match": 1, "setaside_match": 1, "geo_match": 0}})
+    return MemorySupabase({"opportunities": opportunities, "contractors": contractors, "matches": matches})
+
+def fake_email(name, naics, deadline, strategy, drop_naics=False):
+    code = "" if drop_naics else f" under NAICS {naics}"
+    due = "soon" if name == "Hopeless Co" else deadline
+    padding = " Our team has supported similar efforts." * 40 if (name, strategy) == ("Wordy Co", 2) else ""
+    return (f"Hi {name} team, strategy {strategy}: this requirement{code} fits your 8(a) certification and "
+            f"NAICS alignment. Responses are due {due}. We would welcome a short call this week.{padding}")
+
+def responder(prompt):
+    naics = re.search(r"NAICS [Cc]ode: (\d+)", prompt).group(1)
+    # The model restates the ISO deadline the way people write it
+    deadline = re.search(r"Response Deadline: (\d{4}-\d{2}-\d{2})", prompt).group(1)
+    y, m, d = deadline.split("-")
+    spoken = f"November {int(d)}, {y}"
+    batch = re.search(r"Contractors \(JSON\):\s*(\[.*?\])\n", prompt)
+    repair = re.search(r"(?:Hi|to) (\w+ Co)\b", prompt) if "Return only the email text" in prompt else None
+    if "Return only the email text" in prompt:
+        text = fake_email(repair.group(1) if repair else "Acme", naics, spoken, 0)
+    elif batch:
+        drafts = []
+        for c in json.loads(batch.group(1)):
+            if c["company_name"] == "Skipped Co":
+                continue
+            drop = c["company_name"] == "Sloppy Co"
+            drafts.append({"ref": c["ref"], "strategies": [fake_email(c["company_name"], naics, spoken, s, drop) for s in (1, 2, 3)]})
+        text = json.dumps({"drafts": drafts})
+    else:
+        name = re.search(r"Contractor: (.+)", prompt).group(1).strip()
+        text = "\n---\n".join(fake_email(name, naics, spoken, s) for s in ((1, 2) if name == "Short Co" else (1, 2, 3)))
+    return text, (len(prompt) + len(text)) // 4
+
+def run(batched, names, llm_cache=None, quality_log=None):
+    server, base = start_fake_llm(responder)
+    try:
+        client = hot_matches_db(names)
+        provider = GeminiFlash("test-key", base_url=f"{base}/v1beta", rpm=60_000, tpm=10_000_000)
+        drafts = email_drafts.generate_email_drafts(limit=100, concurrency=8, supabase=client, provider=provider,
+                                                    llm_cache=llm_cache, batched=batched, quality_log=quality_log)
+        return drafts, client, dict(FakeLLMHandler.state)
+    finally:
+        server.shutdown()
+
+def test_batched_mode_cuts_requests_and_prompt_tokens():
+    single, _, single_state = run(False, SKIP_SLOPPY)
+    batched, client, batched_state = run(True, SKIP_SLOPPY)
+
+    assert len(single) == len(batched) == 30 and len(client.tables["outreach_drafts"]) == 30
+    # 3 batched requests, a per-match fallback for the skipped contractor, one repair per Sloppy Co email
+    assert single_state["requests"] == 30 and batched_state["requests"] == 3 + 1 + 3
+    # Even counting the three repair prompts, the shared context is sent far fewer times
+    assert single_state["prompt_chars"] >= 2.5 * batched_state["prompt_chars"], "❌ Shared context was not deduplicated"
+
+    opps = {o["id"]: o for o in client.tables["opportunities"]}
+    matches = {m["id"]: m for m in client.tables["matches"]}
+    for draft in client.tables["outreach_drafts"]:
+        opp = opps[matches[draft["match_id"]]["opportunity_id"]]
+        emails = draft["email_body"].split("---")
+        assert len(emails) == 3
+        assert not any(check_email(e, opp["naics_code"], opp["response_deadline"]) for e in emails)
+    print(f"✅ SUCCESS: batched mode used {batched_state['requests']} requests vs {single_state['requests']}, "
+          f"{single_state['prompt_chars'] / batched_state['prompt_chars']:.1f}x fewer prompt characters.")
+
+def test_only_failing_emails_are_repaired_within_budget():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache_path, log_path = os.path.join(tmp, "llm_cache.sqlite3"), os.path.join(tmp, "draft_quality.jsonl")
+        drafts, client, state = run(False, WORDY_SHORT_HOPELESS, llm_cache=cache_path, quality_log=log_path)
+
+        # 30 drafts, then: Wordy's long email, Short's missing one, and Hopeless's 3 emails in both rounds
+        assert state["requests"] == 30 + 1 + 1 + 3 * 2
+        assert len(drafts) == 29 and "M-2-3" not in {d["match_id"] for d in client.tables["outreach_drafts"]}
+        quality = json.loads(open(log_path).read().splitlines()[-1])
+        assert quality["emails"] == 90 and quality["first_pass"] == 90 - 1 - 1 - 3
+        assert quality["repaired"] == 2 and quality["failed"] == 3 and quality["rounds"] == 2
+        # The rejected completion is dropped from the cache so the next run drafts it afresh
+        with sqlite3.connect(cache_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM completions WHERE template = 'email_drafts'").fetchone()[0] == 29
+    print(f"✅ SUCCESS: {quality['first_pass']}/90 passed first time, {quality['repaired']} repaired, "
+          f"{quality['failed']} still failing after {quality['rounds']} rounds.")
+
+def test_draft_rules():
+    forms = deadline_forms("2026-11-03T17:00:00-04:00")
+    assert {"2026-11-03", "11/03/2026", "11/3/2026", "november 3 2026", "nov 3 2026", "3 november 2026"} <= forms
+    ok = "Under NAICS 541512, responses are due Nov. 3rd, 2026."
+    assert check_email(ok, "541512", "2026-11-03") == []
+    assert check_email("Due 11/3/2026 under NAICS 5415120.", "541512", "2026-11-03") == ["missing NAICS code 541512"]
+    assert check_email("NAICS 541512, due soon.", "541512", "2026-11-03") == ["missing response deadline 2026-11-03"]
+    assert check_email(ok + " word" * 180, "541512", "2026-11-03")[0].endswith("(must be under 180)")
+
+if __name__ == "__main__":
+    test_batched_mode_cuts_requests_and_prompt_tokens()
+    test_only_failing_emails_are_repaired_within_budget()
+    test_draft_rules()
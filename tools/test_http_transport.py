@@ -0,0 +1,87 @@
+import time
+import socket
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from http_transport import METRICS, LATENCY_BUCKETS, get_session, set_host_limit
+
+class LocalHandler(BaseHTTPRequestHandler):
+    # /flaky fails with a 503 on its first hit, /broken always fails, /slow holds the connection for 50ms
+    protocol_version = "HTTP/1.1"
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        state = LocalHandler.state
+        with state["lock"]:
+            state["hits"][self.path] = state["hits"].get(self.path, 0) + 1
+            hits = state["hits"][self.path]
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+        try:
+            if self.path == "/slow":
+                time.sleep(0.05)
+            status = 503 if self.path == "/broken" or (self.path == "/flaky" and hits == 1) else 200
+            body = b'{"ok": true}' if status == 200 else b"unavailable"
+            self.send_response(status)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with state["lock"]:
+                state["in_flight"] -= 1
+
+def test_retries_host_cap_and_timings():
+    LocalHandler.state = {"lock": threading.Lock(), "hits": {}, "in_flight": 0, "peak": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), LocalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # "localhost", so every new connection goes through the DNS timing override
+    host = f"localhost:{server.server_address[1]}"
+    real_getaddrinfo = socket.getaddrinfo
+    METRICS.reset()
+    try:
+        # 1. A 5xx is retried by the transport; a caller with its own retry loop sees it once
+        assert get_session(f"http://{host}", retries=2).get(f"http://{host}/flaky", timeout=5).status_code == 200
+        assert LocalHandler.state["hits"]["/flaky"] == 2
+        assert get_session(f"http://{host}", retries=0).get(f"http://{host}/broken", timeout=5).status_code == 503
+        assert LocalHandler.state["hits"]["/broken"] == 1
+
+        # 2. Never more than the host's cap in flight, across threads
+        set_host_limit(host, 2)
+        session = get_session(f"http://{host}")
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            statuses = list(pool.map(lambda _: session.get(f"http://{host}/slow", timeout=5).status_code, range(12)))
+        assert statuses == [200] * 12
+        assert LocalHandler.state["peak"] == 2, f"❌ Peak {LocalHandler.state['peak']} in flight with a cap of 2"
+
+        # 3. A first address that refuses falls back to the rest, as urllib3 alone would
+        def refusing_first(name, *args, **kwargs):
+            infos = real_getaddrinfo(name, *args, **kwargs)
+            if name == "localhost":
+                return [(family, kind, proto, canon, ("127.0.0.2",) + addr[1:]) for family, kind, proto, canon, addr in infos[:1]] + infos
+            return infos
+        socket.getaddrinfo = refusing_first
+        assert get_session(f"http://{host}", retries=0, retry_methods=("GET",)).get(f"http://{host}/slow", timeout=5).status_code == 200
+    finally:
+        socket.getaddrinfo = real_getaddrinfo
+        set_host_limit(host, 8)
+        server.shutdown()
+
+    # 4. Timings fold into fixed per-host totals
+    h = METRICS.summary()[host]
+    assert h["requests"] == 1 + 1 + 12 + 1 and h["errors"] == 1
+    assert 3 <= h["connections"] <= 6, f"❌ {h['connections']} connections: keep-alive not reused"
+    assert h["dns"] > 0 and h["connect"] > 0 and h["ttfb"] > 0 and h["bytes"] > 0
+    assert h["dns"] + h["connect"] + h["ttfb"] <= h["total"] + 1e-3
+    assert sum(h["latency"]) == h["requests"] and len(h["latency"]) == len(LATENCY_BUCKETS) + 1
+    assert METRICS.percentile(h["latency"], 0.95) is not None
+    assert not hasattr(METRICS, "records"), "❌ Per-request records are kept"
+    print(f"✅ SUCCESS: 5xx retried, {LocalHandler.state['peak']} in flight at a cap of 2, refused address fell back; "
+          f"{h['requests']} requests over {h['connections']} connections (dns {h['dns'] * 1000:.1f}ms, "
+          f"connect {h['connect'] * 1000:.1f}ms).")
+
+if __name__ == "__main__":
+    test_retries_host_cap_and_timings()
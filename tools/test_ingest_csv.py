@@ -0,0 +1,74 @@
+import os
+import csv
+import random
+import tempfile
+from memory_supabase import MemorySupabase
+from agency_cache import agency_key
+
+CSV_COLUMNS = [
+    "NoticeId", "Title", "Sol#", "Department/Ind.Agency", "CGAC", "Sub-Tier", "Office", "PostedDate", "Type",
+    "SetASideCode", "ResponseDeadLine", "NaicsCode", "ClassificationCode", "Award$", "AwardDate", "AwardNumber",
+    "Awardee", "PrimaryContactTitle", "PrimaryContactFullname", "PrimaryContactEmail", "PrimaryContactPhone",
+    "PrimaryContactFax", "SecondaryContactTitle", "SecondaryContactFullname", "SecondaryContactEmail",
+    "SecondaryContactPhone", "SecondaryContactFax", "Active", "Link", "Description"
+]
+TYPES = ["Solicitation", "Presolicitation", "Sources Sought", "Combined Synopsis/Solicitation", "Award Notice"]
+SET_ASIDES = ["", "SBA", "8A", "SDVOSBC", "WOSB", "HZC", "Total Small Business Set-Aside (FAR 19.5)"]
+
+def write_synthetic_csv(path, n_rows, seed=7):
+    """ContractOpportunitiesFull-shaped CSV with realistic lookup cardinality (a few thousand agencies)."""
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="latin-1") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(n_rows):
+            dept = rng.randrange(60)
+            primary = rng.random() < 0.9
+            secondary = rng.random() < 0.4
+            writer.writerow([
+                f"N{i:08d}", f"Synthetic requirement {i}", f"SOL-{i:07d}",
+                f"Department {dept}" if rng.random() < 0.98 else "", "", f"Sub {dept}-{rng.randrange(8)}",
+                f"Office {dept}-{rng.randrange(40)}", "2026-01-15", rng.choice(TYPES), rng.choice(SET_ASIDES),
+                "2026-03-01T17:00:00-05:00", str(541000 + rng.randrange(300)), f"R{rng.randrange(200):03d}",
+                f"${rng.randrange(10_000, 5_000_000):,}" if rng.random() < 0.2 else "", "", "", "",
+                "Contracting Officer" if primary else "", f"Officer {i % 5000}" if primary else "",
+                f"CO{i % 5000}@agency.gov" if primary else "", "555-0100" if primary else "", "",
+                "Specialist" if secondary else "", f"Specialist {i % 3000}" if secondary else "",
+                f"cs{i % 3000}@agency.gov" if secondary else "", "", "",
+                "Yes" if rng.random() < 0.9 else "No", f"https://sam.gov/opp/{i}/view", "Provide services as described."
+            ])
+
+def lookup_tables():
+    return {
+        "opportunity_types": [{"id": i + 1, "name": name} for i, name in enumerate(TYPES)],
+        "set_asides": [{"id": i + 1, "code": code} for i, code in enumerate(["NONE", "SBA", "8A", "SDVOSBC", "WOSB", "HZC"])]
+    }
+
+def test_streaming_ingest_resolves_lookups_before_writes():
+    from ingest_csv import ingest_csv, row_agency
+    client = MemorySupabase(lookup_tables())
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "opps.csv")
+        write_synthetic_csv(path, 3_200)
+        total = ingest_csv(path, supabase=client, batch_size=500, queue_depth=2, agency_snapshot=None, change_index=":memory:")
+        with open(path, encoding="latin-1") as f:
+            expected_agency = {row["NoticeId"]: row_agency(row) for row in csv.DictReader(f)}
+
+    ops = client.tables["opportunities"]
+    assert total == len(ops) == 3_200, "❌ Opportunities missing or duplicated"
+    agency_ids = {agency_key(a["department"], a["sub_tier"], a["office"]): a["id"] for a in client.tables["agencies"]}
+    assert len(agency_ids) == len(client.tables["agencies"]), "❌ Duplicate agencies created"
+    for op in ops:
+        triple = expected_agency[op["notice_id"]]
+        assert op["agency_id"] == (agency_ids[agency_key(*triple)] if triple else None), "❌ Wrong agency id"
+
+    naics = {r["code"] for r in client.tables["naics_codes"]}
+    psc = {r["code"] for r in client.tables["psc_codes"]}
+    assert all(op["naics_code"] in naics and op["psc_code"] in psc for op in ops), "❌ Opportunity written before its lookup"
+    # Lookup tables only ever see new codes: no batch re-sends the whole set
+    code_writes = sum(1 for table, _ in client.calls if table in ("naics_codes", "psc_codes"))
+    assert code_writes <= 2 * 7, "❌ Lookups re-upserted on every batch"
+    print(f"✅ SUCCESS: {total} rows streamed in one pass; {len(agency_ids)} agencies, {len(naics)} NAICS, {len(psc)} PSC resolved.")
+
+if __name__ == "__main__":
+    test_streaming_ingest_resolves_lookups_before_writes()
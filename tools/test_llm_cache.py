@@ -0,0 +1,72 @@
+import os
+import time
+import tempfile
+from llm_cache import LLMCache, completion_key
+from draft_pipeline import OpenAIChat, draft_all
+from test_draft_pipeline import start_fake_llm, FakeLLMHandler
+
+def test_second_run_is_served_from_cache():
+    server, base = start_fake_llm()
+    try:
+        provider = OpenAIChat("test-key", base_url=f"{base}/v1", rpm=60_000, tpm=10_000_000, params={"temperature": 0.4})
+        jobs = [{"prompt": f"Draft outreach for contractor {i}"} for i in range(100)]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "llm_cache.sqlite3")
+
+            cache = LLMCache("outreach", "1", db_path=path)
+            _, cold = draft_all(jobs, provider, concurrency=10, cache=cache)
+            cache.close()
+            assert cold["cache_hits"] == 0 and FakeLLMHandler.state["requests"] == 100
+
+            cache = LLMCache("outreach", "1", db_path=path)
+            t0 = time.perf_counter()
+            results, warm = draft_all(jobs, provider, concurrency=10, cache=cache)
+            elapsed = time.perf_counter() - t0
+            assert FakeLLMHandler.state["requests"] == 100, "❌ Cached prompts reached the provider"
+            assert all(r["cached"] and r["text"] for r in results)
+            assert warm["cache_hits"] == 100 and warm["tokens_saved"] == 100 * 120 and warm["tokens"] == 0
+            assert cache.summary()["hit_rate"] == 1.0
+            cache.close()
+
+            # A changed prompt or changed generation parameters is a different completion
+            provider.params = {"temperature": 0.9}
+            cache = LLMCache("outreach", "1", db_path=path)
+            _, changed = draft_all(jobs[:5], provider, concurrency=5, cache=cache)
+            assert changed["cache_hits"] == 0 and FakeLLMHandler.state["requests"] == 105
+            cache.close()
+    finally:
+        server.shutdown()
+    print(f"✅ SUCCESS: warm run served 100/100 from cache in {elapsed * 1000:.0f}ms, {warm['tokens_saved']:,} tokens saved.")
+
+def test_template_version_ttl_and_lru_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "llm_cache.sqlite3")
+        cache = LLMCache("outreach", "1", db_path=path)
+        keys = [completion_key("openai", "gpt-4o-mini", f"prompt {i}") for i in range(10)]
+        for key in keys:
+            cache.put(key, "gpt-4o-mini", "x" * 1000, 100)
+        other = LLMCache("email_drafts", "v3-1", db_path=path)
+        other.put("other-key", "gemini-2.5-flash", "y" * 10, 10)
+        other.close()
+        time.sleep(0.01)
+        cache.get_many(keys[:2]) # Most recently used now
+        cache.close()
+
+        # LRU: room for five 1000-byte entries (plus the 10-byte one) keeps the two just read and the three newest writes
+        cache = LLMCache("outreach", "1", db_path=path, max_mb=5010 / (1024 * 1024))
+        assert cache.stats["evicted"] == 5
+        assert set(cache.get_many(keys)) == set(keys[:2] + keys[7:])
+        cache.close()
+
+        # Bumping the template version drops only that template's entries
+        cache = LLMCache("outreach", "2", db_path=path)
+        assert cache.stats["invalidated"] == 5 and cache.get_many(keys) == {}
+        cache.close()
+        other = LLMCache("email_drafts", "v3-1", db_path=path, ttl_days=0)
+        # ...and a zero TTL expires everything that is left
+        assert other.stats["invalidated"] == 0 and other.stats["expired"] == 1
+        other.close()
+
+if __name__ == "__main__":
+    test_second_run_is_served_from_cache()
+    test_template_version_ttl_and_lru_eviction()
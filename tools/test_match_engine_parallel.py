@@ -0,0 +1,32 @@
+import random
+from memory_supabase import MemorySupabase
+from test_candidate_index import generated_roster, generated_opportunities
+
+def seeded_client(seed, n_opps=120, n_contractors=600):
+    rng = random.Random(seed)
+    contractors = generated_roster(rng, n_contractors)
+    for con in contractors:
+        con["company_name"] = con["company_name"] or "Acme"
+    return MemorySupabase({
+        "opportunities": generated_opportunities(rng, n_opps),
+        "contractors": contractors
+    })
+
+def match_rows(client):
+    return sorted((m["opportunity_id"], m["contractor_id"], m["pwin_score"], m["naics_match"]) for m in client.tables.get("matches", []))
+
+def test_parallel_matches_serial():
+    from match_engine import run_match_engine
+    serial, parallel = seeded_client(5), seeded_client(5)
+    serial_elite = run_match_engine(serial, workers=1, opp_limit=None, contractor_limit=None)
+    parallel_elite = run_match_engine(parallel, workers=4, opp_limit=None, contractor_limit=None)
+
+    assert match_rows(serial) == match_rows(parallel), "❌ Sharded run wrote different matches"
+    key = lambda m: (m["opportunity_id"], m["contractor_id"])
+    assert sorted(serial_elite, key=key) == sorted(parallel_elite, key=key), "❌ Sharded run flagged different elite targets"
+    # One writer: every match write is an upsert from the parent process, never a worker
+    assert all(action == "upsert" for table, action in parallel.calls if table == "matches")
+    print(f"✅ SUCCESS: 4-worker sharded run matches the serial run ({len(match_rows(parallel))} matches).")
+
+if __name__ == "__main__":
+    test_parallel_matches_serial()
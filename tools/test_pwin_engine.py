@@ -0,0 +1,118 @@
+import random
+from memory_supabase import MemorySupabase
+from pwin_engine import PWinModel, pwin_factors, pwin_score, FACTOR_WEIGHTS
+from pwin_features import refresh_features, load_features, name_key
+from test_candidate_index import generated_roster, generated_opportunities
+
+AGENCIES = ["agency-dod", "agency-va", "agency-gsa"]
+TERMS = ["cloud", "cyber", "janitorial", "hvac", "network", "training", "logistics"]
+
+def featured_roster(rng, n):
+    contractors = generated_roster(rng, n)
+    features = {}
+    for con in contractors:
+        con["primary_poc_email"] = rng.choice([None, "bd@example.com"])
+        if rng.random() < 0.6:
+            features[con["id"]] = {
+                "award_count": rng.randint(1, 12),
+                "agency_awards": {agency: rng.randint(1, 4) for agency in rng.sample(AGENCIES, k=rng.randint(0, 2))},
+                "typical_award": rng.choice([None, 0.5, 40_000, 250_000, 3_000_000]),
+                "keywords": rng.sample(TERMS, k=rng.randint(0, 4))
+            }
+    return contractors, features
+
+def featured_opportunities(rng, n):
+    opportunities = generated_opportunities(rng, n)
+    for opp in opportunities:
+        opp["naics_code"] = rng.choice([opp["naics_code"], "541513", "541699", "238210"])
+        opp["agency_id"] = rng.choice(AGENCIES + [None])
+        opp["award_amount"] = rng.choice([None, 90_000, 300_000, 5_000_000])
+        opp["title"] = " ".join(rng.sample(TERMS, k=3)) + " Services"
+    return opportunities
+
+def test_model_matches_pairwise_reference():
+    rng = random.Random(20)
+    for trial in range(30):
+        contractors, features = featured_roster(rng, rng.randint(0, 120))
+        opportunities = featured_opportunities(rng, 6)
+        model = PWinModel(contractors, features)
+        for opp in opportunities:
+            expected = []
+            for pos, con in enumerate(contractors):
+                ratings = pwin_factors(opp, con, features.get(con["id"]))
+                assert all(1 <= ratings[factor] <= 5 for factor in FACTOR_WEIGHTS)
+                expected.append((pos, pwin_score(ratings), ratings["agency_awards"] > 0, ratings["keyword_matches"]))
+            actual = [(pos, score, signals["agency_history_aligned"], signals["keyword_match_count"]) for pos, score, signals in model.score(opp)]
+            assert actual == expected, f"❌ Trial {trial}: roster pass diverged from pwin_factors()"
+            for floor in (40, 60, 75, 90):
+                assert [hit[:2] for hit in model.score(opp, floor)] == [(pos, score) for pos, score, _, _ in expected if score >= floor]
+    print("✅ SUCCESS: PWinModel reproduced the pairwise ten-factor score and signals in 30 trials, pruned at every floor.")
+
+def seeded_client():
+    contractors = [
+        {"id": "c-1", "uei": "ABCDEFGH1234", "company_name": "Apex Cloud, LLC", "updated_at": "2026-01-01T00:00:00+00:00"},
+        {"id": "c-2", "uei": None, "company_name": "Nova Facilities Inc.", "updated_at": "2026-01-01T00:00:00+00:00"},
+        {"id": "c-3", "uei": None, "company_name": "Titan Logistics", "updated_at": "2026-01-01T00:00:00+00:00"}
+    ]
+    award = lambda i, awardee, agency, amount, title: {"id": f"o-{i}", "notice_id": f"N-{i}", "awardee": awardee, "agency_id": agency,
+                                                        "award_amount": amount, "title": title, "updated_at": "2026-01-01T00:00:00+00:00"}
+    opportunities = [
+        award(1, "APEX CLOUD LLC", "agency-dod", 100_000, "Cloud migration support"),
+        award(2, "Some Other Name, UEI ABCDEFGH1234", "agency-dod", 300_000, "Cloud security operations"),
+        award(3, "Nova Facilities", "agency-va", 50_000, "Janitorial services"),
+        award(4, "Unknown Vendor Corp", "agency-gsa", 75_000, "Logistics support"),
+        dict(award(5, None, "agency-va", None, "Open solicitation"))
+    ]
+    return MemorySupabase({"contractors": contractors, "opportunities": opportunities})
+
+def stored_features(client):
+    return {con_id: {k: row[k] for k in ("award_count", "agency_awards", "typical_award", "keywords")}
+            for con_id, row in load_features(client).items()}
+
+def test_incremental_refresh_matches_full_rebuild():
+    assert name_key("The Apex Cloud, L.L.C.") == name_key("APEX CLOUD LLC") == "apex cloud"
+    client = seeded_client()
+    marks = refresh_features(client)
+    features = stored_features(client)
+    assert features["c-1"] == {"award_count": 2, "agency_awards": {"agency-dod": 2}, "typical_award": 200_000.0,
+                               "keywords": ["cloud", "migration", "operations", "security"]}
+    assert set(features) == {"c-1", "c-2"}, "❌ Unresolved awardees must not get a feature row"
+
+    # A new award, a re-awarded notice, and a contractor renamed so it now claims the unresolved award
+    client.table("opportunities").insert([{"id": "o-6", "notice_id": "N-6", "awardee": "Nova Facilities", "agency_id": "agency-va",
+                                           "award_amount": 70_000, "title": "HVAC maintenance"}]).execute()
+    client.table("opportunities").update({"awardee": "Titan Logistics"}).eq("notice_id", "N-3").execute()
+    client.table("contractors").update({"company_name": "Unknown Vendor Corporation"}).eq("id", "c-3").execute()
+    before = len(client.calls)
+    marks = refresh_features(client, marks)
+    incremental = stored_features(client)
+
+    rebuilt = seeded_client()
+    rebuilt.tables = {name: [dict(row) for row in rows] for name, rows in client.tables.items()}
+    rebuilt.tables["contractor_awards"], rebuilt.tables["contractor_features"] = [], []
+    refresh_features(rebuilt)
+    assert incremental == stored_features(rebuilt), "❌ Incremental refresh drifted from a full rebuild"
+    assert incremental["c-3"]["award_count"] == 1 and incremental["c-2"]["keywords"] == ["hvac", "maintenance"]
+    # Only the touched contractors were re-aggregated: one features upsert, no full ledger scan
+    assert sum(1 for table, action in client.calls[before:] if table == "contractor_features" and action == "upsert") == 1
+    print(f"✅ SUCCESS: incremental feature refresh equals a full rebuild ({len(incremental)} contractors with history).")
+
+def test_match_engine_fills_feature_columns():
+    from match_engine import run_match_engine
+    client = seeded_client()
+    refresh_features(client)
+    client.tables["contractors"][0].update(naics_codes=["541512"], sba_certifications=["8A"], certifications=["8A", "SDVOSBC"],
+                                           is_sam_registered=True, primary_poc_email="bd@apex.example", state="VA")
+    client.tables["opportunities"].append({"id": "o-9", "notice_id": "N-9", "title": "Cloud security platform", "naics_code": "541512",
+                                           "set_aside_id": 1, "agency_id": "agency-dod", "award_amount": 150_000,
+                                           "place_of_performance_state": "VA"})
+    elite = run_match_engine(client, opp_limit=None, contractor_limit=None)
+    row = next(m for m in client.tables["matches"] if m["opportunity_id"] == "N-9" and m["contractor_id"] == "c-1")
+    assert row["agency_history_aligned"] and row["keyword_match_count"] == 2 and row["naics_match"] and row["set_aside_aligned"]
+    assert row["pwin_score"] >= 85 and any(m["contractor_id"] == "c-1" for m in elite)
+    print(f"✅ SUCCESS: match rows carry agency history and keyword counts (PWin {row['pwin_score']}).")
+
+if __name__ == "__main__":
+    test_model_matches_pairwise_reference()
+    test_incremental_refresh_matches_full_rebuild()
+    test_match_engine_fills_feature_columns()
@@ -0,0 +1,83 @@
+import os
+import gzip
+import tempfile
+from datetime import datetime, timezone
+from memory_supabase import MemorySupabase
+from bulk_writer import BulkWriter
+from cron_daily_sync import normalize_entity
+from raw_archive import RawArchive, iter_archived_pages, list_segments, read_segment
+
+def at(day, hour=12):
+    return datetime(2026, 10, day, hour, tzinfo=timezone.utc)
+
+def notices(ptype, start, n, title="Original"):
+    return [{"noticeId": f"{ptype}-{i}", "title": title, "type": ptype} for i in range(start, start + n)]
+
+def entity(uei, name):
+    return {"entityRegistration": {"ueiSAM": uei, "legalBusinessName": name}, "coreData": {}, "assertions": {}}
+
+def archived(root, **filters) -> dict:
+    return {op["noticeId"]: op["title"] for _, _, batch in iter_archived_pages("opportunities", root=root, **filters)
+            for op in batch}
+
+def test_archive_filters_latest_copy_and_parallel_replay():
+    with tempfile.TemporaryDirectory() as root:
+        # Tiny gzip segments: many files to decompress in parallel
+        archive = RawArchive(root=root, codec_name="gzip", segment_mb=0.01)
+        for day in (10, 11, 12):
+            for ptype in ("r", "o"):
+                for offset in range(0, 600, 100):
+                    archive.append("opportunities", ptype, offset, notices(ptype, offset, 100),
+                                   params={"api_key": "secret", "ptype": ptype}, fetched_at=at(day))
+        # An amendment captured later that day wins over every earlier copy
+        archive.append("opportunities", "o", 0, notices("o", 5, 1, title="Amended"), fetched_at=at(12, 18))
+        archive.append("entities", None, 0, [entity("UEI1", "Acme"), entity("UEI2", "Globex")], fetched_at=at(12))
+
+        segments = list_segments("opportunities", root=root)
+        assert len(segments) > 6 and {day for day, _, _ in segments} == {"2026-10-10", "2026-10-11", "2026-10-12"}
+        assert archive.stats["stored_bytes"] < archive.stats["raw_bytes"]
+        with open(segments[0][2], "rb") as f:
+            assert b"secret" not in gzip.decompress(f.read()), "❌ API key stored in the archive"
+
+        latest = archived(root, workers=4)
+        assert len(latest) == 1200 and latest["o-5"] == "Amended" and latest["o-6"] == "Original"
+        assert archived(root, workers=1) == latest, "❌ Parallel decompression changed the replay"
+
+        # Capture-day and ptype filters
+        assert archived(root, until="2026-10-11")["o-5"] == "Original"
+        assert set(archived(root, since="2026-10-12", ptypes=["r"])) == {f"r-{i}" for i in range(600)}
+        all_copies = sum(len(batch) for _, _, batch in iter_archived_pages("opportunities", root=root, latest_only=False))
+        assert all_copies == 3 * 1200 + 1
+
+        # A frame cut short by a crash loses only that page
+        with open(segments[-1][2], "ab") as f:
+            f.write(gzip.compress(b'{"records": [1, 2, 3]}\n')[:12])
+        assert len(read_segment(segments[-1][2])) >= 1
+
+        # The archive as an offline fixture: re-normalize and upsert entities without SAM.gov
+        client = MemorySupabase({"contractors": []})
+        with BulkWriter(client, "contractors", on_conflict="uei") as writer:
+            for _, _, entities in iter_archived_pages("entities", root=root):
+                writer.write([record for record in map(normalize_entity, entities) if record])
+        assert sorted(row["company_name"] for row in client.tables["contractors"]) == ["Acme", "Globex"]
+        assert os.listdir(os.path.join(root, "entities", "2026-10-12")) == ["all"]
+    print(f"✅ SUCCESS: {len(segments)} segments replayed newest-first with filters, identical across 1 and 4 workers.")
+
+def test_same_segment_recapture_and_codecs():
+    # A resident process (the engine server) appends every ingest of the day to one segment
+    for codec_name in ("gzip", "zstd"):
+        with tempfile.TemporaryDirectory() as root:
+            try:
+                archive = RawArchive(root=root, codec_name=codec_name)
+            except RuntimeError as e:
+                print(f"⚠️ {e}; skipping the {codec_name} round trip.")
+                continue
+            archive.append("opportunities", "p", 0, notices("p", 0, 3), fetched_at=at(14, 2))
+            archive.append("opportunities", "p", 0, notices("p", 1, 1, title="Amended"), fetched_at=at(14, 9))
+            assert len(list_segments("opportunities", root=root)) == 1
+            assert archived(root) == {"p-0": "Original", "p-1": "Amended", "p-2": "Original"}
+    print("✅ SUCCESS: the latest capture in a shared segment wins on replay.")
+
+if __name__ == "__main__":
+    test_archive_filters_latest_copy_and_parallel_replay()
+    test_same_segment_recapture_and_codecs()
@@ -0,0 +1,68 @@
+import uuid
+import random
+import threading
+from memory_supabase import MemorySupabase
+from repository import iter_pages, iter_rows, fetch_all, projection
+
+def contractor(rng, i):
+    return {"id": str(uuid.UUID(int=rng.getrandbits(128), version=4)), "company_name": f"Contractor {i}",
+            "naics_codes": ["541512"], "state": "VA", "raw_json": {"blob": "x" * 200}, "fts": "contractor"}
+
+def test_keyset_scan_survives_concurrent_upserts():
+    rng = random.Random(17)
+    roster = [contractor(rng, i) for i in range(5000)]
+    # The server caps every response at 400 rows, below the requested page size
+    client = MemorySupabase({"contractors": roster}, max_rows=400)
+    original = {row["id"] for row in roster}
+
+    done = threading.Event()
+    writes = {"updated": 0, "inserted": 0}
+    def writer():
+        wrng = random.Random(18)
+        while not done.is_set():
+            # Re-upsert existing rows with new values, and insert new rows anywhere in the key order
+            batch = [dict(row, state=wrng.choice(["MD", "TX"])) for row in wrng.sample(roster, 20)]
+            client.table("contractors").upsert(batch, on_conflict="id").execute()
+            client.table("contractors").insert([contractor(wrng, 10_000 + writes["inserted"])]).execute()
+            writes["updated"] += len(batch)
+            writes["inserted"] += 1
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        seen, pages = [], 0
+        for page in iter_pages(client, "contractors", "company_name, state", page_size=1000):
+            pages += 1
+            seen.extend(page)
+            threading.Event().wait(0.005) # Give the writer room between pages
+    finally:
+        done.set()
+        thread.join()
+
+    ids = [row["id"] for row in seen]
+    assert writes["updated"] and writes["inserted"], "❌ Writer never ran during the scan"
+    assert len(ids) == len(set(ids)), "❌ A row was returned twice"
+    assert original <= set(ids), f"❌ {len(original - set(ids))} rows were skipped"
+    assert ids == sorted(ids)
+    # Only the declared columns (plus the key) crossed the wire
+    assert all(set(row) == {"id", "company_name", "state"} for row in seen)
+    print(f"✅ SUCCESS: streamed {len(ids)} rows in {pages} capped pages with no gaps or duplicates while "
+          f"{writes['updated']} upserts and {writes['inserted']} inserts landed.")
+
+def test_filters_limits_and_projection():
+    rows = [{"id": f"M-{i:04d}", "classification": "HOT" if i % 3 == 0 else "WARM", "score_breakdown": {}} for i in range(2500)]
+    client = MemorySupabase({"matches": rows})
+    hot = fetch_all(client, "matches", "classification", where=lambda q: q.eq("classification", "HOT"), page_size=100)
+    assert [r["id"] for r in hot] == [r["id"] for r in rows if r["classification"] == "HOT"]
+    # A limit reads only what it needs: one page of 5 rows
+    before = len(client.calls)
+    assert len(list(iter_rows(client, "matches", "classification", limit=5))) == 5
+    assert len(client.calls) - before == 1
+    try:
+        projection("*")
+        assert False, "❌ select('*') was allowed"
+    except ValueError:
+        pass
+
+if __name__ == "__main__":
+    test_keyset_scan_survives_concurrent_upserts()
+    test_filters_limits_and_projection()
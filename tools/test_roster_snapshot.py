@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+from memory_supabase import MemorySupabase
+from roster_snapshot import refresh_snapshot
+from score_engine import score_top_matches, encode_snapshot, WARM_THRESHOLD
+from candidate_index import CandidateIndex, score_top_matches_indexed
+from test_candidate_index import generated_roster, generated_opportunities
+
+FIELDS = ("id", "uei", "company_name", "state", "naics_codes", "psc_codes", "certifications",
+          "sba_certifications", "is_sam_registered", "primary_poc_email")
+
+def stamped_roster(rng, n):
+    roster = generated_roster(rng, n)
+    for i, con in enumerate(roster):
+        con["id"] = f"con-{i:05d}"
+        con["uei"] = f"UEI{i:09d}" if i % 4 else None
+        con["primary_poc_email"] = f"bd{i}@example.com" if i % 3 else None
+        con["updated_at"] = f"2026-01-01T00:{i % 60:02d}:00+00:00"
+        con["raw_json"] = {"blob": "x" * 50}
+    # Blank array elements still count as "has a certification" to PWin, so they must survive the round trip
+    roster[1]["certifications"] = [""]
+    return roster
+
+def normalized(con):
+    row = {field: con.get(field) for field in FIELDS}
+    for field in ("naics_codes", "psc_codes", "certifications", "sba_certifications"):
+        row[field] = list(row[field] or [])
+    row["company_name"] = row["company_name"] or ""
+    row["is_sam_registered"] = bool(row["is_sam_registered"])
+    return row
+
+def test_snapshot_scores_like_the_row_roster():
+    from match_engine import score_opportunities
+    rng = random.Random(18)
+    roster = stamped_roster(rng, 600)
+    opportunities = generated_opportunities(rng, 40)
+    client = MemorySupabase({"contractors": roster})
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = refresh_snapshot(client, path=os.path.join(tmp, "roster.bin"))
+        try:
+            assert len(snapshot) == len(roster)
+            assert [dict(row) for row in snapshot] == [normalized(con) for con in roster], "❌ Snapshot rows differ from the table"
+            assert snapshot.position("con-00042") == 42 and snapshot.position("missing") is None
+
+            assert score_top_matches(opportunities, snapshot, blocks=encode_snapshot(snapshot)) == score_top_matches(opportunities, roster)
+            index = CandidateIndex.from_snapshot(snapshot)
+            assert score_top_matches_indexed(opportunities, index, WARM_THRESHOLD) == \
+                score_top_matches_indexed(opportunities, CandidateIndex(roster), WARM_THRESHOLD)
+            pwin_rows, _ = score_opportunities(opportunities, snapshot)
+            assert pwin_rows == score_opportunities(opportunities, roster)[0], "❌ PWin diverged on the snapshot"
+        finally:
+            snapshot.close()
+    print(f"✅ SUCCESS: the memory-mapped snapshot of {len(roster)} contractors scored {len(pwin_rows)} PWin pairs "
+          f"and every SOP Top 10 exactly like the row roster.")
+
+def test_refresh_reads_only_changed_rows():
+    rng = random.Random(19)
+    roster = stamped_roster(rng, 300)
+    client = MemorySupabase({"contractors": roster})
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "roster.bin")
+        refresh_snapshot(client, path=path).close()
+
+        # A row changed behind the mark's back (no new updated_at) must not be re-read...
+        client.tables["contractors"][3]["company_name"] = "Unseen"
+        # ...while one upserted and one inserted row are
+        client.table("contractors").upsert([dict(roster[7], state="WA"), dict(roster[0], id="con-00007a", company_name="Newco")],
+                                           on_conflict="id").execute()
+        snapshot = refresh_snapshot(client, path=path)
+        try:
+            assert len(snapshot) == 301
+            assert snapshot.mark == max(row["updated_at"] for row in client.tables["contractors"])
+            assert snapshot[3]["company_name"] == roster[3]["company_name"], "❌ Refresh re-read an unchanged row"
+            assert snapshot[snapshot.position("con-00007")]["state"] == "WA"
+            assert snapshot[snapshot.position("con-00007a")]["company_name"] == "Newco"
+            assert [row["id"] for row in snapshot] == sorted(row["id"] for row in client.tables["contractors"])
+        finally:
+            snapshot.close()
+
+        # A deletion cannot be seen through updated_at, so the count check forces a rebuild
+        client.table("contractors").delete().eq("id", "con-00100").execute()
+        snapshot = refresh_snapshot(client, path=path)
+        try:
+            assert len(snapshot) == 300 and snapshot.position("con-00100") is None
+        finally:
+            snapshot.close()
+    print("✅ SUCCESS: refresh merged only the changed contractors and rebuilt after a deletion.")
+
+if __name__ == "__main__":
+    test_snapshot_scores_like_the_row_roster()
+    test_refresh_reads_only_changed_rows()
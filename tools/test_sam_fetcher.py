@@ -0,0 +1,179 @@
+import json
+import time
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from sam_fetcher import iter_opportunity_pages, TokenBucket, PartialFetch
+from cron_daily_sync import iter_entity_pages
+from raw_archive import RawArchive, set_archive, iter_archived_pages
+
+# Local stand-in for api.sam.gov/opportunities/v2/search: fixed records per ptype,
+# a simulated per-request latency, and a 429 (Retry-After: 0) on the first hit of every third page.
+# Unknown ptypes get a 400, which the fetcher does not retry.
+RECORDS_PER_PTYPE = {"r": 2350, "p": 1200, "o": 3010}
+LATENCY = 0.05
+
+class MockSamHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        ptype, offset, limit = q["ptype"], int(q["offset"]), int(q["limit"])
+        state = MockSamHandler.state
+        with state["lock"]:
+            state["in_flight"] += 1
+            state["peak"] = max(state["peak"], state["in_flight"])
+            first_hit = (ptype, offset) not in state["seen"]
+            state["seen"].add((ptype, offset))
+        try:
+            time.sleep(LATENCY)
+            if ptype not in RECORDS_PER_PTYPE:
+                self.send_response(400)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if first_hit and (offset // limit) % 3 == 2:
+                state["throttled"] += 1
+                self.send_response(429)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            total = RECORDS_PER_PTYPE[ptype]
+            records = [{"noticeId": f"{ptype}-{i}"} for i in range(offset, min(offset + limit, total))]
+            body = json.dumps({"totalRecords": total, "opportunitiesData": records}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with state["lock"]:
+                state["in_flight"] -= 1
+
+def run_against_mock(limit=500):
+    MockSamHandler.state = {"lock": threading.Lock(), "in_flight": 0, "peak": 0, "seen": set(), "throttled": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/opportunities/v2/search"
+    try:
+        t0 = time.perf_counter()
+        notice_ids = []
+        for ptype, offset, batch in iter_opportunity_pages("test-key", "01/01/2026", "03/31/2026", limit=limit,
+                                                           url=url, limiter=TokenBucket(rate=200, capacity=10)):
+            time.sleep(LATENCY) # Simulated normalize + upsert work overlapping the next fetch
+            notice_ids.extend(op["noticeId"] for op in batch)
+        return notice_ids, time.perf_counter() - t0, MockSamHandler.state
+    finally:
+        server.shutdown()
+
+def test_fetcher_against_mock_server():
+    with tempfile.TemporaryDirectory() as archive_dir:
+        set_archive(RawArchive(root=archive_dir))
+        try:
+            notice_ids, elapsed, state = run_against_mock()
+        finally:
+            set_archive(None)
+        # Every fetched page was captured, and replays without the server
+        replayed = [op["noticeId"] for _, _, batch in iter_archived_pages("opportunities", root=archive_dir) for op in batch]
+    expected = {f"{p}-{i}" for p, n in RECORDS_PER_PTYPE.items() for i in range(n)}
+    assert len(notice_ids) == len(expected) and set(notice_ids) == expected, "❌ Records missing or duplicated"
+    assert sorted(replayed) == sorted(notice_ids), "❌ Archive replay differs from the fetched pages"
+    assert state["throttled"] > 0, "❌ Mock never throttled; 429 path not exercised"
+    assert state["peak"] > 1, "❌ Notice types were not fetched concurrently"
+
+    requests_made = len(state["seen"]) + state["throttled"]
+    sequential = requests_made * LATENCY + len(state["seen"]) * LATENCY
+    print(f"✅ SUCCESS: {len(notice_ids)} records, {state['throttled']} 429s retried, peak {state['peak']} in flight.")
+    print(f"   {elapsed:.2f}s vs ~{sequential:.2f}s for serial fetch-then-process ({sequential / elapsed:.1f}x).")
+
+def pager_threads() -> list:
+    return [t for t in threading.enumerate() if t.name.startswith("sam-pages-")]
+
+def test_pager_stops_with_its_consumer_and_reports_failed_ptypes():
+    MockSamHandler.state = {"lock": threading.Lock(), "in_flight": 0, "peak": 0, "seen": set(), "throttled": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockSamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/opportunities/v2/search"
+    pager = lambda ptypes: iter_opportunity_pages("test-key", "01/01/2026", "03/31/2026", ptypes=ptypes, limit=100,
+                                                  url=url, limiter=TokenBucket(rate=200, capacity=10))
+    with tempfile.TemporaryDirectory() as archive_dir:
+        set_archive(RawArchive(root=archive_dir))
+        try:
+            # 1. The consumer fails on its first page: every producer exits instead of blocking on the full queue
+            pages = pager(["r", "p", "o"])
+            try:
+                for _ in pages:
+                    raise RuntimeError("normalize failed")
+            except RuntimeError:
+                pages.close()
+            deadline = time.monotonic() + 5
+            while pager_threads() and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert not pager_threads(), f"❌ {len(pager_threads())} producer threads leaked"
+            fetched = len(MockSamHandler.state["seen"])
+
+            # 2. A ptype that fails is raised once the others are done, after all of their pages
+            records = []
+            try:
+                for ptype, _, batch in pager(["p", "x"]):
+                    records.extend(batch)
+                raise AssertionError("❌ A failed ptype was only printed")
+            except PartialFetch as e:
+                assert set(e.failed) == {"x"}
+            assert len(records) == RECORDS_PER_PTYPE["p"]
+        finally:
+            set_archive(None)
+            server.shutdown()
+    print(f"✅ SUCCESS: producers stopped after {fetched} requests when the consumer failed; "
+          f"a failed ptype raised PartialFetch after {len(records)} records of the others.")
+
+class MockEntityHandler(BaseHTTPRequestHandler):
+    # 250 entities; the first hit of offset 100 is throttled and of offset 200 fails with a 503
+    hits = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        q = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        offset, limit = int(q["offset"]), int(q["limit"])
+        first_hit = offset not in MockEntityHandler.hits
+        MockEntityHandler.hits.append(offset)
+        if first_hit and offset in (100, 200):
+            self.send_response(429 if offset == 100 else 503)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        entities = [{"entityRegistration": {"ueiSAM": f"UEI{i}"}} for i in range(offset, min(offset + limit, 250))]
+        body = json.dumps({"totalRecords": 250, "entityData": entities}).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def test_entity_pages_back_off_instead_of_stopping():
+    MockEntityHandler.hits = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockEntityHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as archive_dir:
+        set_archive(RawArchive(root=archive_dir))
+        try:
+            pages = list(iter_entity_pages("2026-10-01", limit=100, url=f"http://127.0.0.1:{server.server_address[1]}/entities",
+                                           limiter=TokenBucket(rate=200, capacity=10)))
+        finally:
+            set_archive(None)
+            server.shutdown()
+    ueis = [e["entityRegistration"]["ueiSAM"] for _, batch in pages for e in batch]
+    assert [offset for offset, _ in pages] == [0, 100, 200]
+    assert ueis == [f"UEI{i}" for i in range(250)], "❌ A 429 or 5xx ended entity paging early"
+    assert MockEntityHandler.hits == [0, 100, 100, 200, 200], "❌ Unexpected request sequence"
+    print(f"✅ SUCCESS: {len(ueis)} entities paged through a 429 and a 503, no request after the short last page.")
+
+if __name__ == "__main__":
+    test_fetcher_against_mock_server()
+    test_pager_stops_with_its_consumer_and_reports_failed_ptypes()
+    test_entity_pages_back_off_instead_of_stopping()
@@ -0,0 +1,37 @@
+import random
+from score_engine import score_top_matches, score_matches_bruteforce, encode_roster, HOT_THRESHOLD, WARM_THRESHOLD
+from test_candidate_index import NAICS_POOL, CERTS_POOL, STATES, generated_opportunities
+
+def sparse_roster(rng, n):
+    """Few distinct profiles, so whole runs of contractors tie, plus every empty shape a list column takes."""
+    empties = [None, [], [""], [None]]
+    return [{
+        "id": f"con-{i}",
+        "naics_codes": rng.choice(empties + [rng.sample(NAICS_POOL[:2], k=rng.randint(1, 2)), [NAICS_POOL[0], NAICS_POOL[0]]]),
+        "certifications": rng.choice(empties + [rng.sample(CERTS_POOL[:2], k=1)]),
+        "state": rng.choice(STATES[:2] + [None, ""])
+    } for i in range(n)]
+
+def test_bitset_engine_matches_bruteforce():
+    rng = random.Random(1)
+    cutoff_ties = tier_edges = 0
+    for trial in range(200):
+        contractors = sparse_roster(rng, rng.choice([0, 1, 9, 10, 11, rng.randint(12, 120)]))
+        opportunities = generated_opportunities(rng, 6)
+        opportunities[0].update(naics_code=None, set_aside_code=None, place_of_performance_state=None)
+        for top_n in (1, 3, 10):
+            expected = score_matches_bruteforce(opportunities, contractors, top_n=top_n)
+            # Small blocks put tied contractors on both sides of a block boundary
+            for block_size in (7, 64):
+                actual = score_top_matches(opportunities, contractors, top_n=top_n, blocks=encode_roster(contractors, block_size))
+                assert actual == expected, f"❌ Trial {trial}, top {top_n}, blocks of {block_size}"
+            for op in opportunities:
+                scores = sorted((r["score"] for r in score_matches_bruteforce([op], contractors, top_n=len(contractors))), reverse=True)
+                cutoff_ties += len(scores) > top_n and scores[top_n - 1] == scores[top_n]
+                tier_edges += any(s >= HOT_THRESHOLD for s in scores[:top_n]) and any(WARM_THRESHOLD <= s < HOT_THRESHOLD for s in scores[:top_n])
+    assert cutoff_ties > 100 and tier_edges > 0, "❌ Generated rosters did not exercise ties at the Top N cutoff"
+    print(f"✅ SUCCESS: bitset Top N equals brute force in 200 trials ({cutoff_ties} ties at the cutoff, "
+          f"{tier_edges} Top Ns spanning HOT and WARM, empty NAICS/certification lists included).")
+
+if __name__ == "__main__":
+    test_bitset_engine_matches_bruteforce()
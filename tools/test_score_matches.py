@@ -0,0 +1,149 @@
+import os
+import random
+import tempfile
+import importlib
+from datetime import datetime, timedelta, timezone
+from memory_supabase import MemorySupabase
+from run_state import STATE_DIR, load_state, parse_timestamp
+from score_engine import find_dirty_opportunities, diff_matches, score_pair, WARM_THRESHOLD
+from test_candidate_index import generated_roster, generated_opportunities
+
+score_matches_module = importlib.import_module("2_score_matches")
+STATE_FILE = "test_score_matches_state.json"
+
+def stored_rows(records) -> dict:
+    stored = {}
+    for record in records:
+        stored.setdefault(record["opportunity_id"], {})[record["contractor_id"]] = record
+    return stored
+
+def test_find_dirty_opportunities():
+    ops = [{"id": f"op-{i}", "naics_code": "541511", "set_aside_code": None, "place_of_performance_state": "VA"} for i in range(4)]
+    con = lambda i, naics, state: {"id": f"con-{i}", "naics_codes": naics, "certifications": [], "state": state}
+    roster = [con(1, ["541511"], "VA"), con(2, ["541511"], "MD"), con(3, ["236220"], "TX")]
+    stored = stored_rows(score_pair(op, c) for op in ops[:3] for c in roster[:2])
+    stored["op-3"] = {}
+
+    # A changed opportunity is dirty; nothing else is
+    assert [op["id"] for op in find_dirty_opportunities(ops, {"op-1"}, [], stored, top_n=2)] == ["op-1"]
+    # A changed contractor in a stored Top N makes that opportunity dirty, even if its score fell
+    fallen = con(2, [], "MD")
+    assert [op["id"] for op in find_dirty_opportunities(ops[:3], set(), [fallen], stored, top_n=2)] == ["op-0", "op-1", "op-2"]
+    # An outside contractor only dirties opportunities where it now reaches the Nth score (or the Top N has room)
+    climber = con(3, [], "VA") # 0.275, under the stored 0.375 Nth
+    assert [op["id"] for op in find_dirty_opportunities(ops, set(), [climber], stored, top_n=2)] == ["op-3"]
+    assert [op["id"] for op in find_dirty_opportunities(ops, set(), [climber], stored, top_n=3)] == ["op-0", "op-1", "op-2", "op-3"]
+    # ...and, under a tier floor, only where it reaches the floor
+    assert find_dirty_opportunities(ops, set(), [con(3, [], "TX")], stored, top_n=3, min_score=WARM_THRESHOLD) == []
+    print("✅ SUCCESS: dirty detection covers changed opportunities, held contractors and climbers.")
+
+def test_diff_matches():
+    record = lambda op, con, score, tier: {"opportunity_id": op, "contractor_id": con, "score": score, "classification": tier}
+    stored = stored_rows([record("op-1", "con-1", 0.725, "HOT"), record("op-1", "con-2", 0.575, "WARM"),
+                          record("op-2", "con-1", 0.575, "WARM"), record("op-3", "con-4", 0.575, "WARM")])
+    fresh = [record("op-1", "con-1", 0.725, "HOT"), record("op-1", "con-3", 0.525, "WARM"), record("op-2", "con-1", 0.725, "HOT")]
+
+    upserts, stale = diff_matches(fresh, stored, scored_ids=["op-1", "op-2", "op-3"])
+    # Unchanged rows are not rewritten; new and re-scored ones are
+    assert [(r["opportunity_id"], r["contractor_id"]) for r in upserts] == [("op-1", "con-3"), ("op-2", "con-1")]
+    # con-2 left op-1's Top N; op-3's only match fell under the floor, leaving it no rows at all
+    assert sorted(stale) == [("op-1", "con-2"), ("op-3", "con-4")]
+    # Opportunities that were not re-scored keep their rows
+    assert diff_matches(fresh, stored, scored_ids=["op-1", "op-2"])[1] == [("op-1", "con-2")]
+    print("✅ SUCCESS: diff_matches writes only moved rows and drops rows that fell out, down to an empty Top N.")
+
+def stamped(rows, start):
+    # A minute apart, so only the last few rows fall inside the read overlap behind a mark
+    for i, row in enumerate(rows):
+        row["updated_at"] = (start + timedelta(minutes=i)).isoformat()
+    return rows
+
+def match_set(client) -> set:
+    return {(m["opportunity_id"], m["contractor_id"], m["score"], m["classification"]) for m in client.tables["matches"]}
+
+def test_incremental_run_matches_full_rescore():
+    rng = random.Random(3)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    client = MemorySupabase({"opportunities": stamped(generated_opportunities(rng, 40), start),
+                             "contractors": stamped(generated_roster(rng, 80), start), "matches": []})
+    requested = []
+    fetch_stored_matches = score_matches_module.fetch_stored_matches
+    score_matches_module.fetch_stored_matches = lambda supabase, op_ids: requested.extend(op_ids) or fetch_stored_matches(supabase, op_ids)
+    try:
+        score_matches_module.score_matches(min_tier="WARM", incremental=True, supabase=client, state_file=STATE_FILE)
+        assert client.tables["matches"], "❌ The first run wrote no matches"
+
+        # A changed opportunity, a changed contractor, and an opportunity whose every match falls under WARM
+        held = client.tables["matches"][0]["contractor_id"]
+        emptied = next(op for op in client.tables["opportunities"] if any(m["opportunity_id"] == op["id"] for m in client.tables["matches"])
+                       and op["id"] != client.tables["matches"][0]["opportunity_id"])
+        client.table("opportunities").update({"place_of_performance_state": "TX"}).eq("id", "op-5").execute()
+        client.table("contractors").update({"naics_codes": []}).eq("id", held).execute()
+        client.table("opportunities").update({"naics_code": "999999"}).eq("id", emptied["id"]).execute()
+        requested.clear()
+        score_matches_module.score_matches(min_tier="WARM", incremental=True, supabase=client, state_file=STATE_FILE)
+
+        rebuilt = MemorySupabase({name: [dict(row) for row in client.tables[name]] for name in ("opportunities", "contractors")})
+        rebuilt.tables["matches"] = []
+        score_matches_module.score_matches(min_tier="WARM", supabase=rebuilt)
+        assert match_set(client) == match_set(rebuilt), "❌ Incremental run drifted from a full re-score"
+        assert not any(m["opportunity_id"] == emptied["id"] for m in client.tables["matches"]), "❌ Rows under the floor survived"
+        assert all(m["contractor_id"] != held for m in client.tables["matches"])
+        assert 0 < len(requested) < len(client.tables["opportunities"]), "❌ Stored matches read for every opportunity"
+    finally:
+        score_matches_module.fetch_stored_matches = fetch_stored_matches
+        if os.path.exists(os.path.join(STATE_DIR, STATE_FILE)):
+            os.remove(os.path.join(STATE_DIR, STATE_FILE))
+    print(f"✅ SUCCESS: incremental run equals a full re-score; stored matches read for {len(requested)} of "
+          f"{len(client.tables['opportunities'])} opportunities.")
+
+def test_late_commit_behind_the_mark_is_scored():
+    rng = random.Random(4)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    client = MemorySupabase({"opportunities": stamped(generated_opportunities(rng, 10), start),
+                             "contractors": stamped(generated_roster(rng, 40), start), "matches": []})
+    try:
+        score_matches_module.score_matches(min_tier="WARM", incremental=True, supabase=client, state_file=STATE_FILE)
+        mark = parse_timestamp(load_state(STATE_FILE)["opportunities"])
+        # Its transaction started (and NOW() stamped it) before the mark, but it only committed after that run read
+        matched = next(op for op in client.tables["opportunities"] if any(m["opportunity_id"] == op["id"] for m in client.tables["matches"]))
+        late = dict(matched, id="op-late", notice_id="late",
+                    updated_at=(mark - timedelta(minutes=1)).isoformat())
+        client.tables["opportunities"].append(late)
+        score_matches_module.score_matches(min_tier="WARM", incremental=True, supabase=client, state_file=STATE_FILE)
+        assert any(m["opportunity_id"] == "op-late" for m in client.tables["matches"]), "❌ A late commit behind the mark was skipped"
+    finally:
+        if os.path.exists(os.path.join(STATE_DIR, STATE_FILE)):
+            os.remove(os.path.join(STATE_DIR, STATE_FILE))
+    print("✅ SUCCESS: an opportunity that committed behind the mark was scored by the next incremental run.")
+
+def test_contractor_updated_during_snapshot_refresh_is_not_skipped():
+    rng = random.Random(5)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    client = MemorySupabase({"opportunities": stamped(generated_opportunities(rng, 10), start),
+                             "contractors": stamped(generated_roster(rng, 40), start), "matches": []})
+    refresh_snapshot = score_matches_module.refresh_snapshot
+    with tempfile.TemporaryDirectory() as tmp:
+        def racing_refresh(supabase):
+            # Written after the changed contractors were read, but before the snapshot reads its mark
+            supabase.table("contractors").update({"state": "TX"}).eq("id", "con-3").execute()
+            return refresh_snapshot(supabase, path=os.path.join(tmp, "roster.bin"))
+        score_matches_module.refresh_snapshot = racing_refresh
+        try:
+            score_matches_module.score_matches(min_tier="WARM", incremental=True, snapshot=True, supabase=client,
+                                               state_file=STATE_FILE)
+            raced = next(con for con in client.tables["contractors"] if con["id"] == "con-3")
+            mark = parse_timestamp(load_state(STATE_FILE)["contractors"])
+            assert mark < parse_timestamp(raced["updated_at"]), "❌ The contractor mark moved past a contractor nobody diffed"
+        finally:
+            score_matches_module.refresh_snapshot = refresh_snapshot
+            if os.path.exists(os.path.join(STATE_DIR, STATE_FILE)):
+                os.remove(os.path.join(STATE_DIR, STATE_FILE))
+    print("✅ SUCCESS: a contractor updated during the snapshot refresh stays behind the contractor mark.")
+
+if __name__ == "__main__":
+    test_find_dirty_opportunities()
+    test_diff_matches()
+    test_incremental_run_matches_full_rescore()
+    test_late_commit_behind_the_mark_is_scored()
+    test_contractor_updated_during_snapshot_refresh_is_not_skipped()
@@ -0,0 +1,107 @@
+import os
+import json
+import uuid
+import random
+import pytest
+from score_engine import score_top_matches, score_matches_bruteforce, WARM_THRESHOLD
+from test_candidate_index import generated_roster, generated_opportunities
+
+# Needs a disposable Postgres (never the Supabase project): TEST_DATABASE_URL=postgresql://localhost/postgres
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+SCHEMA = "score_sql_test"
+
+TABLES = """
+    CREATE TABLE opportunities (id uuid PRIMARY KEY, naics_code varchar(10), set_aside_code varchar(50),
+        place_of_performance_state varchar(50), updated_at timestamptz DEFAULT now());
+    CREATE TABLE contractors (id uuid PRIMARY KEY, naics_codes text[], certifications text[], state varchar(50));
+    CREATE INDEX contractors_state_idx ON contractors (state);
+    CREATE TABLE matches (id uuid PRIMARY KEY DEFAULT gen_random_uuid(), opportunity_id uuid, contractor_id uuid,
+        score numeric, classification varchar(10), score_breakdown jsonb, created_at timestamptz DEFAULT now());
+"""
+
+def connect():
+    """A connection whose search_path is a fresh copy of the tables the migrations expect; skips without one."""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL not set: the Postgres ranking test needs a disposable database")
+    psycopg2 = pytest.importorskip("psycopg2")
+    conn = psycopg2.connect(TEST_DATABASE_URL)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA}; SET search_path TO {SCHEMA}")
+        cur.execute(TABLES)
+        for migration in ("scoring_migration.sql", "ranking_migration.sql"):
+            with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), migration)) as f:
+                cur.execute(f.read())
+    return conn
+
+def seeded_rows(rng, n_contractors, n_opportunities):
+    contractors = generated_roster(rng, n_contractors)
+    opportunities = generated_opportunities(rng, n_opportunities)
+    for row in contractors + opportunities:
+        row["id"] = str(uuid.UUID(int=rng.getrandbits(128), version=4))
+    # Blank codes mean "no signal", the same as NULL
+    opportunities[0].update(naics_code="", set_aside_code="", place_of_performance_state="")
+    # Postgres breaks ties by id; the Python engine by roster order
+    contractors.sort(key=lambda con: con["id"])
+    return contractors, opportunities
+
+def load(cur, contractors, opportunities):
+    cur.execute("TRUNCATE opportunities, contractors, matches")
+    cur.executemany("INSERT INTO contractors (id, naics_codes, certifications, state) VALUES (%s, %s, %s, %s)",
+                    [(c["id"], c["naics_codes"], c["certifications"], c["state"]) for c in contractors])
+    cur.executemany("INSERT INTO opportunities (id, naics_code, set_aside_code, place_of_performance_state) VALUES (%s, %s, %s, %s)",
+                    [(o["id"], o["naics_code"], o["set_aside_code"], o["place_of_performance_state"]) for o in opportunities])
+
+def stored(cur):
+    cur.execute("""SELECT opportunity_id::text, contractor_id::text, score, classification, score_breakdown
+                   FROM matches ORDER BY opportunity_id, score DESC, contractor_id""")
+    return [(op, con, float(score), tier, breakdown) for op, con, score, tier, breakdown in cur.fetchall()]
+
+def expected(records):
+    return sorted(((r["opportunity_id"], r["contractor_id"], r["score"], r["classification"], r["score_breakdown"])
+                   for r in records), key=lambda r: (r[0], -r[2], r[1]))
+
+def rank(cur, min_score=None):
+    cur.execute("SELECT score_matches_sql(%s)", (min_score,))
+    result = cur.fetchone()[0]
+    return result if isinstance(result, dict) else json.loads(result)
+
+def test_sql_ranking_matches_python_engine():
+    conn = connect()
+    rng = random.Random(16)
+    try:
+        with conn.cursor() as cur:
+            # A few contractors so zero-signal filler is needed, then a roster big enough to fill every Top 10
+            for n_contractors in (6, 40, 2000):
+                contractors, opportunities = seeded_rows(rng, n_contractors, 40)
+                load(cur, contractors, opportunities)
+                result = rank(cur)
+                want = expected(score_top_matches(opportunities, contractors, top_n=10))
+                assert stored(cur) == want, f"❌ SQL ranking diverged from score_engine ({n_contractors} contractors)"
+                assert result == {"opportunities": 40, "matches": len(want), "written": len(want)}
+
+            # Re-running over unchanged data rewrites nothing
+            assert rank(cur)["written"] == 0
+            # A contractor gaining a state is re-ranked in place
+            cur.execute("UPDATE contractors SET state = 'VA' WHERE state IS NULL")
+            contractors = [dict(c, state=c["state"] or "VA") for c in contractors]
+            changed = rank(cur)["written"]
+            now = stored(cur)
+            assert 0 < changed < len(want)
+            # Full mode never prunes (same as the Python path), so the new Top 10 sits among the stored rows
+            assert all(row in now for row in expected(score_top_matches(opportunities, contractors, top_n=10)))
+
+            # With a tier floor only pairs at or above it are ranked (--min-tier WARM)
+            load(cur, contractors, opportunities)
+            rank(cur, WARM_THRESHOLD)
+            brute = [m for m in score_matches_bruteforce(opportunities, contractors) if m["score"] >= WARM_THRESHOLD]
+            assert stored(cur) == expected(brute), "❌ SQL tier floor diverged from the Python engine"
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.close()
+    print(f"✅ SUCCESS: score_matches_sql() reproduced score_engine's Top 10 for {len(opportunities)} opportunities x "
+          f"{len(contractors)} contractors; an unchanged re-run wrote 0 rows, a state change rewrote {changed}.")
+
+if __name__ == "__main__":
+    test_sql_ranking_matches_python_engine()
@@ -0,0 +1,110 @@
+import random
+import time
+import threading
+from taxonomy import Taxonomy, has
+from score_engine import score_pair
+from test_candidate_index import generated_roster, generated_opportunities
+
+def list_naics_level(codes, code):
+    """String-slicing reference for Taxonomy.naics_level()."""
+    if not code:
+        return 0
+    if code in (codes or ()):
+        return len(code)
+    for digits in (5, 4, 3, 2):
+        if len(code) > digits and any(c and len(c) > digits and c[:digits] == code[:digits] for c in codes or ()):
+            return digits
+    return 0
+
+def test_bitsets_match_list_membership():
+    rng = random.Random(19)
+    taxonomy = Taxonomy()
+    pool = ["541511", "541512", "541611", "236220", "238210", "561210", "5415", "", None]
+    for _ in range(2000):
+        con = {"naics_codes": rng.sample(pool, k=rng.randint(0, 4)) or rng.choice([None, []]),
+               "psc_codes": rng.sample(["D302", "R408", ""], k=rng.randint(0, 2)),
+               "certifications": rng.sample(["8A", "WOSB", "HZC", ""], k=rng.randint(0, 2)),
+               "sba_certifications": rng.choice([None, [], [""], ["8A"]])}
+        profile = taxonomy.profile(con)
+        for code in ["541511", "541519", "541699", "236118", "999999", "5415", "", None]:
+            assert has(profile.naics, taxonomy.naics_id(code)) == bool(code and code in (con["naics_codes"] or ()))
+            assert taxonomy.naics_level(profile, code) == list_naics_level(con["naics_codes"], code), (con, code)
+        for cert in ["8A", "WOSB", "SBA", "", None]:
+            assert has(profile.certifications, taxonomy.certification_id(cert)) == bool(cert and cert in con["certifications"])
+        assert has(profile.psc, taxonomy.psc_id("D302")) == ("D302" in con["psc_codes"])
+        assert profile.has_sba_certification == (len(con["sba_certifications"] or []) > 0)
+    # Opportunity lookups never grow the ID space
+    size = len(taxonomy.naics)
+    taxonomy.naics_id("111111")
+    assert len(taxonomy.naics) == size
+    print(f"✅ SUCCESS: bitset membership and NAICS levels agreed with list scans ({len(taxonomy.naics)} NAICS IDs, "
+          f"{len(taxonomy.naics_prefixes)} prefix IDs).")
+
+def test_scorers_unchanged_by_encoding():
+    from match_engine import calculate_pwin_score
+    from pwin_engine import pwin_factors, pwin_score, NAICS_LEVEL_RATINGS, TEAMING_RATINGS
+    rng = random.Random(20)
+    contractors = generated_roster(rng, 300)
+    opportunities = generated_opportunities(rng, 30)
+    taxonomy = Taxonomy()
+    for op in opportunities:
+        for con in contractors:
+            record = score_pair(op, con)
+            naics = 1 if op["naics_code"] and con["naics_codes"] and op["naics_code"] in con["naics_codes"] else 0
+            setaside = 1 if op["set_aside_code"] and con["certifications"] and op["set_aside_code"] in con["certifications"] else 0
+            assert record["score_breakdown"]["naics_match"] == naics and record["score_breakdown"]["setaside_match"] == setaside
+            assert score_pair(op, con, taxonomy.profile(con)) == record
+            # The PWin factors that read the bitsets, from list scans instead
+            level = list_naics_level(con["naics_codes"], op["naics_code"])
+            ratings = dict(pwin_factors(op, con),
+                           technical_fit=5 if naics else NAICS_LEVEL_RATINGS.get(level, 1),
+                           competitive_position=(5 if con["sba_certifications"] else 1) if op["set_aside_id"] else 3,
+                           teaming_strategy=TEAMING_RATINGS[min(len({c for c in (con["certifications"] or []) + (con["sba_certifications"] or []) if c}), 3)])
+            assert pwin_factors(op, con) == ratings
+            assert calculate_pwin_score(op, con) == pwin_score(ratings)
+    print("✅ SUCCESS: SOP and PWin scores are unchanged by the taxonomy encoding.")
+
+def test_concurrent_profiles_get_distinct_ids():
+    from candidate_index import CandidateIndex
+    class YieldingIds(dict):
+        # A miss hands the GIL to another thread, so unlocked allocation would reliably hand out a bit twice
+        def get(self, code, default=None):
+            found = super().get(code, default)
+            if found is None:
+                time.sleep(0.0005)
+            return found
+
+    taxonomy = Taxonomy()
+    taxonomy.naics = YieldingIds()
+    # Many threads profile overlapping batches of never-seen codes at once
+    codes = [f"{600000 + i}" for i in range(400)]
+    start = threading.Barrier(8, timeout=5)
+    profiles = {}
+
+    def profile_codes(worker):
+        start.wait()
+        for i in range(worker, len(codes), 3):
+            profiles[(worker, codes[i])] = taxonomy.profile({"naics_codes": [codes[i]]})
+
+    threads = [threading.Thread(target=profile_codes, args=(worker,)) for worker in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(taxonomy.naics.values()) == list(range(len(codes))), "❌ Two codes were given the same bit"
+    for (_, code), profile in profiles.items():
+        assert has(profile.naics, taxonomy.naics_id(code)) and bin(profile.naics).count("1") == 1
+        assert all(not has(profile.naics, taxonomy.naics_id(other)) for other in codes[:20] if other != code)
+
+    # Each index scores against its own ID space: a later run does not inherit (or grow) an earlier one's
+    first, second = CandidateIndex([{"naics_codes": ["541511"]}]), CandidateIndex([{"naics_codes": ["236220"]}])
+    first.profile(0), second.profile(0)
+    assert first.taxonomy is not second.taxonomy and list(second.taxonomy.naics) == ["236220"]
+    assert second.profile(0).taxonomy is second.taxonomy
+    print(f"✅ SUCCESS: 8 threads profiling {len(codes)} new codes got {len(taxonomy.naics)} distinct IDs; "
+          "each index builds its own taxonomy.")
+
+if __name__ == "__main__":
+    test_bitsets_match_list_membership()
+    test_scorers_unchanged_by_encoding()
+    test_concurrent_profiles_get_distinct_ids()